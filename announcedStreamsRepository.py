@@ -0,0 +1,212 @@
+import asyncio
+import time
+from typing import Dict, List, Optional, Set
+
+import CynanBotCommon.utils as utils
+from bufferedTimber import BufferedTimber
+from CynanBotCommon.storage.backingDatabase import BackingDatabase
+from CynanBotCommon.storage.databaseConnection import DatabaseConnection
+from databaseSchemaRegistry import DatabaseSchemaRegistry
+from twitchAnnounceSettingsRepository import TwitchAnnounceSettingsRepository
+
+
+class AnnouncedStreamsRepository():
+
+    # Remembers which Helix stream ids have already been announced. A Helix stream id is unique
+    # to a single broadcast, so a stream is announced exactly once no matter how many poll cycles
+    # see it, while a stream that restarts (and therefore gets a new id) is announced again.
+    # Streams are marked as soon as they're first seen, so that every batch in a poll cycle agrees
+    # on what's new, and it's up to whoever delivers the announcement to unmark a stream that
+    # couldn't be announced anywhere (see unmarkStreamsAnnounced()), so that the next poll cycle
+    # tries again.
+    #
+    # Each entry is just a stream id and the epoch second it was last seen. Entries that haven't
+    # been seen for longer than the time to live are evicted. Last seen times are refreshed in
+    # memory every cycle, but only written back to the database once they've drifted by half of
+    # the time to live, so streams that were already announced cost no writes per cycle.
+
+    def __init__(
+        self,
+        backingDatabase: BackingDatabase,
+        databaseSchemaRegistry: DatabaseSchemaRegistry,
+        timber: BufferedTimber,
+        twitchAnnounceSettingsRepository: TwitchAnnounceSettingsRepository
+    ):
+        if not isinstance(backingDatabase, BackingDatabase):
+            raise ValueError(f'backingDatabase argument is malformed: \"{backingDatabase}\"')
+        elif not isinstance(databaseSchemaRegistry, DatabaseSchemaRegistry):
+            raise ValueError(f'databaseSchemaRegistry argument is malformed: \"{databaseSchemaRegistry}\"')
+        elif not isinstance(timber, BufferedTimber):
+            raise ValueError(f'timber argument is malformed: \"{timber}\"')
+        elif not isinstance(twitchAnnounceSettingsRepository, TwitchAnnounceSettingsRepository):
+            raise ValueError(f'twitchAnnounceSettingsRepository argument is malformed: \"{twitchAnnounceSettingsRepository}\"')
+
+        self.__backingDatabase: BackingDatabase = backingDatabase
+        self.__databaseSchemaRegistry: DatabaseSchemaRegistry = databaseSchemaRegistry
+        self.__timber: BufferedTimber = timber
+        self.__twitchAnnounceSettingsRepository: TwitchAnnounceSettingsRepository = twitchAnnounceSettingsRepository
+
+        self.__isDatabaseReady: bool = False
+        self.__loadLock: asyncio.Lock = asyncio.Lock()
+        self.__lastSeenTimes: Optional[Dict[str, int]] = None
+        self.__persistedLastSeenTimes: Dict[str, int] = dict()
+
+    async def clearCaches(self):
+        self.__lastSeenTimes = None
+        self.__persistedLastSeenTimes = dict()
+
+    async def __evictExpired(self, connection: DatabaseConnection, now: int, timeToLiveSeconds: int):
+        cutoff = now - timeToLiveSeconds
+        expiredStreamIds: List[str] = list()
+
+        for streamId, lastSeenTime in self.__lastSeenTimes.items():
+            if lastSeenTime < cutoff:
+                expiredStreamIds.append(streamId)
+
+        if not utils.hasItems(expiredStreamIds):
+            return
+
+        for streamId in expiredStreamIds:
+            del self.__lastSeenTimes[streamId]
+            self.__persistedLastSeenTimes.pop(streamId, None)
+
+        await connection.execute(
+            '''
+                DELETE FROM announcedstreams
+                WHERE lastseen < $1
+            ''',
+            cutoff
+        )
+
+        self.__timber.log('AnnouncedStreamsRepository', f'Evicted {len(expiredStreamIds)} expired announced stream(s)')
+
+    async def __getDatabaseConnection(self) -> DatabaseConnection:
+        await self.__initDatabaseTable()
+        return await self.__backingDatabase.getConnection()
+
+    async def __getLastSeenTimes(self) -> Dict[str, int]:
+        if self.__lastSeenTimes is not None:
+            return self.__lastSeenTimes
+
+        async with self.__loadLock:
+            if self.__lastSeenTimes is not None:
+                return self.__lastSeenTimes
+
+            connection = await self.__getDatabaseConnection()
+            rows = await connection.fetchRows('SELECT streamid, lastseen FROM announcedstreams')
+            await connection.close()
+
+            lastSeenTimes: Dict[str, int] = dict()
+
+            if utils.hasItems(rows):
+                for row in rows:
+                    lastSeenTimes[row[0]] = int(row[1])
+
+            self.__persistedLastSeenTimes = dict(lastSeenTimes)
+            self.__lastSeenTimes = lastSeenTimes
+            return lastSeenTimes
+
+    async def initDatabaseTable(self):
+        await self.__initDatabaseTable()
+
+    async def __initDatabaseTable(self):
+        if self.__isDatabaseReady:
+            return
+
+        await self.__databaseSchemaRegistry.createTableIfNotExists(
+            tableName = 'announcedstreams',
+            psqlStatement = '''
+                CREATE TABLE IF NOT EXISTS announcedstreams (
+                    streamid text NOT NULL PRIMARY KEY,
+                    lastseen bigint NOT NULL
+                )
+            ''',
+            sqliteStatement = '''
+                CREATE TABLE IF NOT EXISTS announcedstreams (
+                    streamid TEXT NOT NULL PRIMARY KEY,
+                    lastseen INTEGER NOT NULL
+                ) WITHOUT ROWID
+            '''
+        )
+
+        self.__isDatabaseReady = True
+
+    async def markStreamsAnnounced(self, streamIds: List[str]) -> Set[str]:
+        if not utils.hasItems(streamIds):
+            raise ValueError(f'streamIds argument is malformed: \"{streamIds}\"')
+
+        # returns only the stream ids that hadn't been announced before this call
+
+        lastSeenTimes = await self.__getLastSeenTimes()
+        twitchAnnounceSettings = await self.__twitchAnnounceSettingsRepository.getAllAsync()
+        timeToLiveSeconds = int(twitchAnnounceSettings.getAnnouncedStreamTimeToLiveMinutes() * 60)
+        now = int(time.time())
+
+        newStreamIds: Set[str] = set()
+        dirtyStreamIds: List[str] = list()
+
+        for streamId in streamIds:
+            if streamId not in lastSeenTimes:
+                newStreamIds.add(streamId)
+                dirtyStreamIds.append(streamId)
+            elif now - self.__persistedLastSeenTimes.get(streamId, 0) >= timeToLiveSeconds / 2:
+                dirtyStreamIds.append(streamId)
+
+            lastSeenTimes[streamId] = now
+
+        connection: Optional[DatabaseConnection] = None
+
+        if utils.hasItems(dirtyStreamIds):
+            connection = await self.__getDatabaseConnection()
+
+            for streamId in dirtyStreamIds:
+                await connection.execute(
+                    '''
+                        INSERT INTO announcedstreams (streamid, lastseen)
+                        VALUES ($1, $2)
+                        ON CONFLICT (streamid) DO UPDATE SET lastseen = EXCLUDED.lastseen
+                    ''',
+                    streamId, now
+                )
+
+                self.__persistedLastSeenTimes[streamId] = now
+
+        # eviction piggybacks on a connection that's already open, so it never costs an extra
+        # round trip on cycles where nothing new went live
+        if connection is not None:
+            await self.__evictExpired(connection, now, timeToLiveSeconds)
+            await connection.close()
+
+        return newStreamIds
+
+    async def unmarkStreamsAnnounced(self, streamIds: List[str]):
+        if not utils.hasItems(streamIds):
+            raise ValueError(f'streamIds argument is malformed: \"{streamIds}\"')
+
+        lastSeenTimes = await self.__getLastSeenTimes()
+        persistedStreamIds: List[str] = list()
+
+        for streamId in streamIds:
+            lastSeenTimes.pop(streamId, None)
+
+            if self.__persistedLastSeenTimes.pop(streamId, None) is not None:
+                persistedStreamIds.append(streamId)
+
+        if not utils.hasItems(persistedStreamIds):
+            return
+
+        connection = await self.__getDatabaseConnection()
+
+        for streamId in persistedStreamIds:
+            await connection.execute(
+                '''
+                    DELETE FROM announcedstreams
+                    WHERE streamid = $1
+                ''',
+                streamId
+            )
+
+        await connection.close()
+
+    async def warmUp(self):
+        await self.__getLastSeenTimes()
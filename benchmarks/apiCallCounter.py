@@ -0,0 +1,28 @@
+from collections import Counter
+from typing import Dict
+
+import CynanBotCommon.utils as utils
+
+
+class ApiCallCounter():
+
+    def __init__(self):
+        self.__totals: Counter = Counter()
+        self.__sinceLastSnapshot: Counter = Counter()
+
+    def getTotals(self) -> Dict[str, int]:
+        return dict(self.__totals)
+
+    def increment(self, key: str):
+        if not utils.isValidStr(key):
+            raise ValueError(f'key argument is malformed: \"{key}\"')
+
+        self.__totals[key] += 1
+        self.__sinceLastSnapshot[key] += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        # returns the calls made since the previous snapshot, which the harness takes once per
+        # poll cycle
+        counts = dict(self.__sinceLastSnapshot)
+        self.__sinceLastSnapshot.clear()
+        return counts
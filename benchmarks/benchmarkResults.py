@@ -0,0 +1,120 @@
+import json
+import math
+import platform
+import subprocess
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import CynanBotCommon.utils as utils
+
+
+class BenchmarkResults():
+
+    # Results files are plain JSON so that separate runs can be diffed, charted, or compared via
+    # compareTo(). Bump the schema version whenever an existing field changes meaning.
+    schemaVersion: int = 1
+
+    def __init__(self, suiteName: str):
+        if not utils.isValidStr(suiteName):
+            raise ValueError(f'suiteName argument is malformed: \"{suiteName}\"')
+
+        self.__suiteName: str = suiteName
+        self.__results: List[Dict[str, Any]] = list()
+
+    def add(self, result: Dict[str, Any]):
+        if not utils.hasItems(result):
+            raise ValueError(f'result argument is malformed: \"{result}\"')
+
+        self.__results.append(result)
+
+    def compareTo(
+        self,
+        baselineFile: str,
+        tolerance: float
+    ) -> List[str]:
+        if not utils.isValidStr(baselineFile):
+            raise ValueError(f'baselineFile argument is malformed: \"{baselineFile}\"')
+        elif not utils.isValidNum(tolerance):
+            raise ValueError(f'tolerance argument is malformed: \"{tolerance}\"')
+        elif tolerance < 0:
+            raise ValueError(f'tolerance argument is out of bounds: {tolerance}')
+
+        with open(baselineFile, 'r') as file:
+            baseline = json.load(file)
+
+        baselineResults: Dict[str, Dict[str, Any]] = dict()
+        for result in baseline.get('results', list()):
+            baselineResults[self.__keyOf(result)] = result
+
+        regressions: List[str] = list()
+
+        for result in self.__results:
+            baselineResult = baselineResults.get(self.__keyOf(result))
+            if baselineResult is None:
+                continue
+
+            oldLatency = baselineResult['latencySeconds']['p50']
+            newLatency = result['latencySeconds']['p50']
+            if oldLatency > 0 and newLatency > oldLatency * (1 + tolerance):
+                regressions.append(f'{self.__keyOf(result)}: p50 latency {oldLatency:.6f}s -> {newLatency:.6f}s')
+
+            oldMemory = baselineResult['peakMemoryBytes']
+            newMemory = result['peakMemoryBytes']
+            if oldMemory > 0 and newMemory > oldMemory * (1 + tolerance):
+                regressions.append(f'{self.__keyOf(result)}: peak memory {oldMemory} -> {newMemory} bytes')
+
+        return regressions
+
+    def getResults(self) -> List[Dict[str, Any]]:
+        return self.__results
+
+    def __getGitCommit(self) -> Optional[str]:
+        try:
+            return subprocess.check_output(
+                args = [ 'git', 'rev-parse', 'HEAD' ],
+                stderr = subprocess.DEVNULL,
+                text = True
+            ).strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def __keyOf(self, result: Dict[str, Any]) -> str:
+        return f'{result["benchmark"]}/{result["backend"]}/{result["userCount"]}u/{result["channelCount"]}c'
+
+    def toJson(self) -> Dict[str, Any]:
+        return {
+            'createdAt': datetime.now(timezone.utc).isoformat(),
+            'gitCommit': self.__getGitCommit(),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'results': self.__results,
+            'schemaVersion': self.schemaVersion,
+            'suite': self.__suiteName
+        }
+
+    def writeTo(self, outputFile: str):
+        if not utils.isValidStr(outputFile):
+            raise ValueError(f'outputFile argument is malformed: \"{outputFile}\"')
+
+        with open(outputFile, 'w') as file:
+            json.dump(self.toJson(), file, indent = 4, sort_keys = True)
+
+
+def summarizeLatencies(latencies: List[float]) -> Dict[str, float]:
+    if not utils.hasItems(latencies):
+        raise ValueError(f'latencies argument is malformed: \"{latencies}\"')
+
+    ordered = sorted(latencies)
+
+    def percentile(fraction: float) -> float:
+        index = max(0, math.ceil(fraction * len(ordered)) - 1)
+        return ordered[index]
+
+    return {
+        'max': ordered[-1],
+        'mean': sum(ordered) / len(ordered),
+        'min': ordered[0],
+        'p50': percentile(0.50),
+        'p95': percentile(0.95),
+        'p99': percentile(0.99)
+    }
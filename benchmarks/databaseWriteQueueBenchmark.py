@@ -0,0 +1,247 @@
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from asyncio import AbstractEventLoop
+from typing import Any, Dict, List, Optional
+
+import CynanBotCommon.utils as utils
+from benchmarks.benchmarkResults import BenchmarkResults, summarizeLatencies
+from benchmarks.syntheticRoster import SyntheticRoster
+from CynanBotCommon.simpleDateTime import SimpleDateTime
+from CynanBotCommon.storage.backingDatabase import BackingDatabase
+from CynanBotCommon.storage.backingSqliteDatabase import BackingSqliteDatabase
+from databaseSchemaRegistry import DatabaseSchemaRegistry
+from databaseWriteQueue import DatabaseWriteQueue
+from generalSettingsRepository import GeneralSettingsRepository
+from profiledBackingSqliteDatabase import ProfiledBackingSqliteDatabase
+from rosterVersionRepository import RosterVersionRepository
+from twitchAnnounceChannelsRepository import TwitchAnnounceChannelsRepository
+from user import User
+from usersRepository import UsersRepository
+
+# Compares roster writes going straight to SQLite, each on its own connection, against the same
+# writes going through a DatabaseWriteQueue. While the poll loop writes back --liveRatio of the
+# roster every cycle (in batches of 100, the way TwitchLiveUsersRepository does), there are
+# --writers admin command workers, each adding and then removing --commandsPerWriter users
+# as fast as they can. Throughput is every write completed over the whole run, and lock
+# contention shows up as command latency and as "database is locked" errors. Run from the
+# repository root, for example:
+#   python -m benchmarks.databaseWriteQueueBenchmark --output databaseWriteQueue.json
+#   python -m benchmarks.databaseWriteQueueBenchmark --writers 16 --profile --compare databaseWriteQueue.json
+
+
+async def runBackend(
+    eventLoop: AbstractEventLoop,
+    backend: str,
+    isQueued: bool,
+    roster: SyntheticRoster,
+    arguments: argparse.Namespace,
+    workingDirectory: str
+) -> List[Dict[str, Any]]:
+    databaseFile = os.path.join(workingDirectory, f'{backend}.sqlite')
+    backingDatabase: BackingDatabase = None
+
+    if arguments.profile:
+        backingDatabase = ProfiledBackingSqliteDatabase(
+            eventLoop = eventLoop,
+            sqlitePerformanceProfile = GeneralSettingsRepository().getAll().getSqlitePerformanceProfile(),
+            databaseFile = databaseFile
+        )
+    else:
+        backingDatabase = BackingSqliteDatabase(
+            eventLoop = eventLoop,
+            databaseFile = databaseFile
+        )
+
+    databaseWriteQueue: Optional[DatabaseWriteQueue] = None
+    if isQueued:
+        databaseWriteQueue = DatabaseWriteQueue(
+            eventLoop = eventLoop,
+            maxBatchSize = arguments.maxBatchSize,
+            maxDelayMillis = arguments.maxDelayMillis
+        )
+
+    databaseSchemaRegistry = DatabaseSchemaRegistry(
+        backingDatabase = backingDatabase
+    )
+
+    rosterVersionRepository = RosterVersionRepository(
+        backingDatabase = backingDatabase,
+        databaseSchemaRegistry = databaseSchemaRegistry
+    )
+
+    usersRepository = UsersRepository(
+        backingDatabase = backingDatabase,
+        databaseSchemaRegistry = databaseSchemaRegistry,
+        rosterVersionRepository = rosterVersionRepository,
+        databaseWriteQueue = databaseWriteQueue
+    )
+
+    twitchAnnounceChannelsRepository = TwitchAnnounceChannelsRepository(
+        backingDatabase = backingDatabase,
+        databaseSchemaRegistry = databaseSchemaRegistry,
+        rosterVersionRepository = rosterVersionRepository,
+        usersRepository = usersRepository,
+        databaseWriteQueue = databaseWriteQueue
+    )
+
+    for discordChannelId, users in roster.getChannelIdsToUsers().items():
+        if utils.hasItems(users):
+            await twitchAnnounceChannelsRepository.addUsers(users, discordChannelId)
+
+    await twitchAnnounceChannelsRepository.warmUp()
+
+    # both backends see the exact same sequence of live users and commands
+    pollRand = random.Random(49)
+    users = roster.getUsers()
+    discordChannelIds = list(roster.getChannelIdsToUsers().keys())
+    liveCount = max(1, int(len(users) * arguments.liveRatio))
+
+    pollWriteLatencies: List[float] = list()
+    commandLatencies: List[float] = list()
+    writeCount = 0
+    errorCount = 0
+
+    async def poll():
+        nonlocal writeCount, errorCount
+
+        for _ in range(arguments.cycles):
+            liveUsers = pollRand.sample(users, liveCount)
+
+            for index in range(0, len(liveUsers), 100):
+                batch = liveUsers[index:index + 100]
+                writeStart = time.perf_counter()
+
+                for user in batch:
+                    user.setMostRecentStreamDateTime(SimpleDateTime())
+
+                try:
+                    await usersRepository.addOrUpdateUsers(batch)
+                    pollWriteLatencies.append(time.perf_counter() - writeStart)
+                    writeCount = writeCount + len(batch)
+                except Exception:
+                    errorCount = errorCount + 1
+
+    async def issueCommands(writerIndex: int):
+        nonlocal writeCount, errorCount
+        commandRand = random.Random(writerIndex)
+
+        for commandIndex in range(arguments.commandsPerWriter):
+            discordChannelId = commandRand.choice(discordChannelIds)
+
+            # someone who isn't in the roster, so removing them again leaves it as it was
+            user = User(
+                discordDiscriminator = '0000',
+                discordId = str(300000000000000000 + writerIndex * 1000000 + commandIndex),
+                discordName = f'commanduser{writerIndex}_{commandIndex}',
+                twitchName = f'commandtwitchuser{writerIndex}_{commandIndex}'
+            )
+
+            commandStart = time.perf_counter()
+
+            try:
+                await twitchAnnounceChannelsRepository.addUser(user, discordChannelId)
+                await twitchAnnounceChannelsRepository.removeUser(user, discordChannelId)
+                commandLatencies.append(time.perf_counter() - commandStart)
+                writeCount = writeCount + 2
+            except Exception:
+                # e.g. "database is locked", which is exactly what this is here to find out about
+                errorCount = errorCount + 1
+
+    rosterVersionBefore = await rosterVersionRepository.fetchVersion()
+    benchmarkStart = time.perf_counter()
+    await asyncio.gather(poll(), *[ issueCommands(writerIndex) for writerIndex in range(arguments.writers) ])
+    benchmarkSeconds = time.perf_counter() - benchmarkStart
+    rosterVersionAfter = await rosterVersionRepository.fetchVersion()
+
+    def toResult(benchmark: str, latencies: List[float]) -> Dict[str, Any]:
+        return {
+            'backend': backend,
+            'benchmark': benchmark,
+            'benchmarkSeconds': benchmarkSeconds,
+            'channelCount': roster.getChannelCount(),
+            # every separate roster write bumps the roster version once, so this is how many of
+            # them all of the above actually turned into
+            'databaseWriteCount': rosterVersionAfter - rosterVersionBefore,
+            'errorCount': errorCount,
+            'latencySeconds': summarizeLatencies(latencies if utils.hasItems(latencies) else [ 0 ]),
+            'liveCount': liveCount,
+            # compareTo() also checks peak memory, which isn't what this benchmark is about
+            'peakMemoryBytes': 0,
+            'sampleCount': len(latencies),
+            'throughputWritesPerSecond': writeCount / max(benchmarkSeconds, 0.000001),
+            'userCount': roster.getUserCount(),
+            'writeCount': writeCount,
+            'writers': arguments.writers
+        }
+
+    return [
+        toResult('pollWrite:addOrUpdateUsers', pollWriteLatencies),
+        toResult('command:addAndRemoveTwitchUser', commandLatencies)
+    ]
+
+
+async def main(eventLoop: AbstractEventLoop, arguments: argparse.Namespace) -> int:
+    roster = SyntheticRoster(
+        userCount = arguments.users,
+        channelCount = arguments.channels
+    )
+
+    benchmarkResults = BenchmarkResults('databaseWriteQueue')
+    backendsToResults: Dict[str, List[Dict[str, Any]]] = dict()
+
+    with tempfile.TemporaryDirectory() as workingDirectory:
+        for backend, isQueued in [ ('sqlite-direct', False), ('sqlite-queued', True) ]:
+            results = await runBackend(eventLoop, backend, isQueued, roster, arguments, workingDirectory)
+            backendsToResults[backend] = results
+
+            for result in results:
+                benchmarkResults.add(result)
+                print(f'{backend} {result["benchmark"]}: p50={result["latencySeconds"]["p50"] * 1000:.2f}ms p95={result["latencySeconds"]["p95"] * 1000:.2f}ms ({result["sampleCount"]} sample(s), {result["errorCount"]} error(s))')
+
+            print(f'{backend}: {results[0]["throughputWritesPerSecond"]:.0f} writes/s, {results[0]["writeCount"]} write(s) as {results[0]["databaseWriteCount"]} database write(s) in {results[0]["benchmarkSeconds"]:.2f}s')
+
+    directResults = backendsToResults['sqlite-direct']
+    queuedResults = backendsToResults['sqlite-queued']
+    print(f'throughput: {queuedResults[0]["throughputWritesPerSecond"] / max(directResults[0]["throughputWritesPerSecond"], 0.000001):.2f}x with the write queue')
+
+    for directResult, queuedResult in zip(directResults, queuedResults):
+        speedup = directResult['latencySeconds']['p95'] / max(queuedResult['latencySeconds']['p95'], 0.000001)
+        print(f'{directResult["benchmark"]}: {speedup:.2f}x faster at p95 with the write queue')
+
+    benchmarkResults.writeTo(arguments.output)
+    print(f'Wrote {len(benchmarkResults.getResults())} result(s) to \"{arguments.output}\"')
+
+    if utils.isValidStr(arguments.compare):
+        regressions: List[str] = benchmarkResults.compareTo(arguments.compare, arguments.tolerance)
+
+        if utils.hasItems(regressions):
+            for regression in regressions:
+                print(f'REGRESSION {regression}')
+
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Compares direct SQLite roster writes against writes through the DatabaseWriteQueue')
+    parser.add_argument('--channels', type = int, default = 100)
+    parser.add_argument('--commandsPerWriter', type = int, default = 50)
+    parser.add_argument('--compare', default = None, help = 'previous results file to check for regressions against')
+    parser.add_argument('--cycles', type = int, default = 10)
+    parser.add_argument('--liveRatio', type = float, default = 0.05, help = 'fraction of the roster that goes live every poll cycle')
+    parser.add_argument('--maxBatchSize', type = int, default = 200)
+    parser.add_argument('--maxDelayMillis', type = float, default = 5)
+    parser.add_argument('--output', default = 'databaseWriteQueueBenchmark.json')
+    parser.add_argument('--profile', action = 'store_true', help = 'use the SQLite performance profile from generalSettings.json for both backends')
+    parser.add_argument('--tolerance', type = float, default = 0.2, help = 'allowed slowdown before a result counts as a regression')
+    parser.add_argument('--users', type = int, default = 2000)
+    parser.add_argument('--writers', type = int, default = 8, help = 'concurrent admin command workers')
+
+    eventLoop = asyncio.get_event_loop()
+    sys.exit(eventLoop.run_until_complete(main(eventLoop, parser.parse_args())))
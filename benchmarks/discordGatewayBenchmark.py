@@ -0,0 +1,472 @@
+import argparse
+import asyncio
+import gc
+import multiprocessing
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import discord
+from discord.ext import commands
+
+import CynanBotCommon.utils as utils
+from benchmarks.benchmarkResults import BenchmarkResults, summarizeLatencies
+from benchmarks.fakeTwitchDependencies import SilentTimber
+from discordGatewayStats import DiscordGatewayStats
+
+# Compares what the Discord gateway costs this bot with the intents and discord.py caches that
+# it used to run with (text commands: the default intents plus message content, a 1000 message
+# cache, and the default member cache and chunking) against the ones that CynanBotDiscord sets up
+# now (application commands: guilds only, plus members if discordMembersIntentEnabled, and no
+# message cache, member cache, or chunking). A synthetic stream of guild traffic is generated, and
+# each profile is sent only the events that Discord would send it given its intents, which are
+# then fed through discord.py's own gateway event parsing and caching, exactly as they would be
+# when read off of the websocket. Each profile runs in a fresh process, so that resident memory
+# is comparable. Application command interactions are sent regardless of intents, so they're the
+# same for both and left out. Run from the repository root, for example:
+#   python -m benchmarks.discordGatewayBenchmark --output discordGateway.json
+#   python -m benchmarks.discordGatewayBenchmark --guilds 200 --membersIntent --compare discordGateway.json
+
+
+# the gateway intent(s) that Discord requires before it sends each kind of event
+eventTypesToIntents: Dict[str, Callable[[discord.Intents], bool]] = {
+    'CHANNEL_UPDATE': lambda intents: intents.guilds,
+    'GUILD_MEMBER_ADD': lambda intents: intents.members,
+    'GUILD_MEMBER_REMOVE': lambda intents: intents.members,
+    'GUILD_MEMBER_UPDATE': lambda intents: intents.members,
+    'MESSAGE_CREATE': lambda intents: intents.guild_messages,
+    'MESSAGE_DELETE': lambda intents: intents.guild_messages,
+    'MESSAGE_REACTION_ADD': lambda intents: intents.guild_reactions,
+    'MESSAGE_UPDATE': lambda intents: intents.guild_messages,
+    'PRESENCE_UPDATE': lambda intents: intents.presences,
+    'TYPING_START': lambda intents: intents.guild_typing,
+    'VOICE_STATE_UPDATE': lambda intents: intents.voice_states
+}
+
+
+def createClientOptions(profile: str, isMembersIntentEnabled: bool) -> Dict[str, Any]:
+    if profile == 'before':
+        # the text commands needed message content, which isn't part of the default intents
+        intents = discord.Intents.default()
+        intents.message_content = True
+        intents.members = isMembersIntentEnabled
+
+        return {
+            'command_prefix': '!',
+            'intents': intents
+        }
+    elif profile == 'after':
+        # has to be kept the same as CynanBotDiscord.__init__()
+        intents = discord.Intents.none()
+        intents.guilds = True
+        intents.members = isMembersIntentEnabled
+
+        return {
+            'command_prefix': commands.when_mentioned,
+            'intents': intents,
+            'max_messages': None,
+            'member_cache_flags': discord.MemberCacheFlags.none(),
+            'chunk_guilds_at_startup': False
+        }
+    else:
+        raise ValueError(f'profile argument is malformed: \"{profile}\"')
+
+
+class SyntheticGuildTraffic():
+
+    # Deterministic, so that both profiles (in their own processes) see the exact same traffic.
+    # Payloads are only built as they're sent, so that the stream itself doesn't take up memory.
+
+    def __init__(self, arguments: argparse.Namespace):
+        self.__arguments: argparse.Namespace = arguments
+        self.__rand: random.Random = random.Random(50)
+        self.__messageId: int = 500000000000000000
+        self.__timestamp: str = datetime.now(timezone.utc).isoformat()
+
+    def __channelPayload(self, guildIndex: int, channelIndex: int, name: Optional[str] = None) -> Dict[str, Any]:
+        return {
+            'id': str(self.getChannelId(guildIndex, channelIndex)),
+            'guild_id': str(self.getGuildId(guildIndex)),
+            'type': 0,
+            'name': name or f'channel-{channelIndex}',
+            'position': channelIndex,
+            'permission_overwrites': list(),
+            'nsfw': False,
+            'parent_id': None,
+            'topic': None,
+            'last_message_id': None,
+            'rate_limit_per_user': 0
+        }
+
+    def createEventTypes(self) -> List[Tuple[str, int]]:
+        arguments = self.__arguments
+        eventTypesToRates: Dict[str, float] = {
+            'CHANNEL_UPDATE': arguments.channelUpdatesPerMinute,
+            'GUILD_MEMBER_ADD': arguments.memberJoinsPerMinute,
+            'GUILD_MEMBER_REMOVE': arguments.memberJoinsPerMinute,
+            'GUILD_MEMBER_UPDATE': arguments.memberUpdatesPerMinute,
+            'MESSAGE_CREATE': arguments.messagesPerMinute,
+            'MESSAGE_DELETE': arguments.messageDeletesPerMinute,
+            'MESSAGE_REACTION_ADD': arguments.reactionsPerMinute,
+            'MESSAGE_UPDATE': arguments.messageEditsPerMinute,
+            'PRESENCE_UPDATE': arguments.presencesPerMinute,
+            'TYPING_START': arguments.typingPerMinute,
+            'VOICE_STATE_UPDATE': arguments.voiceStatesPerMinute
+        }
+
+        events: List[Tuple[str, int]] = list()
+
+        for eventType, ratePerMinute in eventTypesToRates.items():
+            for guildIndex in range(arguments.guilds):
+                events.extend([ (eventType, guildIndex) ] * round(ratePerMinute * arguments.minutes))
+
+        self.__rand.shuffle(events)
+        return events
+
+    def createGuildPayload(self, guildIndex: int, isMembersIncluded: bool) -> Dict[str, Any]:
+        # Discord sends every member along with the guild only for guilds that aren't "large",
+        # and only with the members intent. Otherwise it's just the bot itself.
+        members = [ self.__memberPayload(self.getBotUserId()) ]
+        isLarge = self.__arguments.membersPerGuild >= 250
+
+        if isMembersIncluded and not isLarge:
+            members.extend([ self.__memberPayload(userId) for userId in self.getMemberIds(guildIndex) ])
+
+        return {
+            'id': str(self.getGuildId(guildIndex)),
+            'name': f'guild-{guildIndex}',
+            'icon': None,
+            'owner_id': str(self.getBotUserId()),
+            'features': list(),
+            'roles': [ {
+                'id': str(self.getGuildId(guildIndex)),
+                'name': '@everyone',
+                'permissions': '0',
+                'position': 0,
+                'color': 0,
+                'hoist': False,
+                'managed': False,
+                'mentionable': False
+            } ],
+            'emojis': list(),
+            'stickers': list(),
+            'channels': [ self.__channelPayload(guildIndex, channelIndex) for channelIndex in range(self.__arguments.channelsPerGuild) ],
+            'threads': list(),
+            'members': members,
+            'member_count': self.__arguments.membersPerGuild + 1,
+            'voice_states': list(),
+            'presences': list(),
+            'stage_instances': list(),
+            'guild_scheduled_events': list(),
+            'large': isLarge,
+            'unavailable': False,
+            'verification_level': 0,
+            'default_message_notifications': 0,
+            'explicit_content_filter': 0,
+            'mfa_level': 0,
+            'nsfw_level': 0,
+            'premium_tier': 0,
+            'afk_timeout': 300,
+            'system_channel_flags': 0,
+            'preferred_locale': 'en-US'
+        }
+
+    def createMemberChunkPayloads(self, guildIndex: int) -> List[Dict[str, Any]]:
+        # what Discord answers a request for a guild's full member list with
+        memberIds = self.getMemberIds(guildIndex)
+        chunks = [ memberIds[index:index + 1000] for index in range(0, len(memberIds), 1000) ]
+
+        return [ {
+            'guild_id': str(self.getGuildId(guildIndex)),
+            'members': [ self.__memberPayload(userId) for userId in chunk ],
+            'chunk_index': chunkIndex,
+            'chunk_count': len(chunks)
+        } for chunkIndex, chunk in enumerate(chunks) ]
+
+    def createPayload(self, eventType: str, guildIndex: int) -> Dict[str, Any]:
+        rand = self.__rand
+        guildId = str(self.getGuildId(guildIndex))
+        channelIndex = rand.randrange(self.__arguments.channelsPerGuild)
+        channelId = str(self.getChannelId(guildIndex, channelIndex))
+        userId = rand.choice(self.getMemberIds(guildIndex))
+
+        if eventType == 'CHANNEL_UPDATE':
+            return self.__channelPayload(guildIndex, channelIndex, f'channel-{channelIndex}-{rand.randrange(1000)}')
+        elif eventType in ('GUILD_MEMBER_ADD', 'GUILD_MEMBER_UPDATE'):
+            return { **self.__memberPayload(userId), 'guild_id': guildId }
+        elif eventType == 'GUILD_MEMBER_REMOVE':
+            return { 'guild_id': guildId, 'user': self.__userPayload(userId) }
+        elif eventType in ('MESSAGE_CREATE', 'MESSAGE_UPDATE'):
+            self.__messageId = self.__messageId + 1
+
+            return {
+                'id': str(self.__messageId),
+                'channel_id': channelId,
+                'guild_id': guildId,
+                'author': self.__userPayload(userId),
+                'member': self.__memberPayload(userId, isUserIncluded = False),
+                'content': 'x' * rand.randrange(10, 300),
+                'timestamp': self.__timestamp,
+                'edited_timestamp': self.__timestamp if eventType == 'MESSAGE_UPDATE' else None,
+                'tts': False,
+                'mention_everyone': False,
+                'mentions': list(),
+                'mention_roles': list(),
+                'attachments': list(),
+                'embeds': list(),
+                'pinned': False,
+                'type': 0,
+                'flags': 0
+            }
+        elif eventType == 'MESSAGE_DELETE':
+            return {
+                'id': str(self.__messageId - rand.randrange(1000)),
+                'channel_id': channelId,
+                'guild_id': guildId
+            }
+        elif eventType == 'MESSAGE_REACTION_ADD':
+            return {
+                'user_id': str(userId),
+                'channel_id': channelId,
+                'message_id': str(self.__messageId - rand.randrange(100)),
+                'guild_id': guildId,
+                'member': self.__memberPayload(userId),
+                'emoji': { 'id': None, 'name': '\U0001F44D' },
+                'burst': False,
+                'type': 0
+            }
+        elif eventType == 'PRESENCE_UPDATE':
+            return {
+                'user': { 'id': str(userId) },
+                'guild_id': guildId,
+                'status': 'online',
+                'activities': list(),
+                'client_status': { 'desktop': 'online' }
+            }
+        elif eventType == 'TYPING_START':
+            return {
+                'channel_id': channelId,
+                'guild_id': guildId,
+                'user_id': str(userId),
+                'timestamp': int(time.time()),
+                'member': self.__memberPayload(userId)
+            }
+        elif eventType == 'VOICE_STATE_UPDATE':
+            return {
+                'guild_id': guildId,
+                'channel_id': channelId if rand.random() < 0.5 else None,
+                'user_id': str(userId),
+                'member': self.__memberPayload(userId),
+                'session_id': 'synthetic',
+                'deaf': False,
+                'mute': False,
+                'self_deaf': False,
+                'self_mute': False,
+                'self_video': False,
+                'suppress': False,
+                'request_to_speak_timestamp': None
+            }
+        else:
+            raise ValueError(f'eventType argument is malformed: \"{eventType}\"')
+
+    def getBotUserId(self) -> int:
+        return 100000000000000000
+
+    def getChannelId(self, guildIndex: int, channelIndex: int) -> int:
+        return 300000000000000000 + guildIndex * 1000 + channelIndex
+
+    def getGuildId(self, guildIndex: int) -> int:
+        return 200000000000000000 + guildIndex
+
+    def getMemberIds(self, guildIndex: int) -> List[int]:
+        # members overlap between guilds, like they do for real
+        return [ 400000000000000000 + (guildIndex * 37 + memberIndex) % (self.__arguments.membersPerGuild * 4) for memberIndex in range(self.__arguments.membersPerGuild) ]
+
+    def __memberPayload(self, userId: int, isUserIncluded: bool = True) -> Dict[str, Any]:
+        member: Dict[str, Any] = {
+            'roles': list(),
+            'joined_at': self.__timestamp,
+            'deaf': False,
+            'mute': False,
+            'flags': 0
+        }
+
+        if isUserIncluded:
+            member['user'] = self.__userPayload(userId)
+
+        return member
+
+    def __userPayload(self, userId: int) -> Dict[str, Any]:
+        return {
+            'id': str(userId),
+            'username': f'discorduser{userId}',
+            'discriminator': '0001',
+            'global_name': None,
+            'avatar': None,
+            'bot': userId == self.getBotUserId()
+        }
+
+
+async def runProfile(profile: str, arguments: argparse.Namespace) -> Dict[str, Any]:
+    traffic = SyntheticGuildTraffic(arguments)
+    events = traffic.createEventTypes()
+    clientOptions = createClientOptions(profile, arguments.membersIntent)
+    intents: discord.Intents = clientOptions['intents']
+
+    discordGatewayStats = DiscordGatewayStats(
+        eventLoop = asyncio.get_running_loop(),
+        timber = SilentTimber()
+    )
+
+    gc.collect()
+    residentMemoryBefore = discordGatewayStats.getResidentMemoryBytes() or 0
+
+    # entering the bot does discord.py's async setup, the same as logging in would, minus the login
+    async with commands.Bot(**clientOptions) as bot:
+        state = bot._connection
+        isChunking: bool = state._chunk_guilds
+
+        # There's no gateway connection here to send chunk requests over, so discord.py is told
+        # not to, and the member chunks that Discord would have answered with are sent below.
+        state._chunk_guilds = False
+        state.user = discord.ClientUser(state = state, data = {
+            'id': str(traffic.getBotUserId()),
+            'username': 'cynanbot',
+            'discriminator': '0001',
+            'avatar': None,
+            'bot': True
+        })
+
+        latencies: List[float] = list()
+        dispatchSeconds: float = 0
+
+        def send(eventType: str, data: Dict[str, Any]):
+            discordGatewayStats.onEvent(eventType)
+            parseStart = time.perf_counter()
+            state.parsers[eventType](data)
+            latencies.append(time.perf_counter() - parseStart)
+
+        for guildIndex in range(arguments.guilds):
+            send('GUILD_CREATE', traffic.createGuildPayload(guildIndex, intents.members))
+
+            if isChunking:
+                for chunkPayload in traffic.createMemberChunkPayloads(guildIndex):
+                    send('GUILD_MEMBERS_CHUNK', chunkPayload)
+
+        for index, (eventType, guildIndex) in enumerate(events):
+            # the payload is always built, whether or not it's sent, so that both profiles stay in step
+            data = traffic.createPayload(eventType, guildIndex)
+
+            if eventTypesToIntents[eventType](intents):
+                send(eventType, data)
+
+            # lets whatever discord.py dispatched (e.g. on_message looking for commands) run
+            if index % 100 == 0:
+                dispatchStart = time.perf_counter()
+                await asyncio.sleep(0)
+                dispatchSeconds = dispatchSeconds + time.perf_counter() - dispatchStart
+
+        dispatchStart = time.perf_counter()
+        await asyncio.sleep(0)
+        dispatchSeconds = dispatchSeconds + time.perf_counter() - dispatchStart
+
+        gc.collect()
+        residentMemoryAfter = discordGatewayStats.getResidentMemoryBytes() or 0
+
+        cachedMessageCount = 0 if state._messages is None else len(state._messages)
+        cachedMemberCount = sum([ len(guild._members) for guild in bot.guilds ])
+
+    return {
+        'cachedMemberCount': cachedMemberCount,
+        'cachedMessageCount': cachedMessageCount,
+        'eventsGenerated': len(events) + arguments.guilds,
+        'eventsProcessed': discordGatewayStats.getEventCount(),
+        'eventTypesToCounts': discordGatewayStats.getEventTypesToCounts(),
+        'latencySeconds': summarizeLatencies(latencies),
+        # just the parsing and dispatching, not building the synthetic payloads
+        'processingSeconds': sum(latencies) + dispatchSeconds,
+        'residentMemoryBytes': residentMemoryAfter,
+        'residentMemoryGrowthBytes': residentMemoryAfter - residentMemoryBefore
+    }
+
+
+def runProfileInProcess(profile: str, arguments: argparse.Namespace) -> Dict[str, Any]:
+    return asyncio.run(runProfile(profile, arguments))
+
+
+def main(arguments: argparse.Namespace) -> int:
+    benchmarkResults = BenchmarkResults('discordGateway')
+    profilesToResults: Dict[str, Dict[str, Any]] = dict()
+
+    # a brand new process for each profile, so that neither one's memory is counted in the other's
+    context = multiprocessing.get_context('spawn')
+
+    for profile in [ 'before', 'after' ]:
+        with context.Pool(1) as pool:
+            result = pool.apply(runProfileInProcess, (profile, arguments))
+
+        result = {
+            'backend': profile,
+            'benchmark': 'gatewayEvents',
+            'channelCount': arguments.guilds * arguments.channelsPerGuild,
+            'guildCount': arguments.guilds,
+            'isMembersIntentEnabled': arguments.membersIntent,
+            'minutes': arguments.minutes,
+            'peakMemoryBytes': result['residentMemoryGrowthBytes'],
+            'userCount': arguments.guilds * arguments.membersPerGuild,
+            **result
+        }
+
+        profilesToResults[profile] = result
+        benchmarkResults.add(result)
+
+        eventTypes = sorted(result['eventTypesToCounts'].keys())
+        print(f'{profile}: {result["eventsProcessed"]} of {result["eventsGenerated"]} event(s) processed in {result["processingSeconds"]:.2f}s, p50={result["latencySeconds"]["p50"] * 1000000:.1f}us p95={result["latencySeconds"]["p95"] * 1000000:.1f}us per event')
+        print(f'{profile}: resident memory {result["residentMemoryBytes"] / 1048576:.1f} MB (+{result["residentMemoryGrowthBytes"] / 1048576:.1f} MB), {result["cachedMessageCount"]} cached message(s), {result["cachedMemberCount"]} cached member(s)')
+        print(f'{profile}: ' + ', '.join([ f'{eventType}={result["eventTypesToCounts"][eventType]}' for eventType in eventTypes ]))
+
+    before = profilesToResults['before']
+    after = profilesToResults['after']
+    print(f'events processed: {before["eventsProcessed"]} -> {after["eventsProcessed"]} ({after["eventsProcessed"] / max(before["eventsProcessed"], 1) * 100:.1f}%)')
+    print(f'CPU spent on gateway events: {before["processingSeconds"]:.2f}s -> {after["processingSeconds"]:.2f}s')
+    print(f'resident memory: {before["residentMemoryBytes"] / 1048576:.1f} MB -> {after["residentMemoryBytes"] / 1048576:.1f} MB')
+
+    benchmarkResults.writeTo(arguments.output)
+    print(f'Wrote {len(benchmarkResults.getResults())} result(s) to \"{arguments.output}\"')
+
+    if utils.isValidStr(arguments.compare):
+        regressions: List[str] = benchmarkResults.compareTo(arguments.compare, arguments.tolerance)
+
+        if utils.hasItems(regressions):
+            for regression in regressions:
+                print(f'REGRESSION {regression}')
+
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Compares gateway events processed and resident memory between the old and current Discord intents and caches')
+    parser.add_argument('--channelUpdatesPerMinute', type = float, default = 0.05, help = 'per guild, like every rate below')
+    parser.add_argument('--channelsPerGuild', type = int, default = 10)
+    parser.add_argument('--compare', default = None, help = 'previous results file to check for regressions against')
+    parser.add_argument('--guilds', type = int, default = 50)
+    parser.add_argument('--memberJoinsPerMinute', type = float, default = 0.2, help = 'joins, and as many leaves')
+    parser.add_argument('--membersIntent', action = 'store_true', help = 'as if discordMembersIntentEnabled were on, for both profiles')
+    parser.add_argument('--membersPerGuild', type = int, default = 200)
+    parser.add_argument('--memberUpdatesPerMinute', type = float, default = 1)
+    parser.add_argument('--messageDeletesPerMinute', type = float, default = 2)
+    parser.add_argument('--messageEditsPerMinute', type = float, default = 3)
+    parser.add_argument('--messagesPerMinute', type = float, default = 30)
+    parser.add_argument('--minutes', type = float, default = 60, help = 'how much traffic to generate')
+    parser.add_argument('--output', default = 'discordGatewayBenchmark.json')
+    parser.add_argument('--presencesPerMinute', type = float, default = 40, help = 'only ever sent with the presences intent, which neither profile has')
+    parser.add_argument('--reactionsPerMinute', type = float, default = 10)
+    parser.add_argument('--tolerance', type = float, default = 0.2, help = 'allowed slowdown before a result counts as a regression')
+    parser.add_argument('--typingPerMinute', type = float, default = 15)
+    parser.add_argument('--voiceStatesPerMinute', type = float, default = 3)
+
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,544 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from asyncio import AbstractEventLoop
+from typing import (Any, AsyncIterator, Callable, Dict, List, Optional, Set,
+                    Tuple)
+
+import discord
+
+import CynanBotCommon.utils as utils
+from announcedStreamsRepository import AnnouncedStreamsRepository
+from authRepository import AuthRepository
+from benchmarks.apiCallCounter import ApiCallCounter
+from benchmarks.benchmarkResults import summarizeLatencies
+from benchmarks.fakeDiscordServer import FakeDiscordServer
+from benchmarks.fakeHelixServer import FakeHelixServer
+from benchmarks.fakeTwitchDependencies import (FakeTwitchHandleProvider,
+                                               FakeTwitchTokensRepository,
+                                               SilentTimber)
+from benchmarks.faultInjection import FaultInjection
+from benchmarks.harnessTwitchApiService import HarnessTwitchApiService
+from CynanBotCommon.storage.backingSqliteDatabase import BackingSqliteDatabase
+from cynanBotDiscord import CynanBotDiscord
+from databaseSchemaRegistry import DatabaseSchemaRegistry
+from discordRestScheduler import DiscordRestPriority, DiscordRestScheduler
+from eventLoopFactory import EventLoopFactory
+from eventLoopType import EventLoopType
+from generalSettingsRepository import GeneralSettingsRepository
+from rosterPruner import RosterPruner
+from rosterVersionRepository import RosterVersionRepository
+from startupHelper import StartupHelper
+from twitchAnnounceChannelsRepository import TwitchAnnounceChannelsRepository
+from twitchAnnounceSettingsRepository import TwitchAnnounceSettingsRepository
+from twitchAnnounceSettingsSnapshot import TwitchAnnounceSettingsSnapshot
+from twitchLiveHelper import TwitchLiveHelper
+from twitchLiveUsersRepository import (TwitchLiveUserData,
+                                       TwitchLiveUsersRepository)
+from twitchUserIdsRepository import TwitchUserIdsRepository
+from twitchUsersImportExportHelper import TwitchUsersImportExportHelper
+from user import User
+from usersRepository import UsersRepository
+
+# Runs the real CynanBotDiscord poll/announce loop against local fake Discord and Helix servers
+# and reports detection-to-message latency. Run from the repository root, for example:
+#   python -m benchmarks.endToEndHarness --output harness.json
+#   python -m benchmarks.endToEndHarness --scenario myScenario.json
+
+defaultScenario: Dict[str, Any] = {
+    'durationSeconds': 60,
+    'cycleSeconds': 5,
+    'users': 100,
+    'guilds': 4,
+    'channelsPerGuild': 5,
+    'storms': [
+        { 'atSeconds': 3, 'goLive': 30 },
+        { 'atSeconds': 20, 'goLive': 40 },
+        { 'atSeconds': 40, 'goOffline': 20 },
+        { 'atSeconds': 42, 'goLive': 20 }
+    ],
+    'helix': {
+        'latencyMs': 80,
+        'latencyJitterMs': 40,
+        'rateLimitedRate': 0.02,
+        'rateLimitPerMinute': 800,
+        'outages': [ { 'startSeconds': 30, 'endSeconds': 36 } ]
+    },
+    'discord': {
+        'latencyMs': 40,
+        'latencyJitterMs': 40,
+        'rateLimitedRate': 0.01,
+        'outages': list()
+    }
+}
+
+
+class HarnessTwitchAnnounceSettingsSnapshot(TwitchAnnounceSettingsSnapshot):
+
+    def __init__(
+        self,
+        jsonContents: Dict[str, Any],
+        twitchAnnounceSettingsFile: str,
+        announcedStreamTimeToLiveMinutes: float,
+        refreshEveryMinutes: float
+    ):
+        super().__init__(jsonContents, twitchAnnounceSettingsFile)
+
+        self.__announcedStreamTimeToLiveMinutes: float = announcedStreamTimeToLiveMinutes
+        self.__refreshEveryMinutes: float = refreshEveryMinutes
+
+    def getAnnouncedStreamTimeToLiveMinutes(self) -> float:
+        return self.__announcedStreamTimeToLiveMinutes
+
+    def getRefreshEveryMinutes(self) -> float:
+        return self.__refreshEveryMinutes
+
+
+class HarnessTwitchAnnounceSettingsRepository(TwitchAnnounceSettingsRepository):
+
+    # The real settings snapshot refuses refresh intervals below five minutes, which is far too
+    # slow for a load test, so the harness supplies its own (much shorter) intervals.
+
+    def __init__(
+        self,
+        twitchAnnounceSettingsFile: str,
+        announcedStreamTimeToLiveMinutes: float,
+        refreshEveryMinutes: float
+    ):
+        super().__init__(twitchAnnounceSettingsFile)
+
+        self.__snapshot: TwitchAnnounceSettingsSnapshot = HarnessTwitchAnnounceSettingsSnapshot(
+            jsonContents = { 'harness': True },
+            twitchAnnounceSettingsFile = twitchAnnounceSettingsFile,
+            announcedStreamTimeToLiveMinutes = announcedStreamTimeToLiveMinutes,
+            refreshEveryMinutes = refreshEveryMinutes
+        )
+
+    def getAll(self) -> TwitchAnnounceSettingsSnapshot:
+        return self.__snapshot
+
+    async def getAllAsync(self) -> TwitchAnnounceSettingsSnapshot:
+        return self.__snapshot
+
+
+class CycleCountingTwitchLiveUsersRepository(TwitchLiveUsersRepository):
+
+    def __init__(
+        self,
+        onCycleStarted: Callable[[], None],
+        onCycleFetched: Callable[[float, float], None],
+        eventLoop: AbstractEventLoop,
+        announcedStreamsRepository: AnnouncedStreamsRepository,
+        twitchAnnounceChannelsRepository: TwitchAnnounceChannelsRepository,
+        twitchLiveHelper: TwitchLiveHelper,
+        usersRepository: UsersRepository
+    ):
+        super().__init__(
+            eventLoop = eventLoop,
+            announcedStreamsRepository = announcedStreamsRepository,
+            twitchAnnounceChannelsRepository = twitchAnnounceChannelsRepository,
+            twitchLiveHelper = twitchLiveHelper,
+            usersRepository = usersRepository
+        )
+
+        self.__onCycleStarted: Callable[[], None] = onCycleStarted
+        self.__onCycleFetched: Callable[[float, float], None] = onCycleFetched
+
+    async def streamTwitchLiveUserData(self) -> AsyncIterator[TwitchLiveUserData]:
+        # Announcements go out while the cycle is still being fetched, and a slow announcer holds
+        # the fetch back, so this measures the cycle as a whole rather than only its Helix calls
+        self.__onCycleStarted()
+        startTime = time.monotonic()
+
+        async for twitchLiveUserData in super().streamTwitchLiveUserData():
+            yield twitchLiveUserData
+
+        self.__onCycleFetched(startTime, time.monotonic())
+
+
+class EndToEndHarness():
+
+    def __init__(
+        self,
+        eventLoop: AbstractEventLoop,
+        scenario: Dict[str, Any],
+        workingDirectory: str
+    ):
+        if not isinstance(eventLoop, AbstractEventLoop):
+            raise ValueError(f'eventLoop argument is malformed: \"{eventLoop}\"')
+        elif not utils.hasItems(scenario):
+            raise ValueError(f'scenario argument is malformed: \"{scenario}\"')
+        elif not utils.isValidStr(workingDirectory):
+            raise ValueError(f'workingDirectory argument is malformed: \"{workingDirectory}\"')
+
+        self.__eventLoop: AbstractEventLoop = eventLoop
+        self.__scenario: Dict[str, Any] = scenario
+        self.__workingDirectory: str = workingDirectory
+
+        self.__random: random.Random = random.Random(27)
+        self.__helixApiCallCounter: ApiCallCounter = ApiCallCounter()
+        self.__discordApiCallCounter: ApiCallCounter = ApiCallCounter()
+        self.__cycleApiCalls: List[Dict[str, int]] = list()
+        self.__twitchLoginPattern = re.compile(r'https://twitch\.tv/(\S+)')
+        self.__discordRestScheduler: Optional[DiscordRestScheduler] = None
+        self.__cycleFetchTimes: List[Tuple[float, float]] = list()
+
+    def __buildRoster(self) -> Dict[int, List[User]]:
+        channelIdsToUsers: Dict[int, List[User]] = dict()
+        channelIds: List[int] = list()
+
+        for guildIndex in range(self.__scenario['guilds']):
+            for channelIndex in range(self.__scenario['channelsPerGuild']):
+                channelId = 110000000000000000 + (guildIndex * 1000) + channelIndex
+                channelIds.append(channelId)
+                channelIdsToUsers[channelId] = list()
+
+        for index in range(self.__scenario['users']):
+            user = User(
+                discordDiscriminator = '0001',
+                discordId = str(210000000000000000 + index),
+                discordName = f'discorduser{index}',
+                twitchName = f'twitchuser{index}'
+            )
+
+            for channelId in self.__random.sample(channelIds, min(2, len(channelIds))):
+                channelIdsToUsers[channelId].append(user)
+
+        return channelIdsToUsers
+
+    def __guildIdForChannelId(self, channelId: int) -> int:
+        return 120000000000000000 + ((channelId - 110000000000000000) // 1000)
+
+    def __onCycleFetched(self, startTime: float, endTime: float):
+        self.__cycleFetchTimes.append((startTime, endTime))
+
+    def __onCycleStarted(self):
+        self.__cycleApiCalls.append({
+            **self.__discordApiCallCounter.snapshot(),
+            **self.__helixApiCallCounter.snapshot()
+        })
+
+    async def run(self) -> Dict[str, Any]:
+        channelIdsToUsers = self.__buildRoster()
+        guildIdsToChannelIds: Dict[int, List[int]] = dict()
+        guildIdsToMemberIds: Dict[int, Set[str]] = dict()
+        allTwitchNames: List[str] = list()
+
+        for channelId, users in channelIdsToUsers.items():
+            guildId = self.__guildIdForChannelId(channelId)
+            guildIdsToChannelIds.setdefault(guildId, list()).append(channelId)
+            memberIds = guildIdsToMemberIds.setdefault(guildId, set())
+
+            for user in users:
+                memberIds.add(user.getDiscordId())
+
+                if user.getTwitchName() not in allTwitchNames:
+                    allTwitchNames.append(user.getTwitchName())
+
+        helixFaultInjection = FaultInjection.fromJson(self.__scenario.get('helix'))
+        discordFaultInjection = FaultInjection.fromJson(self.__scenario.get('discord'))
+
+        fakeHelixServer = FakeHelixServer(
+            faultInjection = helixFaultInjection,
+            apiCallCounter = self.__helixApiCallCounter,
+            rateLimitPerMinute = self.__scenario.get('helix', dict()).get('rateLimitPerMinute', 800)
+        )
+
+        fakeDiscordServer = FakeDiscordServer(
+            faultInjection = discordFaultInjection,
+            apiCallCounter = self.__discordApiCallCounter,
+            guildIdsToChannelIds = guildIdsToChannelIds,
+            guildIdsToMemberIds = guildIdsToMemberIds
+        )
+
+        await fakeHelixServer.start()
+        await fakeDiscordServer.start()
+        discord.http.Route.BASE = f'{fakeDiscordServer.getBaseUrl()}/api/v10'
+
+        cynanBotDiscord, twitchApiService = await self.__buildBot(channelIdsToUsers, fakeHelixServer)
+        botTask = self.__eventLoop.create_task(cynanBotDiscord.start('harness'))
+        await cynanBotDiscord.wait_until_ready()
+
+        helixFaultInjection.resetClock()
+        discordFaultInjection.resetClock()
+        await self.__runStorms(fakeHelixServer, allTwitchNames)
+
+        await cynanBotDiscord.close()
+        await twitchApiService.close()
+        await asyncio.gather(botTask, return_exceptions = True)
+        await fakeDiscordServer.stop()
+        await fakeHelixServer.stop()
+
+        return self.__buildReport(fakeDiscordServer, fakeHelixServer)
+
+    async def __buildBot(
+        self,
+        channelIdsToUsers: Dict[int, List[User]],
+        fakeHelixServer: FakeHelixServer
+    ):
+        authFile = os.path.join(self.__workingDirectory, 'authFile.json')
+        generalSettingsFile = os.path.join(self.__workingDirectory, 'generalSettings.json')
+
+        with open(authFile, 'w') as file:
+            json.dump({ 'discordToken': 'harness', 'twitchClientId': 'harness', 'twitchClientSecret': 'harness', 'twitchHandle': 'cynanbot' }, file)
+
+        with open(generalSettingsFile, 'w') as file:
+            json.dump({ 'databaseType': 'sqlite', 'networkClientType': 'aiohttp', 'refreshEverySeconds': self.__scenario['cycleSeconds'] }, file)
+
+        backingDatabase = BackingSqliteDatabase(
+            eventLoop = self.__eventLoop,
+            databaseFile = os.path.join(self.__workingDirectory, 'harness.sqlite')
+        )
+
+        databaseSchemaRegistry = DatabaseSchemaRegistry(
+            backingDatabase = backingDatabase
+        )
+
+        rosterVersionRepository = RosterVersionRepository(
+            backingDatabase = backingDatabase,
+            databaseSchemaRegistry = databaseSchemaRegistry
+        )
+
+        usersRepository = UsersRepository(
+            backingDatabase = backingDatabase,
+            databaseSchemaRegistry = databaseSchemaRegistry,
+            rosterVersionRepository = rosterVersionRepository
+        )
+
+        twitchAnnounceChannelsRepository = TwitchAnnounceChannelsRepository(
+            backingDatabase = backingDatabase,
+            databaseSchemaRegistry = databaseSchemaRegistry,
+            rosterVersionRepository = rosterVersionRepository,
+            usersRepository = usersRepository
+        )
+
+        for channelId, users in channelIdsToUsers.items():
+            for user in users:
+                await twitchAnnounceChannelsRepository.addUser(user, channelId)
+
+        twitchAnnounceSettingsRepository = HarnessTwitchAnnounceSettingsRepository(
+            twitchAnnounceSettingsFile = os.path.join(self.__workingDirectory, 'twitchAnnounceSettings.json'),
+            announcedStreamTimeToLiveMinutes = self.__scenario['durationSeconds'] / 60,
+            refreshEveryMinutes = (self.__scenario['cycleSeconds'] / 2) / 60
+        )
+
+        authRepository = AuthRepository(authFile)
+        timber = SilentTimber()
+        twitchApiService = HarnessTwitchApiService(fakeHelixServer.getBaseUrl())
+        twitchHandleProvider = FakeTwitchHandleProvider()
+        twitchTokensRepository = FakeTwitchTokensRepository()
+
+        twitchUserIdsRepository = TwitchUserIdsRepository(
+            backingDatabase = backingDatabase,
+            databaseSchemaRegistry = databaseSchemaRegistry,
+            timber = timber,
+            twitchHandleProviderInterface = twitchHandleProvider,
+            twitchHelixApiService = twitchApiService,
+            twitchTokensRepository = twitchTokensRepository
+        )
+
+        announcedStreamsRepository = AnnouncedStreamsRepository(
+            backingDatabase = backingDatabase,
+            databaseSchemaRegistry = databaseSchemaRegistry,
+            timber = timber,
+            twitchAnnounceSettingsRepository = twitchAnnounceSettingsRepository
+        )
+
+        self.__discordRestScheduler = DiscordRestScheduler(
+            eventLoop = self.__eventLoop,
+            timber = timber
+        )
+
+        cynanBotDiscord = CynanBotDiscord(
+            eventLoop = self.__eventLoop,
+            authRepository = authRepository,
+            discordRestScheduler = self.__discordRestScheduler,
+            generalSettingsRepository = GeneralSettingsRepository(generalSettingsFile),
+            rosterPruner = RosterPruner(
+                eventLoop = self.__eventLoop,
+                timber = timber,
+                twitchAnnounceChannelsRepository = twitchAnnounceChannelsRepository
+            ),
+            startupHelper = StartupHelper(
+                announcedStreamsRepository = announcedStreamsRepository,
+                authRepository = authRepository,
+                rosterVersionRepository = rosterVersionRepository,
+                timber = timber,
+                twitchAnnounceChannelsRepository = twitchAnnounceChannelsRepository,
+                twitchAnnounceSettingsRepository = twitchAnnounceSettingsRepository,
+                twitchTokensRepository = twitchTokensRepository,
+                twitchUserIdsRepository = twitchUserIdsRepository,
+                usersRepository = usersRepository
+            ),
+            timber = timber,
+            twitchAnnounceChannelsRepository = twitchAnnounceChannelsRepository,
+            twitchAnnounceSettingsRepository = twitchAnnounceSettingsRepository,
+            twitchLiveUsersRepository = CycleCountingTwitchLiveUsersRepository(
+                onCycleStarted = self.__onCycleStarted,
+                onCycleFetched = self.__onCycleFetched,
+                eventLoop = self.__eventLoop,
+                announcedStreamsRepository = announcedStreamsRepository,
+                twitchAnnounceChannelsRepository = twitchAnnounceChannelsRepository,
+                twitchLiveHelper = TwitchLiveHelper(
+                    timber = timber,
+                    twitchHandleProviderInterface = twitchHandleProvider,
+                    twitchHelixApiService = twitchApiService,
+                    twitchTokensRepository = twitchTokensRepository,
+                    twitchUserIdsRepository = twitchUserIdsRepository,
+                    usersRepository = usersRepository
+                ),
+                usersRepository = usersRepository
+            ),
+            twitchUserIdsRepository = twitchUserIdsRepository,
+            twitchUsersImportExportHelper = TwitchUsersImportExportHelper(
+                timber = timber,
+                twitchAnnounceChannelsRepository = twitchAnnounceChannelsRepository,
+                twitchUserIdsRepository = twitchUserIdsRepository
+            )
+        )
+
+        return cynanBotDiscord, twitchApiService
+
+    def __buildReport(
+        self,
+        fakeDiscordServer: FakeDiscordServer,
+        fakeHelixServer: FakeHelixServer
+    ) -> Dict[str, Any]:
+        announceLatencies: List[float] = list()
+        firstAnnounceLatencies: Dict[str, float] = dict()
+
+        for message in fakeDiscordServer.getMessages():
+            match = self.__twitchLoginPattern.search(message.getContent())
+            if match is None:
+                continue
+
+            userLogin = match.group(1)
+            wentLiveTime = fakeHelixServer.getWentLiveTime(userLogin)
+            if wentLiveTime is None:
+                continue
+
+            latency = message.getReceivedTime() - wentLiveTime
+            announceLatencies.append(latency)
+
+            if userLogin not in firstAnnounceLatencies:
+                firstAnnounceLatencies[userLogin] = latency
+
+        # the first snapshot only holds startup traffic (login, gateway, roster seeding)
+        cycleApiCalls = self.__cycleApiCalls[1:]
+        self.__onCycleStarted()
+        cycleApiCalls.append(self.__cycleApiCalls[-1])
+
+        report: Dict[str, Any] = {
+            'announceMessageCount': len(announceLatencies),
+            'announcedStreamerCount': len(firstAnnounceLatencies),
+            'apiCallTotals': {
+                **self.__discordApiCallCounter.getTotals(),
+                **self.__helixApiCallCounter.getTotals()
+            },
+            'cycleApiCalls': cycleApiCalls,
+            'cycleCount': len(cycleApiCalls),
+            'scenario': self.__scenario
+        }
+
+        if utils.hasItems(self.__cycleFetchTimes):
+            report['cycleFetchSeconds'] = summarizeLatencies([ endTime - startTime for startTime, endTime in self.__cycleFetchTimes ])
+
+        # Fan-out throughput is how quickly a cycle's announcements go out once its live users are
+        # known: every message sent between the end of a cycle's fetch and the start of the next
+        # cycle, over the time from that fetch ending until the last of those messages arrived.
+        fanOutMessageCount = 0
+        fanOutSeconds: float = 0
+        messageTimes = sorted(message.getReceivedTime() for message in fakeDiscordServer.getMessages())
+
+        for index, (_, fetchEndTime) in enumerate(self.__cycleFetchTimes):
+            nextCycleStartTime = self.__cycleFetchTimes[index + 1][0] if index + 1 < len(self.__cycleFetchTimes) else float('inf')
+            cycleMessageTimes = [ messageTime for messageTime in messageTimes if fetchEndTime <= messageTime < nextCycleStartTime ]
+
+            if utils.hasItems(cycleMessageTimes):
+                fanOutMessageCount = fanOutMessageCount + len(cycleMessageTimes)
+                fanOutSeconds = fanOutSeconds + (cycleMessageTimes[len(cycleMessageTimes) - 1] - fetchEndTime)
+
+        if fanOutSeconds > 0:
+            report['announceFanOutPerSecond'] = fanOutMessageCount / fanOutSeconds
+
+        if self.__discordRestScheduler is not None:
+            report['discordRestMedianWaitSeconds'] = { priority.toStr(): self.__discordRestScheduler.getMedianWaitSeconds(priority) for priority in DiscordRestPriority }
+
+        if utils.hasItems(announceLatencies):
+            report['announceLatencySeconds'] = summarizeLatencies(announceLatencies)
+            report['firstAnnounceLatencySeconds'] = summarizeLatencies(list(firstAnnounceLatencies.values()))
+
+        return report
+
+    async def __runStorms(
+        self,
+        fakeHelixServer: FakeHelixServer,
+        allTwitchNames: List[str]
+    ):
+        elapsedSeconds = 0
+        offlineTwitchNames: List[str] = list(allTwitchNames)
+        liveTwitchNames: List[str] = list()
+
+        for storm in sorted(self.__scenario.get('storms', list()), key = lambda storm: storm['atSeconds']):
+            await asyncio.sleep(max(0, storm['atSeconds'] - elapsedSeconds))
+            elapsedSeconds = storm['atSeconds']
+
+            goLive = offlineTwitchNames[:storm.get('goLive', 0)]
+            if utils.hasItems(goLive):
+                del offlineTwitchNames[:len(goLive)]
+                liveTwitchNames.extend(goLive)
+                fakeHelixServer.goLive(goLive)
+
+            goOffline = liveTwitchNames[:storm.get('goOffline', 0)]
+            if utils.hasItems(goOffline):
+                del liveTwitchNames[:len(goOffline)]
+                offlineTwitchNames.extend(goOffline)
+                fakeHelixServer.goOffline(goOffline)
+
+        await asyncio.sleep(max(0, self.__scenario['durationSeconds'] - elapsedSeconds))
+
+
+async def main(eventLoop: AbstractEventLoop, arguments: argparse.Namespace) -> int:
+    scenario = dict(defaultScenario)
+
+    if utils.isValidStr(arguments.scenario):
+        with open(arguments.scenario, 'r') as file:
+            scenario.update(json.load(file))
+
+    with tempfile.TemporaryDirectory() as workingDirectory:
+        harness = EndToEndHarness(
+            eventLoop = eventLoop,
+            scenario = scenario,
+            workingDirectory = workingDirectory
+        )
+
+        report = await harness.run()
+
+    with open(arguments.output, 'w') as file:
+        json.dump(report, file, indent = 4, sort_keys = True)
+
+    latencies = report.get('announceLatencySeconds')
+    if latencies is None:
+        print(f'No announcements were made! Wrote report to \"{arguments.output}\"')
+        return 1
+
+    print(f'{report["announceMessageCount"]} announcement(s) over {report["cycleCount"]} cycle(s): p50={latencies["p50"]:.3f}s p95={latencies["p95"]:.3f}s p99={latencies["p99"]:.3f}s')
+    print(f'Wrote report to \"{arguments.output}\"')
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'End-to-end load harness for CynanBotDiscord with local fake Discord and Helix servers')
+    parser.add_argument('--eventLoop', default = 'asyncio', choices = [ eventLoopType.toStr() for eventLoopType in EventLoopType ])
+    parser.add_argument('--output', default = 'endToEndHarness.json')
+    parser.add_argument('--scenario', default = None, help = 'JSON file overriding keys of the default scenario')
+    arguments = parser.parse_args()
+
+    eventLoop = EventLoopFactory().create(EventLoopType.fromStr(arguments.eventLoop))
+    sys.exit(eventLoop.run_until_complete(main(eventLoop, arguments)))
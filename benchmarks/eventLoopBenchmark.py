@@ -0,0 +1,111 @@
+import argparse
+import json
+import sys
+import tempfile
+from typing import Any, Dict, List
+
+import CynanBotCommon.utils as utils
+from benchmarks.benchmarkResults import BenchmarkResults
+from benchmarks.endToEndHarness import EndToEndHarness, defaultScenario
+from eventLoopFactory import EventLoopFactory
+from eventLoopType import EventLoopType
+
+# Runs the end-to-end harness (the real poll/announce loop against local fake Discord and Helix
+# servers) once on each event loop, and compares poll cycle time and announcement fan-out
+# throughput. Run from the repository root, for example:
+#   python -m benchmarks.eventLoopBenchmark --output eventLoop.json
+#   python -m benchmarks.eventLoopBenchmark --scenario myScenario.json --compare eventLoop.json
+
+
+def runHarness(eventLoopType: EventLoopType, scenario: Dict[str, Any]) -> Dict[str, Any]:
+    eventLoopFactory = EventLoopFactory()
+    eventLoop = eventLoopFactory.create(eventLoopType)
+
+    if eventLoopFactory.getFallbackReason() is not None:
+        eventLoop.close()
+        raise RuntimeError(eventLoopFactory.getFallbackReason())
+
+    try:
+        with tempfile.TemporaryDirectory() as workingDirectory:
+            harness = EndToEndHarness(
+                eventLoop = eventLoop,
+                scenario = scenario,
+                workingDirectory = workingDirectory
+            )
+
+            return eventLoop.run_until_complete(harness.run())
+    finally:
+        eventLoop.close()
+
+
+def main(arguments: argparse.Namespace) -> int:
+    scenario = dict(defaultScenario)
+
+    if utils.isValidStr(arguments.scenario):
+        with open(arguments.scenario, 'r') as file:
+            scenario.update(json.load(file))
+
+    benchmarkResults = BenchmarkResults('eventLoop')
+    reports: Dict[EventLoopType, Dict[str, Any]] = dict()
+
+    for eventLoopType in [ EventLoopType.fromStr(eventLoop) for eventLoop in arguments.eventLoops ]:
+        try:
+            report = runHarness(eventLoopType, scenario)
+        except RuntimeError as e:
+            print(f'Skipping the {eventLoopType.toStr()} event loop: {e}')
+            continue
+
+        if 'cycleFetchSeconds' not in report or 'announceLatencySeconds' not in report:
+            print(f'The {eventLoopType.toStr()} event loop run made no announcements, skipping it')
+            continue
+
+        reports[eventLoopType] = report
+
+        benchmarkResults.add({
+            'announceFanOutPerSecond': report.get('announceFanOutPerSecond', 0),
+            'announceLatencySeconds': report['announceLatencySeconds'],
+            'announceMessageCount': report['announceMessageCount'],
+            'backend': eventLoopType.toStr(),
+            'benchmark': 'EndToEndHarness.cycle',
+            'channelCount': scenario['guilds'] * scenario['channelsPerGuild'],
+            'cycleCount': report['cycleCount'],
+            # compareTo() checks for regressions in latencySeconds, which here is poll cycle time.
+            # Both runs share one process, so there's no meaningful per-run peak memory to report.
+            'latencySeconds': report['cycleFetchSeconds'],
+            'peakMemoryBytes': 0,
+            'userCount': scenario['users']
+        })
+
+        print(f'{eventLoopType.toStr()}: cycle p50={report["cycleFetchSeconds"]["p50"] * 1000:.1f}ms p95={report["cycleFetchSeconds"]["p95"] * 1000:.1f}ms, fan-out={report.get("announceFanOutPerSecond", 0):.1f} msg/s, announce p50={report["announceLatencySeconds"]["p50"]:.3f}s')
+
+    if EventLoopType.ASYNCIO in reports and EventLoopType.UVLOOP in reports:
+        asyncioReport = reports[EventLoopType.ASYNCIO]
+        uvloopReport = reports[EventLoopType.UVLOOP]
+        cycleSpeedup = asyncioReport['cycleFetchSeconds']['p50'] / max(uvloopReport['cycleFetchSeconds']['p50'], 0.000001)
+        fanOutSpeedup = uvloopReport.get('announceFanOutPerSecond', 0) / max(asyncioReport.get('announceFanOutPerSecond', 0), 0.000001)
+        print(f'uvloop vs asyncio: {cycleSpeedup:.2f}x cycle time (p50), {fanOutSpeedup:.2f}x announcement fan-out throughput')
+
+    benchmarkResults.writeTo(arguments.output)
+    print(f'Wrote {len(benchmarkResults.getResults())} result(s) to \"{arguments.output}\"')
+
+    if utils.isValidStr(arguments.compare):
+        regressions: List[str] = benchmarkResults.compareTo(arguments.compare, arguments.tolerance)
+
+        if utils.hasItems(regressions):
+            for regression in regressions:
+                print(f'REGRESSION {regression}')
+
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Compares the asyncio and uvloop event loops through the end-to-end harness')
+    parser.add_argument('--compare', default = None, help = 'previous results file to check for regressions against')
+    parser.add_argument('--eventLoops', nargs = '+', default = [ 'asyncio', 'uvloop' ], choices = [ eventLoopType.toStr() for eventLoopType in EventLoopType ])
+    parser.add_argument('--output', default = 'eventLoopBenchmark.json')
+    parser.add_argument('--scenario', default = None, help = 'JSON file overriding keys of the default scenario')
+    parser.add_argument('--tolerance', type = float, default = 0.2, help = 'allowed slowdown before a result counts as a regression')
+
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,385 @@
+import asyncio
+import re
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Pattern, Set, Tuple
+
+from aiohttp import WSMsgType, web
+
+import CynanBotCommon.utils as utils
+from benchmarks.apiCallCounter import ApiCallCounter
+from benchmarks.faultInjection import FaultInjection
+
+
+class FakeDiscordMessage():
+
+    def __init__(
+        self,
+        discordChannelId: int,
+        content: str,
+        receivedTime: float
+    ):
+        self.__discordChannelId: int = discordChannelId
+        self.__content: str = content
+        self.__receivedTime: float = receivedTime
+
+    def getContent(self) -> str:
+        return self.__content
+
+    def getDiscordChannelId(self) -> int:
+        return self.__discordChannelId
+
+    def getReceivedTime(self) -> float:
+        return self.__receivedTime
+
+
+class FakeDiscordServer():
+
+    # Just enough of the Discord REST API and gateway for discord.py to log in, become ready,
+    # and for CynanBotDiscord to fetch channels and members and send messages. Each route has
+    # its own rate limit bucket (keyed on the route's major parameter, like Discord does), and
+    # requests beyond a bucket's limit get a real-looking 429 so that discord.py's own rate
+    # limit handling is exercised.
+
+    routeLimits: Dict[str, Tuple[int, float]] = {
+        'GET /channels/{id}': (50, 1),
+        'GET /guilds/{id}/members/{id}': (10, 10),
+        'POST /channels/{id}/messages': (5, 5)
+    }
+
+    def __init__(
+        self,
+        faultInjection: FaultInjection,
+        apiCallCounter: ApiCallCounter,
+        guildIdsToChannelIds: Dict[int, List[int]],
+        guildIdsToMemberIds: Dict[int, Set[str]],
+        heartbeatIntervalMs: int = 41250,
+        host: str = '127.0.0.1'
+    ):
+        if not isinstance(faultInjection, FaultInjection):
+            raise ValueError(f'faultInjection argument is malformed: \"{faultInjection}\"')
+        elif not isinstance(apiCallCounter, ApiCallCounter):
+            raise ValueError(f'apiCallCounter argument is malformed: \"{apiCallCounter}\"')
+        elif not utils.hasItems(guildIdsToChannelIds):
+            raise ValueError(f'guildIdsToChannelIds argument is malformed: \"{guildIdsToChannelIds}\"')
+        elif guildIdsToMemberIds is None:
+            raise ValueError(f'guildIdsToMemberIds argument is malformed: \"{guildIdsToMemberIds}\"')
+        elif not utils.isValidInt(heartbeatIntervalMs):
+            raise ValueError(f'heartbeatIntervalMs argument is malformed: \"{heartbeatIntervalMs}\"')
+        elif not utils.isValidStr(host):
+            raise ValueError(f'host argument is malformed: \"{host}\"')
+
+        self.__faultInjection: FaultInjection = faultInjection
+        self.__apiCallCounter: ApiCallCounter = apiCallCounter
+        self.__guildIdsToChannelIds: Dict[int, List[int]] = guildIdsToChannelIds
+        self.__guildIdsToMemberIds: Dict[int, Set[str]] = guildIdsToMemberIds
+        self.__heartbeatIntervalMs: int = heartbeatIntervalMs
+        self.__host: str = host
+
+        self.__botUserId: str = '300000000000000000'
+        self.__channelIdsToGuildIds: Dict[int, int] = dict()
+        for guildId, channelIds in guildIdsToChannelIds.items():
+            for channelId in channelIds:
+                self.__channelIdsToGuildIds[channelId] = guildId
+
+        self.__buckets: Dict[str, Tuple[float, int]] = dict()
+        self.__messages: List[FakeDiscordMessage] = list()
+        self.__messageIdCounter: int = 400000000000000000
+        self.__runner: Optional[web.AppRunner] = None
+        self.__baseUrl: Optional[str] = None
+        self.__snowflakePattern: Pattern = re.compile(r'\d{5,}')
+
+    def __botUser(self) -> Dict[str, Any]:
+        return {
+            'id': self.__botUserId,
+            'username': 'CynanBotHarness',
+            'discriminator': '0001',
+            'avatar': None,
+            'bot': True,
+            'flags': 0
+        }
+
+    def __channelPayload(self, channelId: int) -> Dict[str, Any]:
+        return {
+            'id': str(channelId),
+            'type': 0,
+            'guild_id': str(self.__channelIdsToGuildIds[channelId]),
+            'name': f'announcements-{channelId}',
+            'position': 0,
+            'permission_overwrites': list(),
+            'nsfw': False,
+            'parent_id': None,
+            'topic': None,
+            'rate_limit_per_user': 0
+        }
+
+    def __checkBucket(self, request: web.Request) -> Tuple[Optional[web.Response], Dict[str, str]]:
+        # request paths look like "/api/v10/channels/123/messages", strip off the "/api/v10"
+        # prefix and swap snowflakes out so that every channel shares the same route name
+        path = '/'.join(request.path.split('/')[3:])
+        route = self.__snowflakePattern.sub('{id}', f'{request.method} /{path}')
+        self.__apiCallCounter.increment(f'discord {route}')
+
+        limit, periodSeconds = self.routeLimits.get(route, (50, 1))
+        majorParameter = request.match_info.get('channelId') or request.match_info.get('guildId') or ''
+        bucketKey = f'{route}:{majorParameter}'
+
+        now = time.time()
+        windowStart, count = self.__buckets.get(bucketKey, (now, 0))
+        if now - windowStart >= periodSeconds:
+            windowStart, count = now, 0
+
+        resetAfter = max(0, periodSeconds - (now - windowStart))
+        headers = {
+            'X-RateLimit-Bucket': bucketKey,
+            'X-RateLimit-Limit': str(limit),
+            'X-RateLimit-Remaining': str(max(0, limit - count - 1)),
+            'X-RateLimit-Reset': f'{windowStart + periodSeconds:.3f}',
+            'X-RateLimit-Reset-After': f'{resetAfter:.3f}'
+        }
+
+        if self.__faultInjection.isInOutage():
+            self.__apiCallCounter.increment('discord 503')
+            return web.json_response({ 'message': 'Service Unavailable', 'code': 0 }, status = 503), headers
+
+        if count >= limit or self.__faultInjection.shouldRateLimit():
+            self.__apiCallCounter.increment('discord 429')
+            headers['X-RateLimit-Remaining'] = '0'
+            headers['Retry-After'] = f'{max(resetAfter, 0.1):.3f}'
+            return web.json_response(
+                { 'message': 'You are being rate limited.', 'retry_after': max(resetAfter, 0.1), 'global': False },
+                status = 429,
+                headers = headers
+            ), headers
+
+        self.__buckets[bucketKey] = (windowStart, count + 1)
+        return None, headers
+
+    def getBaseUrl(self) -> str:
+        if not utils.isValidStr(self.__baseUrl):
+            raise RuntimeError('FakeDiscordServer has not been started')
+
+        return self.__baseUrl
+
+    def getMessages(self) -> List[FakeDiscordMessage]:
+        return self.__messages
+
+    def __guildPayload(self, guildId: int) -> Dict[str, Any]:
+        return {
+            'id': str(guildId),
+            'name': f'guild-{guildId}',
+            'icon': None,
+            'owner_id': self.__botUserId,
+            'features': list(),
+            'roles': [ {
+                'id': str(guildId),
+                'name': '@everyone',
+                'permissions': '0',
+                'position': 0,
+                'color': 0,
+                'hoist': False,
+                'managed': False,
+                'mentionable': False
+            } ],
+            'emojis': list(),
+            'stickers': list(),
+            'channels': [ self.__channelPayload(channelId) for channelId in self.__guildIdsToChannelIds[guildId] ],
+            'threads': list(),
+            'members': list(),
+            'member_count': len(self.__guildIdsToMemberIds.get(guildId, set())) + 1,
+            'voice_states': list(),
+            'presences': list(),
+            'stage_instances': list(),
+            'guild_scheduled_events': list(),
+            'large': False,
+            'unavailable': False,
+            'verification_level': 0,
+            'default_message_notifications': 0,
+            'explicit_content_filter': 0,
+            'mfa_level': 0,
+            'nsfw_level': 0,
+            'premium_tier': 0,
+            'afk_timeout': 300,
+            'system_channel_flags': 0,
+            'preferred_locale': 'en-US'
+        }
+
+    async def __handleFetchChannel(self, request: web.Request) -> web.Response:
+        await self.__faultInjection.delay()
+        errorResponse, headers = self.__checkBucket(request)
+        if errorResponse is not None:
+            return errorResponse
+
+        channelId = int(request.match_info['channelId'])
+        if channelId not in self.__channelIdsToGuildIds:
+            return web.json_response({ 'message': 'Unknown Channel', 'code': 10003 }, status = 404, headers = headers)
+
+        return web.json_response(self.__channelPayload(channelId), headers = headers)
+
+    async def __handleFetchMember(self, request: web.Request) -> web.Response:
+        await self.__faultInjection.delay()
+        errorResponse, headers = self.__checkBucket(request)
+        if errorResponse is not None:
+            return errorResponse
+
+        guildId = int(request.match_info['guildId'])
+        userId = request.match_info['userId']
+        if userId not in self.__guildIdsToMemberIds.get(guildId, set()):
+            return web.json_response({ 'message': 'Unknown Member', 'code': 10007 }, status = 404, headers = headers)
+
+        return web.json_response({
+            'user': {
+                'id': userId,
+                'username': f'discorduser{userId}',
+                'discriminator': '0001',
+                'avatar': None
+            },
+            'roles': list(),
+            'joined_at': datetime.now(timezone.utc).isoformat(),
+            'deaf': False,
+            'mute': False,
+            'flags': 0
+        }, headers = headers)
+
+    async def __handleGateway(self, request: web.Request) -> web.Response:
+        self.__apiCallCounter.increment('discord GET /gateway')
+        wsUrl = self.__baseUrl.replace('http://', 'ws://')
+
+        return web.json_response({
+            'url': f'{wsUrl}/ws',
+            'shards': 1,
+            'session_start_limit': {
+                'total': 1000,
+                'remaining': 1000,
+                'reset_after': 0,
+                'max_concurrency': 1
+            }
+        })
+
+    async def __handleGatewayWebSocket(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+
+        sequence = 0
+        await ws.send_json({ 'op': 10, 'd': { 'heartbeat_interval': self.__heartbeatIntervalMs } })
+
+        async for message in ws:
+            if message.type is not WSMsgType.TEXT:
+                continue
+
+            payload = message.json()
+            op = payload.get('op')
+
+            if op == 1:
+                await ws.send_json({ 'op': 11 })
+            elif op == 2 or op == 6:
+                self.__apiCallCounter.increment('discord gateway IDENTIFY')
+                sequence = sequence + 1
+                await ws.send_json({
+                    'op': 0,
+                    's': sequence,
+                    't': 'READY',
+                    'd': {
+                        'v': 10,
+                        'user': self.__botUser(),
+                        'guilds': [ { 'id': str(guildId), 'unavailable': True } for guildId in self.__guildIdsToChannelIds ],
+                        'session_id': 'harness',
+                        'resume_gateway_url': f'{self.__baseUrl.replace("http://", "ws://")}/ws',
+                        'private_channels': list(),
+                        'relationships': list(),
+                        'application': { 'id': self.__botUserId, 'flags': 0 }
+                    }
+                })
+
+                for guildId in self.__guildIdsToChannelIds:
+                    sequence = sequence + 1
+                    await ws.send_json({
+                        'op': 0,
+                        's': sequence,
+                        't': 'GUILD_CREATE',
+                        'd': self.__guildPayload(guildId)
+                    })
+
+        return ws
+
+    async def __handleSendMessage(self, request: web.Request) -> web.Response:
+        receivedTime = time.monotonic()
+        await self.__faultInjection.delay()
+        errorResponse, headers = self.__checkBucket(request)
+        if errorResponse is not None:
+            return errorResponse
+
+        channelId = int(request.match_info['channelId'])
+        body = await request.json()
+        content: str = body.get('content') or ''
+        self.__messages.append(FakeDiscordMessage(
+            discordChannelId = channelId,
+            content = content,
+            receivedTime = receivedTime
+        ))
+
+        self.__messageIdCounter = self.__messageIdCounter + 1
+
+        return web.json_response({
+            'id': str(self.__messageIdCounter),
+            'channel_id': str(channelId),
+            'guild_id': str(self.__channelIdsToGuildIds.get(channelId, 0)),
+            'author': self.__botUser(),
+            'content': content,
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'edited_timestamp': None,
+            'tts': False,
+            'mention_everyone': False,
+            'mentions': list(),
+            'mention_roles': list(),
+            'attachments': list(),
+            'embeds': list(),
+            'pinned': False,
+            'type': 0,
+            'flags': 0
+        }, headers = headers)
+
+    async def __handleSyncCommands(self, request: web.Request) -> web.Response:
+        # the bot registers its application commands every time it logs in
+        self.__apiCallCounter.increment('discord PUT /applications/{id}/commands')
+        applicationId = request.match_info['applicationId']
+        commands: List[Dict[str, Any]] = list()
+
+        for index, command in enumerate(await request.json()):
+            commands.append({
+                **command,
+                'id': str(900000000000000000 + index),
+                'application_id': applicationId,
+                'version': '1'
+            })
+
+        return web.json_response(commands)
+
+    async def __handleUsersMe(self, request: web.Request) -> web.Response:
+        self.__apiCallCounter.increment('discord GET /users/@me')
+        return web.json_response(self.__botUser())
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/api/{version}/gateway', self.__handleGateway)
+        app.router.add_get('/api/{version}/gateway/bot', self.__handleGateway)
+        app.router.add_get('/api/{version}/users/@me', self.__handleUsersMe)
+        app.router.add_get('/api/{version}/channels/{channelId}', self.__handleFetchChannel)
+        app.router.add_post('/api/{version}/channels/{channelId}/messages', self.__handleSendMessage)
+        app.router.add_get('/api/{version}/guilds/{guildId}/members/{userId}', self.__handleFetchMember)
+        app.router.add_put('/api/{version}/applications/{applicationId}/commands', self.__handleSyncCommands)
+        app.router.add_get('/ws', self.__handleGatewayWebSocket)
+
+        self.__runner = web.AppRunner(app)
+        await self.__runner.setup()
+
+        site = web.TCPSite(self.__runner, self.__host, 0)
+        await site.start()
+
+        port = self.__runner.addresses[0][1]
+        self.__baseUrl = f'http://{self.__host}:{port}'
+
+    async def stop(self):
+        if self.__runner is not None:
+            await asyncio.wait_for(self.__runner.cleanup(), timeout = 5)
+            self.__runner = None
@@ -0,0 +1,192 @@
+import time
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+import CynanBotCommon.utils as utils
+from benchmarks.apiCallCounter import ApiCallCounter
+from benchmarks.faultInjection import FaultInjection
+
+
+class FakeHelixServer():
+
+    def __init__(
+        self,
+        faultInjection: FaultInjection,
+        apiCallCounter: ApiCallCounter,
+        rateLimitPerMinute: int = 800,
+        host: str = '127.0.0.1'
+    ):
+        if not isinstance(faultInjection, FaultInjection):
+            raise ValueError(f'faultInjection argument is malformed: \"{faultInjection}\"')
+        elif not isinstance(apiCallCounter, ApiCallCounter):
+            raise ValueError(f'apiCallCounter argument is malformed: \"{apiCallCounter}\"')
+        elif not utils.isValidInt(rateLimitPerMinute):
+            raise ValueError(f'rateLimitPerMinute argument is malformed: \"{rateLimitPerMinute}\"')
+        elif not utils.isValidStr(host):
+            raise ValueError(f'host argument is malformed: \"{host}\"')
+
+        self.__faultInjection: FaultInjection = faultInjection
+        self.__apiCallCounter: ApiCallCounter = apiCallCounter
+        self.__rateLimitPerMinute: int = rateLimitPerMinute
+        self.__host: str = host
+
+        self.__liveLogins: Dict[str, float] = dict()
+        self.__userIdsToLogins: Dict[str, str] = dict()
+        self.__bucketRemaining: int = rateLimitPerMinute
+        self.__bucketResetTime: float = time.time() + 60
+        self.__runner: Optional[web.AppRunner] = None
+        self.__baseUrl: Optional[str] = None
+
+    def __checkFaults(self) -> Optional[web.Response]:
+        if self.__faultInjection.isInOutage():
+            self.__apiCallCounter.increment('helix 503')
+            return web.json_response({ 'error': 'Service Unavailable', 'status': 503 }, status = 503)
+
+        now = time.time()
+        if now >= self.__bucketResetTime:
+            self.__bucketRemaining = self.__rateLimitPerMinute
+            self.__bucketResetTime = now + 60
+
+        if self.__bucketRemaining <= 0 or self.__faultInjection.shouldRateLimit():
+            self.__apiCallCounter.increment('helix 429')
+            return web.json_response(
+                { 'error': 'Too Many Requests', 'status': 429 },
+                status = 429,
+                headers = self.__rateLimitHeaders()
+            )
+
+        self.__bucketRemaining = self.__bucketRemaining - 1
+        return None
+
+    def getBaseUrl(self) -> str:
+        if not utils.isValidStr(self.__baseUrl):
+            raise RuntimeError('FakeHelixServer has not been started')
+
+        return self.__baseUrl
+
+    def getUserId(self, userLogin: str) -> str:
+        userId = str(zlib.adler32(userLogin.lower().encode('utf-8')))
+        self.__userIdsToLogins[userId] = userLogin.lower()
+        return userId
+
+    def getWentLiveTime(self, userLogin: str) -> Optional[float]:
+        return self.__liveLogins.get(userLogin.lower())
+
+    def goLive(self, userLogins: List[str]):
+        now = time.monotonic()
+
+        for userLogin in userLogins:
+            if userLogin.lower() not in self.__liveLogins:
+                self.__liveLogins[userLogin.lower()] = now
+
+    def goOffline(self, userLogins: List[str]):
+        for userLogin in userLogins:
+            self.__liveLogins.pop(userLogin.lower(), None)
+
+    async def __handleStreams(self, request: web.Request) -> web.Response:
+        self.__apiCallCounter.increment('helix GET /streams')
+        await self.__faultInjection.delay()
+
+        faultResponse = self.__checkFaults()
+        if faultResponse is not None:
+            return faultResponse
+
+        userLogins: List[str] = list(request.query.getall('user_login', list()))
+
+        for userId in request.query.getall('user_id', list()):
+            userLogin = self.__userIdsToLogins.get(userId)
+
+            if utils.isValidStr(userLogin):
+                userLogins.append(userLogin)
+
+        data: List[Dict[str, Any]] = list()
+        for userLogin in userLogins:
+            wentLiveTime = self.__liveLogins.get(userLogin.lower())
+            if wentLiveTime is None:
+                continue
+
+            startedAt = datetime.fromtimestamp(time.time() - (time.monotonic() - wentLiveTime), timezone.utc)
+            data.append({
+                'id': str(zlib.crc32(f'{userLogin.lower()}:{wentLiveTime}'.encode('utf-8'))),
+                'user_id': self.getUserId(userLogin),
+                'user_login': userLogin.lower(),
+                'user_name': userLogin,
+                'game_id': '1',
+                'game_name': 'Load Testing',
+                'type': 'live',
+                'title': f'{userLogin} is live for the load harness',
+                'viewer_count': 1,
+                'started_at': startedAt.isoformat().replace('+00:00', 'Z'),
+                'language': 'en',
+                'thumbnail_url': '',
+                'tag_ids': list(),
+                'is_mature': False
+            })
+
+        return web.json_response(
+            { 'data': data, 'pagination': dict() },
+            headers = self.__rateLimitHeaders()
+        )
+
+    async def __handleUsers(self, request: web.Request) -> web.Response:
+        self.__apiCallCounter.increment('helix GET /users')
+        await self.__faultInjection.delay()
+
+        faultResponse = self.__checkFaults()
+        if faultResponse is not None:
+            return faultResponse
+
+        # every login exists on this fake, and its user id is a stable hash of the login
+        userLogins: List[str] = list(request.query.getall('login', list()))
+
+        for userId in request.query.getall('id', list()):
+            userLogin = self.__userIdsToLogins.get(userId)
+
+            if utils.isValidStr(userLogin):
+                userLogins.append(userLogin)
+
+        data: List[Dict[str, Any]] = list()
+        for userLogin in userLogins:
+            data.append({
+                'id': self.getUserId(userLogin),
+                'login': userLogin.lower(),
+                'display_name': userLogin,
+                'type': '',
+                'broadcaster_type': '',
+                'description': '',
+                'created_at': '2020-01-01T00:00:00Z'
+            })
+
+        return web.json_response(
+            { 'data': data },
+            headers = self.__rateLimitHeaders()
+        )
+
+    def __rateLimitHeaders(self) -> Dict[str, str]:
+        return {
+            'Ratelimit-Limit': str(self.__rateLimitPerMinute),
+            'Ratelimit-Remaining': str(max(0, self.__bucketRemaining)),
+            'Ratelimit-Reset': str(int(self.__bucketResetTime))
+        }
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/helix/streams', self.__handleStreams)
+        app.router.add_get('/helix/users', self.__handleUsers)
+
+        self.__runner = web.AppRunner(app)
+        await self.__runner.setup()
+
+        site = web.TCPSite(self.__runner, self.__host, 0)
+        await site.start()
+
+        port = self.__runner.addresses[0][1]
+        self.__baseUrl = f'http://{self.__host}:{port}'
+
+    async def stop(self):
+        if self.__runner is not None:
+            await self.__runner.cleanup()
+            self.__runner = None
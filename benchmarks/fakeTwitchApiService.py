@@ -0,0 +1,152 @@
+import asyncio
+import zlib
+from typing import Dict, List, Optional
+
+import CynanBotCommon.utils as utils
+from CynanBotCommon.twitch.twitchLiveUserDetails import TwitchLiveUserDetails
+from CynanBotCommon.twitch.twitchStreamType import TwitchStreamType
+from twitchHelixApiService import TwitchHelixApiService, TwitchUserIdentity
+
+
+class FakeTwitchApiService(TwitchHelixApiService):
+
+    # Intentionally doesn't call super().__init__(), this fake never touches the network. Whether
+    # or not a given user is live is decided by a stable hash of their user name, so that the same
+    # roster always produces the same set of live users between benchmark runs.
+
+    def __init__(
+        self,
+        liveRatio: float = 0.1,
+        latencySeconds: float = 0
+    ):
+        if not utils.isValidNum(liveRatio):
+            raise ValueError(f'liveRatio argument is malformed: \"{liveRatio}\"')
+        elif liveRatio < 0 or liveRatio > 1:
+            raise ValueError(f'liveRatio argument is out of bounds: {liveRatio}')
+        elif not utils.isValidNum(latencySeconds):
+            raise ValueError(f'latencySeconds argument is malformed: \"{latencySeconds}\"')
+        elif latencySeconds < 0:
+            raise ValueError(f'latencySeconds argument is out of bounds: {latencySeconds}')
+
+        self.__liveRatio: float = liveRatio
+        self.__latencySeconds: float = latencySeconds
+        self.__callCount: int = 0
+        self.__userIdsToLogins: Dict[str, str] = dict()
+
+    async def fetchLiveUserDetails(
+        self,
+        twitchAccessToken: str,
+        userNames: List[str]
+    ) -> List[TwitchLiveUserDetails]:
+        if not utils.isValidStr(twitchAccessToken):
+            raise ValueError(f'twitchAccessToken argument is malformed: \"{twitchAccessToken}\"')
+        elif not utils.hasItems(userNames):
+            raise ValueError(f'userNames argument is malformed: \"{userNames}\"')
+
+        self.__callCount = self.__callCount + 1
+
+        if self.__latencySeconds > 0:
+            await asyncio.sleep(self.__latencySeconds)
+
+        liveUserDetails: List[TwitchLiveUserDetails] = list()
+
+        for userName in userNames:
+            if self.isLive(userName):
+                liveUserDetails.append(self.__createLiveUserDetails(userName))
+
+        return liveUserDetails
+
+    async def fetchLiveUserDetailsByUserIds(
+        self,
+        twitchAccessToken: str,
+        userIds: List[str]
+    ) -> List[TwitchLiveUserDetails]:
+        if not utils.isValidStr(twitchAccessToken):
+            raise ValueError(f'twitchAccessToken argument is malformed: \"{twitchAccessToken}\"')
+        elif not utils.hasItems(userIds):
+            raise ValueError(f'userIds argument is malformed: \"{userIds}\"')
+
+        self.__callCount = self.__callCount + 1
+
+        if self.__latencySeconds > 0:
+            await asyncio.sleep(self.__latencySeconds)
+
+        liveUserDetails: List[TwitchLiveUserDetails] = list()
+
+        for userId in userIds:
+            userName = self.__userIdsToLogins.get(userId)
+
+            if utils.isValidStr(userName) and self.isLive(userName):
+                liveUserDetails.append(self.__createLiveUserDetails(userName))
+
+        return liveUserDetails
+
+    async def fetchUserIdentities(
+        self,
+        twitchAccessToken: str,
+        userLogins: Optional[List[str]] = None,
+        userIds: Optional[List[str]] = None
+    ) -> List[TwitchUserIdentity]:
+        if not utils.isValidStr(twitchAccessToken):
+            raise ValueError(f'twitchAccessToken argument is malformed: \"{twitchAccessToken}\"')
+        elif not utils.hasItems(userLogins) and not utils.hasItems(userIds):
+            raise ValueError(f'userLogins and userIds arguments are both malformed: \"{userLogins}\", \"{userIds}\"')
+
+        self.__callCount = self.__callCount + 1
+
+        if self.__latencySeconds > 0:
+            await asyncio.sleep(self.__latencySeconds)
+
+        userIdentities: List[TwitchUserIdentity] = list()
+
+        if utils.hasItems(userLogins):
+            for userLogin in userLogins:
+                userId = self.getUserId(userLogin)
+                self.__userIdsToLogins[userId] = userLogin.lower()
+                userIdentities.append(TwitchUserIdentity(userId = userId, userLogin = userLogin.lower()))
+
+        if utils.hasItems(userIds):
+            for userId in userIds:
+                userLogin = self.__userIdsToLogins.get(userId)
+
+                if utils.isValidStr(userLogin):
+                    userIdentities.append(TwitchUserIdentity(userId = userId, userLogin = userLogin))
+
+        return userIdentities
+
+    def __createLiveUserDetails(self, userName: str) -> TwitchLiveUserDetails:
+        return TwitchLiveUserDetails(
+            streamId = str(zlib.crc32(userName.encode('utf-8'))),
+            userId = self.getUserId(userName),
+            userLogin = userName.lower(),
+            userName = userName,
+            viewerCount = 1,
+            gameId = '1',
+            gameName = 'Benchmarking',
+            language = 'en',
+            thumbnailUrl = None,
+            title = f'{userName} is streaming a benchmark',
+            streamType = TwitchStreamType.LIVE
+        )
+
+    def getCallCount(self) -> int:
+        return self.__callCount
+
+    def getLiveRatio(self) -> float:
+        return self.__liveRatio
+
+    def getUserId(self, userName: str) -> str:
+        if not utils.isValidStr(userName):
+            raise ValueError(f'userName argument is malformed: \"{userName}\"')
+
+        return str(zlib.adler32(userName.lower().encode('utf-8')))
+
+    def isLive(self, userName: str) -> bool:
+        if not utils.isValidStr(userName):
+            raise ValueError(f'userName argument is malformed: \"{userName}\"')
+
+        bucket = zlib.crc32(userName.lower().encode('utf-8')) % 10000
+        return bucket < int(self.__liveRatio * 10000)
+
+    def resetCallCount(self):
+        self.__callCount = 0
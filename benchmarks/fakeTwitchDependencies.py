@@ -0,0 +1,57 @@
+from typing import Callable, Optional, Union
+
+import CynanBotCommon.utils as utils
+from bufferedTimber import BufferedTimber
+from CynanBotCommon.twitch.twitchHandleProviderInterface import \
+    TwitchHandleProviderInterface
+from CynanBotCommon.twitch.twitchTokensRepository import TwitchTokensRepository
+
+
+class FakeTwitchHandleProvider(TwitchHandleProviderInterface):
+
+    def __init__(self, twitchHandle: str = 'cynanbot'):
+        if not utils.isValidStr(twitchHandle):
+            raise ValueError(f'twitchHandle argument is malformed: \"{twitchHandle}\"')
+
+        self.__twitchHandle: str = twitchHandle
+
+    async def getTwitchHandle(self) -> str:
+        return self.__twitchHandle
+
+
+class FakeTwitchTokensRepository(TwitchTokensRepository):
+
+    # Intentionally doesn't call super().__init__(), tokens are always valid here.
+
+    def __init__(self, twitchAccessToken: str = 'benchmark'):
+        if not utils.isValidStr(twitchAccessToken):
+            raise ValueError(f'twitchAccessToken argument is malformed: \"{twitchAccessToken}\"')
+
+        self.__twitchAccessToken: str = twitchAccessToken
+
+    async def getAccessToken(self, twitchHandle: str) -> Optional[str]:
+        return self.__twitchAccessToken
+
+    async def requireAccessToken(self, twitchHandle: str) -> str:
+        return self.__twitchAccessToken
+
+    async def validateAndRefreshAccessToken(self, twitchHandle: str):
+        pass
+
+
+class SilentTimber(BufferedTimber):
+
+    # Intentionally doesn't call super().__init__(), so that benchmark numbers aren't skewed by
+    # log file writes.
+
+    def __init__(self):
+        pass
+
+    def log(
+        self,
+        tag: str,
+        msg: Union[str, Callable[[], str]],
+        exception: Optional[Exception] = None,
+        sampleKey: Optional[str] = None
+    ):
+        pass
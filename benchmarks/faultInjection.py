@@ -0,0 +1,80 @@
+import asyncio
+import random
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import CynanBotCommon.utils as utils
+
+
+class FaultInjection():
+
+    def __init__(
+        self,
+        latencySeconds: float = 0,
+        latencyJitterSeconds: float = 0,
+        rateLimitedRate: float = 0,
+        outages: Optional[List[Tuple[float, float]]] = None,
+        seed: int = 27
+    ):
+        if not utils.isValidNum(latencySeconds):
+            raise ValueError(f'latencySeconds argument is malformed: \"{latencySeconds}\"')
+        elif latencySeconds < 0:
+            raise ValueError(f'latencySeconds argument is out of bounds: {latencySeconds}')
+        elif not utils.isValidNum(latencyJitterSeconds):
+            raise ValueError(f'latencyJitterSeconds argument is malformed: \"{latencyJitterSeconds}\"')
+        elif latencyJitterSeconds < 0:
+            raise ValueError(f'latencyJitterSeconds argument is out of bounds: {latencyJitterSeconds}')
+        elif not utils.isValidNum(rateLimitedRate):
+            raise ValueError(f'rateLimitedRate argument is malformed: \"{rateLimitedRate}\"')
+        elif rateLimitedRate < 0 or rateLimitedRate > 1:
+            raise ValueError(f'rateLimitedRate argument is out of bounds: {rateLimitedRate}')
+
+        self.__latencySeconds: float = latencySeconds
+        self.__latencyJitterSeconds: float = latencyJitterSeconds
+        self.__rateLimitedRate: float = rateLimitedRate
+        self.__outages: List[Tuple[float, float]] = outages or list()
+        self.__random: random.Random = random.Random(seed)
+        self.__startTime: float = time.monotonic()
+
+    async def delay(self):
+        latency = self.__latencySeconds
+
+        if self.__latencyJitterSeconds > 0:
+            latency = latency + self.__random.uniform(0, self.__latencyJitterSeconds)
+
+        if latency > 0:
+            await asyncio.sleep(latency)
+
+    @classmethod
+    def fromJson(cls, jsonContents: Optional[Dict[str, Any]]):
+        if not utils.hasItems(jsonContents):
+            return FaultInjection()
+
+        outages: List[Tuple[float, float]] = list()
+        for outage in jsonContents.get('outages', list()):
+            outages.append((float(outage['startSeconds']), float(outage['endSeconds'])))
+
+        return FaultInjection(
+            latencySeconds = jsonContents.get('latencyMs', 0) / 1000,
+            latencyJitterSeconds = jsonContents.get('latencyJitterMs', 0) / 1000,
+            rateLimitedRate = jsonContents.get('rateLimitedRate', 0),
+            outages = outages
+        )
+
+    def getElapsedSeconds(self) -> float:
+        return time.monotonic() - self.__startTime
+
+    def isInOutage(self) -> bool:
+        elapsedSeconds = self.getElapsedSeconds()
+
+        for startSeconds, endSeconds in self.__outages:
+            if startSeconds <= elapsedSeconds < endSeconds:
+                return True
+
+        return False
+
+    def resetClock(self):
+        self.__startTime = time.monotonic()
+
+    def shouldRateLimit(self) -> bool:
+        return self.__rateLimitedRate > 0 and self.__random.random() < self.__rateLimitedRate
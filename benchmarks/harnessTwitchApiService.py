@@ -0,0 +1,146 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+
+import CynanBotCommon.utils as utils
+from CynanBotCommon.network.exceptions import GenericNetworkException
+from CynanBotCommon.twitch.twitchLiveUserDetails import TwitchLiveUserDetails
+from CynanBotCommon.twitch.twitchStreamType import TwitchStreamType
+from twitchHelixApiService import TwitchHelixApiService, TwitchUserIdentity
+
+
+class HarnessTwitchApiService(TwitchHelixApiService):
+
+    # Intentionally doesn't call super().__init__(), all Helix traffic is pointed at the load
+    # harness' local FakeHelixServer instead of api.twitch.tv.
+
+    def __init__(self, helixBaseUrl: str):
+        if not utils.isValidStr(helixBaseUrl):
+            raise ValueError(f'helixBaseUrl argument is malformed: \"{helixBaseUrl}\"')
+
+        self.__helixBaseUrl: str = helixBaseUrl
+        self.__clientSession: Optional[aiohttp.ClientSession] = None
+
+    async def close(self):
+        if self.__clientSession is not None:
+            await self.__clientSession.close()
+            self.__clientSession = None
+
+    async def fetchLiveUserDetails(
+        self,
+        twitchAccessToken: str,
+        userNames: List[str]
+    ) -> List[TwitchLiveUserDetails]:
+        if not utils.isValidStr(twitchAccessToken):
+            raise ValueError(f'twitchAccessToken argument is malformed: \"{twitchAccessToken}\"')
+        elif not utils.hasItems(userNames):
+            raise ValueError(f'userNames argument is malformed: \"{userNames}\"')
+
+        jsonResponse = await self.__get(
+            twitchAccessToken = twitchAccessToken,
+            path = '/helix/streams',
+            params = [ ('user_login', userName) for userName in userNames ]
+        )
+
+        return self.__parseLiveUserDetails(jsonResponse)
+
+    async def fetchLiveUserDetailsByUserIds(
+        self,
+        twitchAccessToken: str,
+        userIds: List[str]
+    ) -> List[TwitchLiveUserDetails]:
+        if not utils.isValidStr(twitchAccessToken):
+            raise ValueError(f'twitchAccessToken argument is malformed: \"{twitchAccessToken}\"')
+        elif not utils.hasItems(userIds):
+            raise ValueError(f'userIds argument is malformed: \"{userIds}\"')
+
+        jsonResponse = await self.__get(
+            twitchAccessToken = twitchAccessToken,
+            path = '/helix/streams',
+            params = [ ('user_id', userId) for userId in userIds ]
+        )
+
+        return self.__parseLiveUserDetails(jsonResponse)
+
+    async def fetchUserIdentities(
+        self,
+        twitchAccessToken: str,
+        userLogins: Optional[List[str]] = None,
+        userIds: Optional[List[str]] = None
+    ) -> List[TwitchUserIdentity]:
+        if not utils.isValidStr(twitchAccessToken):
+            raise ValueError(f'twitchAccessToken argument is malformed: \"{twitchAccessToken}\"')
+        elif not utils.hasItems(userLogins) and not utils.hasItems(userIds):
+            raise ValueError(f'userLogins and userIds arguments are both malformed: \"{userLogins}\", \"{userIds}\"')
+
+        params: List[Tuple[str, str]] = list()
+
+        if utils.hasItems(userLogins):
+            params.extend(('login', userLogin) for userLogin in userLogins)
+
+        if utils.hasItems(userIds):
+            params.extend(('id', userId) for userId in userIds)
+
+        jsonResponse = await self.__get(
+            twitchAccessToken = twitchAccessToken,
+            path = '/helix/users',
+            params = params
+        )
+
+        userIdentities: List[TwitchUserIdentity] = list()
+
+        for entry in jsonResponse.get('data', list()):
+            userIdentities.append(TwitchUserIdentity(
+                userId = entry['id'],
+                userLogin = entry['login'],
+                displayName = entry.get('display_name')
+            ))
+
+        return userIdentities
+
+    async def __get(
+        self,
+        twitchAccessToken: str,
+        path: str,
+        params: List[Tuple[str, str]]
+    ) -> Dict[str, Any]:
+        if self.__clientSession is None:
+            self.__clientSession = aiohttp.ClientSession()
+
+        try:
+            response = await self.__clientSession.get(
+                url = f'{self.__helixBaseUrl}{path}',
+                params = params,
+                headers = { 'Authorization': f'Bearer {twitchAccessToken}' }
+            )
+        except aiohttp.ClientError as e:
+            raise GenericNetworkException(f'Encountered network error when fetching {path}: {e}')
+
+        if response.status != 200:
+            response.close()
+            raise GenericNetworkException(f'Encountered non-200 HTTP status code when fetching {path}: {response.status}')
+
+        jsonResponse = await response.json()
+        response.close()
+
+        return jsonResponse
+
+    def __parseLiveUserDetails(self, jsonResponse: Dict[str, Any]) -> List[TwitchLiveUserDetails]:
+        liveUserDetails: List[TwitchLiveUserDetails] = list()
+
+        for entry in jsonResponse.get('data', list()):
+            liveUserDetails.append(TwitchLiveUserDetails(
+                streamId = entry['id'],
+                userId = entry['user_id'],
+                userLogin = entry['user_login'],
+                userName = entry['user_name'],
+                viewerCount = entry['viewer_count'],
+                gameId = entry.get('game_id'),
+                gameName = entry.get('game_name'),
+                language = entry.get('language'),
+                thumbnailUrl = entry.get('thumbnail_url'),
+                title = entry.get('title'),
+                streamType = TwitchStreamType.fromStr(entry['type'])
+            ))
+
+        return liveUserDetails
@@ -0,0 +1,299 @@
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set
+
+import CynanBotCommon.utils as utils
+from announcedStreamsRepository import AnnouncedStreamsRepository
+from twitchAnnounceChannelsRepository import (TwitchAnnounceChannel,
+                                              TwitchAnnounceChannelsRepository)
+from twitchHelixApiService import TwitchHelixApiService
+from twitchUserIdsRepository import TwitchUserIdEntry, TwitchUserIdsRepository
+from user import User
+from usersRepository import UsersRepository
+
+
+class InMemoryAnnouncedStreamsRepository(AnnouncedStreamsRepository):
+
+    # Intentionally doesn't call super().__init__(), there is no backing database here.
+
+    def __init__(self):
+        self.__streamIds: Set[str] = set()
+
+    async def clearCaches(self):
+        self.__streamIds = set()
+
+    async def initDatabaseTable(self):
+        pass
+
+    async def markStreamsAnnounced(self, streamIds: List[str]) -> Set[str]:
+        if not utils.hasItems(streamIds):
+            raise ValueError(f'streamIds argument is malformed: \"{streamIds}\"')
+
+        newStreamIds = set(streamIds) - self.__streamIds
+        self.__streamIds.update(newStreamIds)
+
+        return newStreamIds
+
+    async def warmUp(self):
+        pass
+
+
+class InMemoryUsersRepository(UsersRepository):
+
+    # Intentionally doesn't call super().__init__(), there is no backing database here.
+
+    def __init__(self):
+        self.__users: Dict[str, User] = dict()
+        self.__writeCount: int = 0
+
+    async def addOrUpdateUser(self, user: User):
+        if user is None:
+            raise ValueError(f'user argument is malformed: \"{user}\"')
+
+        self.__users[user.getDiscordId()] = user
+        self.__writeCount = self.__writeCount + 1
+
+    async def addOrUpdateUsers(self, users: List[User], chunkSize: int = 200):
+        if not utils.hasItems(users):
+            raise ValueError(f'users argument is malformed: \"{users}\"')
+
+        for user in users:
+            self.__users[user.getDiscordId()] = user
+
+        self.__writeCount = self.__writeCount + 1
+
+    async def getUserAsync(self, discordId: str) -> User:
+        if not utils.isValidStr(discordId):
+            raise ValueError(f'discordId argument is malformed: {discordId}')
+
+        user = self.__users.get(discordId)
+
+        if user is None:
+            raise ValueError(f'Unable to find user with discordId: \"{discordId}\"')
+
+        return user
+
+    async def getUsersAsync(self, discordIds: List[str], chunkSize: int = 500) -> List[User]:
+        if not utils.hasItems(discordIds):
+            raise ValueError(f'discordIds argument is malformed: \"{discordIds}\"')
+
+        users: List[User] = list()
+
+        for discordId in dict.fromkeys(discordIds):
+            user = self.__users.get(discordId)
+
+            if user is not None:
+                users.append(user)
+
+        return users
+
+    async def getUsersByTwitchNames(self, twitchNames: List[str], chunkSize: int = 500) -> List[User]:
+        if not utils.hasItems(twitchNames):
+            raise ValueError(f'twitchNames argument is malformed: \"{twitchNames}\"')
+
+        twitchNames = set(twitchName.lower() for twitchName in twitchNames)
+        return [ user for user in self.__users.values() if user.hasTwitchName() and user.getTwitchName().lower() in twitchNames ]
+
+    def getWriteCount(self) -> int:
+        return self.__writeCount
+
+
+class InMemoryTwitchAnnounceChannelsRepository(TwitchAnnounceChannelsRepository):
+
+    # Intentionally doesn't call super().__init__(), there is no backing database here.
+
+    def __init__(self, usersRepository: InMemoryUsersRepository):
+        if not isinstance(usersRepository, InMemoryUsersRepository):
+            raise ValueError(f'usersRepository argument is malformed: \"{usersRepository}\"')
+
+        self.__usersRepository: InMemoryUsersRepository = usersRepository
+        self.__channelIdsToUserIds: Dict[int, List[str]] = dict()
+
+    async def addUser(self, user: User, discordChannelId: int):
+        if not isinstance(user, User):
+            raise ValueError(f'user argument is malformed: \"{user}\"')
+        elif not utils.isValidInt(discordChannelId):
+            raise ValueError(f'discordChannelId argument is malformed: \"{discordChannelId}\"')
+
+        await self.__usersRepository.addOrUpdateUser(user)
+
+        userIds = self.__channelIdsToUserIds.get(discordChannelId)
+        if userIds is None:
+            userIds = list()
+            self.__channelIdsToUserIds[discordChannelId] = userIds
+
+        if user.getDiscordId() not in userIds:
+            userIds.append(user.getDiscordId())
+
+    async def addUsers(self, users: List[User], discordChannelId: int, chunkSize: int = 500):
+        if not utils.hasItems(users):
+            raise ValueError(f'users argument is malformed: \"{users}\"')
+        elif not utils.isValidInt(discordChannelId):
+            raise ValueError(f'discordChannelId argument is malformed: \"{discordChannelId}\"')
+
+        await self.__usersRepository.addOrUpdateUsers(users)
+
+        userIds = self.__channelIdsToUserIds.get(discordChannelId)
+        if userIds is None:
+            userIds = list()
+            self.__channelIdsToUserIds[discordChannelId] = userIds
+
+        for user in users:
+            if user.getDiscordId() not in userIds:
+                userIds.append(user.getDiscordId())
+
+    async def fetchTwitchAnnounceChannel(self, discordChannelId: int) -> TwitchAnnounceChannel:
+        if not utils.isValidInt(discordChannelId):
+            raise ValueError(f'discordChannelId argument is malformed: \"{discordChannelId}\"')
+
+        userIds = self.__channelIdsToUserIds.get(discordChannelId)
+        if not utils.hasItems(userIds):
+            return TwitchAnnounceChannel(discordChannelId = discordChannelId)
+
+        users: List[User] = list()
+        for userId in userIds:
+            users.append(await self.__usersRepository.getUserAsync(userId))
+
+        users.sort(key = lambda user: user.getDiscordName().lower())
+
+        return TwitchAnnounceChannel(
+            discordChannelId = discordChannelId,
+            users = users
+        )
+
+    async def fetchTwitchAnnounceChannelUserCount(self, discordChannelId: int) -> int:
+        userIds = self.__channelIdsToUserIds.get(discordChannelId)
+
+        if userIds is None:
+            return 0
+
+        return len(userIds)
+
+    async def fetchTwitchAnnounceChannelUsersPage(
+        self,
+        discordChannelId: int,
+        pageSize: int,
+        afterUser: Optional[User] = None
+    ) -> List[User]:
+        twitchAnnounceChannel = await self.fetchTwitchAnnounceChannel(discordChannelId)
+        if not twitchAnnounceChannel.hasUsers():
+            return list()
+
+        users = sorted(twitchAnnounceChannel.getUsers(), key = lambda user: (user.getDiscordName().lower(), user.getDiscordId()))
+
+        if afterUser is not None:
+            afterKey = (afterUser.getDiscordName().lower(), afterUser.getDiscordId())
+            users = [ user for user in users if (user.getDiscordName().lower(), user.getDiscordId()) > afterKey ]
+
+        return users[0:pageSize]
+
+    async def fetchTwitchAnnounceChannels(self) -> Optional[List[TwitchAnnounceChannel]]:
+        if not utils.hasItems(self.__channelIdsToUserIds):
+            return None
+
+        twitchAnnounceChannels: List[TwitchAnnounceChannel] = list()
+
+        for discordChannelId in self.__channelIdsToUserIds:
+            twitchAnnounceChannels.append(await self.fetchTwitchAnnounceChannel(discordChannelId))
+
+        return twitchAnnounceChannels
+
+    async def removeChannels(self, discordChannelIds: List[int], chunkSize: int = 500):
+        if not utils.hasItems(discordChannelIds):
+            raise ValueError(f'discordChannelIds argument is malformed: \"{discordChannelIds}\"')
+
+        for discordChannelId in discordChannelIds:
+            self.__channelIdsToUserIds.pop(discordChannelId, None)
+
+    async def removeUser(self, user: User, discordChannelId: int):
+        if not isinstance(user, User):
+            raise ValueError(f'user argument is malformed: \"{user}\"')
+        elif not utils.isValidInt(discordChannelId):
+            raise ValueError(f'discordChannelId argument is malformed: \"{discordChannelId}\"')
+
+        userIds = self.__channelIdsToUserIds.get(discordChannelId)
+
+        if userIds is not None and user.getDiscordId() in userIds:
+            userIds.remove(user.getDiscordId())
+
+    async def removeUsers(self, discordChannelIdsToUserIds: Dict[int, Set[str]], chunkSize: int = 500):
+        if not utils.hasItems(discordChannelIdsToUserIds):
+            raise ValueError(f'discordChannelIdsToUserIds argument is malformed: \"{discordChannelIdsToUserIds}\"')
+
+        for discordChannelId, discordUserIds in discordChannelIdsToUserIds.items():
+            userIds = self.__channelIdsToUserIds.get(discordChannelId)
+
+            if userIds is not None:
+                self.__channelIdsToUserIds[discordChannelId] = [ userId for userId in userIds if userId not in discordUserIds ]
+
+    async def saveSnapshot(self):
+        pass
+
+
+class InMemoryTwitchUserIdsRepository(TwitchUserIdsRepository):
+
+    # Intentionally doesn't call super().__init__(), there is no backing database here. Entries
+    # never expire, but missing ones are still looked up in batches through the (fake or replayed)
+    # Helix API, so the one-off resolution cost shows up in the benchmark's Helix call counts.
+
+    def __init__(
+        self,
+        twitchApiService: TwitchHelixApiService,
+        maxLookupsPerRequest: int = 100
+    ):
+        if not isinstance(twitchApiService, TwitchHelixApiService):
+            raise ValueError(f'twitchApiService argument is malformed: \"{twitchApiService}\"')
+        elif not utils.isValidInt(maxLookupsPerRequest):
+            raise ValueError(f'maxLookupsPerRequest argument is malformed: \"{maxLookupsPerRequest}\"')
+
+        self.__twitchApiService: TwitchHelixApiService = twitchApiService
+        self.__maxLookupsPerRequest: int = maxLookupsPerRequest
+        self.__loginsToEntries: Dict[str, TwitchUserIdEntry] = dict()
+
+    async def clearCaches(self):
+        self.__loginsToEntries = dict()
+
+    async def fetchUserId(self, twitchLogin: str) -> Optional[TwitchUserIdEntry]:
+        entries = await self.fetchUserIds([ twitchLogin ])
+        return entries.get(twitchLogin.lower())
+
+    async def fetchUserIds(self, twitchLogins: List[str]) -> Dict[str, TwitchUserIdEntry]:
+        if not utils.hasItems(twitchLogins):
+            raise ValueError(f'twitchLogins argument is malformed: \"{twitchLogins}\"')
+
+        missingLogins: List[str] = list()
+        for twitchLogin in twitchLogins:
+            if twitchLogin.lower() not in self.__loginsToEntries and twitchLogin.lower() not in missingLogins:
+                missingLogins.append(twitchLogin.lower())
+
+        now = datetime.now(timezone.utc)
+
+        for index in range(0, len(missingLogins), self.__maxLookupsPerRequest):
+            userIdentities = await self.__twitchApiService.fetchUserIdentities(
+                twitchAccessToken = 'benchmark',
+                userLogins = missingLogins[index:index + self.__maxLookupsPerRequest]
+            )
+
+            for userIdentity in userIdentities:
+                self.__loginsToEntries[userIdentity.getUserLogin().lower()] = TwitchUserIdEntry(
+                    twitchLogin = userIdentity.getUserLogin(),
+                    twitchUserId = userIdentity.getUserId(),
+                    updatedAt = now
+                )
+
+        entries: Dict[str, TwitchUserIdEntry] = dict()
+        for twitchLogin in twitchLogins:
+            entry = self.__loginsToEntries.get(twitchLogin.lower())
+
+            if entry is not None:
+                entries[twitchLogin.lower()] = entry
+
+        return entries
+
+    async def initDatabaseTable(self):
+        pass
+
+    async def onUserLoginObserved(self, twitchUserId: str, twitchLogin: str) -> Optional[str]:
+        return None
+
+    async def warmUp(self):
+        pass
@@ -0,0 +1,377 @@
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from asyncio import AbstractEventLoop
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+import CynanBotCommon.utils as utils
+from announcedStreamsRepository import AnnouncedStreamsRepository
+from benchmarks.benchmarkResults import BenchmarkResults, summarizeLatencies
+from benchmarks.fakeTwitchApiService import FakeTwitchApiService
+from benchmarks.fakeTwitchDependencies import (FakeTwitchHandleProvider,
+                                               FakeTwitchTokensRepository,
+                                               SilentTimber)
+from benchmarks.inMemoryRepositories import (
+    InMemoryAnnouncedStreamsRepository,
+    InMemoryTwitchAnnounceChannelsRepository, InMemoryTwitchUserIdsRepository,
+    InMemoryUsersRepository)
+from benchmarks.syntheticRoster import SyntheticRoster
+from CynanBotCommon.storage.backingSqliteDatabase import BackingSqliteDatabase
+from databaseSchemaRegistry import DatabaseSchemaRegistry
+from rosterVersionRepository import RosterVersionRepository
+from twitchAnnounceChannelsRepository import TwitchAnnounceChannelsRepository
+from twitchAnnounceSettingsRepository import TwitchAnnounceSettingsRepository
+from twitchLiveHelper import TwitchLiveHelper
+from twitchLiveUsersRepository import TwitchLiveUsersRepository
+from twitchUserIdsRepository import TwitchUserIdsRepository
+from usersRepository import UsersRepository
+
+# Run from the repository root, for example:
+#   python -m benchmarks.liveDetectionBenchmark --output bench.json
+#   python -m benchmarks.liveDetectionBenchmark --scenarios 1000x100 --compare bench.json
+
+defaultScenarios: List[Tuple[int, int]] = [ (100, 10), (1000, 100), (10000, 1000), (50000, 5000) ]
+helixBatchSize: int = 100
+
+
+class LiveDetectionBenchmark():
+
+    def __init__(
+        self,
+        eventLoop: AbstractEventLoop,
+        twitchAnnounceSettingsRepository: TwitchAnnounceSettingsRepository,
+        iterations: int,
+        liveRatio: float,
+        helixLatencySeconds: float,
+        workingDirectory: str
+    ):
+        if not isinstance(eventLoop, AbstractEventLoop):
+            raise ValueError(f'eventLoop argument is malformed: \"{eventLoop}\"')
+        elif not isinstance(twitchAnnounceSettingsRepository, TwitchAnnounceSettingsRepository):
+            raise ValueError(f'twitchAnnounceSettingsRepository argument is malformed: \"{twitchAnnounceSettingsRepository}\"')
+        elif not utils.isValidInt(iterations):
+            raise ValueError(f'iterations argument is malformed: \"{iterations}\"')
+        elif iterations < 1:
+            raise ValueError(f'iterations argument is out of bounds: {iterations}')
+        elif not utils.isValidStr(workingDirectory):
+            raise ValueError(f'workingDirectory argument is malformed: \"{workingDirectory}\"')
+
+        self.__eventLoop: AbstractEventLoop = eventLoop
+        self.__twitchAnnounceSettingsRepository: TwitchAnnounceSettingsRepository = twitchAnnounceSettingsRepository
+        self.__iterations: int = iterations
+        self.__liveRatio: float = liveRatio
+        self.__helixLatencySeconds: float = helixLatencySeconds
+        self.__workingDirectory: str = workingDirectory
+        self.__timber: SilentTimber = SilentTimber()
+
+    async def __buildRepositories(
+        self,
+        backend: str,
+        roster: SyntheticRoster,
+        twitchApiService: FakeTwitchApiService
+    ) -> Tuple[UsersRepository, TwitchAnnounceChannelsRepository, TwitchUserIdsRepository, AnnouncedStreamsRepository]:
+        if backend == 'fake':
+            usersRepository = InMemoryUsersRepository()
+            twitchAnnounceChannelsRepository = InMemoryTwitchAnnounceChannelsRepository(usersRepository)
+
+            for discordChannelId, users in roster.getChannelIdsToUsers().items():
+                for user in users:
+                    await twitchAnnounceChannelsRepository.addUser(user, discordChannelId)
+
+            return usersRepository, twitchAnnounceChannelsRepository, InMemoryTwitchUserIdsRepository(twitchApiService), InMemoryAnnouncedStreamsRepository()
+        elif backend == 'sqlite':
+            databaseFile = os.path.join(self.__workingDirectory, f'benchmark_{roster.getUserCount()}_{roster.getChannelCount()}.sqlite')
+            if os.path.exists(databaseFile):
+                os.remove(databaseFile)
+
+            backingDatabase = BackingSqliteDatabase(
+                eventLoop = self.__eventLoop,
+                databaseFile = databaseFile
+            )
+
+            databaseSchemaRegistry = DatabaseSchemaRegistry(
+                backingDatabase = backingDatabase
+            )
+
+            rosterVersionRepository = RosterVersionRepository(
+                backingDatabase = backingDatabase,
+                databaseSchemaRegistry = databaseSchemaRegistry
+            )
+
+            usersRepository = UsersRepository(
+                backingDatabase = backingDatabase,
+                databaseSchemaRegistry = databaseSchemaRegistry,
+                rosterVersionRepository = rosterVersionRepository
+            )
+
+            twitchAnnounceChannelsRepository = TwitchAnnounceChannelsRepository(
+                backingDatabase = backingDatabase,
+                databaseSchemaRegistry = databaseSchemaRegistry,
+                rosterVersionRepository = rosterVersionRepository,
+                usersRepository = usersRepository
+            )
+
+            twitchUserIdsRepository = TwitchUserIdsRepository(
+                backingDatabase = backingDatabase,
+                databaseSchemaRegistry = databaseSchemaRegistry,
+                timber = self.__timber,
+                twitchHandleProviderInterface = FakeTwitchHandleProvider(),
+                twitchHelixApiService = twitchApiService,
+                twitchTokensRepository = FakeTwitchTokensRepository()
+            )
+
+            announcedStreamsRepository = AnnouncedStreamsRepository(
+                backingDatabase = backingDatabase,
+                databaseSchemaRegistry = databaseSchemaRegistry,
+                timber = self.__timber,
+                twitchAnnounceSettingsRepository = self.__twitchAnnounceSettingsRepository
+            )
+
+            await self.__seedSqlite(databaseFile, roster, twitchAnnounceChannelsRepository)
+            return usersRepository, twitchAnnounceChannelsRepository, twitchUserIdsRepository, announcedStreamsRepository
+        else:
+            raise ValueError(f'unknown backend: \"{backend}\"')
+
+    async def __measure(
+        self,
+        operation: Callable[[], Awaitable[Any]]
+    ) -> Tuple[List[float], int, List[Any]]:
+        latencies: List[float] = list()
+        returnValues: List[Any] = list()
+
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+
+        for _ in range(self.__iterations):
+            start = time.perf_counter()
+            returnValues.append(await operation())
+            latencies.append(time.perf_counter() - start)
+
+        _, peakMemoryBytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return latencies, peakMemoryBytes, returnValues
+
+    async def runScenario(
+        self,
+        backend: str,
+        roster: SyntheticRoster
+    ) -> List[Dict[str, Any]]:
+        twitchApiService = FakeTwitchApiService(
+            liveRatio = self.__liveRatio,
+            latencySeconds = self.__helixLatencySeconds
+        )
+
+        usersRepository, twitchAnnounceChannelsRepository, twitchUserIdsRepository, announcedStreamsRepository = await self.__buildRepositories(backend, roster, twitchApiService)
+
+        twitchLiveHelper = TwitchLiveHelper(
+            timber = self.__timber,
+            twitchHandleProviderInterface = FakeTwitchHandleProvider(),
+            twitchHelixApiService = twitchApiService,
+            twitchTokensRepository = FakeTwitchTokensRepository(),
+            twitchUserIdsRepository = twitchUserIdsRepository,
+            usersRepository = usersRepository
+        )
+
+        twitchLiveUsersRepository = TwitchLiveUsersRepository(
+            eventLoop = self.__eventLoop,
+            announcedStreamsRepository = announcedStreamsRepository,
+            twitchAnnounceChannelsRepository = twitchAnnounceChannelsRepository,
+            twitchLiveHelper = twitchLiveHelper,
+            usersRepository = usersRepository
+        )
+
+        results: List[Dict[str, Any]] = list()
+
+        # fetchWhoIsLive() refuses more than one Helix page worth of users, so it's measured one
+        # page at a time across the entire roster
+        batches: List[List[Any]] = list()
+        users = roster.getUsers()
+        for index in range(0, len(users), helixBatchSize):
+            batches.append(users[index:index + helixBatchSize])
+
+        async def fetchWhoIsLiveForRoster() -> int:
+            liveCount = 0
+
+            for batch in batches:
+                whoIsLive = await twitchLiveHelper.fetchWhoIsLive(batch)
+                if utils.hasItems(whoIsLive):
+                    liveCount = liveCount + len(whoIsLive)
+
+            return liveCount
+
+        twitchApiService.resetCallCount()
+        latencies, peakMemoryBytes, liveCounts = await self.__measure(fetchWhoIsLiveForRoster)
+        results.append(self.__toResult(
+            benchmark = 'TwitchLiveHelper.fetchWhoIsLive',
+            backend = backend,
+            roster = roster,
+            latencies = latencies,
+            peakMemoryBytes = peakMemoryBytes,
+            helixCallCount = twitchApiService.getCallCount(),
+            liveCount = liveCounts[-1]
+        ))
+
+        async def fetchTwitchLiveUserData() -> int:
+            twitchLiveUserData = await twitchLiveUsersRepository.fetchTwitchLiveUserData()
+
+            if utils.hasItems(twitchLiveUserData):
+                return len(twitchLiveUserData)
+            else:
+                return 0
+
+        twitchApiService.resetCallCount()
+        latencies, peakMemoryBytes, announceCounts = await self.__measure(fetchTwitchLiveUserData)
+        results.append(self.__toResult(
+            benchmark = 'TwitchLiveUsersRepository.fetchTwitchLiveUserData',
+            backend = backend,
+            roster = roster,
+            latencies = latencies,
+            peakMemoryBytes = peakMemoryBytes,
+            helixCallCount = twitchApiService.getCallCount(),
+            liveCount = announceCounts[0]
+        ))
+
+        return results
+
+    async def __seedSqlite(
+        self,
+        databaseFile: str,
+        roster: SyntheticRoster,
+        twitchAnnounceChannelsRepository: TwitchAnnounceChannelsRepository
+    ):
+        remainingMemberships: List[Tuple[int, List[Any]]] = list()
+
+        # Let the repository itself create the schema and per-channel tables (one user per
+        # channel), then bulk load everything else directly so that seeding large rosters
+        # doesn't dominate the benchmark's own run time.
+        for discordChannelId, users in roster.getChannelIdsToUsers().items():
+            if not utils.hasItems(users):
+                continue
+
+            await twitchAnnounceChannelsRepository.addUser(users[0], discordChannelId)
+            remainingMemberships.append((discordChannelId, users[1:]))
+
+        connection = sqlite3.connect(databaseFile)
+
+        connection.executemany(
+            '''
+                INSERT INTO users (discorddiscriminator, discordid, discordname, twitchname)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(discordid) DO NOTHING
+            ''',
+            [ (user.getDiscordDiscriminator(), user.getDiscordId(), user.getDiscordName(), user.getTwitchName()) for user in roster.getUsers() ]
+        )
+
+        for discordChannelId, users in remainingMemberships:
+            connection.executemany(
+                f'''
+                    INSERT INTO twitchannouncechannel_{discordChannelId} (discorduserid)
+                    VALUES (?)
+                    ON CONFLICT(discorduserid) DO NOTHING
+                ''',
+                [ (user.getDiscordId(),) for user in users ]
+            )
+
+        connection.commit()
+        connection.close()
+
+    def __toResult(
+        self,
+        benchmark: str,
+        backend: str,
+        roster: SyntheticRoster,
+        latencies: List[float],
+        peakMemoryBytes: int,
+        helixCallCount: int,
+        liveCount: int
+    ) -> Dict[str, Any]:
+        latencySummary = summarizeLatencies(latencies)
+
+        throughput = 0
+        if latencySummary['mean'] > 0:
+            throughput = roster.getUserCount() / latencySummary['mean']
+
+        return {
+            'backend': backend,
+            'benchmark': benchmark,
+            'channelCount': roster.getChannelCount(),
+            'helixCallsPerIteration': helixCallCount / self.__iterations,
+            'helixLatencySeconds': self.__helixLatencySeconds,
+            'iterations': self.__iterations,
+            'latencySeconds': latencySummary,
+            'liveCount': liveCount,
+            'liveRatio': self.__liveRatio,
+            'membershipCount': roster.getMembershipCount(),
+            'peakMemoryBytes': peakMemoryBytes,
+            'throughputUsersPerSecond': throughput,
+            'userCount': roster.getUserCount()
+        }
+
+
+def parseScenario(scenario: str) -> Tuple[int, int]:
+    userCount, channelCount = scenario.lower().split('x')
+    return int(userCount), int(channelCount)
+
+
+async def main(eventLoop: AbstractEventLoop, arguments: argparse.Namespace) -> int:
+    scenarios = defaultScenarios
+    if utils.hasItems(arguments.scenarios):
+        scenarios = [ parseScenario(scenario) for scenario in arguments.scenarios ]
+
+    benchmarkResults = BenchmarkResults('liveDetection')
+
+    with tempfile.TemporaryDirectory() as workingDirectory:
+        benchmark = LiveDetectionBenchmark(
+            eventLoop = eventLoop,
+            twitchAnnounceSettingsRepository = TwitchAnnounceSettingsRepository(),
+            iterations = arguments.iterations,
+            liveRatio = arguments.liveRatio,
+            helixLatencySeconds = arguments.helixLatencyMs / 1000,
+            workingDirectory = workingDirectory
+        )
+
+        for userCount, channelCount in scenarios:
+            roster = SyntheticRoster(
+                userCount = userCount,
+                channelCount = channelCount
+            )
+
+            for backend in arguments.backends:
+                for result in await benchmark.runScenario(backend, roster):
+                    benchmarkResults.add(result)
+                    print(f'{result["benchmark"]} [{backend}, {userCount} users, {channelCount} channels]: p50={result["latencySeconds"]["p50"]:.4f}s p95={result["latencySeconds"]["p95"]:.4f}s peak={result["peakMemoryBytes"]}B live={result["liveCount"]}')
+
+    benchmarkResults.writeTo(arguments.output)
+    print(f'Wrote {len(benchmarkResults.getResults())} result(s) to \"{arguments.output}\"')
+
+    if utils.isValidStr(arguments.compare):
+        regressions = benchmarkResults.compareTo(arguments.compare, arguments.tolerance)
+
+        if utils.hasItems(regressions):
+            for regression in regressions:
+                print(f'REGRESSION {regression}')
+
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Synthetic-scale benchmarks for the Twitch live-detection pipeline')
+    parser.add_argument('--backends', nargs = '+', choices = [ 'fake', 'sqlite' ], default = [ 'fake', 'sqlite' ])
+    parser.add_argument('--compare', default = None, help = 'previous results file to check for regressions against')
+    parser.add_argument('--helixLatencyMs', type = float, default = 0, help = 'simulated latency of each Helix call')
+    parser.add_argument('--iterations', type = int, default = 5)
+    parser.add_argument('--liveRatio', type = float, default = 0.1, help = 'fraction of the roster that is live')
+    parser.add_argument('--output', default = 'liveDetectionBenchmark.json')
+    parser.add_argument('--scenarios', nargs = '*', help = 'USERSxCHANNELS, for example 1000x100')
+    parser.add_argument('--tolerance', type = float, default = 0.2, help = 'allowed slowdown before a result counts as a regression')
+
+    eventLoop = asyncio.get_event_loop()
+    sys.exit(eventLoop.run_until_complete(main(eventLoop, parser.parse_args())))
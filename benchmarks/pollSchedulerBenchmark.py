@@ -0,0 +1,308 @@
+import argparse
+import asyncio
+import math
+import random
+import sys
+from asyncio import AbstractEventLoop
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import CynanBotCommon.utils as utils
+from benchmarks.benchmarkResults import BenchmarkResults, summarizeLatencies
+from benchmarks.fakeTwitchDependencies import SilentTimber
+from CynanBotCommon.simpleDateTime import SimpleDateTime
+from pollScheduler import PollScheduler, PollTier
+from twitchAnnounceSettingsRepository import TwitchAnnounceSettingsRepository
+from twitchAnnounceSettingsSnapshot import TwitchAnnounceSettingsSnapshot
+from user import User
+
+# Run from the repository root, for example:
+#   python -m benchmarks.pollSchedulerBenchmark --output pollScheduler.json
+#   python -m benchmarks.pollSchedulerBenchmark --users 5000 --days 14
+
+helixBatchSize: int = 100
+
+
+class SimulatedTwitchAnnounceSettingsRepository(TwitchAnnounceSettingsRepository):
+
+    def __init__(self, jsonContents: Dict[str, Any]):
+        super().__init__('simulated')
+
+        self.__snapshot: TwitchAnnounceSettingsSnapshot = TwitchAnnounceSettingsSnapshot(
+            jsonContents = jsonContents,
+            twitchAnnounceSettingsFile = 'simulated'
+        )
+
+    def getAll(self) -> TwitchAnnounceSettingsSnapshot:
+        return self.__snapshot
+
+    async def getAllAsync(self) -> TwitchAnnounceSettingsSnapshot:
+        return self.__snapshot
+
+
+class SimulatedStreamer():
+
+    # A streamer's broadcasts are generated up front as (start, end) epoch seconds, so that the
+    # flat and tiered runs are scored against exactly the same streams.
+
+    def __init__(
+        self,
+        user: User,
+        profile: str,
+        streams: List[Tuple[float, float]]
+    ):
+        self.__user: User = user
+        self.__profile: str = profile
+        self.__streams: List[Tuple[float, float]] = streams
+
+    def getLiveStream(self, now: float) -> Optional[Tuple[float, float]]:
+        for stream in self.__streams:
+            if stream[0] <= now < stream[1]:
+                return stream
+
+        return None
+
+    def getProfile(self) -> str:
+        return self.__profile
+
+    def getStreamCount(self) -> int:
+        return len(self.__streams)
+
+    def getUser(self) -> User:
+        return self.__user
+
+
+class PollSchedulerBenchmark():
+
+    # Simulates days of polling against a synthetic roster, on a simulated clock, and compares
+    # flat polling (everyone every refreshEveryMinutes) with the tiered PollScheduler:
+    #
+    # - daily: streams most days, at roughly the same time of day
+    # - occasional: streams every couple of weeks, at any time of day
+    # - dormant: hasn't streamed in months, and only very rarely starts again
+
+    def __init__(
+        self,
+        userCount: int,
+        days: int,
+        settings: Dict[str, Any],
+        seed: int = 37
+    ):
+        if not utils.isValidInt(userCount):
+            raise ValueError(f'userCount argument is malformed: \"{userCount}\"')
+        elif userCount < 1:
+            raise ValueError(f'userCount argument is out of bounds: {userCount}')
+        elif not utils.isValidInt(days):
+            raise ValueError(f'days argument is malformed: \"{days}\"')
+        elif days < 1:
+            raise ValueError(f'days argument is out of bounds: {days}')
+        elif not utils.hasItems(settings):
+            raise ValueError(f'settings argument is malformed: \"{settings}\"')
+
+        self.__userCount: int = userCount
+        self.__days: int = days
+        self.__settings: Dict[str, Any] = settings
+        self.__seed: int = seed
+
+        self.__startTime: float = datetime(2024, 1, 1, tzinfo = timezone.utc).timestamp()
+
+    def __buildStreamers(self) -> List[SimulatedStreamer]:
+        rand = random.Random(self.__seed)
+        endTime = self.__startTime + (self.__days * 86400)
+        streamers: List[SimulatedStreamer] = list()
+
+        for index in range(self.__userCount):
+            roll = rand.random()
+            streams: List[Tuple[float, float]] = list()
+            mostRecentStreamTime: Optional[float] = None
+
+            if roll < 0.1:
+                profile = 'daily'
+                secondOfDay = rand.randint(0, 86399)
+                mostRecentStreamTime = self.__startTime - 86400 + secondOfDay
+
+                for day in range(self.__days):
+                    if rand.random() < 0.8:
+                        start = self.__startTime + (day * 86400) + secondOfDay + rand.randint(-1800, 1800)
+                        streams.append((start, start + rand.randint(3600, 4 * 3600)))
+            elif roll < 0.4:
+                profile = 'occasional'
+                mostRecentStreamTime = self.__startTime - rand.randint(8, 40) * 86400
+                start = self.__startTime + rand.uniform(0, 14 * 86400)
+
+                while start < endTime:
+                    streams.append((start, start + rand.randint(3600, 3 * 3600)))
+                    start = start + rand.uniform(7 * 86400, 21 * 86400)
+            else:
+                profile = 'dormant'
+
+                if rand.random() < 0.5:
+                    mostRecentStreamTime = self.__startTime - rand.randint(90, 600) * 86400
+
+                if rand.random() < 0.02:
+                    start = self.__startTime + rand.uniform(0, self.__days * 86400)
+                    streams.append((start, start + 2 * 3600))
+
+            mostRecentStreamDateTime: Optional[SimpleDateTime] = None
+            if mostRecentStreamTime is not None:
+                mostRecentStreamDateTime = SimpleDateTime(
+                    now = datetime.fromtimestamp(mostRecentStreamTime, timezone.utc)
+                )
+
+            streamers.append(SimulatedStreamer(
+                user = User(
+                    discordDiscriminator = f'{index % 10000:04d}',
+                    discordId = str(300000000000000000 + index),
+                    discordName = f'discorduser{index}',
+                    mostRecentStreamDateTime = mostRecentStreamDateTime,
+                    twitchName = f'twitchuser{index}'
+                ),
+                profile = profile,
+                streams = streams
+            ))
+
+        return streamers
+
+    async def run(self) -> List[Dict[str, Any]]:
+        return [
+            await self.__simulate('flat'),
+            await self.__simulate('tiered')
+        ]
+
+    async def __simulate(self, strategy: str) -> Dict[str, Any]:
+        streamers = self.__buildStreamers()
+        usersToStreamers: Dict[str, SimulatedStreamer] = { streamer.getUser().getDiscordId(): streamer for streamer in streamers }
+        users = [ streamer.getUser() for streamer in streamers ]
+
+        twitchAnnounceSettingsRepository = SimulatedTwitchAnnounceSettingsRepository(self.__settings)
+        twitchAnnounceSettings = await twitchAnnounceSettingsRepository.getAllAsync()
+        pollScheduler = PollScheduler(
+            timber = SilentTimber(),
+            twitchAnnounceSettingsRepository = twitchAnnounceSettingsRepository,
+            helixBatchSize = helixBatchSize
+        )
+
+        tickSeconds = twitchAnnounceSettings.getPollTickSeconds()
+        refreshEverySeconds = twitchAnnounceSettings.getRefreshEveryMinutes() * 60
+        endTime = self.__startTime + (self.__days * 86400)
+
+        helixCallCount = 0
+        announcedStreams: Dict[str, float] = dict()
+        profileLatencies: Dict[str, List[float]] = dict()
+        now = self.__startTime
+
+        while now < endTime:
+            batches: List[List[User]] = list()
+
+            if strategy == 'flat':
+                if (now - self.__startTime) % refreshEverySeconds < tickSeconds:
+                    for index in range(0, len(users), helixBatchSize):
+                        batches.append(users[index:index + helixBatchSize])
+            else:
+                batches = await pollScheduler.selectBatches(users, now)
+
+            polledUsers: List[User] = list()
+            detectedUsers: List[User] = list()
+
+            for batch in batches:
+                helixCallCount = helixCallCount + 1
+
+                for user in batch:
+                    polledUsers.append(user)
+                    streamer = usersToStreamers[user.getDiscordId()]
+                    liveStream = streamer.getLiveStream(now)
+
+                    if liveStream is None or announcedStreams.get(user.getDiscordId()) == liveStream[0]:
+                        continue
+
+                    announcedStreams[user.getDiscordId()] = liveStream[0]
+                    profileLatencies.setdefault(streamer.getProfile(), list()).append(now - liveStream[0])
+                    detectedUsers.append(user)
+
+            if strategy == 'tiered':
+                pollScheduler.onPolled(polledUsers, detectedUsers, now)
+
+            for user in detectedUsers:
+                user.setMostRecentStreamDateTime(SimpleDateTime(
+                    now = datetime.fromtimestamp(now, timezone.utc)
+                ))
+
+            now = now + tickSeconds
+
+        expectedCallCount = math.ceil(self.__userCount / helixBatchSize) * math.ceil((self.__days * 86400) / refreshEverySeconds)
+        detectionLatencies = profileLatencies.get('daily', [ 0.0 ])
+
+        result: Dict[str, Any] = {
+            'backend': 'simulated',
+            'benchmark': f'PollScheduler.{strategy}',
+            'channelCount': 1,
+            'days': self.__days,
+            'flatHelixCallCount': expectedCallCount,
+            'helixCallCount': helixCallCount,
+            'latencySeconds': summarizeLatencies(detectionLatencies),
+            'peakMemoryBytes': 0,
+            'profileMedianDetectionSeconds': { profile: summarizeLatencies(latencies)['p50'] for profile, latencies in profileLatencies.items() },
+            'profileDetectionCounts': { profile: len(latencies) for profile, latencies in profileLatencies.items() },
+            'userCount': self.__userCount
+        }
+
+        if strategy == 'tiered':
+            metrics = pollScheduler.getMetrics()
+            result['tierUserCounts'] = { pollTier.toStr(): metrics.getTierUserCount(pollTier) for pollTier in PollTier }
+            result['overBudgetTickCount'] = metrics.getOverBudgetTickCount()
+
+        return result
+
+
+async def main(eventLoop: AbstractEventLoop, arguments: argparse.Namespace) -> int:
+    benchmarkResults = BenchmarkResults('pollScheduler')
+
+    settings: Dict[str, Any] = {
+        'activePollMinutes': arguments.activePollMinutes,
+        'dormantPollMinutes': arguments.dormantPollMinutes,
+        'helixCallsPerHourBudget': arguments.helixCallsPerHourBudget,
+        'pollTickSeconds': arguments.pollTickSeconds,
+        'refreshEveryMinutes': arguments.refreshEveryMinutes
+    }
+
+    for userCount in arguments.users:
+        benchmark = PollSchedulerBenchmark(
+            userCount = userCount,
+            days = arguments.days,
+            settings = settings
+        )
+
+        for result in await benchmark.run():
+            benchmarkResults.add(result)
+            print(f'{result["benchmark"]} [{userCount} users, {arguments.days} days]: helixCalls={result["helixCallCount"]} (flat={result["flatHelixCallCount"]}) dailyStreamerDetection p50={result["latencySeconds"]["p50"]:.0f}s p95={result["latencySeconds"]["p95"]:.0f}s medianByProfile={result["profileMedianDetectionSeconds"]}')
+
+    benchmarkResults.writeTo(arguments.output)
+    print(f'Wrote {len(benchmarkResults.getResults())} result(s) to \"{arguments.output}\"')
+
+    if utils.isValidStr(arguments.compare):
+        regressions = benchmarkResults.compareTo(arguments.compare, arguments.tolerance)
+
+        if utils.hasItems(regressions):
+            for regression in regressions:
+                print(f'REGRESSION {regression}')
+
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Simulated comparison of flat and tiered Twitch live polling')
+    parser.add_argument('--activePollMinutes', type = int, default = 1)
+    parser.add_argument('--compare', default = None, help = 'previous results file to check for regressions against')
+    parser.add_argument('--days', type = int, default = 7)
+    parser.add_argument('--dormantPollMinutes', type = int, default = 30)
+    parser.add_argument('--helixCallsPerHourBudget', type = int, default = 0, help = '0 means the same budget that flat polling uses')
+    parser.add_argument('--output', default = 'pollSchedulerBenchmark.json')
+    parser.add_argument('--pollTickSeconds', type = int, default = 60)
+    parser.add_argument('--refreshEveryMinutes', type = int, default = 5)
+    parser.add_argument('--tolerance', type = float, default = 0.2, help = 'allowed slowdown before a result counts as a regression')
+    parser.add_argument('--users', type = int, nargs = '+', default = [ 1000, 10000 ])
+
+    eventLoop = asyncio.get_event_loop()
+    sys.exit(eventLoop.run_until_complete(main(eventLoop, parser.parse_args())))
@@ -0,0 +1,196 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import sys
+import time
+import tracemalloc
+from asyncio import AbstractEventLoop
+from typing import Any, Dict, List
+
+import CynanBotCommon.utils as utils
+from benchmarks.benchmarkResults import BenchmarkResults, summarizeLatencies
+from benchmarks.fakeTwitchDependencies import (FakeTwitchHandleProvider,
+                                               FakeTwitchTokensRepository,
+                                               SilentTimber)
+from benchmarks.inMemoryRepositories import (
+    InMemoryAnnouncedStreamsRepository,
+    InMemoryTwitchAnnounceChannelsRepository, InMemoryTwitchUserIdsRepository,
+    InMemoryUsersRepository)
+from benchmarks.replayTwitchApiService import ReplayTwitchApiService
+from benchmarks.syntheticRoster import SyntheticRoster
+from helixRecorder import HelixRecorder
+from twitchLiveHelper import TwitchLiveHelper
+from twitchLiveUsersRepository import TwitchLiveUsersRepository
+
+# Replays a recording of real Helix traffic (see HelixRecorder, enabled with
+# "helixRecordingEnabled" in generalSettings.json) through fetchTwitchLiveUserData() and the
+# announcement fan-out, one poll cycle every --cycleSeconds of recorded time. Without --speed the
+# replay jumps straight from one cycle to the next, so a whole evening goes by in seconds and every
+# run announces exactly the same streams in exactly the same order (checked with --compare, via
+# announcementDigest). With --speed, the replay instead follows the wall clock at that multiplier.
+# Run from the repository root, for example:
+#   python -m benchmarks.replayBenchmark --recording helixRecording.jsonl.gz --output replay.json
+#   python -m benchmarks.replayBenchmark --recording helixRecording.jsonl.gz --compare replay.json
+
+
+async def replay(
+    eventLoop: AbstractEventLoop,
+    arguments: argparse.Namespace
+) -> Dict[str, Any]:
+    timber = SilentTimber()
+    helixRecording = await HelixRecorder(
+        eventLoop = eventLoop,
+        timber = timber,
+        recordingFile = arguments.recording
+    ).load()
+
+    if not utils.hasItems(helixRecording.getEntries()):
+        raise RuntimeError(f'\"{arguments.recording}\" holds no recorded Helix responses')
+
+    twitchApiService = ReplayTwitchApiService(
+        helixRecording = helixRecording,
+        latencySeconds = arguments.helixLatencyMs / 1000
+    )
+
+    # the recording only knows about Twitch accounts, so they're spread across made up Discord
+    # channels the same (seeded) way as the synthetic benchmarks
+    userIdentities = twitchApiService.getUserIdentities()
+    roster = SyntheticRoster(
+        userCount = len(userIdentities),
+        channelCount = min(arguments.channels, len(userIdentities)),
+        twitchNames = [ userIdentity.getUserLogin() for userIdentity in userIdentities ]
+    )
+
+    usersRepository = InMemoryUsersRepository()
+    twitchAnnounceChannelsRepository = InMemoryTwitchAnnounceChannelsRepository(usersRepository)
+
+    for discordChannelId, users in roster.getChannelIdsToUsers().items():
+        for user in users:
+            await twitchAnnounceChannelsRepository.addUser(user, discordChannelId)
+
+    twitchUserIdsRepository = InMemoryTwitchUserIdsRepository(twitchApiService)
+
+    twitchLiveUsersRepository = TwitchLiveUsersRepository(
+        eventLoop = eventLoop,
+        announcedStreamsRepository = InMemoryAnnouncedStreamsRepository(),
+        twitchAnnounceChannelsRepository = twitchAnnounceChannelsRepository,
+        twitchLiveHelper = TwitchLiveHelper(
+            timber = timber,
+            twitchHandleProviderInterface = FakeTwitchHandleProvider(),
+            twitchHelixApiService = twitchApiService,
+            twitchTokensRepository = FakeTwitchTokensRepository(),
+            twitchUserIdsRepository = twitchUserIdsRepository,
+            usersRepository = usersRepository
+        ),
+        usersRepository = usersRepository
+    )
+
+    cycleLatencies: List[float] = list()
+    transcript: List[str] = list()
+    announcementCount = 0
+    announceMessageCount = 0
+    durationSeconds = twitchApiService.getDurationSeconds()
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    replayStart = time.perf_counter()
+
+    if utils.isValidNum(arguments.speed):
+        twitchApiService.start(arguments.speed)
+
+    cycleOffsetSeconds: float = 0
+
+    while cycleOffsetSeconds <= durationSeconds:
+        if utils.isValidNum(arguments.speed):
+            await asyncio.sleep(max(0, (cycleOffsetSeconds - twitchApiService.getOffsetSeconds()) / arguments.speed))
+        else:
+            twitchApiService.seek(cycleOffsetSeconds)
+
+        cycleStart = time.perf_counter()
+        twitchLiveUserData = await twitchLiveUsersRepository.fetchTwitchLiveUserData()
+
+        if utils.hasItems(twitchLiveUserData):
+            for liveUserData in twitchLiveUserData:
+                discordAnnounceText = liveUserData.getDiscordAnnounceText()
+                announcementCount = announcementCount + 1
+
+                for discordChannelId in sorted(liveUserData.getDiscordChannelIds()):
+                    announceMessageCount = announceMessageCount + 1
+                    transcript.append(f'{cycleOffsetSeconds:.0f}\t{discordChannelId}\t{liveUserData.getTwitchLiveDetails().getStreamId()}\t{discordAnnounceText}')
+
+        cycleLatencies.append(time.perf_counter() - cycleStart)
+        cycleOffsetSeconds = cycleOffsetSeconds + arguments.cycleSeconds
+
+    replaySeconds = time.perf_counter() - replayStart
+    _, peakMemoryBytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    if utils.isValidStr(arguments.transcript):
+        with open(arguments.transcript, 'w') as file:
+            file.write('\n'.join(transcript))
+
+    return {
+        'announcementCount': announcementCount,
+        'announcementDigest': hashlib.sha256('\n'.join(transcript).encode('utf-8')).hexdigest(),
+        'announceMessageCount': announceMessageCount,
+        'backend': 'replay' if not utils.isValidNum(arguments.speed) else f'replay@{arguments.speed:g}x',
+        'benchmark': 'TwitchLiveUsersRepository.fetchTwitchLiveUserData',
+        'channelCount': roster.getChannelCount(),
+        'cycleCount': len(cycleLatencies),
+        'helixCallCount': twitchApiService.getCallCount(),
+        'latencySeconds': summarizeLatencies(cycleLatencies),
+        'peakMemoryBytes': peakMemoryBytes,
+        'recordedEntryCount': len(helixRecording.getEntries()),
+        'recordedSeconds': durationSeconds,
+        'replaySeconds': replaySeconds,
+        'userCount': roster.getUserCount()
+    }
+
+
+async def main(eventLoop: AbstractEventLoop, arguments: argparse.Namespace) -> int:
+    result = await replay(eventLoop, arguments)
+
+    benchmarkResults = BenchmarkResults('replay')
+    benchmarkResults.add(result)
+
+    print(f'Replayed {result["recordedSeconds"] / 3600:.1f}h of Helix traffic ({result["recordedEntryCount"]} response(s), {result["userCount"]} users) in {result["replaySeconds"]:.2f}s: {result["cycleCount"]} cycle(s), p50={result["latencySeconds"]["p50"] * 1000:.1f}ms p95={result["latencySeconds"]["p95"] * 1000:.1f}ms, {result["announcementCount"]} announcement(s) as {result["announceMessageCount"]} message(s), digest={result["announcementDigest"][0:12]}')
+
+    benchmarkResults.writeTo(arguments.output)
+    print(f'Wrote {len(benchmarkResults.getResults())} result(s) to \"{arguments.output}\"')
+
+    if utils.isValidStr(arguments.compare):
+        failures: List[str] = benchmarkResults.compareTo(arguments.compare, arguments.tolerance)
+
+        # only a stepped replay is guaranteed to announce the same things every time
+        if not utils.isValidNum(arguments.speed):
+            with open(arguments.compare, 'r') as file:
+                baseline = json.load(file)
+
+            for baselineResult in baseline.get('results', list()):
+                if baselineResult.get('backend') == result['backend'] and baselineResult.get('announcementDigest') != result['announcementDigest']:
+                    failures.append(f'announcements differ from the baseline\'s: {baselineResult.get("announcementCount")} -> {result["announcementCount"]} announcement(s), digest {baselineResult.get("announcementDigest")} -> {result["announcementDigest"]}')
+
+        if utils.hasItems(failures):
+            for failure in failures:
+                print(f'REGRESSION {failure}')
+
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Replays recorded Helix traffic through the Twitch live-detection and announcement path')
+    parser.add_argument('--channels', type = int, default = 100, help = 'how many Discord channels to spread the recorded users across')
+    parser.add_argument('--compare', default = None, help = 'previous results file to check for regressions against')
+    parser.add_argument('--cycleSeconds', type = float, default = 120, help = 'recorded seconds between poll cycles')
+    parser.add_argument('--helixLatencyMs', type = float, default = 0, help = 'simulated latency of each replayed Helix call')
+    parser.add_argument('--output', default = 'replayBenchmark.json')
+    parser.add_argument('--recording', default = 'helixRecording.jsonl.gz')
+    parser.add_argument('--speed', type = float, default = None, help = 'follow the wall clock at this multiplier (1 for original speed) instead of stepping')
+    parser.add_argument('--tolerance', type = float, default = 0.2, help = 'allowed slowdown before a result counts as a regression')
+    parser.add_argument('--transcript', default = None, help = 'file to write every announcement to, for diffing runs')
+
+    eventLoop = asyncio.get_event_loop()
+    sys.exit(eventLoop.run_until_complete(main(eventLoop, parser.parse_args())))
@@ -0,0 +1,244 @@
+import asyncio
+import bisect
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import CynanBotCommon.utils as utils
+from CynanBotCommon.twitch.twitchLiveUserDetails import TwitchLiveUserDetails
+from CynanBotCommon.twitch.twitchStreamType import TwitchStreamType
+from helixRecorder import HelixRecording
+from twitchHelixApiService import TwitchHelixApiService, TwitchUserIdentity
+
+
+class ReplayTwitchApiService(TwitchHelixApiService):
+
+    # Intentionally doesn't call super().__init__(), every response comes out of a HelixRecording
+    # (see HelixRecorder) instead of the network.
+    #
+    # Recordings are replayed per user rather than per request. Each recorded /streams response
+    # says, for every user id that it asked about, whether that user was live (and on which
+    # stream) at that moment. A replayed query for any set of user ids, batched however the code
+    # under test likes, gets back each user's most recently recorded state as of the current
+    # replay position. The position either follows the wall clock at some speed multiplier (see
+    # start()), or is moved explicitly with seek() for runs that must give the exact same results
+    # every time.
+
+    def __init__(
+        self,
+        helixRecording: HelixRecording,
+        latencySeconds: float = 0
+    ):
+        if not isinstance(helixRecording, HelixRecording):
+            raise ValueError(f'helixRecording argument is malformed: \"{helixRecording}\"')
+        elif not utils.isValidNum(latencySeconds):
+            raise ValueError(f'latencySeconds argument is malformed: \"{latencySeconds}\"')
+        elif latencySeconds < 0:
+            raise ValueError(f'latencySeconds argument is out of bounds: {latencySeconds}')
+
+        self.__helixRecording: HelixRecording = helixRecording
+        self.__latencySeconds: float = latencySeconds
+
+        self.__callCount: int = 0
+        self.__offsetSeconds: float = 0
+        self.__speed: Optional[float] = None
+        self.__startedAt: float = 0
+
+        # per user id, the offsets at which they were observed, and what was observed (the
+        # recorded stream entry, or None if they weren't live), in time order
+        self.__userIdsToObservations: Dict[str, Tuple[List[float], List[Optional[Dict[str, Any]]]]] = dict()
+        self.__loginsToUserIds: Dict[str, str] = dict()
+        self.__userIdsToIdentities: Dict[str, TwitchUserIdentity] = dict()
+
+        self.__index()
+
+    async def fetchLiveUserDetails(
+        self,
+        twitchAccessToken: str,
+        userNames: List[str]
+    ) -> List[TwitchLiveUserDetails]:
+        if not utils.isValidStr(twitchAccessToken):
+            raise ValueError(f'twitchAccessToken argument is malformed: \"{twitchAccessToken}\"')
+        elif not utils.hasItems(userNames):
+            raise ValueError(f'userNames argument is malformed: \"{userNames}\"')
+
+        userIds: List[str] = list()
+
+        for userName in userNames:
+            userId = self.__loginsToUserIds.get(userName.lower())
+
+            if utils.isValidStr(userId):
+                userIds.append(userId)
+
+        return await self.__fetchLiveUserDetails(userIds)
+
+    async def __fetchLiveUserDetails(self, userIds: List[str]) -> List[TwitchLiveUserDetails]:
+        self.__callCount = self.__callCount + 1
+
+        if self.__latencySeconds > 0:
+            await asyncio.sleep(self.__latencySeconds)
+
+        offsetSeconds = self.getOffsetSeconds()
+        liveUserDetails: List[TwitchLiveUserDetails] = list()
+
+        for userId in userIds:
+            observations = self.__userIdsToObservations.get(userId)
+
+            if observations is None:
+                continue
+
+            offsets, entries = observations
+            index = bisect.bisect_right(offsets, offsetSeconds) - 1
+
+            if index < 0 or entries[index] is None:
+                continue
+
+            entry = entries[index]
+
+            liveUserDetails.append(TwitchLiveUserDetails(
+                streamId = entry['id'],
+                userId = entry['user_id'],
+                userLogin = entry['user_login'],
+                userName = entry.get('user_name', entry['user_login']),
+                viewerCount = entry.get('viewer_count', 0),
+                gameId = entry.get('game_id'),
+                gameName = entry.get('game_name'),
+                language = entry.get('language'),
+                thumbnailUrl = entry.get('thumbnail_url'),
+                title = entry.get('title'),
+                streamType = TwitchStreamType.fromStr(entry.get('type'))
+            ))
+
+        return liveUserDetails
+
+    async def fetchLiveUserDetailsByUserIds(
+        self,
+        twitchAccessToken: str,
+        userIds: List[str]
+    ) -> List[TwitchLiveUserDetails]:
+        if not utils.isValidStr(twitchAccessToken):
+            raise ValueError(f'twitchAccessToken argument is malformed: \"{twitchAccessToken}\"')
+        elif not utils.hasItems(userIds):
+            raise ValueError(f'userIds argument is malformed: \"{userIds}\"')
+
+        return await self.__fetchLiveUserDetails(userIds)
+
+    async def fetchUserIdentities(
+        self,
+        twitchAccessToken: str,
+        userLogins: Optional[List[str]] = None,
+        userIds: Optional[List[str]] = None
+    ) -> List[TwitchUserIdentity]:
+        if not utils.isValidStr(twitchAccessToken):
+            raise ValueError(f'twitchAccessToken argument is malformed: \"{twitchAccessToken}\"')
+        elif not utils.hasItems(userLogins) and not utils.hasItems(userIds):
+            raise ValueError(f'userLogins and userIds arguments are both malformed: \"{userLogins}\", \"{userIds}\"')
+
+        self.__callCount = self.__callCount + 1
+
+        if self.__latencySeconds > 0:
+            await asyncio.sleep(self.__latencySeconds)
+
+        requestedUserIds: List[str] = list()
+
+        if utils.hasItems(userLogins):
+            for userLogin in userLogins:
+                userId = self.__loginsToUserIds.get(userLogin.lower())
+
+                if utils.isValidStr(userId):
+                    requestedUserIds.append(userId)
+
+        if utils.hasItems(userIds):
+            requestedUserIds.extend(userIds)
+
+        userIdentities: List[TwitchUserIdentity] = list()
+
+        for userId in requestedUserIds:
+            userIdentity = self.__userIdsToIdentities.get(userId)
+
+            if userIdentity is not None:
+                userIdentities.append(userIdentity)
+
+        return userIdentities
+
+    def getCallCount(self) -> int:
+        return self.__callCount
+
+    def getDurationSeconds(self) -> float:
+        return self.__helixRecording.getDurationSeconds()
+
+    def getOffsetSeconds(self) -> float:
+        if self.__speed is None:
+            return self.__offsetSeconds
+
+        return self.__offsetSeconds + (time.monotonic() - self.__startedAt) * self.__speed
+
+    def getUserIdentities(self) -> List[TwitchUserIdentity]:
+        userIdentities = list(self.__userIdsToIdentities.values())
+        userIdentities.sort(key = lambda userIdentity: userIdentity.getUserLogin())
+        return userIdentities
+
+    def __index(self):
+        for entry in self.__helixRecording.getEntries():
+            if entry.getEndpoint() == 'users':
+                for user in entry.getData():
+                    self.__userIdsToIdentities[user['id']] = TwitchUserIdentity(
+                        userId = user['id'],
+                        userLogin = user['login'],
+                        displayName = user.get('display_name')
+                    )
+            elif entry.getEndpoint() == 'streams':
+                userIdsToStreams: Dict[str, Dict[str, Any]] = dict()
+
+                for stream in entry.getData():
+                    userIdsToStreams[stream['user_id']] = stream
+
+                    if stream['user_id'] not in self.__userIdsToIdentities:
+                        self.__userIdsToIdentities[stream['user_id']] = TwitchUserIdentity(
+                            userId = stream['user_id'],
+                            userLogin = stream['user_login'],
+                            displayName = stream.get('user_name')
+                        )
+
+                for userId in entry.getQueriedIds():
+                    if userId not in self.__userIdsToObservations:
+                        self.__userIdsToObservations[userId] = (list(), list())
+
+                    offsets, streams = self.__userIdsToObservations[userId]
+                    offsets.append(entry.getOffsetSeconds())
+                    streams.append(userIdsToStreams.get(userId))
+
+        # Users whose ids were already cached when the recording started, and who never went
+        # live during it, never had their logins recorded. They still need some login to be
+        # looked up by, so they're given a stable made up one.
+        for userId in self.__userIdsToObservations:
+            if userId not in self.__userIdsToIdentities:
+                self.__userIdsToIdentities[userId] = TwitchUserIdentity(
+                    userId = userId,
+                    userLogin = f'replayuser{userId}'
+                )
+
+        for userIdentity in self.__userIdsToIdentities.values():
+            self.__loginsToUserIds[userIdentity.getUserLogin().lower()] = userIdentity.getUserId()
+
+    def resetCallCount(self):
+        self.__callCount = 0
+
+    def seek(self, offsetSeconds: float):
+        if not utils.isValidNum(offsetSeconds):
+            raise ValueError(f'offsetSeconds argument is malformed: \"{offsetSeconds}\"')
+        elif offsetSeconds < 0:
+            raise ValueError(f'offsetSeconds argument is out of bounds: {offsetSeconds}')
+
+        self.__speed = None
+        self.__offsetSeconds = offsetSeconds
+
+    def start(self, speed: float = 1):
+        if not utils.isValidNum(speed):
+            raise ValueError(f'speed argument is malformed: \"{speed}\"')
+        elif speed <= 0:
+            raise ValueError(f'speed argument is out of bounds: {speed}')
+
+        # carries on from wherever the replay currently is
+        self.__offsetSeconds = self.getOffsetSeconds()
+        self.__speed = speed
+        self.__startedAt = time.monotonic()
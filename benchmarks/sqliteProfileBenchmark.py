@@ -0,0 +1,252 @@
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from asyncio import AbstractEventLoop
+from typing import Any, Dict, List, Optional
+
+import CynanBotCommon.utils as utils
+from announcedStreamsRepository import AnnouncedStreamsRepository
+from benchmarks.benchmarkResults import BenchmarkResults, summarizeLatencies
+from benchmarks.fakeTwitchDependencies import SilentTimber
+from benchmarks.syntheticRoster import SyntheticRoster
+from CynanBotCommon.simpleDateTime import SimpleDateTime
+from CynanBotCommon.storage.backingDatabase import BackingDatabase
+from CynanBotCommon.storage.backingSqliteDatabase import BackingSqliteDatabase
+from databaseSchemaRegistry import DatabaseSchemaRegistry
+from generalSettingsRepository import GeneralSettingsRepository
+from profiledBackingSqliteDatabase import ProfiledBackingSqliteDatabase
+from rosterVersionRepository import RosterVersionRepository
+from sqlitePerformanceProfile import SqlitePerformanceProfile
+from twitchAnnounceChannelsRepository import TwitchAnnounceChannelsRepository
+from twitchAnnounceSettingsRepository import TwitchAnnounceSettingsRepository
+from user import User
+from usersRepository import UsersRepository
+
+# Compares SQLite with its default settings against the performance profile configured in
+# generalSettings.json ("sqlite*" keys), on the two things that contend for the database in
+# production: the poll loop's writes (marking streams announced, and writing back each newly
+# live user), and admin commands that arrive while those writes are happening. Every poll cycle
+# has --liveRatio of the roster go live, and meanwhile a command is issued every
+# --commandIntervalMs, alternating between listing a channel's users and adding then removing a
+# user. Run from the repository root, for example:
+#   python -m benchmarks.sqliteProfileBenchmark --output sqliteProfile.json
+#   python -m benchmarks.sqliteProfileBenchmark --users 10000 --channels 1000 --compare sqliteProfile.json
+
+
+async def runBackend(
+    eventLoop: AbstractEventLoop,
+    backend: str,
+    sqlitePerformanceProfile: Optional[SqlitePerformanceProfile],
+    roster: SyntheticRoster,
+    arguments: argparse.Namespace,
+    workingDirectory: str
+) -> List[Dict[str, Any]]:
+    timber = SilentTimber()
+    databaseFile = os.path.join(workingDirectory, f'{backend}.sqlite')
+    backingDatabase: BackingDatabase = None
+
+    if sqlitePerformanceProfile is None:
+        backingDatabase = BackingSqliteDatabase(
+            eventLoop = eventLoop,
+            databaseFile = databaseFile
+        )
+    else:
+        backingDatabase = ProfiledBackingSqliteDatabase(
+            eventLoop = eventLoop,
+            sqlitePerformanceProfile = sqlitePerformanceProfile,
+            databaseFile = databaseFile
+        )
+
+    databaseSchemaRegistry = DatabaseSchemaRegistry(
+        backingDatabase = backingDatabase
+    )
+
+    rosterVersionRepository = RosterVersionRepository(
+        backingDatabase = backingDatabase,
+        databaseSchemaRegistry = databaseSchemaRegistry
+    )
+
+    usersRepository = UsersRepository(
+        backingDatabase = backingDatabase,
+        databaseSchemaRegistry = databaseSchemaRegistry,
+        rosterVersionRepository = rosterVersionRepository
+    )
+
+    twitchAnnounceChannelsRepository = TwitchAnnounceChannelsRepository(
+        backingDatabase = backingDatabase,
+        databaseSchemaRegistry = databaseSchemaRegistry,
+        rosterVersionRepository = rosterVersionRepository,
+        usersRepository = usersRepository
+    )
+
+    announcedStreamsRepository = AnnouncedStreamsRepository(
+        backingDatabase = backingDatabase,
+        databaseSchemaRegistry = databaseSchemaRegistry,
+        timber = timber,
+        twitchAnnounceSettingsRepository = TwitchAnnounceSettingsRepository()
+    )
+
+    for discordChannelId, users in roster.getChannelIdsToUsers().items():
+        if utils.hasItems(users):
+            await twitchAnnounceChannelsRepository.addUsers(users, discordChannelId)
+
+    await twitchAnnounceChannelsRepository.warmUp()
+
+    # both backends see the exact same sequence of live users and commands
+    pollRand = random.Random(26)
+    commandRand = random.Random(27)
+    users = roster.getUsers()
+    discordChannelIds = list(roster.getChannelIdsToUsers().keys())
+    liveCount = max(1, int(len(users) * arguments.liveRatio))
+
+    pollCycleLatencies: List[float] = list()
+    listCommandLatencies: List[float] = list()
+    addRemoveCommandLatencies: List[float] = list()
+    commandErrorCount = 0
+    isPolling = True
+
+    async def poll():
+        for cycle in range(arguments.cycles):
+            liveUsers = pollRand.sample(users, liveCount)
+            cycleStart = time.perf_counter()
+
+            for index in range(0, len(liveUsers), 100):
+                batch = liveUsers[index:index + 100]
+                await announcedStreamsRepository.markStreamsAnnounced(
+                    streamIds = [ f'{cycle}_{user.getDiscordId()}' for user in batch ]
+                )
+
+                for user in batch:
+                    user.setMostRecentStreamDateTime(SimpleDateTime())
+                    await usersRepository.addOrUpdateUser(user)
+
+            pollCycleLatencies.append(time.perf_counter() - cycleStart)
+
+    async def issueCommands():
+        nonlocal commandErrorCount
+        commandIndex = 0
+
+        while isPolling:
+            await asyncio.sleep(arguments.commandIntervalMs / 1000)
+
+            discordChannelId = commandRand.choice(discordChannelIds)
+            commandStart = time.perf_counter()
+
+            try:
+                if commandIndex % 2 == 0:
+                    await twitchAnnounceChannelsRepository.fetchTwitchAnnounceChannelUsersPage(
+                        discordChannelId = discordChannelId,
+                        pageSize = 10
+                    )
+
+                    listCommandLatencies.append(time.perf_counter() - commandStart)
+                else:
+                    # someone who isn't in the roster, so removing them again leaves it as it was
+                    user = User(
+                        discordDiscriminator = '0000',
+                        discordId = str(300000000000000000 + commandIndex),
+                        discordName = f'commanduser{commandIndex}',
+                        twitchName = f'commandtwitchuser{commandIndex}'
+                    )
+
+                    await twitchAnnounceChannelsRepository.addUser(user, discordChannelId)
+                    await twitchAnnounceChannelsRepository.removeUser(user, discordChannelId)
+                    addRemoveCommandLatencies.append(time.perf_counter() - commandStart)
+            except Exception:
+                # e.g. "database is locked", which is exactly what this is here to find out about
+                commandErrorCount = commandErrorCount + 1
+
+            commandIndex = commandIndex + 1
+
+    commandsTask = eventLoop.create_task(issueCommands())
+    benchmarkStart = time.perf_counter()
+    await poll()
+    benchmarkSeconds = time.perf_counter() - benchmarkStart
+    isPolling = False
+    await commandsTask
+
+    journalMode = 'default'
+    if isinstance(backingDatabase, ProfiledBackingSqliteDatabase) and utils.isValidStr(backingDatabase.getJournalMode()):
+        journalMode = backingDatabase.getJournalMode()
+
+    def toResult(benchmark: str, latencies: List[float]) -> Dict[str, Any]:
+        return {
+            'backend': backend,
+            'benchmark': benchmark,
+            'benchmarkSeconds': benchmarkSeconds,
+            'channelCount': roster.getChannelCount(),
+            'commandErrorCount': commandErrorCount,
+            'journalMode': journalMode,
+            'latencySeconds': summarizeLatencies(latencies if utils.hasItems(latencies) else [ 0 ]),
+            'liveCount': liveCount,
+            # compareTo() also checks peak memory, which isn't what this benchmark is about
+            'peakMemoryBytes': 0,
+            'profile': 'sqlite defaults' if sqlitePerformanceProfile is None else sqlitePerformanceProfile.toStr(),
+            'sampleCount': len(latencies),
+            'userCount': roster.getUserCount()
+        }
+
+    return [
+        toResult('pollCycleDb', pollCycleLatencies),
+        toResult('command:listTwitchUsers', listCommandLatencies),
+        toResult('command:addAndRemoveTwitchUser', addRemoveCommandLatencies)
+    ]
+
+
+async def main(eventLoop: AbstractEventLoop, arguments: argparse.Namespace) -> int:
+    sqlitePerformanceProfile = GeneralSettingsRepository().getAll().getSqlitePerformanceProfile()
+    roster = SyntheticRoster(
+        userCount = arguments.users,
+        channelCount = arguments.channels
+    )
+
+    benchmarkResults = BenchmarkResults('sqliteProfile')
+    backendsToResults: Dict[str, List[Dict[str, Any]]] = dict()
+
+    with tempfile.TemporaryDirectory() as workingDirectory:
+        for backend, profile in [ ('sqlite-default', None), ('sqlite-profile', sqlitePerformanceProfile) ]:
+            results = await runBackend(eventLoop, backend, profile, roster, arguments, workingDirectory)
+            backendsToResults[backend] = results
+
+            for result in results:
+                benchmarkResults.add(result)
+                print(f'{backend} {result["benchmark"]}: p50={result["latencySeconds"]["p50"] * 1000:.2f}ms p95={result["latencySeconds"]["p95"] * 1000:.2f}ms ({result["sampleCount"]} sample(s), {result["commandErrorCount"]} command error(s), journal={result["journalMode"]})')
+
+    print(f'Profile: {sqlitePerformanceProfile.toStr()}')
+
+    for defaultResult, profileResult in zip(backendsToResults['sqlite-default'], backendsToResults['sqlite-profile']):
+        speedup = defaultResult['latencySeconds']['p95'] / max(profileResult['latencySeconds']['p95'], 0.000001)
+        print(f'{defaultResult["benchmark"]}: {speedup:.2f}x faster at p95 with the profile')
+
+    benchmarkResults.writeTo(arguments.output)
+    print(f'Wrote {len(benchmarkResults.getResults())} result(s) to \"{arguments.output}\"')
+
+    if utils.isValidStr(arguments.compare):
+        regressions: List[str] = benchmarkResults.compareTo(arguments.compare, arguments.tolerance)
+
+        if utils.hasItems(regressions):
+            for regression in regressions:
+                print(f'REGRESSION {regression}')
+
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Compares SQLite\'s default settings against the configured SQLite performance profile')
+    parser.add_argument('--channels', type = int, default = 100)
+    parser.add_argument('--commandIntervalMs', type = float, default = 20, help = 'time between admin commands issued during the poll cycles')
+    parser.add_argument('--compare', default = None, help = 'previous results file to check for regressions against')
+    parser.add_argument('--cycles', type = int, default = 20)
+    parser.add_argument('--liveRatio', type = float, default = 0.05, help = 'fraction of the roster that goes live every poll cycle')
+    parser.add_argument('--output', default = 'sqliteProfileBenchmark.json')
+    parser.add_argument('--tolerance', type = float, default = 0.2, help = 'allowed slowdown before a result counts as a regression')
+    parser.add_argument('--users', type = int, default = 2000)
+
+    eventLoop = asyncio.get_event_loop()
+    sys.exit(eventLoop.run_until_complete(main(eventLoop, parser.parse_args())))
@@ -0,0 +1,88 @@
+import random
+from typing import Dict, List, Optional
+
+import CynanBotCommon.utils as utils
+from user import User
+
+
+class SyntheticRoster():
+
+    def __init__(
+        self,
+        userCount: int,
+        channelCount: int,
+        maxChannelsPerUser: int = 3,
+        seed: int = 26,
+        twitchNames: Optional[List[str]] = None
+    ):
+        if not utils.isValidInt(userCount):
+            raise ValueError(f'userCount argument is malformed: \"{userCount}\"')
+        elif userCount < 1:
+            raise ValueError(f'userCount argument is out of bounds: {userCount}')
+        elif not utils.isValidInt(channelCount):
+            raise ValueError(f'channelCount argument is malformed: \"{channelCount}\"')
+        elif channelCount < 1:
+            raise ValueError(f'channelCount argument is out of bounds: {channelCount}')
+        elif not utils.isValidInt(maxChannelsPerUser):
+            raise ValueError(f'maxChannelsPerUser argument is malformed: \"{maxChannelsPerUser}\"')
+        elif maxChannelsPerUser < 1:
+            raise ValueError(f'maxChannelsPerUser argument is out of bounds: {maxChannelsPerUser}')
+        elif not utils.isValidInt(seed):
+            raise ValueError(f'seed argument is malformed: \"{seed}\"')
+        elif twitchNames is not None and len(twitchNames) != userCount:
+            raise ValueError(f'twitchNames argument is out of bounds: {len(twitchNames)} name(s) for {userCount} user(s)')
+
+        self.__userCount: int = userCount
+        self.__channelCount: int = channelCount
+
+        self.__users: List[User] = list()
+        self.__channelIdsToUsers: Dict[int, List[User]] = dict()
+
+        rand = random.Random(seed)
+        channelIds: List[int] = [ 100000000000000000 + index for index in range(channelCount) ]
+
+        for channelId in channelIds:
+            self.__channelIdsToUsers[channelId] = list()
+
+        for index in range(userCount):
+            twitchName = f'twitchuser{index}'
+            if twitchNames is not None:
+                twitchName = twitchNames[index]
+
+            user = User(
+                discordDiscriminator = f'{index % 10000:04d}',
+                discordId = str(200000000000000000 + index),
+                discordName = f'discorduser{index}',
+                twitchName = twitchName
+            )
+
+            self.__users.append(user)
+
+            # every channel gets at least one user (when there are enough users to go around),
+            # after that users are scattered across a random handful of channels
+            if index < channelCount:
+                self.__channelIdsToUsers[channelIds[index]].append(user)
+
+            for channelId in rand.sample(channelIds, rand.randint(1, min(maxChannelsPerUser, channelCount))):
+                if user not in self.__channelIdsToUsers[channelId][-1:]:
+                    self.__channelIdsToUsers[channelId].append(user)
+
+    def getChannelCount(self) -> int:
+        return self.__channelCount
+
+    def getChannelIdsToUsers(self) -> Dict[int, List[User]]:
+        return self.__channelIdsToUsers
+
+    def getMembershipCount(self) -> int:
+        membershipCount = 0
+
+        for users in self.__channelIdsToUsers.values():
+            membershipCount = membershipCount + len(users)
+
+        return membershipCount
+
+    def getUserCount(self) -> int:
+        return self.__userCount
+
+    def getUsers(self) -> List[User]:
+        return self.__users
@@ -0,0 +1,236 @@
+import asyncio
+import os
+import sys
+import traceback
+from asyncio import AbstractEventLoop
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import aiofiles
+import aiofiles.os
+import aiofiles.ospath
+
+import CynanBotCommon.utils as utils
+from CynanBotCommon.timber.timber import Timber
+
+
+class BufferedTimberEntry():
+
+    def __init__(
+        self,
+        tag: str,
+        msg: Union[str, Callable[[], str]],
+        exception: Optional[Exception],
+        dateTime: datetime
+    ):
+        self.__tag: str = tag
+        self.__msg: Union[str, Callable[[], str]] = msg
+        self.__exception: Optional[Exception] = exception
+        self.__dateTime: datetime = dateTime
+
+    def format(self) -> str:
+        msg = self.__msg
+        if callable(msg):
+            msg = msg()
+
+        text = f'{self.__dateTime.isoformat()} — {self.__tag} — {msg}'
+
+        if self.__exception is not None:
+            exceptionText = ''.join(traceback.format_exception(type(self.__exception), self.__exception, self.__exception.__traceback__))
+            text = f'{text}\n{exceptionText.rstrip()}'
+
+        return text
+
+    def getDateTime(self) -> datetime:
+        return self.__dateTime
+
+
+class BufferedTimber(Timber):
+
+    # A Timber that can take the log formatting and file I/O off of the hot path. Messages may be
+    # given as a callable so that big joined strings are only ever built by the background writer
+    # (or never, if the entry gets dropped). Entries go into a bounded queue, and the writer drains
+    # that queue in batches, doing a single file write per batch. Repetitive messages can pass a
+    # sampleKey, in which case only one of them is logged per sampleWindowSeconds.
+    #
+    # With isBuffered set to False this behaves exactly like a regular Timber, aside from also
+    # accepting callable messages.
+
+    def __init__(
+        self,
+        eventLoop: AbstractEventLoop,
+        isBuffered: bool = True,
+        alsoPrintToStandardOut: bool = True,
+        maxQueueSize: int = 10000,
+        maxBatchSize: int = 500,
+        flushIntervalSeconds: float = 1,
+        sampleWindowSeconds: float = 60,
+        timberRootDirectory: str = 'logs'
+    ):
+        super().__init__(eventLoop = eventLoop)
+
+        if not isinstance(eventLoop, AbstractEventLoop):
+            raise ValueError(f'eventLoop argument is malformed: \"{eventLoop}\"')
+        elif not utils.isValidBool(isBuffered):
+            raise ValueError(f'isBuffered argument is malformed: \"{isBuffered}\"')
+        elif not utils.isValidBool(alsoPrintToStandardOut):
+            raise ValueError(f'alsoPrintToStandardOut argument is malformed: \"{alsoPrintToStandardOut}\"')
+        elif not utils.isValidInt(maxQueueSize):
+            raise ValueError(f'maxQueueSize argument is malformed: \"{maxQueueSize}\"')
+        elif maxQueueSize < 100:
+            raise ValueError(f'maxQueueSize argument is out of bounds: {maxQueueSize}')
+        elif not utils.isValidInt(maxBatchSize):
+            raise ValueError(f'maxBatchSize argument is malformed: \"{maxBatchSize}\"')
+        elif maxBatchSize < 1:
+            raise ValueError(f'maxBatchSize argument is out of bounds: {maxBatchSize}')
+        elif not utils.isValidNum(flushIntervalSeconds):
+            raise ValueError(f'flushIntervalSeconds argument is malformed: \"{flushIntervalSeconds}\"')
+        elif flushIntervalSeconds <= 0:
+            raise ValueError(f'flushIntervalSeconds argument is out of bounds: {flushIntervalSeconds}')
+        elif not utils.isValidNum(sampleWindowSeconds):
+            raise ValueError(f'sampleWindowSeconds argument is malformed: \"{sampleWindowSeconds}\"')
+        elif sampleWindowSeconds < 0:
+            raise ValueError(f'sampleWindowSeconds argument is out of bounds: {sampleWindowSeconds}')
+        elif not utils.isValidStr(timberRootDirectory):
+            raise ValueError(f'timberRootDirectory argument is malformed: \"{timberRootDirectory}\"')
+
+        self.__eventLoop: AbstractEventLoop = eventLoop
+        self.__isBuffered: bool = isBuffered
+        self.__alsoPrintToStandardOut: bool = alsoPrintToStandardOut
+        self.__maxBatchSize: int = maxBatchSize
+        self.__flushIntervalSeconds: float = flushIntervalSeconds
+        self.__sampleWindowSeconds: float = sampleWindowSeconds
+        self.__timberRootDirectory: str = timberRootDirectory
+
+        self.__entryQueue: asyncio.Queue = asyncio.Queue(maxsize = maxQueueSize)
+        self.__samples: Dict[str, Tuple[float, int]] = dict()
+        self.__droppedCount: int = 0
+        self.__suppressedCount: int = 0
+        self.__writerTask: Optional[asyncio.Task] = None
+
+    async def flush(self):
+        if not self.__isBuffered:
+            return
+
+        entries: List[BufferedTimberEntry] = list()
+
+        while not self.__entryQueue.empty():
+            entries.append(self.__entryQueue.get_nowait())
+
+        await self.__writeEntries(entries)
+
+    def getDroppedCount(self) -> int:
+        return self.__droppedCount
+
+    def getQueueSize(self) -> int:
+        return self.__entryQueue.qsize()
+
+    def getSuppressedCount(self) -> int:
+        return self.__suppressedCount
+
+    def isBuffered(self) -> bool:
+        return self.__isBuffered
+
+    def log(
+        self,
+        tag: str,
+        msg: Union[str, Callable[[], str]],
+        exception: Optional[Exception] = None,
+        sampleKey: Optional[str] = None
+    ):
+        if not utils.isValidStr(tag):
+            raise ValueError(f'tag argument is malformed: \"{tag}\"')
+        elif msg is None:
+            raise ValueError(f'msg argument is malformed: \"{msg}\"')
+
+        if utils.isValidStr(sampleKey):
+            suppressedSinceLast = self.__sample(sampleKey)
+
+            if suppressedSinceLast is None:
+                return
+            elif suppressedSinceLast >= 1:
+                originalMsg = msg
+                msg = lambda: f'{originalMsg() if callable(originalMsg) else originalMsg} (suppressed {suppressedSinceLast} similar message(s))'
+
+        if not self.__isBuffered:
+            if callable(msg):
+                msg = msg()
+
+            super().log(tag, msg, exception)
+            return
+
+        entry = BufferedTimberEntry(
+            tag = tag,
+            msg = msg,
+            exception = exception,
+            dateTime = datetime.now(timezone.utc)
+        )
+
+        try:
+            self.__entryQueue.put_nowait(entry)
+        except asyncio.QueueFull:
+            self.__droppedCount = self.__droppedCount + 1
+            return
+
+        if self.__writerTask is None or self.__writerTask.done():
+            self.__writerTask = self.__eventLoop.create_task(self.__startWriterLoop())
+
+    def __sample(self, sampleKey: str) -> Optional[int]:
+        # Returns None if this message should be suppressed, otherwise returns how many messages
+        # with the same sampleKey were suppressed since the last one that got through.
+        now = self.__eventLoop.time()
+        windowStart, suppressedCount = self.__samples.get(sampleKey, (None, 0))
+
+        if windowStart is not None and now - windowStart < self.__sampleWindowSeconds:
+            self.__samples[sampleKey] = (windowStart, suppressedCount + 1)
+            self.__suppressedCount = self.__suppressedCount + 1
+            return None
+
+        self.__samples[sampleKey] = (now, 0)
+        return suppressedCount
+
+    async def __startWriterLoop(self):
+        while True:
+            entries: List[BufferedTimberEntry] = list()
+
+            try:
+                entries.append(await asyncio.wait_for(
+                    self.__entryQueue.get(),
+                    timeout = self.__flushIntervalSeconds
+                ))
+            except asyncio.TimeoutError:
+                continue
+
+            # give other log calls in this same tick of the event loop a moment to pile up, so
+            # that they all get written together
+            await asyncio.sleep(0)
+
+            while len(entries) < self.__maxBatchSize and not self.__entryQueue.empty():
+                entries.append(self.__entryQueue.get_nowait())
+
+            try:
+                await self.__writeEntries(entries)
+            except Exception as e:
+                print(f'BufferedTimber failed to write {len(entries)} log entries: {e}', file = sys.stderr)
+
+    async def __writeEntries(self, entries: List[BufferedTimberEntry]):
+        if not utils.hasItems(entries):
+            return
+
+        filesToLines: Dict[str, List[str]] = dict()
+
+        for entry in entries:
+            fileName = os.path.join(self.__timberRootDirectory, f'{entry.getDateTime().strftime("%Y-%m-%d")}.log')
+            filesToLines.setdefault(fileName, list()).append(entry.format())
+
+        if not await aiofiles.ospath.exists(self.__timberRootDirectory):
+            await aiofiles.os.makedirs(self.__timberRootDirectory, exist_ok = True)
+
+        for fileName, lines in filesToLines.items():
+            text = '\n'.join(lines)
+
+            if self.__alsoPrintToStandardOut:
+                print(text)
+
+            async with aiofiles.open(fileName, mode = 'a') as file:
+                await file.write(f'{text}\n')
@@ -1,21 +1,32 @@
 import asyncio
+import io
+import math
 import traceback
 import urllib
 from asyncio import AbstractEventLoop
 from datetime import datetime, timedelta, timezone
-from typing import List
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import discord
 from discord.ext import commands
-from discord.ext.commands import CommandNotFound
 
 import CynanBotCommon.utils as utils
 from authRepository import AuthRepository
-from CynanBotCommon.timber.timber import Timber
+from bufferedTimber import BufferedTimber
+from CynanBotCommon.network.exceptions import GenericNetworkException
+from CynanBotCommon.twitch.exceptions import TwitchTokenIsExpiredException
+from discordGatewayStats import DiscordGatewayStats
+from discordRestScheduler import DiscordRestPriority, DiscordRestScheduler
 from generalSettingsRepository import GeneralSettingsRepository
+from rosterPruner import RosterPruner
+from startupHelper import StartupHelper
 from twitchAnnounceChannelsRepository import TwitchAnnounceChannelsRepository
 from twitchAnnounceSettingsRepository import TwitchAnnounceSettingsRepository
-from twitchLiveUsersRepository import TwitchLiveUsersRepository
+from twitchLiveUsersRepository import (TwitchLiveUserData,
+                                       TwitchLiveUsersRepository)
+from twitchLogins import isValidTwitchLogin
+from twitchUserIdsRepository import TwitchUserIdsRepository
+from twitchUsersImportExportHelper import TwitchUsersImportExportHelper
 from user import User
 
 
@@ -25,26 +36,60 @@ class CynanBotDiscord(commands.Bot):
         self,
         eventLoop: AbstractEventLoop,
         authRepository: AuthRepository,
+        discordRestScheduler: DiscordRestScheduler,
         generalSettingsRepository: GeneralSettingsRepository,
-        timber: Timber,
+        rosterPruner: RosterPruner,
+        startupHelper: StartupHelper,
+        timber: BufferedTimber,
         twitchAnnounceChannelsRepository: TwitchAnnounceChannelsRepository,
         twitchAnnounceSettingsRepository: TwitchAnnounceSettingsRepository,
-        twitchLiveUsersRepository: TwitchLiveUsersRepository
+        twitchLiveUsersRepository: TwitchLiveUsersRepository,
+        twitchUserIdsRepository: TwitchUserIdsRepository,
+        twitchUsersImportExportHelper: TwitchUsersImportExportHelper,
+        discordGatewayStats: Optional[DiscordGatewayStats] = None,
+        announceConcurrency: int = 4,
+        listTwitchUsersPageSize: int = 20,
+        maxImportFailuresShown: int = 10,
+        maxImportFileSizeBytes: int = 2097152,
+        maxImportMemberLookups: int = 50,
+        paginatorTimeoutSeconds: float = 120
     ):
+        # Commands are application (slash) commands, which arrive as interactions, and Discord
+        # sends those regardless of intents. So beyond the guilds intent (which keeps track of
+        # guilds and their channels, and fires on_guild_remove and on_guild_channel_delete), the
+        # gateway doesn't need to send any message, reaction, typing, presence, or voice events
+        # at all. on_raw_member_remove only fires with the privileged members intent, which also
+        # has to be switched on for the bot in Discord's developer portal. Nothing here reads
+        # discord.py's message cache or member cache, so both are switched off, as is requesting
+        # every guild's full member list at startup.
+        intents = discord.Intents.none()
+        intents.guilds = True
+        intents.members = generalSettingsRepository.getAll().isDiscordMembersIntentEnabled()
+
+        # discord.py 2.x ignores any loop given here, the bot runs on whichever loop start() is
+        # awaited on, which initCynanBotDiscord makes sure is eventLoop
         super().__init__(
-            loop = eventLoop,
-            command_prefix = '!',
-            intents = discord.Intents.default(),
-            status = discord.Status.online
+            command_prefix = commands.when_mentioned,
+            intents = intents,
+            status = discord.Status.online,
+            max_messages = None,
+            member_cache_flags = discord.MemberCacheFlags.none(),
+            chunk_guilds_at_startup = False
         )
 
         if not isinstance(eventLoop, AbstractEventLoop):
             raise ValueError(f'eventLoop argument is malformed: \"{eventLoop}\"')
         elif not isinstance(authRepository, AuthRepository):
             raise ValueError(f'authRepository argument is malformed: \"{authRepository}\"')
+        elif not isinstance(discordRestScheduler, DiscordRestScheduler):
+            raise ValueError(f'discordRestScheduler argument is malformed: \"{discordRestScheduler}\"')
         elif not isinstance(generalSettingsRepository, GeneralSettingsRepository):
             raise ValueError(f'generalSettingsRepository argument is malformed: \"{generalSettingsRepository}\"')
-        elif not isinstance(timber, Timber):
+        elif not isinstance(rosterPruner, RosterPruner):
+            raise ValueError(f'rosterPruner argument is malformed: \"{rosterPruner}\"')
+        elif not isinstance(startupHelper, StartupHelper):
+            raise ValueError(f'startupHelper argument is malformed: \"{startupHelper}\"')
+        elif not isinstance(timber, BufferedTimber):
             raise ValueError(f'timber argument is malformed: \"{timber}\"')
         elif not isinstance(twitchAnnounceChannelsRepository, TwitchAnnounceChannelsRepository):
             raise ValueError(f'twitchAnnounceChannelsRepository argument is malformed: \"{twitchAnnounceChannelsRepository}\"')
@@ -52,52 +97,116 @@ class CynanBotDiscord(commands.Bot):
             raise ValueError(f'twitchAnnounceSettingsRepository argument is malformed: \"{twitchAnnounceSettingsRepository}\"')
         elif not isinstance(twitchLiveUsersRepository, TwitchLiveUsersRepository):
             raise ValueError(f'twitchLiveUsersRepository argument is malformed: \"{twitchLiveUsersRepository}\"')
+        elif not isinstance(twitchUserIdsRepository, TwitchUserIdsRepository):
+            raise ValueError(f'twitchUserIdsRepository argument is malformed: \"{twitchUserIdsRepository}\"')
+        elif not isinstance(twitchUsersImportExportHelper, TwitchUsersImportExportHelper):
+            raise ValueError(f'twitchUsersImportExportHelper argument is malformed: \"{twitchUsersImportExportHelper}\"')
+        elif discordGatewayStats is not None and not isinstance(discordGatewayStats, DiscordGatewayStats):
+            raise ValueError(f'discordGatewayStats argument is malformed: \"{discordGatewayStats}\"')
+        elif not utils.isValidInt(announceConcurrency):
+            raise ValueError(f'announceConcurrency argument is malformed: \"{announceConcurrency}\"')
+        elif announceConcurrency < 1 or announceConcurrency > 32:
+            raise ValueError(f'announceConcurrency argument is out of bounds: {announceConcurrency}')
+        elif not utils.isValidInt(listTwitchUsersPageSize):
+            raise ValueError(f'listTwitchUsersPageSize argument is malformed: \"{listTwitchUsersPageSize}\"')
+        elif listTwitchUsersPageSize < 1 or listTwitchUsersPageSize > 20:
+            raise ValueError(f'listTwitchUsersPageSize argument is out of bounds: {listTwitchUsersPageSize}')
+        elif not utils.isValidInt(maxImportFailuresShown):
+            raise ValueError(f'maxImportFailuresShown argument is malformed: \"{maxImportFailuresShown}\"')
+        elif maxImportFailuresShown < 0 or maxImportFailuresShown > 20:
+            raise ValueError(f'maxImportFailuresShown argument is out of bounds: {maxImportFailuresShown}')
+        elif not utils.isValidInt(maxImportFileSizeBytes):
+            raise ValueError(f'maxImportFileSizeBytes argument is malformed: \"{maxImportFileSizeBytes}\"')
+        elif maxImportFileSizeBytes < 1024:
+            raise ValueError(f'maxImportFileSizeBytes argument is out of bounds: {maxImportFileSizeBytes}')
+        elif not utils.isValidInt(maxImportMemberLookups):
+            raise ValueError(f'maxImportMemberLookups argument is malformed: \"{maxImportMemberLookups}\"')
+        elif maxImportMemberLookups < 0 or maxImportMemberLookups > 500:
+            raise ValueError(f'maxImportMemberLookups argument is out of bounds: {maxImportMemberLookups}')
+        elif not utils.isValidNum(paginatorTimeoutSeconds):
+            raise ValueError(f'paginatorTimeoutSeconds argument is malformed: \"{paginatorTimeoutSeconds}\"')
+        elif paginatorTimeoutSeconds <= 0:
+            raise ValueError(f'paginatorTimeoutSeconds argument is out of bounds: {paginatorTimeoutSeconds}')
 
         self.__eventLoop: AbstractEventLoop = eventLoop
         self.__authRepository: AuthRepository = authRepository
+        self.__discordRestScheduler: DiscordRestScheduler = discordRestScheduler
         self.__generalSettingsRepository: GeneralSettingsRepository = generalSettingsRepository
-        self.__timber: Timber = timber
+        self.__rosterPruner: RosterPruner = rosterPruner
+        self.__startupHelper: StartupHelper = startupHelper
+        self.__timber: BufferedTimber = timber
         self.__twitchAnnounceChannelsRepository: TwitchAnnounceChannelsRepository = twitchAnnounceChannelsRepository
         self.__twitchAnnounceSettingsRepository: TwitchAnnounceSettingsRepository = twitchAnnounceSettingsRepository
         self.__twitchLiveUsersRepository: TwitchLiveUsersRepository = twitchLiveUsersRepository
-
-        now = datetime.now(timezone.utc)
-        self.__lastTwitchCheckTime = now - timedelta(minutes = self.__twitchAnnounceSettingsRepository.getAll().getRefreshEveryMinutes())
-
-    async def on_command_error(self, ctx, error):
-        if isinstance(error, CommandNotFound):
-            return
-        else:
-            raise error
+        self.__twitchUserIdsRepository: TwitchUserIdsRepository = twitchUserIdsRepository
+        self.__twitchUsersImportExportHelper: TwitchUsersImportExportHelper = twitchUsersImportExportHelper
+        self.__discordGatewayStats: Optional[DiscordGatewayStats] = discordGatewayStats
+        self.__announceConcurrency: int = announceConcurrency
+        self.__listTwitchUsersPageSize: int = listTwitchUsersPageSize
+        self.__maxImportFailuresShown: int = maxImportFailuresShown
+        self.__maxImportFileSizeBytes: int = maxImportFileSizeBytes
+        self.__maxImportMemberLookups: int = maxImportMemberLookups
+        self.__paginatorTimeoutSeconds: float = paginatorTimeoutSeconds
+
+        self.__lastTwitchCheckTime: Optional[datetime] = None
+        self.__loopingTask: Optional[asyncio.Task] = None
+        self.__startupTask: Optional[asyncio.Task] = None
+
+        # discord.py schedules a task for every listener of every event, so this one's only
+        # registered when the stats are actually wanted
+        if discordGatewayStats is not None:
+            self.add_listener(self.__onSocketEventType, 'on_socket_event_type')
+
+    async def on_guild_channel_delete(self, channel):
+        self.__rosterPruner.onChannelsRemoved([ channel.id ])
+
+    async def on_guild_remove(self, guild):
+        self.__timber.log('CynanBotDiscord', f'Removed from guild {guild.name}, pruning its {len(guild.channels)} channel(s) from the roster...')
+        self.__rosterPruner.onChannelsRemoved([ channel.id for channel in guild.channels ])
+
+    async def on_raw_member_remove(self, payload):
+        # the raw event still fires without the member cache, unlike on_member_remove
+        guild = self.get_guild(payload.guild_id)
+
+        if guild is not None:
+            self.__rosterPruner.onMemberRemoved(str(payload.user.id), [ channel.id for channel in guild.channels ])
 
     async def on_ready(self):
         self.__timber.log('CynanBotDiscord', f'{self.user} is ready!')
-        self.loop.create_task(self.__beginLooping())
-
-    async def addTwitchUser(self, ctx):
-        if ctx is None:
-            raise ValueError(f'ctx argument is malformed: \"{ctx}\"')
-
-        await self.wait_until_ready()
-
-        if not self.__isAuthorAdministrator(ctx):
-            return
 
-        mentions = self.__getMentionsFromCtx(ctx)
-        if not utils.hasItems(mentions):
-            await ctx.send('please mention the user you want to add')
+        # on_ready fires again after every gateway reconnect, but there should only ever be
+        # one poll loop running
+        if self.__loopingTask is None or self.__loopingTask.done():
+            self.__loopingTask = self.__eventLoop.create_task(self.__beginLooping())
+
+    async def __acknowledgeCommand(self, interaction: discord.Interaction) -> bool:
+        # Discord hides these commands from anyone but administrators by default, but a server
+        # can change that, so it's checked here as well
+        if not self.__isAuthorAdministrator(interaction):
+            await interaction.response.send_message('only administrators can use this command', ephemeral = True)
+            return False
+
+        # Discord only waits 3 seconds for an interaction to be acknowledged, which a command
+        # that goes to the database or to Twitch could take longer than. Deferring shows that the
+        # bot is thinking until the actual reply is sent as a followup. Interaction callbacks
+        # don't count against any channel's rate limits, so this skips the scheduler.
+        await interaction.response.defer(thinking = True)
+        return True
+
+    async def addTwitchUser(self, interaction: discord.Interaction, member: discord.Member, twitchHandle: str):
+        if interaction is None:
+            raise ValueError(f'interaction argument is malformed: \"{interaction}\"')
+        elif member is None:
+            raise ValueError(f'member argument is malformed: \"{member}\"')
+
+        if not await self.__acknowledgeCommand(interaction):
             return
 
-        content = utils.getCleanedSplits(ctx.message.content)
-        if not utils.hasItems(content):
-            await ctx.send('please give the user\'s twitch handle, as taken directly from their ttv url')
+        if not utils.isValidStr(twitchHandle):
+            await self.__reply(interaction, 'please give the user\'s twitch handle, as taken directly from their ttv url')
             return
 
-        if len(content) != 3:
-            await ctx.send('example command: `!addTwitchUser @CynanBot cynanbot` (the last parameter is their ttv handle)')
-            return
-
-        url = urllib.parse.urlparse(content[len(content) - 1])
+        url = urllib.parse.urlparse(twitchHandle.strip())
         twitchName = None
 
         if '/' in url.path:
@@ -106,88 +215,202 @@ class CynanBotDiscord(commands.Bot):
         else:
             twitchName = url.path
 
-        if not utils.isValidStr(twitchName):
-            await ctx.send('example command: `!addTwitchUser @CynanBot cynanbot` (the last parameter is their ttv handle)')
+        if not isValidTwitchLogin(twitchName):
+            await self.__reply(interaction, 'example command: `/addtwitchuser @CynanBot cynanbot` (the last parameter is their ttv handle)')
+            return
+
+        try:
+            twitchUserIdEntry = await self.__twitchUserIdsRepository.fetchUserId(twitchName)
+        except (GenericNetworkException, TwitchTokenIsExpiredException) as e:
+            self.__timber.log('CynanBotDiscord', f'Unable to verify Twitch handle \"{twitchName}\": {e}', e)
+            await self.__reply(interaction, f'unable to verify ttv/{twitchName} with Twitch right now, please try again later')
             return
 
+        if twitchUserIdEntry is None:
+            await self.__reply(interaction, f'ttv/{twitchName} doesn\'t seem to exist, please double check their ttv handle')
+            return
+
+        # use Twitch's own spelling of the login, rather than whatever was typed in
+        twitchName = twitchUserIdEntry.getTwitchLogin()
+
         user = User(
-            discordDiscriminator = mentions[0].discriminator,
-            discordId = str(mentions[0].id),
-            discordName = mentions[0].name,
+            discordDiscriminator = member.discriminator,
+            discordId = str(member.id),
+            discordName = member.name,
             twitchName = twitchName
         )
 
-        await self.__twitchAnnounceChannelsRepository.addUser(user, ctx.channel.id)
+        await self.__twitchAnnounceChannelsRepository.addUser(user, interaction.channel_id)
 
         self.__timber.log('CynanBotDiscord', f'Added `{user.getDiscordNameAndDiscriminator()}` (ttv/{user.getTwitchName()}) to Twitch announce users')
-        await ctx.send(f'added `{user.getDiscordNameAndDiscriminator()}` (ttv/{user.getTwitchName()}) to Twitch announce users')
+        await self.__reply(interaction, f'added `{user.getDiscordNameAndDiscriminator()}` (ttv/{user.getTwitchName()}) to Twitch announce users')
+
+    async def __announceTwitchLiveUser(self, twitchLiveUserData: TwitchLiveUserData):
+        discordAnnounceText = twitchLiveUserData.getDiscordAnnounceText()
+        user = twitchLiveUserData.getUser()
+        announceChannelNames: List[str] = list()
+        failedChannelCount = 0
+
+        for discordChannelId in twitchLiveUserData.getDiscordChannelIds():
+            try:
+                channel = await self.__fetchChannel(discordChannelId)
+            except discord.NotFound:
+                self.__timber.log('CynanBotDiscord', f'Couldn\'t find channel ID {discordChannelId}, removing it from the Twitch announce channels...')
+                self.__rosterPruner.onChannelsRemoved([ discordChannelId ])
+                continue
+            except discord.DiscordException as e:
+                self.__timber.log('CynanBotDiscord', f'Unable to fetch channel ID {discordChannelId} to announce a Twitch live stream in: {e}', e)
+                failedChannelCount = failedChannelCount + 1
+                continue
+
+            guildMember = None
+
+            try:
+                guildMember = await self.__discordRestScheduler.submit(
+                    route = 'GET /guilds/{id}/members/{id}',
+                    majorId = channel.guild.id,
+                    priority = DiscordRestPriority.BULK,
+                    call = lambda: channel.guild.fetch_member(user.getDiscordId())
+                )
+            except discord.NotFound:
+                pass
+            except discord.DiscordException as e:
+                self.__timber.log('CynanBotDiscord', f'Unable to fetch user ID {user.getDiscordId()} in guild {channel.guild.name} to announce their Twitch live stream: {e}', e)
+                failedChannelCount = failedChannelCount + 1
+                continue
+
+            if guildMember is None:
+                self.__timber.log('CynanBotDiscord', f'Couldn\'t find user ID {user.getDiscordId()} in guild {channel.guild.name}, removing them from this channel\'s Twitch announce users...')
+                self.__rosterPruner.onMemberRemoved(user.getDiscordId(), [ discordChannelId ])
+                continue
+
+            try:
+                await self.__discordRestScheduler.submit(
+                    route = 'POST /channels/{id}/messages',
+                    majorId = discordChannelId,
+                    priority = DiscordRestPriority.BULK,
+                    call = lambda: channel.send(discordAnnounceText)
+                )
+            except discord.DiscordException as e:
+                self.__timber.log('CynanBotDiscord', f'Unable to announce Twitch live stream for {user.getDiscordNameAndDiscriminator()} in {channel.guild.name}:{channel.name}: {e}', e)
+                failedChannelCount = failedChannelCount + 1
+                continue
+
+            announceChannelNames.append(f'{channel.guild.name}:{channel.name}')
+
+        if utils.hasItems(announceChannelNames):
+            self.__timber.log('CynanBotDiscord', lambda user = user, announceChannelNames = announceChannelNames: f'Announced Twitch live stream for {user.getDiscordNameAndDiscriminator()} in {", ".join(announceChannelNames)}')
+        elif failedChannelCount >= 1:
+            # Nobody saw this announcement, so the stream is unmarked and gets another go on the
+            # next poll cycle. If it reached some channels but not others, it isn't sent again, as
+            # that would repeat it everywhere it already went out.
+            await self.__twitchLiveUsersRepository.unmarkAnnounced(twitchLiveUserData)
+
+    async def __announceTwitchLiveUsers(self, announceQueue: asyncio.Queue):
+        while True:
+            twitchLiveUserData: Optional[TwitchLiveUserData] = await announceQueue.get()
+
+            if twitchLiveUserData is None:
+                return
+
+            # one failed announcement mustn't hold up everybody else's, or stop this announcer
+            try:
+                await self.__announceTwitchLiveUser(twitchLiveUserData)
+            except Exception as e:
+                exceptionText = traceback.format_exc()
+                self.__timber.log('CynanBotDiscord', lambda e = e, exceptionText = exceptionText: f'Encountered Exception when announcing a Twitch live stream: {e}\n{exceptionText}', e, sampleKey = 'announceTwitchLiveUser:Exception')
 
     async def __beginLooping(self):
         await self.wait_until_ready()
 
+        if self.__startupTask is not None:
+            startupTimings = await self.__startupTask
+            self.__timber.log('CynanBotDiscord', f'Startup warm up finished before first poll ({startupTimings.toStr()})')
+
         while not self.is_closed():
             try:
                 await self.__checkTwitchStreams()
+
+                # only actually writes anything if the roster has changed since the last snapshot
+                await self.__twitchAnnounceChannelsRepository.saveSnapshot()
             except Exception as e:
-                self.__timber.log('CynanBotDiscord', f'Encountered Exception when checking Twitch streams: {e}\n{traceback.format_exc()}', e)
+                exceptionText = traceback.format_exc()
+                self.__timber.log('CynanBotDiscord', lambda e = e, exceptionText = exceptionText: f'Encountered Exception when checking Twitch streams: {e}\n{exceptionText}', e, sampleKey = 'checkTwitchStreams:Exception')
 
             generalSettings = await self.__generalSettingsRepository.getAllAsync()
-            await asyncio.sleep(generalSettings.getRefreshEverySeconds())
+            twitchAnnounceSettings = await self.__twitchAnnounceSettingsRepository.getAllAsync()
+            await asyncio.sleep(min(generalSettings.getRefreshEverySeconds(), twitchAnnounceSettings.getPollTickSeconds()))
 
     async def __checkTwitchStreams(self):
         now = datetime.now(timezone.utc)
         twitchAnnounceSettings = await self.__twitchAnnounceSettingsRepository.getAllAsync()
-        if self.__lastTwitchCheckTime + timedelta(minutes = twitchAnnounceSettings.getRefreshEveryMinutes()) >= now:
+        # Twitch is checked once per poll tick, but each tick only asks about the users that are
+        # due (see PollScheduler), so ticks can be much more frequent than refreshEveryMinutes
+        pollTickSeconds = min(twitchAnnounceSettings.getPollTickSeconds(), twitchAnnounceSettings.getRefreshEveryMinutes() * 60)
+        if self.__lastTwitchCheckTime is not None and self.__lastTwitchCheckTime + timedelta(seconds = pollTickSeconds) >= now:
             return
 
         self.__lastTwitchCheckTime = now
         self.__timber.log('CynanBotDiscord', 'Checking for live Twitch streams...')
 
-        twitchLiveUserData = await self.__twitchLiveUsersRepository.fetchTwitchLiveUserData()
-        if not utils.hasItems(twitchLiveUserData):
-            return
+        # Live users come out of the poll cycle one checked batch at a time, and each one is
+        # announced as soon as one of the announcers is free, while later batches are still
+        # being checked. The queue is bounded, so when announcing falls behind, so does checking.
+        announceQueue: asyncio.Queue = asyncio.Queue(maxsize = self.__announceConcurrency)
+        announceTasks: List[asyncio.Task] = list()
 
-        for twitchLiveUserData in twitchLiveUserData:
-            twitchLiveData = twitchLiveUserData.getTwitchLiveDetails()
+        for _ in range(self.__announceConcurrency):
+            announceTasks.append(self.__eventLoop.create_task(self.__announceTwitchLiveUsers(announceQueue)))
 
-            firstLineText = ''
-            if twitchLiveData.hasGameName():
-                firstLineText = f'{twitchLiveData.getUserLogin()} is now live with {twitchLiveData.getGameName()}!'
-            else:
-                firstLineText = f'{twitchLiveData.getUserLogin()} is now live!'
+        try:
+            async for twitchLiveUserData in self.__twitchLiveUsersRepository.streamTwitchLiveUserData():
+                await announceQueue.put(twitchLiveUserData)
 
-            secondLineText = f' https://twitch.tv/{twitchLiveData.getUserLogin()}'
+            for _ in range(len(announceTasks)):
+                await announceQueue.put(None)
 
-            thirdLineText = ''
-            if twitchLiveData.hasTitle():
-                thirdLineText = f'\n> {twitchLiveData.getTitle()}'
+            await asyncio.gather(*announceTasks)
+        finally:
+            for announceTask in announceTasks:
+                if not announceTask.done():
+                    announceTask.cancel()
 
-            discordAnnounceText = f'{firstLineText}{secondLineText}{thirdLineText}'
+    async def exportTwitchUsers(self, interaction: discord.Interaction, fileFormat: str = 'csv'):
+        if interaction is None:
+            raise ValueError(f'interaction argument is malformed: \"{interaction}\"')
 
-            user = twitchLiveUserData.getUser()
-            announceChannelNames: List[str] = list()
+        if not await self.__acknowledgeCommand(interaction):
+            return
 
-            for discordChannelId in twitchLiveUserData.getDiscordChannelIds():
-                channel = await self.__fetchChannel(discordChannelId)
-                guildMember = await channel.guild.fetch_member(user.getDiscordId())
+        isJson = utils.isValidStr(fileFormat) and fileFormat.lower() == 'json'
 
-                if guildMember is None:
-                    self.__timber.log('CynanBotDiscord', f'Couldn\'t find user ID {user.getDiscordId()} in guild {channel.guild.name}, removing them from this channel\'s Twitch announce users...')
-                    self.__twitchAnnounceChannelsRepository.removeUser(user, discordChannelId)
-                else:
-                    announceChannelNames.append(f'{channel.guild.name}:{channel.name}')
-                    await channel.send(discordAnnounceText)
+        discordChannelId: int = interaction.channel_id
+        exportedContents, userCount = await self.__twitchUsersImportExportHelper.exportUsers(discordChannelId, isJson)
+
+        if userCount == 0:
+            await self.__reply(interaction, 'no users are currently having their Twitch streams announced in this channel')
+            return
 
-            if utils.hasItems(announceChannelNames):
-                channelNames = ', '.join(announceChannelNames)
-                self.__timber.log('CynanBotDiscord', f'Announced Twitch live stream for {user.getDiscordNameAndDiscriminator()} in {channelNames}')
+        fileName = f'twitchUsers-{discordChannelId}.json' if isJson else f'twitchUsers-{discordChannelId}.csv'
+
+        self.__timber.log('CynanBotDiscord', f'Exported {userCount} Twitch announce user(s) from channel {discordChannelId}')
+        await self.__reply(
+            interaction = interaction,
+            content = f'exported {userCount} Twitch announce user(s)',
+            file = discord.File(io.BytesIO(exportedContents.encode('utf-8')), filename = fileName)
+        )
 
     async def __fetchChannel(self, channelId: int):
         if not utils.isValidNum(channelId):
             raise ValueError(f'channelId argument is malformed: \"{channelId}\"')
 
         await self.wait_until_ready()
-        channel = await self.fetch_channel(channelId)
+        channel = await self.__discordRestScheduler.submit(
+            route = 'GET /channels/{id}',
+            majorId = channelId,
+            priority = DiscordRestPriority.BULK,
+            call = lambda: self.fetch_channel(channelId)
+        )
 
         if channel is None:
             raise RuntimeError(f'No channel returned for ID: \"{channelId}\"')
@@ -208,82 +431,324 @@ class CynanBotDiscord(commands.Bot):
 
         return guild
 
-    def __getMentionsFromCtx(self, ctx):
-        if ctx is None:
-            raise ValueError(f'ctx argument is malformed: \"{ctx}\"')
+    async def __fetchMemberNames(self, guild: Optional[discord.Guild], discordIds: List[str]) -> Dict[str, Tuple[str, str]]:
+        # The member cache is switched off, so members are fetched from Discord, through the
+        # scheduler, which spaces them out to that route's (rather tight) per guild rate limit.
+        # So only the first maxImportMemberLookups of them are ever fetched for any one import,
+        # anyone beyond that has to have their name and discriminator given in the file.
+        discordIdsToMembers: Dict[str, Tuple[str, str]] = dict()
 
-        message = ctx.message
+        if guild is None or not utils.hasItems(discordIds):
+            return discordIdsToMembers
 
-        if message is None:
-            raise ValueError(f'ctx ({ctx}) message is malformed: \"{message}\"')
+        async def fetchMemberName(discordId: str):
+            try:
+                member = await self.__discordRestScheduler.submit(
+                    route = 'GET /guilds/{id}/members/{id}',
+                    majorId = guild.id,
+                    priority = DiscordRestPriority.INTERACTIVE,
+                    call = lambda: guild.fetch_member(int(discordId))
+                )
+            except discord.NotFound:
+                return
+            except discord.DiscordException as e:
+                self.__timber.log('CynanBotDiscord', f'Unable to fetch user ID {discordId} in guild {guild.name} for a Twitch users import: {e}', e, sampleKey = 'fetchMemberNames:DiscordException')
+                return
+
+            discordIdsToMembers[discordId] = (member.name, member.discriminator)
+
+        await asyncio.gather(*[ fetchMemberName(discordId) for discordId in discordIds[0:self.__maxImportMemberLookups] ])
+        return discordIdsToMembers
+
+    async def importTwitchUsers(self, interaction: discord.Interaction, attachment: discord.Attachment):
+        if interaction is None:
+            raise ValueError(f'interaction argument is malformed: \"{interaction}\"')
+
+        if not await self.__acknowledgeCommand(interaction):
+            return
 
-        return message.mentions
+        if attachment is None:
+            await self.__reply(interaction, 'please attach a CSV (with a `discordId,discordName,discordDiscriminator,twitchName` header) or JSON file of the users you want to add, the same format that `/exporttwitchusers` creates')
+            return
 
-    def __isAuthorAdministrator(self, ctx):
-        if ctx is None:
-            raise ValueError(f'ctx argument is malformed: \"{ctx}\"')
+        if attachment.size > self.__maxImportFileSizeBytes:
+            await self.__reply(interaction, f'that file is too large to import, it can be at most {self.__maxImportFileSizeBytes // 1024} KB')
+            return
 
-        roles = ctx.author.roles
+        try:
+            fileContents = (await attachment.read()).decode('utf-8-sig')
+        except discord.DiscordException as e:
+            self.__timber.log('CynanBotDiscord', f'Unable to download Twitch users import file \"{attachment.filename}\": {e}', e)
+            await self.__reply(interaction, 'unable to download that file right now, please try again later')
+            return
+        except UnicodeDecodeError:
+            await self.__reply(interaction, 'that file isn\'t valid UTF-8 text')
+            return
 
-        if utils.hasItems(roles):
-            for role in roles:
-                if role.permissions.administrator:
-                    return True
+        if not utils.isValidStr(fileContents):
+            await self.__reply(interaction, 'that file is empty')
+            return
 
-        return False
+        guild = interaction.guild
 
-    async def listTwitchUsers(self, ctx):
-        if ctx is None:
-            raise ValueError(f'ctx argument is malformed: \"{ctx}\"')
+        try:
+            result = await self.__twitchUsersImportExportHelper.importUsers(
+                discordChannelId = interaction.channel_id,
+                content = fileContents,
+                fileName = attachment.filename,
+                memberLookup = lambda discordIds: self.__fetchMemberNames(guild, discordIds)
+            )
+        except ValueError as e:
+            await self.__reply(interaction, f'unable to import that file: {e}')
+            return
 
-        await self.wait_until_ready()
+        summary = f'imported {len(result.getImportedUsers())} of {result.getRowCount()} row(s) into this channel\'s Twitch announce users in {result.getElapsedSeconds():.1f}s'
 
-        if not self.__isAuthorAdministrator(ctx):
+        if not result.hasFailures():
+            await self.__reply(interaction, summary)
             return
 
-        twitchAnnounceChannel = await self.__twitchAnnounceChannelsRepository.fetchTwitchAnnounceChannel(ctx.channel.id)
-        if twitchAnnounceChannel is None or not twitchAnnounceChannel.hasUsers():
-            await ctx.send('no users are currently having their Twitch streams announced in this channel')
+        failures = result.getFailures()
+        failureLines: List[str] = list()
+
+        for failure in failures[0:self.__maxImportFailuresShown]:
+            failureStr = failure.toStr()
+
+            if len(failureStr) > 150:
+                failureStr = f'{failureStr[0:147]}...'
+
+            failureLines.append(f' - {failureStr}')
+
+        summary = f'{summary}, {len(failures)} row(s) were rejected:\n' + '\n'.join(failureLines)
+
+        # the full list of rejected rows could easily blow past Discord's message length limit,
+        # so anything beyond the first few is sent as a file instead
+        if len(failures) <= self.__maxImportFailuresShown:
+            await self.__reply(interaction, summary)
+        else:
+            failuresReport = '\n'.join([ failure.toStr() for failure in failures ])
+
+            await self.__reply(
+                interaction = interaction,
+                content = f'{summary}\n(see the attached file for all {len(failures)} rejected rows)',
+                file = discord.File(io.BytesIO(failuresReport.encode('utf-8')), filename = 'twitchUsersImportFailures.txt')
+            )
+
+    async def __interact(self, interaction: discord.Interaction, route: str, call):
+        # edits to a reply that the bot already sent to a command
+        return await self.__discordRestScheduler.submit(
+            route = route,
+            majorId = interaction.token,
+            priority = DiscordRestPriority.INTERACTIVE,
+            call = call
+        )
+
+    def __isAuthorAdministrator(self, interaction: discord.Interaction) -> bool:
+        if interaction is None:
+            raise ValueError(f'interaction argument is malformed: \"{interaction}\"')
+
+        # the user's permissions in the channel that the command was used in, roles included
+        return interaction.permissions.administrator
+
+    async def listTwitchUsers(self, interaction: discord.Interaction):
+        if interaction is None:
+            raise ValueError(f'interaction argument is malformed: \"{interaction}\"')
+
+        if not await self.__acknowledgeCommand(interaction):
             return
 
-        userNames: List[str] = list()
-        for user in twitchAnnounceChannel.getUsers():
-            # Every user retrieved here _should_ have a Twitch name, as we require it when
-            # entering them into the database as a Twitch announce user. But let's just be safe...
+        discordChannelId: int = interaction.channel_id
+        userCount = await self.__twitchAnnounceChannelsRepository.fetchTwitchAnnounceChannelUserCount(discordChannelId)
 
-            if user.hasTwitchName():
-                userNames.append(f' - `{user.getDiscordNameAndDiscriminator()}` (ttv/{user.getTwitchName()})')
-            else:
-                userNames.append(f' - `{user.getDiscordNameAndDiscriminator()}`')
+        if userCount == 0:
+            await self.__reply(interaction, 'no users are currently having their Twitch streams announced in this channel')
+            return
 
-        userNamesString = '\n'.join(userNames)
-        await ctx.send(f'users who are having their Twitch streams announced in this channel:\n{userNamesString}')
+        # Rosters are listed one page at a time (a single query per page), and each page is kept
+        # small enough to always fit within Discord's 2000 character message limit. If there's
+        # more than one page, the message gets previous and next page buttons. Button presses
+        # arrive as interactions just like commands do, so unlike reactions they don't need any
+        # gateway intents.
+        pageCount = math.ceil(userCount / self.__listTwitchUsersPageSize)
+        pageIndex = 0
+        pageCursors: List[Optional[User]] = [ None ]
+        pageLock = asyncio.Lock()
+
+        users = await self.__twitchAnnounceChannelsRepository.fetchTwitchAnnounceChannelUsersPage(
+            discordChannelId = discordChannelId,
+            pageSize = self.__listTwitchUsersPageSize
+        )
 
-    async def removeTwitchUser(self, ctx):
-        if ctx is None:
-            raise ValueError(f'ctx argument is malformed: \"{ctx}\"')
+        pageContent = self.__toTwitchUsersPageStr(users, pageIndex, pageCount, userCount)
 
-        await self.wait_until_ready()
+        if pageCount <= 1:
+            await self.__reply(interaction, pageContent)
+            return
+
+        view = discord.ui.View(timeout = self.__paginatorTimeoutSeconds)
+        previousPageButton = discord.ui.Button(emoji = '\u25c0', disabled = True)
+        nextPageButton = discord.ui.Button(emoji = '\u25b6')
+
+        async def turnPage(buttonInteraction: discord.Interaction, pageDelta: int):
+            nonlocal pageIndex, users
 
-        if not self.__isAuthorAdministrator(ctx):
+            if buttonInteraction.user.id != interaction.user.id:
+                await buttonInteraction.response.send_message('only whoever used this command can turn its pages', ephemeral = True)
+                return
+
+            async with pageLock:
+                if pageDelta > 0 and pageIndex + 1 < pageCount and utils.hasItems(users):
+                    if len(pageCursors) == pageIndex + 1:
+                        pageCursors.append(users[len(users) - 1])
+
+                    pageIndex = pageIndex + 1
+                elif pageDelta < 0 and pageIndex > 0:
+                    pageIndex = pageIndex - 1
+                else:
+                    await buttonInteraction.response.defer()
+                    return
+
+                users = await self.__twitchAnnounceChannelsRepository.fetchTwitchAnnounceChannelUsersPage(
+                    discordChannelId = discordChannelId,
+                    pageSize = self.__listTwitchUsersPageSize,
+                    afterUser = pageCursors[pageIndex]
+                )
+
+                previousPageButton.disabled = pageIndex == 0
+                nextPageButton.disabled = pageIndex + 1 >= pageCount
+
+                # answering the button press is what updates the message, so like deferring a
+                # command, it doesn't go through the scheduler
+                await buttonInteraction.response.edit_message(
+                    content = self.__toTwitchUsersPageStr(users, pageIndex, pageCount, userCount),
+                    view = view
+                )
+
+        previousPageButton.callback = lambda buttonInteraction: turnPage(buttonInteraction, -1)
+        nextPageButton.callback = lambda buttonInteraction: turnPage(buttonInteraction, 1)
+        view.add_item(previousPageButton)
+        view.add_item(nextPageButton)
+
+        message = await self.__reply(interaction, pageContent, view = view)
+
+        # once the paginator times out, its buttons no longer do anything, so they're taken away
+        await view.wait()
+
+        try:
+            await self.__interact(interaction, 'PATCH /webhooks/{id}/{token}/messages/{id}', lambda: message.edit(view = None))
+        except discord.DiscordException:
+            pass
+
+    async def __onSocketEventType(self, eventType: str):
+        self.__discordGatewayStats.onEvent(eventType)
+
+    async def removeTwitchUsers(self, interaction: discord.Interaction, members: List[Union[discord.Member, discord.User]]):
+        if interaction is None:
+            raise ValueError(f'interaction argument is malformed: \"{interaction}\"')
+        elif not utils.hasItems(members):
+            raise ValueError(f'members argument is malformed: \"{members}\"')
+
+        if not await self.__acknowledgeCommand(interaction):
             return
 
-        mentions = self.__getMentionsFromCtx(ctx)
-        if not utils.hasItems(mentions):
-            await ctx.send('please mention the user(s) you want to remove')
+        # they may well have already left the server, in which case these are just Users
+        users: Dict[str, User] = dict()
+
+        for member in members:
+            if member is not None:
+                users[str(member.id)] = User(
+                    discordDiscriminator = member.discriminator,
+                    discordId = str(member.id),
+                    discordName = member.name
+                )
+
+        if not utils.hasItems(users):
+            await self.__reply(interaction, 'example command: `/removetwitchuser @CynanBot`')
             return
 
+        # one write for however many users were given, rather than one per user
+        await self.__twitchAnnounceChannelsRepository.removeUsers({ interaction.channel_id: set(users.keys()) })
+
+        userNamesStr = ', '.join([ f'`{user.getDiscordNameAndDiscriminator()}`' for user in users.values() ])
+        self.__timber.log('CynanBotDiscord', f'Removed {userNamesStr} from Twitch announce users')
+        await self.__reply(interaction, f'removed {userNamesStr} from Twitch announce users')
+
+    async def __reply(
+        self,
+        interaction: discord.Interaction,
+        content: Optional[str] = None,
+        file: Optional[discord.File] = None,
+        view: Optional[discord.ui.View] = None
+    ):
+        # Command replies jump ahead of any go-live announcements that are still waiting to go
+        # out. They're followups to the deferred interaction, which can't be given a None file or
+        # view, those have to be left out entirely.
+        arguments: Dict[str, Any] = {
+            'content': content,
+            'wait': True
+        }
+
+        if file is not None:
+            arguments['file'] = file
+
+        if view is not None:
+            arguments['view'] = view
+
+        return await self.__discordRestScheduler.submit(
+            route = 'POST /webhooks/{id}/{token}',
+            majorId = interaction.token,
+            priority = DiscordRestPriority.INTERACTIVE,
+            call = lambda: interaction.followup.send(**arguments)
+        )
+
+    async def setup_hook(self):
+        # Registers the application commands (see initCynanBotDiscord) with Discord. That's only
+        # needed when the commands themselves have changed (and Discord rate limits it), so it's
+        # only done while discordCommandSyncEnabled is switched on, which is best left on for just
+        # the one startup. New or changed global commands can take a little while to show up.
+        generalSettings = await self.__generalSettingsRepository.getAllAsync()
+
+        if not generalSettings.isDiscordCommandSyncEnabled():
+            self.__timber.log('CynanBotDiscord', 'Not syncing application commands, switch on discordCommandSyncEnabled for a startup if they\'ve changed (or have never been synced)')
+            return
+
+        try:
+            appCommands = await self.tree.sync()
+            self.__timber.log('CynanBotDiscord', f'Synced {len(appCommands)} application command(s)')
+        except discord.DiscordException as e:
+            self.__timber.log('CynanBotDiscord', f'Unable to sync application commands: {e}', e)
+
+    async def start(self, *args, **kwargs):
+        # Kick off the warm up before logging in, so that it runs concurrently with discord.py's
+        # login and gateway handshake rather than after on_ready.
+        if self.__startupTask is None:
+            self.__startupTask = self.__eventLoop.create_task(self.__startupHelper.warmUp())
+
+        await super().start(*args, **kwargs)
+
+    def __toTwitchUsersPageStr(
+        self,
+        users: List[User],
+        pageIndex: int,
+        pageCount: int,
+        userCount: int
+    ) -> str:
+        if not utils.hasItems(users):
+            return f'there are no more users on page {pageIndex + 1} of {pageCount}'
+
         userNames: List[str] = list()
-        for mention in mentions:
-            user = User(
-                discordDiscriminator = mention.discriminator,
-                discordId = str(mention.id),
-                discordName = mention.name
-            )
+        for user in users:
+            # Every user retrieved here _should_ have a Twitch name, as we require it when
+            # entering them into the database as a Twitch announce user. But let's just be safe...
 
-            await self.__twitchAnnounceChannelsRepository.removeUser(user, ctx.channel.id)
-            userNames.append(f'`{user.getDiscordNameAndDiscriminator()}`')
+            if user.hasTwitchName():
+                userNames.append(f' - `{user.getDiscordNameAndDiscriminator()}` (ttv/{user.getTwitchName()})')
+            else:
+                userNames.append(f' - `{user.getDiscordNameAndDiscriminator()}`')
 
-        usersString = ', '.join(userNames)
-        self.__timber.log('CynanBotDiscord', f'Removed {usersString} from Twitch announce users')
-        await ctx.send(f'removed {usersString} from Twitch announce users')
+        userNamesString = '\n'.join(userNames)
+
+        if pageCount <= 1:
+            return f'users who are having their Twitch streams announced in this channel:\n{userNamesString}'
+        else:
+            return f'users who are having their Twitch streams announced in this channel ({userCount} total, page {pageIndex + 1} of {pageCount}):\n{userNamesString}'
@@ -0,0 +1,137 @@
+import asyncio
+from typing import Dict, List, Optional, Set
+
+import CynanBotCommon.utils as utils
+from CynanBotCommon.storage.backingDatabase import BackingDatabase
+from CynanBotCommon.storage.databaseConnection import DatabaseConnection
+from CynanBotCommon.storage.databaseType import DatabaseType
+
+
+class DatabaseSchemaRegistry():
+
+    # Keeps track of which tables exist in the database, so that repositories don't need to
+    # re-run CREATE TABLE statements over and over again. The existing tables are introspected
+    # once (lazily, upon first use), and from then on every table this registry creates gets
+    # remembered. Table creation is guarded by a per-table lock, so concurrent callers asking
+    # for the same table will wait for the first one to finish rather than racing past it.
+
+    def __init__(self, backingDatabase: BackingDatabase):
+        if not isinstance(backingDatabase, BackingDatabase):
+            raise ValueError(f'backingDatabase argument is malformed: \"{backingDatabase}\"')
+
+        self.__backingDatabase: BackingDatabase = backingDatabase
+
+        self.__introspectionLock: asyncio.Lock = asyncio.Lock()
+        self.__tableLocks: Dict[str, asyncio.Lock] = dict()
+        self.__tableNames: Optional[Set[str]] = None
+
+    async def clearCaches(self):
+        # only forgets which tables exist, they're introspected again upon next use
+        self.__tableNames = None
+
+    async def createTableIfNotExists(
+        self,
+        tableName: str,
+        psqlStatement: str,
+        sqliteStatement: str,
+        connection: Optional[DatabaseConnection] = None
+    ) -> bool:
+        if not utils.isValidStr(tableName):
+            raise ValueError(f'tableName argument is malformed: \"{tableName}\"')
+        elif not utils.isValidStr(psqlStatement):
+            raise ValueError(f'psqlStatement argument is malformed: \"{psqlStatement}\"')
+        elif not utils.isValidStr(sqliteStatement):
+            raise ValueError(f'sqliteStatement argument is malformed: \"{sqliteStatement}\"')
+
+        # returns True only if this call is the one that actually created the table
+
+        tableName = tableName.lower()
+        tableNames = await self.__getTableNames()
+
+        if tableName in tableNames:
+            return False
+
+        tableLock = self.__tableLocks.get(tableName)
+        if tableLock is None:
+            tableLock = asyncio.Lock()
+            self.__tableLocks[tableName] = tableLock
+
+        async with tableLock:
+            if tableName in tableNames:
+                return False
+
+            ownsConnection = connection is None
+            if ownsConnection:
+                connection = await self.__backingDatabase.getConnection()
+
+            try:
+                if connection.getDatabaseType() is DatabaseType.POSTGRESQL:
+                    await connection.createTableIfNotExists(psqlStatement)
+                elif connection.getDatabaseType() is DatabaseType.SQLITE:
+                    await connection.createTableIfNotExists(sqliteStatement)
+                else:
+                    raise RuntimeError(f'unknown DatabaseType: \"{connection.getDatabaseType()}\"')
+            finally:
+                if ownsConnection:
+                    await connection.close()
+
+            tableNames.add(tableName)
+
+        self.__tableLocks.pop(tableName, None)
+        return True
+
+    async def __getTableNames(self) -> Set[str]:
+        if self.__tableNames is not None:
+            return self.__tableNames
+
+        async with self.__introspectionLock:
+            if self.__tableNames is not None:
+                return self.__tableNames
+
+            connection = await self.__backingDatabase.getConnection()
+            rows: Optional[List[List[str]]] = None
+
+            if connection.getDatabaseType() is DatabaseType.POSTGRESQL:
+                rows = await connection.fetchRows(
+                    '''
+                        SELECT tablename FROM pg_catalog.pg_tables
+                        WHERE schemaname = current_schema()
+                    '''
+                )
+            elif connection.getDatabaseType() is DatabaseType.SQLITE:
+                rows = await connection.fetchRows(
+                    '''
+                        SELECT name FROM sqlite_master
+                        WHERE type = 'table'
+                    '''
+                )
+            else:
+                await connection.close()
+                raise RuntimeError(f'unknown DatabaseType: \"{connection.getDatabaseType()}\"')
+
+            await connection.close()
+
+            tableNames: Set[str] = set()
+            if utils.hasItems(rows):
+                for row in rows:
+                    tableNames.add(row[0].lower())
+
+            self.__tableNames = tableNames
+            return tableNames
+
+    async def hasTable(self, tableName: str) -> bool:
+        if not utils.isValidStr(tableName):
+            raise ValueError(f'tableName argument is malformed: \"{tableName}\"')
+
+        tableNames = await self.__getTableNames()
+        return tableName.lower() in tableNames
+
+    async def introspect(self):
+        await self.__getTableNames()
+
+    def removeTable(self, tableName: str):
+        if not utils.isValidStr(tableName):
+            raise ValueError(f'tableName argument is malformed: \"{tableName}\"')
+
+        if self.__tableNames is not None:
+            self.__tableNames.discard(tableName.lower())
@@ -0,0 +1,223 @@
+import asyncio
+import contextvars
+from asyncio import AbstractEventLoop
+from typing import Any, Awaitable, Callable, List, Optional
+
+import CynanBotCommon.utils as utils
+
+
+class DatabaseWrite():
+
+    def __init__(
+        self,
+        writeKey: Optional[str],
+        items: List[Any],
+        writeFunction: Callable[[List[Any]], Awaitable[Any]],
+        future: asyncio.Future
+    ):
+        if writeKey is not None and not utils.isValidStr(writeKey):
+            raise ValueError(f'writeKey argument is malformed: \"{writeKey}\"')
+        elif not utils.hasItems(items):
+            raise ValueError(f'items argument is malformed: \"{items}\"')
+        elif not callable(writeFunction):
+            raise ValueError(f'writeFunction argument is malformed: \"{writeFunction}\"')
+        elif not isinstance(future, asyncio.Future):
+            raise ValueError(f'future argument is malformed: \"{future}\"')
+
+        self.__writeKey: Optional[str] = writeKey
+        self.__items: List[Any] = items
+        self.__writeFunction: Callable[[List[Any]], Awaitable[Any]] = writeFunction
+        self.__future: asyncio.Future = future
+
+    def getFuture(self) -> asyncio.Future:
+        return self.__future
+
+    def getItems(self) -> List[Any]:
+        return self.__items
+
+    def getWriteFunction(self) -> Callable[[List[Any]], Awaitable[Any]]:
+        return self.__writeFunction
+
+    def getWriteKey(self) -> Optional[str]:
+        return self.__writeKey
+
+
+class DatabaseWriteQueue():
+
+    # Funnels roster writes through one single writer task, so that SQLite never has more than
+    # one of them contending for its write lock at a time. Writes are submitted along with the
+    # bulk function that performs them, and a writeKey. Once a write arrives, the writer waits
+    # up to maxDelayMillis (or until maxBatchSize writes have queued up), and then goes through
+    # them in the order that they were submitted. Consecutive writes that share a writeKey are
+    # coalesced into one call of the bulk function, e.g. every addOrUpdateUser() from a poll
+    # cycle becomes one multi-row upsert. A write without a writeKey is never coalesced.
+    #
+    # Every write gets its own future, which resolves once its batch has been committed, so
+    # anything read after awaiting it will see it. If a coalesced call fails, its writes are
+    # tried again one by one, so that only the writes that actually fail get the exception.
+    #
+    # A bulk function may well submit writes of its own (e.g. adding users to a channel also
+    # upserts those users), which are run inline rather than queued, as the writer would
+    # otherwise end up waiting on itself.
+
+    def __init__(
+        self,
+        eventLoop: AbstractEventLoop,
+        maxBatchSize: int = 200,
+        maxDelayMillis: float = 5
+    ):
+        if not isinstance(eventLoop, AbstractEventLoop):
+            raise ValueError(f'eventLoop argument is malformed: \"{eventLoop}\"')
+        elif not utils.isValidInt(maxBatchSize):
+            raise ValueError(f'maxBatchSize argument is malformed: \"{maxBatchSize}\"')
+        elif maxBatchSize < 1:
+            raise ValueError(f'maxBatchSize argument is out of bounds: {maxBatchSize}')
+        elif not utils.isValidNum(maxDelayMillis):
+            raise ValueError(f'maxDelayMillis argument is malformed: \"{maxDelayMillis}\"')
+        elif maxDelayMillis < 0:
+            raise ValueError(f'maxDelayMillis argument is out of bounds: {maxDelayMillis}')
+
+        self.__eventLoop: AbstractEventLoop = eventLoop
+        self.__maxBatchSize: int = maxBatchSize
+        self.__maxDelaySeconds: float = maxDelayMillis / 1000
+
+        self.__isWriter: contextvars.ContextVar = contextvars.ContextVar('isDatabaseWriter', default = False)
+        self.__queue: asyncio.Queue = asyncio.Queue()
+        self.__writerTask: Optional[asyncio.Task] = None
+
+        self.__batchCount: int = 0
+        self.__writeCount: int = 0
+        self.__writeFunctionCallCount: int = 0
+
+    async def __flush(self, databaseWrites: List[DatabaseWrite]):
+        self.__batchCount = self.__batchCount + 1
+        runs: List[List[DatabaseWrite]] = list()
+
+        for databaseWrite in databaseWrites:
+            if utils.hasItems(runs) and databaseWrite.getWriteKey() is not None and databaseWrite.getWriteKey() == runs[-1][0].getWriteKey():
+                runs[-1].append(databaseWrite)
+            else:
+                runs.append([ databaseWrite ])
+
+        for run in runs:
+            if len(run) == 1:
+                await self.__runWrite(run[0].getWriteFunction(), run[0].getItems(), run)
+                continue
+
+            items: List[Any] = list()
+            for databaseWrite in run:
+                items.extend(databaseWrite.getItems())
+
+            if not await self.__runWrite(run[0].getWriteFunction(), items, run, raiseException = False):
+                for databaseWrite in run:
+                    await self.__runWrite(databaseWrite.getWriteFunction(), databaseWrite.getItems(), [ databaseWrite ])
+
+    def getBatchCount(self) -> int:
+        return self.__batchCount
+
+    def getQueueSize(self) -> int:
+        return self.__queue.qsize()
+
+    def getWriteCount(self) -> int:
+        return self.__writeCount
+
+    def getWriteFunctionCallCount(self) -> int:
+        return self.__writeFunctionCallCount
+
+    async def __runWrite(
+        self,
+        writeFunction: Callable[[List[Any]], Awaitable[Any]],
+        items: List[Any],
+        databaseWrites: List[DatabaseWrite],
+        raiseException: bool = True
+    ) -> bool:
+        self.__writeFunctionCallCount = self.__writeFunctionCallCount + 1
+
+        try:
+            result = await writeFunction(items)
+        except Exception as e:
+            if not raiseException:
+                return False
+
+            for databaseWrite in databaseWrites:
+                if not databaseWrite.getFuture().done():
+                    databaseWrite.getFuture().set_exception(e)
+
+            return False
+
+        for databaseWrite in databaseWrites:
+            # the caller may have stopped waiting, e.g. it was cancelled
+            if not databaseWrite.getFuture().done():
+                databaseWrite.getFuture().set_result(result)
+
+        return True
+
+    async def __runWriter(self):
+        self.__isWriter.set(True)
+
+        while True:
+            databaseWrites: List[DatabaseWrite] = [ await self.__queue.get() ]
+            deadline = self.__eventLoop.time() + self.__maxDelaySeconds
+
+            while len(databaseWrites) < self.__maxBatchSize:
+                if not self.__queue.empty():
+                    databaseWrites.append(self.__queue.get_nowait())
+                    continue
+
+                timeout = deadline - self.__eventLoop.time()
+                if timeout <= 0:
+                    break
+
+                try:
+                    databaseWrites.append(await asyncio.wait_for(self.__queue.get(), timeout = timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            await self.__flush(databaseWrites)
+
+    def submit(
+        self,
+        writeKey: Optional[str],
+        items: List[Any],
+        writeFunction: Callable[[List[Any]], Awaitable[Any]]
+    ) -> asyncio.Future:
+        if writeKey is not None and not utils.isValidStr(writeKey):
+            raise ValueError(f'writeKey argument is malformed: \"{writeKey}\"')
+        elif not utils.hasItems(items):
+            raise ValueError(f'items argument is malformed: \"{items}\"')
+        elif not callable(writeFunction):
+            raise ValueError(f'writeFunction argument is malformed: \"{writeFunction}\"')
+
+        self.__writeCount = self.__writeCount + 1
+
+        if self.__isWriter.get():
+            # already inside of a write, see the comment up at the top
+            return self.__eventLoop.create_task(writeFunction(items))
+
+        future = self.__eventLoop.create_future()
+        self.__queue.put_nowait(DatabaseWrite(
+            writeKey = writeKey,
+            items = items,
+            writeFunction = writeFunction,
+            future = future
+        ))
+
+        if self.__writerTask is None or self.__writerTask.done():
+            self.__writerTask = self.__eventLoop.create_task(self.__runWriter())
+
+        return future
+
+    def toStr(self) -> str:
+        return f'writes={self.__writeCount}, batches={self.__batchCount}, writeFunctionCalls={self.__writeFunctionCallCount}, queued={self.__queue.qsize()}'
+
+    async def write(
+        self,
+        writeKey: Optional[str],
+        items: List[Any],
+        writeFunction: Callable[[List[Any]], Awaitable[Any]]
+    ) -> Any:
+        return await self.submit(
+            writeKey = writeKey,
+            items = items,
+            writeFunction = writeFunction
+        )
@@ -0,0 +1,93 @@
+import asyncio
+import os
+from asyncio import AbstractEventLoop
+from typing import Dict, List, Optional
+
+import CynanBotCommon.utils as utils
+from bufferedTimber import BufferedTimber
+
+
+class DiscordGatewayStats():
+
+    # Counts every event that the Discord gateway sends this bot, by event type, and every
+    # logEverySeconds logs how many arrived since the last time (the busiest types first)
+    # alongside the process' resident memory. This is how to see what the gateway intents and
+    # discord.py caches configured in CynanBotDiscord actually cost. Counting is just a dict
+    # increment per event, fed from discord.py's on_socket_event_type.
+
+    def __init__(
+        self,
+        eventLoop: AbstractEventLoop,
+        timber: BufferedTimber,
+        logEverySeconds: float = 900,
+        topEventTypesLogged: int = 10
+    ):
+        if not isinstance(eventLoop, AbstractEventLoop):
+            raise ValueError(f'eventLoop argument is malformed: \"{eventLoop}\"')
+        elif not isinstance(timber, BufferedTimber):
+            raise ValueError(f'timber argument is malformed: \"{timber}\"')
+        elif not utils.isValidNum(logEverySeconds):
+            raise ValueError(f'logEverySeconds argument is malformed: \"{logEverySeconds}\"')
+        elif logEverySeconds < 1:
+            raise ValueError(f'logEverySeconds argument is out of bounds: {logEverySeconds}')
+        elif not utils.isValidInt(topEventTypesLogged):
+            raise ValueError(f'topEventTypesLogged argument is malformed: \"{topEventTypesLogged}\"')
+        elif topEventTypesLogged < 1:
+            raise ValueError(f'topEventTypesLogged argument is out of bounds: {topEventTypesLogged}')
+
+        self.__eventLoop: AbstractEventLoop = eventLoop
+        self.__timber: BufferedTimber = timber
+        self.__logEverySeconds: float = logEverySeconds
+        self.__topEventTypesLogged: int = topEventTypesLogged
+
+        self.__eventCount: int = 0
+        self.__eventTypesToCounts: Dict[str, int] = dict()
+        self.__loggingTask: Optional[asyncio.Task] = None
+
+    def getEventCount(self) -> int:
+        return self.__eventCount
+
+    def getEventTypesToCounts(self) -> Dict[str, int]:
+        return dict(self.__eventTypesToCounts)
+
+    def getResidentMemoryBytes(self) -> Optional[int]:
+        # /proc only exists on Linux, which is the only place this bot is run for real
+        try:
+            with open('/proc/self/statm', 'r') as file:
+                return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (IndexError, OSError, ValueError):
+            return None
+
+    async def __logStats(self):
+        while True:
+            await asyncio.sleep(self.__logEverySeconds)
+
+            eventCount = self.__eventCount
+            eventTypesToCounts = self.__eventTypesToCounts
+            self.__eventCount = 0
+            self.__eventTypesToCounts = dict()
+
+            self.__timber.log('DiscordGatewayStats', self.toStr(eventCount, eventTypesToCounts))
+
+    def onEvent(self, eventType: Optional[str]):
+        if not utils.isValidStr(eventType):
+            return
+
+        self.__eventCount = self.__eventCount + 1
+        self.__eventTypesToCounts[eventType] = self.__eventTypesToCounts.get(eventType, 0) + 1
+
+    def start(self):
+        if self.__loggingTask is None or self.__loggingTask.done():
+            self.__loggingTask = self.__eventLoop.create_task(self.__logStats())
+
+    def toStr(self, eventCount: int, eventTypesToCounts: Dict[str, int]) -> str:
+        residentMemoryBytes = self.getResidentMemoryBytes()
+        residentMemoryStr = 'unknown' if residentMemoryBytes is None else f'{residentMemoryBytes / 1048576:.1f} MB'
+
+        eventTypes: List[str] = sorted(eventTypesToCounts.keys(), key = lambda eventType: eventTypesToCounts[eventType], reverse = True)
+        eventTypesStr = ', '.join([ f'{eventType}={eventTypesToCounts[eventType]}' for eventType in eventTypes[0:self.__topEventTypesLogged] ])
+
+        if not utils.isValidStr(eventTypesStr):
+            eventTypesStr = 'none'
+
+        return f'{eventCount} gateway event(s) in the last {self.__logEverySeconds:.0f}s ({eventTypesStr}), resident memory {residentMemoryStr}'
@@ -0,0 +1,288 @@
+import asyncio
+import statistics
+import time
+from asyncio import AbstractEventLoop
+from collections import deque
+from enum import Enum, auto
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+import CynanBotCommon.utils as utils
+from bufferedTimber import BufferedTimber
+
+
+class DiscordRestPriority(Enum):
+
+    INTERACTIVE = auto()
+    BULK = auto()
+
+    def getRank(self) -> int:
+        if self is DiscordRestPriority.INTERACTIVE:
+            return 0
+        elif self is DiscordRestPriority.BULK:
+            return 1
+        else:
+            raise RuntimeError(f'unknown DiscordRestPriority: \"{self}\"')
+
+    def toStr(self) -> str:
+        return self.name.lower()
+
+
+class DiscordRestBucket():
+
+    # Discord rate limits each route separately for every value of its "major parameter" (the
+    # channel id or guild id in the URL), as a fixed number of requests per window.
+
+    def __init__(self, limit: int, windowSeconds: float):
+        if not utils.isValidInt(limit):
+            raise ValueError(f'limit argument is malformed: \"{limit}\"')
+        elif limit < 1:
+            raise ValueError(f'limit argument is out of bounds: {limit}')
+        elif not utils.isValidNum(windowSeconds):
+            raise ValueError(f'windowSeconds argument is malformed: \"{windowSeconds}\"')
+        elif windowSeconds <= 0:
+            raise ValueError(f'windowSeconds argument is out of bounds: {windowSeconds}')
+
+        self.__limit: int = limit
+        self.__windowSeconds: float = windowSeconds
+
+        self.__remaining: int = limit
+        self.__resetAt: float = 0
+        self.__lastUsedAt: float = 0
+
+    def getLastUsedAt(self) -> float:
+        return self.__lastUsedAt
+
+    def getRemaining(self, now: float) -> int:
+        if now >= self.__resetAt:
+            return self.__limit
+
+        return self.__remaining
+
+    def getResetAt(self) -> float:
+        return self.__resetAt
+
+    def spend(self, now: float):
+        if now >= self.__resetAt:
+            self.__remaining = self.__limit
+            self.__resetAt = now + self.__windowSeconds
+
+        self.__remaining = self.__remaining - 1
+        self.__lastUsedAt = now
+
+
+class DiscordRestScheduler():
+
+    # Every REST call the bot makes to Discord goes through here, rather than straight into
+    # discord.py, where they would otherwise queue up on discord.py's own bucket locks in whatever
+    # order they happened to arrive. Calls are let out in priority order (interactive command
+    # replies before bulk go-live announcements), as long as both the route's bucket (see
+    # routeLimits) and the bot-wide global limit have room. Bulk calls are never allowed to take
+    # the last interactiveReserve request(s) out of a bucket, so even while a go-live storm is
+    # being announced into a channel, an admin command in that same channel gets answered right
+    # away. discord.py's own rate limit handling stays in place underneath all of this, in case
+    # Discord's real limits are ever tighter than the ones here.
+
+    routeLimits: Dict[str, Tuple[int, float]] = {
+        'GET /channels/{id}': (50, 1),
+        'GET /guilds/{id}/members/{id}': (10, 10),
+        'PATCH /webhooks/{id}/{token}/messages/{id}': (5, 5),
+        'POST /channels/{id}/messages': (5, 5),
+        'POST /webhooks/{id}/{token}': (5, 5)
+    }
+
+    def __init__(
+        self,
+        eventLoop: AbstractEventLoop,
+        timber: BufferedTimber,
+        globalLimitPerSecond: int = 50,
+        interactiveReserve: int = 1,
+        maxWaitSamples: int = 500,
+        metricsLogEveryRequests: int = 250
+    ):
+        if not isinstance(eventLoop, AbstractEventLoop):
+            raise ValueError(f'eventLoop argument is malformed: \"{eventLoop}\"')
+        elif not isinstance(timber, BufferedTimber):
+            raise ValueError(f'timber argument is malformed: \"{timber}\"')
+        elif not utils.isValidInt(globalLimitPerSecond):
+            raise ValueError(f'globalLimitPerSecond argument is malformed: \"{globalLimitPerSecond}\"')
+        elif globalLimitPerSecond < 1:
+            raise ValueError(f'globalLimitPerSecond argument is out of bounds: {globalLimitPerSecond}')
+        elif not utils.isValidInt(interactiveReserve):
+            raise ValueError(f'interactiveReserve argument is malformed: \"{interactiveReserve}\"')
+        elif interactiveReserve < 0:
+            raise ValueError(f'interactiveReserve argument is out of bounds: {interactiveReserve}')
+        elif not utils.isValidInt(maxWaitSamples):
+            raise ValueError(f'maxWaitSamples argument is malformed: \"{maxWaitSamples}\"')
+        elif maxWaitSamples < 1:
+            raise ValueError(f'maxWaitSamples argument is out of bounds: {maxWaitSamples}')
+        elif not utils.isValidInt(metricsLogEveryRequests):
+            raise ValueError(f'metricsLogEveryRequests argument is malformed: \"{metricsLogEveryRequests}\"')
+        elif metricsLogEveryRequests < 1:
+            raise ValueError(f'metricsLogEveryRequests argument is out of bounds: {metricsLogEveryRequests}')
+
+        self.__eventLoop: AbstractEventLoop = eventLoop
+        self.__timber: BufferedTimber = timber
+        self.__interactiveReserve: int = interactiveReserve
+        self.__metricsLogEveryRequests: int = metricsLogEveryRequests
+
+        self.__globalBucket: DiscordRestBucket = DiscordRestBucket(globalLimitPerSecond, 1)
+        self.__buckets: Dict[str, DiscordRestBucket] = dict()
+        self.__sequence: int = 0
+        self.__queue: List[Tuple[int, int, float, str, str, DiscordRestPriority, asyncio.Future]] = list()
+        self.__dispatcherTask: Optional[asyncio.Task] = None
+        self.__wakeUp: asyncio.Event = asyncio.Event()
+
+        self.__grantedCount: int = 0
+        self.__priorityWaitTimes: Dict[DiscordRestPriority, Deque[float]] = dict()
+
+        for priority in DiscordRestPriority:
+            self.__priorityWaitTimes[priority] = deque(maxlen = maxWaitSamples)
+
+    async def __acquire(self, route: str, majorId: str, priority: DiscordRestPriority):
+        bucketKey = f'{route}:{majorId}'
+
+        # nobody waiting ahead of us, and there's room, so don't bother queueing
+        if not utils.hasItems(self.__queue) and self.__canSpend(bucketKey, route, priority, time.monotonic()):
+            self.__spend(bucketKey, route, priority, 0)
+            return
+
+        future: asyncio.Future = self.__eventLoop.create_future()
+        self.__sequence = self.__sequence + 1
+        self.__queue.append((priority.getRank(), self.__sequence, time.monotonic(), bucketKey, route, priority, future))
+
+        if self.__dispatcherTask is None or self.__dispatcherTask.done():
+            self.__dispatcherTask = self.__eventLoop.create_task(self.__dispatch())
+        else:
+            self.__wakeUp.set()
+
+        await future
+
+    def __canSpend(self, bucketKey: str, route: str, priority: DiscordRestPriority, now: float) -> bool:
+        if self.__globalBucket.getRemaining(now) < 1:
+            return False
+
+        reserve = 0
+        if priority is DiscordRestPriority.BULK:
+            reserve = min(self.__interactiveReserve, self.__getRouteLimit(route)[0] - 1)
+
+        return self.__getBucket(bucketKey, route).getRemaining(now) - reserve >= 1
+
+    async def __dispatch(self):
+        while utils.hasItems(self.__queue):
+            now = time.monotonic()
+            self.__queue.sort(key = lambda entry: (entry[0], entry[1]))
+            grantIndex: Optional[int] = None
+
+            for index, entry in enumerate(self.__queue):
+                # the caller gave up waiting (e.g. it was cancelled), so it can just be dropped
+                if entry[6].done():
+                    grantIndex = index
+                    break
+                elif self.__canSpend(entry[3], entry[4], entry[5], now):
+                    grantIndex = index
+                    break
+
+            if grantIndex is not None:
+                _, _, queuedAt, bucketKey, route, priority, future = self.__queue.pop(grantIndex)
+
+                if not future.done():
+                    self.__spend(bucketKey, route, priority, now - queuedAt)
+                    future.set_result(None)
+
+                continue
+
+            # nothing can go out yet, so sleep until the soonest bucket that anybody's waiting on resets
+            resetAt = min(self.__getBucket(entry[3], entry[4]).getResetAt() for entry in self.__queue)
+
+            if self.__globalBucket.getRemaining(now) < 1:
+                resetAt = max(resetAt, self.__globalBucket.getResetAt())
+
+            self.__wakeUp.clear()
+
+            try:
+                await asyncio.wait_for(self.__wakeUp.wait(), timeout = max(0.01, resetAt - now))
+            except asyncio.TimeoutError:
+                pass
+
+    def __getBucket(self, bucketKey: str, route: str) -> DiscordRestBucket:
+        bucket = self.__buckets.get(bucketKey)
+
+        if bucket is None:
+            limit, windowSeconds = self.__getRouteLimit(route)
+            bucket = DiscordRestBucket(limit, windowSeconds)
+            self.__buckets[bucketKey] = bucket
+
+        return bucket
+
+    def getMedianWaitSeconds(self, priority: DiscordRestPriority) -> Optional[float]:
+        if not isinstance(priority, DiscordRestPriority):
+            raise ValueError(f'priority argument is malformed: \"{priority}\"')
+
+        waitTimes = self.__priorityWaitTimes[priority]
+
+        if not utils.hasItems(waitTimes):
+            return None
+
+        return statistics.median(waitTimes)
+
+    def getQueueLength(self) -> int:
+        return len(self.__queue)
+
+    def __getRouteLimit(self, route: str) -> Tuple[int, float]:
+        return self.routeLimits.get(route, (5, 5))
+
+    def __pruneBuckets(self, now: float):
+        # buckets for channels/guilds we haven't talked to in a while don't need to be kept
+        staleBucketKeys = [ bucketKey for bucketKey, bucket in self.__buckets.items() if now - bucket.getLastUsedAt() > 600 and now >= bucket.getResetAt() ]
+
+        for bucketKey in staleBucketKeys:
+            del self.__buckets[bucketKey]
+
+    def __spend(self, bucketKey: str, route: str, priority: DiscordRestPriority, waitSeconds: float):
+        now = time.monotonic()
+        self.__globalBucket.spend(now)
+        self.__getBucket(bucketKey, route).spend(now)
+
+        self.__grantedCount = self.__grantedCount + 1
+        self.__priorityWaitTimes[priority].append(waitSeconds)
+
+        if waitSeconds >= 5:
+            self.__timber.log('DiscordRestScheduler', lambda route = route, priority = priority, waitSeconds = waitSeconds: f'A {priority.toStr()} {route} request waited {waitSeconds:.1f}s to be sent ({self.toStr()})', sampleKey = f'DiscordRestScheduler:slow:{priority.toStr()}')
+
+        if self.__grantedCount % self.__metricsLogEveryRequests == 0:
+            self.__pruneBuckets(now)
+            self.__timber.log('DiscordRestScheduler', f'Discord REST scheduler metrics: {self.toStr()}')
+
+    async def submit(
+        self,
+        route: str,
+        majorId: Any,
+        priority: DiscordRestPriority,
+        call: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        if not utils.isValidStr(route):
+            raise ValueError(f'route argument is malformed: \"{route}\"')
+        elif majorId is None:
+            raise ValueError(f'majorId argument is malformed: \"{majorId}\"')
+        elif not isinstance(priority, DiscordRestPriority):
+            raise ValueError(f'priority argument is malformed: \"{priority}\"')
+        elif not callable(call):
+            raise ValueError(f'call argument is malformed: \"{call}\"')
+
+        await self.__acquire(route, str(majorId), priority)
+        return await call()
+
+    def toStr(self) -> str:
+        priorityStrs: List[str] = list()
+
+        for priority in DiscordRestPriority:
+            waitTimes = self.__priorityWaitTimes[priority]
+
+            if utils.hasItems(waitTimes):
+                sortedWaitTimes = sorted(waitTimes)
+                p95WaitTime = sortedWaitTimes[min(len(sortedWaitTimes) - 1, int(len(sortedWaitTimes) * 0.95))]
+                priorityStrs.append(f'{priority.toStr()}(p50={statistics.median(sortedWaitTimes) * 1000:.0f}ms, p95={p95WaitTime * 1000:.0f}ms)')
+            else:
+                priorityStrs.append(f'{priority.toStr()}(n/a)')
+
+        return f'requests={self.__grantedCount}, queued={len(self.__queue)}, buckets={len(self.__buckets)}, wait: {", ".join(priorityStrs)}'
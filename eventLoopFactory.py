@@ -0,0 +1,51 @@
+import asyncio
+from asyncio import AbstractEventLoop
+from typing import Optional
+
+from eventLoopType import EventLoopType
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+
+class EventLoopFactory():
+
+    # uvloop is an optional dependency. Asking for it when it isn't installed (or on a platform it
+    # doesn't support, like Windows) falls back to asyncio's own event loop rather than failing to
+    # start, and getFallbackReason() says why, so that it can be logged once Timber exists.
+
+    def __init__(self):
+        self.__fallbackReason: Optional[str] = None
+
+    def create(self, eventLoopType: EventLoopType) -> AbstractEventLoop:
+        if not isinstance(eventLoopType, EventLoopType):
+            raise ValueError(f'eventLoopType argument is malformed: \"{eventLoopType}\"')
+
+        self.__fallbackReason = None
+
+        if eventLoopType is EventLoopType.UVLOOP:
+            if uvloop is None:
+                self.__fallbackReason = 'uvloop was requested, but it isn\'t installed (pip install uvloop)'
+            else:
+                try:
+                    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+                except Exception as e:
+                    self.__fallbackReason = f'uvloop was requested, but couldn\'t be installed: {e}'
+                    asyncio.set_event_loop_policy(None)
+        else:
+            asyncio.set_event_loop_policy(None)
+
+        eventLoop = asyncio.new_event_loop()
+        asyncio.set_event_loop(eventLoop)
+        return eventLoop
+
+    def getEventLoopType(self, eventLoop: AbstractEventLoop) -> EventLoopType:
+        if uvloop is not None and isinstance(eventLoop, uvloop.Loop):
+            return EventLoopType.UVLOOP
+        else:
+            return EventLoopType.ASYNCIO
+
+    def getFallbackReason(self) -> Optional[str]:
+        return self.__fallbackReason
@@ -0,0 +1,26 @@
+from enum import Enum, auto
+
+import CynanBotCommon.utils as utils
+
+
+class EventLoopType(Enum):
+
+    ASYNCIO = auto()
+    UVLOOP = auto()
+
+    @classmethod
+    def fromStr(cls, text: str):
+        if not utils.isValidStr(text):
+            raise ValueError(f'text argument is malformed: \"{text}\"')
+
+        text = text.lower()
+
+        if text == 'asyncio':
+            return EventLoopType.ASYNCIO
+        elif text == 'uvloop':
+            return EventLoopType.UVLOOP
+        else:
+            raise ValueError(f'unknown EventLoopType: \"{text}\"')
+
+    def toStr(self) -> str:
+        return self.name.lower()
@@ -0,0 +1,278 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from asyncio import AbstractEventLoop
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+import CynanBotCommon.utils as utils
+from bufferedTimber import BufferedTimber
+
+
+class EventLoopOffender():
+
+    def __init__(self, location: str, stack: str):
+        if not utils.isValidStr(location):
+            raise ValueError(f'location argument is malformed: \"{location}\"')
+        elif not utils.isValidStr(stack):
+            raise ValueError(f'stack argument is malformed: \"{stack}\"')
+
+        self.__location: str = location
+        self.__stack: str = stack
+
+        self.__count: int = 0
+        self.__maxLagSeconds: float = 0
+        self.__totalLagSeconds: float = 0
+
+    def getCount(self) -> int:
+        return self.__count
+
+    def getLocation(self) -> str:
+        return self.__location
+
+    def getMaxLagSeconds(self) -> float:
+        return self.__maxLagSeconds
+
+    def getStack(self) -> str:
+        return self.__stack
+
+    def getTotalLagSeconds(self) -> float:
+        return self.__totalLagSeconds
+
+    def recordStall(self, lagSeconds: float):
+        self.__count = self.__count + 1
+        self.__totalLagSeconds = self.__totalLagSeconds + lagSeconds
+        self.__maxLagSeconds = max(self.__maxLagSeconds, lagSeconds)
+
+    def toStr(self) -> str:
+        return f'{self.__location} (stalls={self.__count}, total={self.__totalLagSeconds * 1000:.0f}ms, max={self.__maxLagSeconds * 1000:.0f}ms)'
+
+
+class EventLoopWatchdog():
+
+    # Continuously measures how late the event loop is at waking up a task that asked to sleep
+    # for sampleIntervalSeconds, which is exactly how long everything else on the loop (Discord
+    # heartbeats, command handling, the poll loop) was held up by. Measuring that is nearly free,
+    # it's one timer every sampleIntervalSeconds.
+    #
+    # To find out *what* was holding up the loop, a small daemon thread checks the loop's
+    # heartbeat. Once the loop has gone more than lagThresholdSeconds without one, the thread
+    # grabs the loop thread's current stack, which at that moment is the code that's blocking it.
+    # That capture is the only time anything expensive happens, and only while the loop is
+    # already stalled. Stalls are grouped by the innermost frame that's in this bot's own code
+    # (falling back to the innermost frame at all), and the worst offenders are logged alongside
+    # lag percentiles every metricsLogEverySeconds. BufferedTimber isn't thread safe, so the
+    # thread never logs anything itself, captures are handed back to the loop to be logged.
+
+    def __init__(
+        self,
+        eventLoop: AbstractEventLoop,
+        timber: BufferedTimber,
+        lagThresholdSeconds: float = 0.25,
+        sampleIntervalSeconds: float = 0.25,
+        metricsLogEverySeconds: float = 300,
+        maxLagSamples: int = 2400,
+        maxOffenders: int = 100,
+        topOffendersLogged: int = 5
+    ):
+        if not isinstance(eventLoop, AbstractEventLoop):
+            raise ValueError(f'eventLoop argument is malformed: \"{eventLoop}\"')
+        elif not isinstance(timber, BufferedTimber):
+            raise ValueError(f'timber argument is malformed: \"{timber}\"')
+        elif not utils.isValidNum(lagThresholdSeconds):
+            raise ValueError(f'lagThresholdSeconds argument is malformed: \"{lagThresholdSeconds}\"')
+        elif lagThresholdSeconds < 0.01:
+            raise ValueError(f'lagThresholdSeconds argument is out of bounds: {lagThresholdSeconds}')
+        elif not utils.isValidNum(sampleIntervalSeconds):
+            raise ValueError(f'sampleIntervalSeconds argument is malformed: \"{sampleIntervalSeconds}\"')
+        elif sampleIntervalSeconds < 0.01:
+            raise ValueError(f'sampleIntervalSeconds argument is out of bounds: {sampleIntervalSeconds}')
+        elif not utils.isValidNum(metricsLogEverySeconds):
+            raise ValueError(f'metricsLogEverySeconds argument is malformed: \"{metricsLogEverySeconds}\"')
+        elif metricsLogEverySeconds <= 0:
+            raise ValueError(f'metricsLogEverySeconds argument is out of bounds: {metricsLogEverySeconds}')
+        elif not utils.isValidInt(maxLagSamples):
+            raise ValueError(f'maxLagSamples argument is malformed: \"{maxLagSamples}\"')
+        elif maxLagSamples < 1:
+            raise ValueError(f'maxLagSamples argument is out of bounds: {maxLagSamples}')
+        elif not utils.isValidInt(maxOffenders):
+            raise ValueError(f'maxOffenders argument is malformed: \"{maxOffenders}\"')
+        elif maxOffenders < 1:
+            raise ValueError(f'maxOffenders argument is out of bounds: {maxOffenders}')
+        elif not utils.isValidInt(topOffendersLogged):
+            raise ValueError(f'topOffendersLogged argument is malformed: \"{topOffendersLogged}\"')
+        elif topOffendersLogged < 0:
+            raise ValueError(f'topOffendersLogged argument is out of bounds: {topOffendersLogged}')
+
+        self.__eventLoop: AbstractEventLoop = eventLoop
+        self.__timber: BufferedTimber = timber
+        self.__lagThresholdSeconds: float = lagThresholdSeconds
+        self.__sampleIntervalSeconds: float = sampleIntervalSeconds
+        self.__metricsLogEverySeconds: float = metricsLogEverySeconds
+        self.__maxOffenders: int = maxOffenders
+        self.__topOffendersLogged: int = topOffendersLogged
+
+        self.__watchdogFile: str = os.path.abspath(__file__)
+        self.__projectDirectory: str = os.path.dirname(self.__watchdogFile)
+        self.__heartbeat: float = time.monotonic()
+        self.__loopThreadId: Optional[int] = None
+        self.__monitorTask: Optional[asyncio.Task] = None
+        self.__watcherThread: Optional[threading.Thread] = None
+
+        # deque appends and pops are atomic, which is all the watcher thread needs to hand
+        # captured stacks back to the loop
+        self.__pendingCaptures: Deque[Tuple[str, str]] = deque(maxlen = 100)
+        self.__lagSamples: Deque[float] = deque(maxlen = maxLagSamples)
+        self.__offenders: Dict[str, EventLoopOffender] = dict()
+        self.__stallCount: int = 0
+
+    def __captureLoopStack(self) -> Optional[Tuple[str, str]]:
+        frame = sys._current_frames().get(self.__loopThreadId)
+
+        if frame is None:
+            return None
+
+        stack = traceback.extract_stack(frame)
+
+        if not utils.hasItems(stack):
+            return None
+
+        location = stack[len(stack) - 1]
+
+        for frameSummary in reversed(stack):
+            fileName = os.path.abspath(frameSummary.filename)
+
+            if fileName == self.__watchdogFile or 'site-packages' in fileName:
+                continue
+            elif fileName.startswith(self.__projectDirectory):
+                location = frameSummary
+                break
+
+        locationStr = f'{os.path.relpath(location.filename, self.__projectDirectory)}:{location.lineno} in {location.name}'
+        return locationStr, ''.join(traceback.format_list(stack))
+
+    def getLagPercentiles(self) -> Dict[str, float]:
+        if not utils.hasItems(self.__lagSamples):
+            return { 'p50': 0, 'p95': 0, 'p99': 0, 'max': 0 }
+
+        lagSamples = sorted(self.__lagSamples)
+
+        def percentile(fraction: float) -> float:
+            return lagSamples[min(len(lagSamples) - 1, int(len(lagSamples) * fraction))]
+
+        return {
+            'p50': percentile(0.5),
+            'p95': percentile(0.95),
+            'p99': percentile(0.99),
+            'max': lagSamples[len(lagSamples) - 1]
+        }
+
+    def getStallCount(self) -> int:
+        return self.__stallCount
+
+    def getTopOffenders(self, count: int) -> List[EventLoopOffender]:
+        if not utils.isValidInt(count):
+            raise ValueError(f'count argument is malformed: \"{count}\"')
+        elif count < 0:
+            raise ValueError(f'count argument is out of bounds: {count}')
+
+        offenders = sorted(self.__offenders.values(), key = lambda offender: offender.getTotalLagSeconds(), reverse = True)
+        return offenders[0:count]
+
+    def isRunning(self) -> bool:
+        return self.__monitorTask is not None and not self.__monitorTask.done()
+
+    async def __monitor(self):
+        self.__loopThreadId = threading.get_ident()
+        self.__heartbeat = time.monotonic()
+
+        if self.__watcherThread is None or not self.__watcherThread.is_alive():
+            self.__watcherThread = threading.Thread(
+                target = self.__watch,
+                name = 'EventLoopWatchdog',
+                daemon = True
+            )
+
+            self.__watcherThread.start()
+
+        lastMetricsLogTime = time.monotonic()
+
+        while True:
+            sleepStart = time.monotonic()
+            await asyncio.sleep(self.__sampleIntervalSeconds)
+            now = time.monotonic()
+            self.__heartbeat = now
+
+            lagSeconds = max(0, now - sleepStart - self.__sampleIntervalSeconds)
+            self.__lagSamples.append(lagSeconds)
+
+            if lagSeconds >= self.__lagThresholdSeconds:
+                self.__stallCount = self.__stallCount + 1
+                self.__recordStall(lagSeconds)
+
+            if now - lastMetricsLogTime >= self.__metricsLogEverySeconds:
+                lastMetricsLogTime = now
+                self.__timber.log('EventLoopWatchdog', f'Event loop lag: {self.toStr()}')
+
+    def __recordStall(self, lagSeconds: float):
+        # a stall that ended before the watcher thread got a look at it has no stack to go with it
+        if not utils.hasItems(self.__pendingCaptures):
+            self.__timber.log('EventLoopWatchdog', lambda lagSeconds = lagSeconds: f'Event loop was blocked for {lagSeconds * 1000:.0f}ms (too briefly to capture what was blocking it)', sampleKey = 'EventLoopWatchdog:uncapturedStall')
+            return
+
+        while utils.hasItems(self.__pendingCaptures):
+            location, stack = self.__pendingCaptures.popleft()
+            offender = self.__offenders.get(location)
+
+            if offender is None:
+                if len(self.__offenders) >= self.__maxOffenders:
+                    # make room by forgetting whichever offender has cost the least so far
+                    leastOffender = min(self.__offenders.values(), key = lambda offender: offender.getTotalLagSeconds())
+                    del self.__offenders[leastOffender.getLocation()]
+
+                offender = EventLoopOffender(location, stack)
+                self.__offenders[location] = offender
+
+            offender.recordStall(lagSeconds)
+            self.__timber.log('EventLoopWatchdog', lambda lagSeconds = lagSeconds, location = location, stack = stack: f'Event loop was blocked for {lagSeconds * 1000:.0f}ms by {location}:\n{stack}', sampleKey = f'EventLoopWatchdog:stall:{location}')
+
+    def start(self):
+        if self.isRunning():
+            return
+
+        self.__monitorTask = self.__eventLoop.create_task(self.__monitor())
+
+    def toStr(self) -> str:
+        percentiles = self.getLagPercentiles()
+        percentilesStr = ', '.join(f'{key}={value * 1000:.0f}ms' for key, value in percentiles.items())
+        topOffenders = self.getTopOffenders(self.__topOffendersLogged)
+
+        if not utils.hasItems(topOffenders):
+            return f'{percentilesStr}, stalls={self.__stallCount}'
+
+        topOffendersStr = '; '.join(offender.toStr() for offender in topOffenders)
+        return f'{percentilesStr}, stalls={self.__stallCount}, top offenders: {topOffendersStr}'
+
+    def __watch(self):
+        # runs on its own thread, so this must never touch timber or anything else on the loop
+        capturedHeartbeat: Optional[float] = None
+
+        while True:
+            time.sleep(self.__lagThresholdSeconds / 2)
+
+            heartbeat = self.__heartbeat
+
+            if heartbeat == capturedHeartbeat:
+                # already captured this stall
+                continue
+            elif time.monotonic() - heartbeat < self.__sampleIntervalSeconds + self.__lagThresholdSeconds:
+                continue
+
+            capture = self.__captureLoopStack()
+
+            if capture is not None:
+                self.__pendingCaptures.append(capture)
+                capturedHeartbeat = heartbeat
@@ -3,6 +3,10 @@ from typing import Any, Dict
 import CynanBotCommon.utils as utils
 from CynanBotCommon.network.networkClientType import NetworkClientType
 from CynanBotCommon.storage.databaseType import DatabaseType
+from eventLoopType import EventLoopType
+from sqliteJournalMode import SqliteJournalMode
+from sqlitePerformanceProfile import SqlitePerformanceProfile
+from sqliteSynchronousMode import SqliteSynchronousMode
 
 
 class GeneralSettingsRepositorySnapshot():
@@ -20,9 +24,87 @@ class GeneralSettingsRepositorySnapshot():
         self.__jsonContents: Dict[str, Any] = jsonContents
         self.__generalSettingsFile: str = generalSettingsFile
 
+    def getDatabaseWriteQueueMaxBatchSize(self) -> int:
+        return utils.getIntFromDict(self.__jsonContents, 'databaseWriteQueueMaxBatchSize', 200)
+
+    def getDatabaseWriteQueueMaxDelayMillis(self) -> int:
+        return utils.getIntFromDict(self.__jsonContents, 'databaseWriteQueueMaxDelayMillis', 5)
+
+    def getEventLoopLagThresholdMillis(self) -> int:
+        return utils.getIntFromDict(self.__jsonContents, 'eventLoopLagThresholdMillis', 250)
+
+    def getEventLoopType(self) -> EventLoopType:
+        return EventLoopType.fromStr(utils.getStrFromDict(self.__jsonContents, 'eventLoopType', 'asyncio'))
+
+    def getHelixRecordingFile(self) -> str:
+        return utils.getStrFromDict(self.__jsonContents, 'helixRecordingFile', 'helixRecording.jsonl.gz')
+
+    def getNetworkConnectionPoolSize(self) -> int:
+        return utils.getIntFromDict(self.__jsonContents, 'networkConnectionPoolSize', 10)
+
+    def getNetworkThreadPoolSize(self) -> int:
+        return utils.getIntFromDict(self.__jsonContents, 'networkThreadPoolSize', 4)
+
+    def getNetworkTimeoutSeconds(self) -> int:
+        return utils.getIntFromDict(self.__jsonContents, 'networkTimeoutSeconds', 8)
+
     def getRefreshEverySeconds(self) -> int:
         return utils.getIntFromDict(self.__jsonContents, 'refreshEverySeconds', 120)
 
+    def getRosterMaintenanceIntervalHours(self) -> int:
+        return utils.getIntFromDict(self.__jsonContents, 'rosterMaintenanceIntervalHours', 24)
+
+    def getRosterSnapshotFile(self) -> str:
+        return utils.getStrFromDict(self.__jsonContents, 'rosterSnapshotFile', 'rosterSnapshot.bin')
+
+    def getSqlitePerformanceProfile(self) -> SqlitePerformanceProfile:
+        return SqlitePerformanceProfile(
+            journalMode = SqliteJournalMode.fromStr(utils.getStrFromDict(self.__jsonContents, 'sqliteJournalMode', 'wal')),
+            synchronousMode = SqliteSynchronousMode.fromStr(utils.getStrFromDict(self.__jsonContents, 'sqliteSynchronousMode', 'normal')),
+            mmapSizeBytes = utils.getIntFromDict(self.__jsonContents, 'sqliteMmapSizeBytes', 268435456),
+            cacheSizeKibibytes = utils.getIntFromDict(self.__jsonContents, 'sqliteCacheSizeKibibytes', 32768),
+            busyTimeoutMillis = utils.getIntFromDict(self.__jsonContents, 'sqliteBusyTimeoutMillis', 5000)
+        )
+
+    def getTimberMaxQueueSize(self) -> int:
+        return utils.getIntFromDict(self.__jsonContents, 'timberMaxQueueSize', 10000)
+
+    def getTimberSampleWindowSeconds(self) -> int:
+        return utils.getIntFromDict(self.__jsonContents, 'timberSampleWindowSeconds', 60)
+
+    def isDatabaseWriteQueueEnabled(self) -> bool:
+        return utils.getBoolFromDict(self.__jsonContents, 'databaseWriteQueueEnabled', True)
+
+    def isDiscordCommandSyncEnabled(self) -> bool:
+        return utils.getBoolFromDict(self.__jsonContents, 'discordCommandSyncEnabled', False)
+
+    def isDiscordGatewayStatsEnabled(self) -> bool:
+        return utils.getBoolFromDict(self.__jsonContents, 'discordGatewayStatsEnabled', False)
+
+    def isDiscordMembersIntentEnabled(self) -> bool:
+        return utils.getBoolFromDict(self.__jsonContents, 'discordMembersIntentEnabled', False)
+
+    def isEventLoopWatchdogEnabled(self) -> bool:
+        return utils.getBoolFromDict(self.__jsonContents, 'eventLoopWatchdogEnabled', True)
+
+    def isHelixRecordingEnabled(self) -> bool:
+        return utils.getBoolFromDict(self.__jsonContents, 'helixRecordingEnabled', False)
+
+    def isRosterChangeNotificationsEnabled(self) -> bool:
+        return utils.getBoolFromDict(self.__jsonContents, 'rosterChangeNotificationsEnabled', True)
+
+    def isRosterMaintenanceEnabled(self) -> bool:
+        return utils.getBoolFromDict(self.__jsonContents, 'rosterMaintenanceEnabled', True)
+
+    def isRosterSnapshotEnabled(self) -> bool:
+        return utils.getBoolFromDict(self.__jsonContents, 'rosterSnapshotEnabled', True)
+
+    def isSqlitePerformanceProfileEnabled(self) -> bool:
+        return utils.getBoolFromDict(self.__jsonContents, 'sqlitePerformanceProfileEnabled', True)
+
+    def isTimberBufferedLoggingEnabled(self) -> bool:
+        return utils.getBoolFromDict(self.__jsonContents, 'timberBufferedLogging', False)
+
     def requireDatabaseType(self) -> DatabaseType:
         databaseType = self.__jsonContents.get('databaseType')
 
@@ -0,0 +1,274 @@
+import asyncio
+import heapq
+import time
+from asyncio import AbstractEventLoop
+from enum import Enum, auto
+from typing import Dict, List, Optional, Tuple
+
+import CynanBotCommon.utils as utils
+from bufferedTimber import BufferedTimber
+
+
+class HelixRequestPriority(Enum):
+
+    POLL = auto()
+    LOOKUP = auto()
+
+    def getRank(self) -> int:
+        if self is HelixRequestPriority.POLL:
+            return 0
+        elif self is HelixRequestPriority.LOOKUP:
+            return 1
+        else:
+            raise RuntimeError(f'unknown HelixRequestPriority: \"{self}\"')
+
+    def toStr(self) -> str:
+        return self.name.lower()
+
+
+class HelixRateLimiter():
+
+    # A token bucket shared by every Helix call the bot makes. Twitch describes its bucket in the
+    # headers of every Helix response:
+    #
+    # - Ratelimit-Limit: how many points the bucket holds (and refills over a minute)
+    # - Ratelimit-Remaining: how many points are left right now
+    # - Ratelimit-Reset: the epoch second at which the bucket will be full again
+    #
+    # Until the first response comes back, the bucket is assumed to hold defaultLimit points.
+    # After that, every response corrects our local estimate. Requests that can't go out
+    # immediately are queued, and are let through in priority order (live polling first, then
+    # user lookups), oldest first within the same priority. A 429 empties the bucket until
+    # Twitch's reset time, instead of letting the rest of the cycle's requests fail one after
+    # another. Once started, the bucket's state is logged every metricsLogEverySeconds.
+
+    def __init__(
+        self,
+        eventLoop: AbstractEventLoop,
+        timber: BufferedTimber,
+        defaultLimit: int = 800,
+        reservedPoints: int = 10,
+        refillWindowSeconds: float = 60,
+        metricsLogEverySeconds: float = 300
+    ):
+        if not isinstance(eventLoop, AbstractEventLoop):
+            raise ValueError(f'eventLoop argument is malformed: \"{eventLoop}\"')
+        elif not isinstance(timber, BufferedTimber):
+            raise ValueError(f'timber argument is malformed: \"{timber}\"')
+        elif not utils.isValidInt(defaultLimit):
+            raise ValueError(f'defaultLimit argument is malformed: \"{defaultLimit}\"')
+        elif defaultLimit < 1:
+            raise ValueError(f'defaultLimit argument is out of bounds: {defaultLimit}')
+        elif not utils.isValidInt(reservedPoints):
+            raise ValueError(f'reservedPoints argument is malformed: \"{reservedPoints}\"')
+        elif reservedPoints < 0 or reservedPoints >= defaultLimit:
+            raise ValueError(f'reservedPoints argument is out of bounds: {reservedPoints}')
+        elif not utils.isValidNum(refillWindowSeconds):
+            raise ValueError(f'refillWindowSeconds argument is malformed: \"{refillWindowSeconds}\"')
+        elif refillWindowSeconds <= 0:
+            raise ValueError(f'refillWindowSeconds argument is out of bounds: {refillWindowSeconds}')
+        elif not utils.isValidNum(metricsLogEverySeconds):
+            raise ValueError(f'metricsLogEverySeconds argument is malformed: \"{metricsLogEverySeconds}\"')
+        elif metricsLogEverySeconds < 1:
+            raise ValueError(f'metricsLogEverySeconds argument is out of bounds: {metricsLogEverySeconds}')
+
+        self.__eventLoop: AbstractEventLoop = eventLoop
+        self.__timber: BufferedTimber = timber
+        self.__reservedPoints: int = reservedPoints
+        self.__refillWindowSeconds: float = refillWindowSeconds
+        self.__metricsLogEverySeconds: float = metricsLogEverySeconds
+
+        self.__limit: int = defaultLimit
+        self.__remaining: float = defaultLimit
+        self.__lastRefill: float = time.monotonic()
+        self.__blockedUntil: float = 0
+        self.__inFlightCount: int = 0
+        self.__sequence: int = 0
+        self.__queue: List[Tuple[int, int, float, asyncio.Future]] = list()
+        self.__dispatcherTask: Optional[asyncio.Task] = None
+        self.__metricsTask: Optional[asyncio.Task] = None
+        self.__wakeUp: asyncio.Event = asyncio.Event()
+
+        self.__grantedCount: int = 0
+        self.__queuedCount: int = 0
+        self.__rateLimitedCount: int = 0
+        self.__maxWaitSeconds: float = 0
+        self.__totalWaitSeconds: float = 0
+
+    async def acquire(self, priority: HelixRequestPriority):
+        if not isinstance(priority, HelixRequestPriority):
+            raise ValueError(f'priority argument is malformed: \"{priority}\"')
+
+        self.__refill()
+
+        # nobody waiting ahead of us, and there's room in the bucket, so don't bother queueing
+        if not utils.hasItems(self.__queue) and self.__canSpend():
+            self.__spend(0)
+            return
+
+        future: asyncio.Future = self.__eventLoop.create_future()
+        self.__sequence = self.__sequence + 1
+        heapq.heappush(self.__queue, (priority.getRank(), self.__sequence, time.monotonic(), future))
+        self.__queuedCount = self.__queuedCount + 1
+
+        if self.__dispatcherTask is None or self.__dispatcherTask.done():
+            self.__dispatcherTask = self.__eventLoop.create_task(self.__dispatch())
+        else:
+            self.__wakeUp.set()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            # the dispatcher may have already granted this request its point just before the
+            # caller was cancelled, in which case nobody else is ever going to hand it back
+            if future.done() and not future.cancelled():
+                self.release()
+
+            raise
+
+    def __canSpend(self) -> bool:
+        if time.monotonic() < self.__blockedUntil:
+            return False
+
+        return self.__remaining - self.__reservedPoints >= 1
+
+    async def __dispatch(self):
+        while utils.hasItems(self.__queue):
+            self.__refill()
+
+            if self.__canSpend():
+                _, _, queuedAt, future = heapq.heappop(self.__queue)
+
+                # the caller gave up waiting (e.g. it was cancelled), so don't spend a point on it
+                if future.done():
+                    continue
+
+                self.__spend(time.monotonic() - queuedAt)
+                future.set_result(None)
+                continue
+
+            waitSeconds = self.__getSecondsUntilNextPoint()
+            queueLength = len(self.__queue)
+            self.__timber.log('HelixRateLimiter', lambda waitSeconds = waitSeconds, queueLength = queueLength: f'Helix rate limit budget is spent, holding {queueLength} request(s) for {waitSeconds:.2f}s ({self.toStr()})', sampleKey = 'HelixRateLimiter:throttled')
+
+            self.__wakeUp.clear()
+
+            try:
+                await asyncio.wait_for(self.__wakeUp.wait(), timeout = waitSeconds)
+            except asyncio.TimeoutError:
+                pass
+
+    def getInFlightCount(self) -> int:
+        return self.__inFlightCount
+
+    def getLimit(self) -> int:
+        return self.__limit
+
+    def getQueueLength(self) -> int:
+        return len(self.__queue)
+
+    def getRateLimitedCount(self) -> int:
+        return self.__rateLimitedCount
+
+    def getRemainingBudget(self) -> int:
+        self.__refill()
+        return int(self.__remaining)
+
+    def __getSecondsUntilNextPoint(self) -> float:
+        now = time.monotonic()
+
+        if now < self.__blockedUntil:
+            return self.__blockedUntil - now
+
+        missingPoints = (self.__reservedPoints + 1) - self.__remaining
+        return max(0.01, missingPoints * self.__refillWindowSeconds / self.__limit)
+
+    async def __logMetrics(self):
+        while True:
+            await asyncio.sleep(self.__metricsLogEverySeconds)
+            self.__refill()
+            self.__timber.log('HelixRateLimiter', f'Helix rate limit metrics: {self.toStr()}')
+
+    def onResponse(self, statusCode: int, headers: Optional[Dict[str, str]]):
+        if not utils.isValidInt(statusCode):
+            raise ValueError(f'statusCode argument is malformed: \"{statusCode}\"')
+
+        self.__inFlightCount = max(0, self.__inFlightCount - 1)
+
+        # header names are case-insensitive, and different network clients normalize them differently
+        normalizedHeaders: Dict[str, str] = dict()
+        if utils.hasItems(headers):
+            normalizedHeaders = { key.lower(): value for key, value in headers.items() }
+
+        limit = self.__parseInt(normalizedHeaders.get('ratelimit-limit'))
+        remaining = self.__parseInt(normalizedHeaders.get('ratelimit-remaining'))
+        resetAt = self.__parseInt(normalizedHeaders.get('ratelimit-reset'))
+
+        if limit is not None and limit >= 1:
+            self.__limit = limit
+
+        if remaining is not None:
+            # Twitch counted this response's remaining points before any of our other requests
+            # that are still in flight landed, so those are taken off of its number too
+            self.__remaining = max(0, min(self.__limit, remaining - self.__inFlightCount))
+            self.__lastRefill = time.monotonic()
+
+        if statusCode == 429:
+            self.__rateLimitedCount = self.__rateLimitedCount + 1
+            self.__remaining = 0
+            self.__lastRefill = time.monotonic()
+
+            waitSeconds = self.__refillWindowSeconds
+            if resetAt is not None:
+                waitSeconds = max(0, resetAt - time.time())
+
+            self.__blockedUntil = time.monotonic() + waitSeconds
+            self.__timber.log('HelixRateLimiter', f'Received 429 from Helix, holding all Helix requests for {waitSeconds:.1f}s ({self.toStr()})')
+        elif remaining == 0 and resetAt is not None:
+            self.__blockedUntil = time.monotonic() + max(0, resetAt - time.time())
+
+        self.__wakeUp.set()
+
+    def __parseInt(self, value: Optional[str]) -> Optional[int]:
+        if not utils.isValidStr(value):
+            return None
+
+        try:
+            return int(value)
+        except ValueError:
+            return None
+
+    def __refill(self):
+        now = time.monotonic()
+        elapsed = now - self.__lastRefill
+        self.__lastRefill = now
+
+        if elapsed <= 0:
+            return
+
+        self.__remaining = min(self.__limit, self.__remaining + (elapsed * self.__limit / self.__refillWindowSeconds))
+
+    def release(self):
+        # the request finished without any Helix rate limit headers to learn from (a network
+        # error, or a call to a non-Helix endpoint like token validation), but either way it's no
+        # longer in flight
+        self.__inFlightCount = max(0, self.__inFlightCount - 1)
+        self.__wakeUp.set()
+
+    def __spend(self, waitSeconds: float):
+        self.__remaining = self.__remaining - 1
+        self.__inFlightCount = self.__inFlightCount + 1
+        self.__grantedCount = self.__grantedCount + 1
+        self.__totalWaitSeconds = self.__totalWaitSeconds + waitSeconds
+        self.__maxWaitSeconds = max(self.__maxWaitSeconds, waitSeconds)
+
+    def start(self):
+        if self.__metricsTask is None or self.__metricsTask.done():
+            self.__metricsTask = self.__eventLoop.create_task(self.__logMetrics())
+
+    def toStr(self) -> str:
+        averageWaitMillis = 0
+        if self.__queuedCount >= 1:
+            averageWaitMillis = (self.__totalWaitSeconds / self.__queuedCount) * 1000
+
+        return f'remaining={int(self.__remaining)}/{self.__limit}, queued={len(self.__queue)}, inFlight={self.__inFlightCount}, granted={self.__grantedCount}, waited={self.__queuedCount} (avg {averageWaitMillis:.0f}ms, max {self.__maxWaitSeconds * 1000:.0f}ms), rateLimited={self.__rateLimitedCount}'
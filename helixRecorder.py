@@ -0,0 +1,222 @@
+import asyncio
+import gzip
+import json
+import os
+import time
+from asyncio import AbstractEventLoop
+from typing import Any, Dict, List, Optional
+
+import CynanBotCommon.utils as utils
+from bufferedTimber import BufferedTimber
+
+
+class HelixRecordingEntry():
+
+    def __init__(
+        self,
+        offsetSeconds: float,
+        endpoint: str,
+        queriedIds: List[str],
+        data: List[Dict[str, Any]]
+    ):
+        if not utils.isValidNum(offsetSeconds):
+            raise ValueError(f'offsetSeconds argument is malformed: \"{offsetSeconds}\"')
+        elif offsetSeconds < 0:
+            raise ValueError(f'offsetSeconds argument is out of bounds: {offsetSeconds}')
+        elif not utils.isValidStr(endpoint):
+            raise ValueError(f'endpoint argument is malformed: \"{endpoint}\"')
+        elif queriedIds is None:
+            raise ValueError(f'queriedIds argument is malformed: \"{queriedIds}\"')
+        elif data is None:
+            raise ValueError(f'data argument is malformed: \"{data}\"')
+
+        self.__offsetSeconds: float = offsetSeconds
+        self.__endpoint: str = endpoint
+        self.__queriedIds: List[str] = queriedIds
+        self.__data: List[Dict[str, Any]] = data
+
+    def getData(self) -> List[Dict[str, Any]]:
+        return self.__data
+
+    def getEndpoint(self) -> str:
+        return self.__endpoint
+
+    def getOffsetSeconds(self) -> float:
+        return self.__offsetSeconds
+
+    def getQueriedIds(self) -> List[str]:
+        return self.__queriedIds
+
+
+class HelixRecording():
+
+    def __init__(
+        self,
+        entries: List[HelixRecordingEntry],
+        startedAt: Optional[float]
+    ):
+        if entries is None:
+            raise ValueError(f'entries argument is malformed: \"{entries}\"')
+
+        self.__entries: List[HelixRecordingEntry] = entries
+        self.__startedAt: Optional[float] = startedAt
+
+    def getDurationSeconds(self) -> float:
+        if not utils.hasItems(self.__entries):
+            return 0
+
+        return self.__entries[len(self.__entries) - 1].getOffsetSeconds()
+
+    def getEntries(self) -> List[HelixRecordingEntry]:
+        return self.__entries
+
+    def getStartedAt(self) -> Optional[float]:
+        return self.__startedAt
+
+
+class HelixRecorder():
+
+    # Records the Helix responses that the live detection path depends on, so that they can be
+    # replayed later (see benchmarks/replayTwitchApiService.py) as realistic, repeatable input for
+    # performance work. The file is gzipped JSON lines, one line per response:
+    #
+    #   [epoch millis, endpoint, queried ids, data]
+    #
+    # where data holds only the fields of each Helix entry that this bot actually reads. Lines are
+    # buffered in memory and appended to the file on the event loop's default executor, as a new
+    # gzip member every flushEveryEntries responses or flushEverySeconds (whichever comes first).
+    # gzip readers concatenate members transparently, so a recording can span several runs of the
+    # bot, and a crash only ever loses whatever hadn't been flushed yet.
+
+    recordedFields: Dict[str, List[str]] = {
+        'streams': [ 'id', 'user_id', 'user_login', 'user_name', 'viewer_count', 'game_id', 'game_name', 'language', 'thumbnail_url', 'title', 'type' ],
+        'users': [ 'id', 'login', 'display_name' ]
+    }
+
+    def __init__(
+        self,
+        eventLoop: AbstractEventLoop,
+        timber: BufferedTimber,
+        recordingFile: str = 'helixRecording.jsonl.gz',
+        flushEveryEntries: int = 200,
+        flushEverySeconds: float = 60
+    ):
+        if not isinstance(eventLoop, AbstractEventLoop):
+            raise ValueError(f'eventLoop argument is malformed: \"{eventLoop}\"')
+        elif not isinstance(timber, BufferedTimber):
+            raise ValueError(f'timber argument is malformed: \"{timber}\"')
+        elif not utils.isValidStr(recordingFile):
+            raise ValueError(f'recordingFile argument is malformed: \"{recordingFile}\"')
+        elif not utils.isValidInt(flushEveryEntries):
+            raise ValueError(f'flushEveryEntries argument is malformed: \"{flushEveryEntries}\"')
+        elif flushEveryEntries < 1:
+            raise ValueError(f'flushEveryEntries argument is out of bounds: {flushEveryEntries}')
+        elif not utils.isValidNum(flushEverySeconds):
+            raise ValueError(f'flushEverySeconds argument is malformed: \"{flushEverySeconds}\"')
+        elif flushEverySeconds <= 0:
+            raise ValueError(f'flushEverySeconds argument is out of bounds: {flushEverySeconds}')
+
+        self.__eventLoop: AbstractEventLoop = eventLoop
+        self.__timber: BufferedTimber = timber
+        self.__recordingFile: str = recordingFile
+        self.__flushEveryEntries: int = flushEveryEntries
+        self.__flushEverySeconds: float = flushEverySeconds
+
+        self.__pendingLines: List[str] = list()
+        self.__lastFlushTime: float = time.monotonic()
+        self.__flushLock: asyncio.Lock = asyncio.Lock()
+        self.__flushTask: Optional[asyncio.Task] = None
+        self.__recordedCount: int = 0
+
+    def __appendLines(self, lines: List[str]):
+        with gzip.open(self.__recordingFile, 'at', encoding = 'utf-8') as file:
+            file.writelines(lines)
+
+    async def flush(self):
+        async with self.__flushLock:
+            if not utils.hasItems(self.__pendingLines):
+                return
+
+            lines = self.__pendingLines
+            self.__pendingLines = list()
+            self.__lastFlushTime = time.monotonic()
+
+            try:
+                await self.__eventLoop.run_in_executor(None, self.__appendLines, lines)
+            except OSError as e:
+                self.__timber.log('HelixRecorder', f'Unable to write {len(lines)} Helix response(s) to \"{self.__recordingFile}\": {e}', e)
+
+    def getRecordedCount(self) -> int:
+        return self.__recordedCount
+
+    async def load(self) -> HelixRecording:
+        return await self.__eventLoop.run_in_executor(None, self.readRecording, self.__recordingFile)
+
+    def readRecording(self, recordingFile: str) -> HelixRecording:
+        if not utils.isValidStr(recordingFile):
+            raise ValueError(f'recordingFile argument is malformed: \"{recordingFile}\"')
+
+        if not os.path.exists(recordingFile):
+            return HelixRecording(entries = list(), startedAt = None)
+
+        rows: List[List[Any]] = list()
+
+        with gzip.open(recordingFile, 'rt', encoding = 'utf-8') as file:
+            for line in file:
+                if utils.isValidStr(line.strip()):
+                    rows.append(json.loads(line))
+
+        if not utils.hasItems(rows):
+            return HelixRecording(entries = list(), startedAt = None)
+
+        # runs of the bot can overlap in a shared file (e.g. a restart while the old process was
+        # still flushing), so entries are put back into time order here
+        rows.sort(key = lambda row: row[0])
+        startedAtMillis = rows[0][0]
+        entries: List[HelixRecordingEntry] = list()
+
+        for epochMillis, endpoint, queriedIds, data in rows:
+            entries.append(HelixRecordingEntry(
+                offsetSeconds = (epochMillis - startedAtMillis) / 1000,
+                endpoint = endpoint,
+                queriedIds = queriedIds,
+                data = data
+            ))
+
+        return HelixRecording(
+            entries = entries,
+            startedAt = startedAtMillis / 1000
+        )
+
+    def record(
+        self,
+        endpoint: str,
+        queriedIds: List[str],
+        data: Optional[List[Dict[str, Any]]]
+    ):
+        if not utils.isValidStr(endpoint):
+            raise ValueError(f'endpoint argument is malformed: \"{endpoint}\"')
+        elif queriedIds is None:
+            raise ValueError(f'queriedIds argument is malformed: \"{queriedIds}\"')
+
+        compactData: List[Dict[str, Any]] = list()
+
+        if utils.hasItems(data):
+            fields = self.recordedFields.get(endpoint)
+
+            for entry in data:
+                if fields is None:
+                    compactData.append(entry)
+                else:
+                    compactData.append({ field: entry[field] for field in fields if entry.get(field) is not None })
+
+        row = [ int(time.time() * 1000), endpoint, queriedIds, compactData ]
+        self.__pendingLines.append(json.dumps(row, separators = (',', ':')) + '\n')
+        self.__recordedCount = self.__recordedCount + 1
+
+        if len(self.__pendingLines) < self.__flushEveryEntries and time.monotonic() - self.__lastFlushTime < self.__flushEverySeconds:
+            return
+        elif self.__flushTask is not None and not self.__flushTask.done():
+            return
+
+        self.__flushTask = self.__eventLoop.create_task(self.flush())
@@ -1,40 +1,85 @@
-import asyncio
+from typing import Literal, Optional, Union
 
+import discord
+from discord import app_commands
+
+from announcedStreamsRepository import AnnouncedStreamsRepository
 from authRepository import AuthRepository
-from CynanBotCommon.network.aioHttpClientProvider import AioHttpClientProvider
+from bufferedTimber import BufferedTimber
 from CynanBotCommon.network.networkClientProvider import NetworkClientProvider
 from CynanBotCommon.network.networkClientType import NetworkClientType
-from CynanBotCommon.network.requestsClientProvider import \
-    RequestsClientProvider
 from CynanBotCommon.storage.backingDatabase import BackingDatabase
 from CynanBotCommon.storage.backingPsqlDatabase import BackingPsqlDatabase
 from CynanBotCommon.storage.backingSqliteDatabase import BackingSqliteDatabase
 from CynanBotCommon.storage.databaseType import DatabaseType
 from CynanBotCommon.storage.psqlCredentialsProvider import \
     PsqlCredentialsProvider
-from CynanBotCommon.timber.timber import Timber
-from CynanBotCommon.twitch.twitchApiService import TwitchApiService
 from CynanBotCommon.twitch.twitchTokensRepository import TwitchTokensRepository
 from cynanBotDiscord import CynanBotDiscord
+from databaseSchemaRegistry import DatabaseSchemaRegistry
+from databaseWriteQueue import DatabaseWriteQueue
+from discordGatewayStats import DiscordGatewayStats
+from discordRestScheduler import DiscordRestScheduler
+from eventLoopFactory import EventLoopFactory
+from eventLoopWatchdog import EventLoopWatchdog
 from generalSettingsRepository import GeneralSettingsRepository
+from helixRateLimiter import HelixRateLimiter
+from helixRecorder import HelixRecorder
+from pollScheduler import PollScheduler
+from pooledAioHttpClientProvider import PooledAioHttpClientProvider
+from profiledBackingSqliteDatabase import ProfiledBackingSqliteDatabase
+from rosterChangeListener import RosterChangeListener
+from rosterChangeNotifier import RosterChangeNotifier
+from rosterMaintenance import RosterMaintenance
+from rosterPruner import RosterPruner
+from rosterSnapshotStore import RosterSnapshotStore
+from rosterVersionRepository import RosterVersionRepository
+from startupHelper import StartupHelper
+from threadedRequestsClientProvider import ThreadedRequestsClientProvider
 from twitchAnnounceChannelsRepository import TwitchAnnounceChannelsRepository
 from twitchAnnounceSettingsRepository import TwitchAnnounceSettingsRepository
+from twitchHelixApiService import TwitchHelixApiService
 from twitchLiveHelper import TwitchLiveHelper
 from twitchLiveUsersRepository import TwitchLiveUsersRepository
+from twitchUserIdsRepository import TwitchUserIdsRepository
+from twitchUsersImportExportHelper import TwitchUsersImportExportHelper
 from usersRepository import UsersRepository
 
-eventLoop = asyncio.get_event_loop()
-timber = Timber(
-    eventLoop = eventLoop
-)
+# Written against discord.py 2.x (application commands, setup_hook, and a Client that can be
+# started on an event loop of our own), older versions of discord.py won't work at all.
+if discord.version_info.major < 2:
+    raise RuntimeError(f'discord.py 2.0 or newer is required, but found {discord.__version__}')
+
 generalSettingsRepository = GeneralSettingsRepository()
+eventLoopFactory = EventLoopFactory()
+eventLoop = eventLoopFactory.create(generalSettingsRepository.getAll().getEventLoopType())
+timber = BufferedTimber(
+    eventLoop = eventLoop,
+    isBuffered = generalSettingsRepository.getAll().isTimberBufferedLoggingEnabled(),
+    maxQueueSize = generalSettingsRepository.getAll().getTimberMaxQueueSize(),
+    sampleWindowSeconds = generalSettingsRepository.getAll().getTimberSampleWindowSeconds()
+)
+
+if eventLoopFactory.getFallbackReason() is not None:
+    timber.log('initCynanBotDiscord', f'Falling back to the asyncio event loop: {eventLoopFactory.getFallbackReason()}')
+
+timber.log('initCynanBotDiscord', f'Using the {eventLoopFactory.getEventLoopType(eventLoop).toStr()} event loop')
 
 backingDatabase: BackingDatabase = None
+psqlCredentialsProvider: PsqlCredentialsProvider = None
 if generalSettingsRepository.getAll().requireDatabaseType() is DatabaseType.POSTGRESQL:
+    psqlCredentialsProvider = PsqlCredentialsProvider()
     backingDatabase = BackingPsqlDatabase(
         eventLoop = eventLoop,
-        psqlCredentialsProvider = PsqlCredentialsProvider()
+        psqlCredentialsProvider = psqlCredentialsProvider
     )
+elif generalSettingsRepository.getAll().requireDatabaseType() is DatabaseType.SQLITE and generalSettingsRepository.getAll().isSqlitePerformanceProfileEnabled():
+    backingDatabase = ProfiledBackingSqliteDatabase(
+        eventLoop = eventLoop,
+        sqlitePerformanceProfile = generalSettingsRepository.getAll().getSqlitePerformanceProfile()
+    )
+
+    timber.log('initCynanBotDiscord', f'Using SQLite performance profile: {generalSettingsRepository.getAll().getSqlitePerformanceProfile().toStr()}')
 elif generalSettingsRepository.getAll().requireDatabaseType() is DatabaseType.SQLITE:
     backingDatabase = BackingSqliteDatabase(
         eventLoop = eventLoop
@@ -44,81 +89,290 @@ else:
 
 networkClientProvider: NetworkClientProvider = None
 if generalSettingsRepository.getAll().requireNetworkClientType() is NetworkClientType.AIOHTTP:
-    networkClientProvider: NetworkClientProvider = AioHttpClientProvider(
-        eventLoop = eventLoop,
-        timber = timber
+    networkClientProvider: NetworkClientProvider = PooledAioHttpClientProvider(
+        timber = timber,
+        connectionPoolSize = generalSettingsRepository.getAll().getNetworkConnectionPoolSize(),
+        timeoutSeconds = generalSettingsRepository.getAll().getNetworkTimeoutSeconds()
     )
 elif generalSettingsRepository.getAll().requireNetworkClientType() is NetworkClientType.REQUESTS:
-    networkClientProvider: NetworkClientProvider = RequestsClientProvider(
-        timber = timber
+    networkClientProvider: NetworkClientProvider = ThreadedRequestsClientProvider(
+        eventLoop = eventLoop,
+        timber = timber,
+        maxWorkers = generalSettingsRepository.getAll().getNetworkThreadPoolSize(),
+        connectionPoolSize = generalSettingsRepository.getAll().getNetworkConnectionPoolSize(),
+        timeoutSeconds = generalSettingsRepository.getAll().getNetworkTimeoutSeconds()
     )
 else:
     raise RuntimeError(f'Unknown/misconfigured network client type: \"{generalSettingsRepository.getAll().requireNetworkClientType()}\"')
 
 authRepository = AuthRepository()
-usersRepository = UsersRepository(
+databaseSchemaRegistry = DatabaseSchemaRegistry(
     backingDatabase = backingDatabase
 )
+rosterVersionRepository = RosterVersionRepository(
+    backingDatabase = backingDatabase,
+    databaseSchemaRegistry = databaseSchemaRegistry
+)
+
+# other bot processes sharing the same PostgreSQL database are told about every roster write
+rosterChangeNotifier: RosterChangeNotifier = None
+if psqlCredentialsProvider is not None and generalSettingsRepository.getAll().isRosterChangeNotificationsEnabled():
+    rosterChangeNotifier = RosterChangeNotifier()
+
+# roster writes all go through one single writer, rather than contending for the database
+databaseWriteQueue: DatabaseWriteQueue = None
+if generalSettingsRepository.getAll().isDatabaseWriteQueueEnabled():
+    databaseWriteQueue = DatabaseWriteQueue(
+        eventLoop = eventLoop,
+        maxBatchSize = generalSettingsRepository.getAll().getDatabaseWriteQueueMaxBatchSize(),
+        maxDelayMillis = generalSettingsRepository.getAll().getDatabaseWriteQueueMaxDelayMillis()
+    )
+
+usersRepository = UsersRepository(
+    backingDatabase = backingDatabase,
+    databaseSchemaRegistry = databaseSchemaRegistry,
+    rosterVersionRepository = rosterVersionRepository,
+    rosterChangeNotifier = rosterChangeNotifier,
+    databaseWriteQueue = databaseWriteQueue
+)
+
+rosterSnapshotStore: RosterSnapshotStore = None
+if generalSettingsRepository.getAll().isRosterSnapshotEnabled():
+    rosterSnapshotStore = RosterSnapshotStore(
+        eventLoop = eventLoop,
+        timber = timber,
+        snapshotFile = generalSettingsRepository.getAll().getRosterSnapshotFile()
+    )
+
 twitchAnnounceChannelsRepository = TwitchAnnounceChannelsRepository(
     backingDatabase = backingDatabase,
-    usersRepository = usersRepository
+    databaseSchemaRegistry = databaseSchemaRegistry,
+    rosterVersionRepository = rosterVersionRepository,
+    usersRepository = usersRepository,
+    rosterSnapshotStore = rosterSnapshotStore,
+    rosterChangeNotifier = rosterChangeNotifier,
+    databaseWriteQueue = databaseWriteQueue
 )
 twitchAnnounceSettingsRepository = TwitchAnnounceSettingsRepository()
-twitchApiService = TwitchApiService(
+helixRateLimiter = HelixRateLimiter(
+    eventLoop = eventLoop,
+    timber = timber
+)
+
+helixRecorder: HelixRecorder = None
+if generalSettingsRepository.getAll().isHelixRecordingEnabled():
+    helixRecorder = HelixRecorder(
+        eventLoop = eventLoop,
+        timber = timber,
+        recordingFile = generalSettingsRepository.getAll().getHelixRecordingFile()
+    )
+
+twitchHelixApiService = TwitchHelixApiService(
     networkClientProvider = networkClientProvider,
     timber = timber,
-    twitchCredentialsProviderInterface = authRepository
+    twitchCredentialsProviderInterface = authRepository,
+    helixRateLimiter = helixRateLimiter,
+    helixRecorder = helixRecorder
 )
 twitchTokensRepository = TwitchTokensRepository(
     timber = timber,
-    twitchApiService = twitchApiService
+    twitchApiService = twitchHelixApiService
+)
+twitchUserIdsRepository = TwitchUserIdsRepository(
+    backingDatabase = backingDatabase,
+    databaseSchemaRegistry = databaseSchemaRegistry,
+    timber = timber,
+    twitchHandleProviderInterface = authRepository,
+    twitchHelixApiService = twitchHelixApiService,
+    twitchTokensRepository = twitchTokensRepository
+)
+
+announcedStreamsRepository = AnnouncedStreamsRepository(
+    backingDatabase = backingDatabase,
+    databaseSchemaRegistry = databaseSchemaRegistry,
+    timber = timber,
+    twitchAnnounceSettingsRepository = twitchAnnounceSettingsRepository
 )
 
+discordGatewayStats: DiscordGatewayStats = None
+if generalSettingsRepository.getAll().isDiscordGatewayStatsEnabled():
+    discordGatewayStats = DiscordGatewayStats(
+        eventLoop = eventLoop,
+        timber = timber
+    )
+
 cynanBotDiscord = CynanBotDiscord(
     eventLoop = eventLoop,
     authRepository = authRepository,
+    discordRestScheduler = DiscordRestScheduler(
+        eventLoop = eventLoop,
+        timber = timber
+    ),
     generalSettingsRepository = generalSettingsRepository,
+    rosterPruner = RosterPruner(
+        eventLoop = eventLoop,
+        timber = timber,
+        twitchAnnounceChannelsRepository = twitchAnnounceChannelsRepository
+    ),
+    startupHelper = StartupHelper(
+        announcedStreamsRepository = announcedStreamsRepository,
+        authRepository = authRepository,
+        rosterVersionRepository = rosterVersionRepository,
+        timber = timber,
+        twitchAnnounceChannelsRepository = twitchAnnounceChannelsRepository,
+        twitchAnnounceSettingsRepository = twitchAnnounceSettingsRepository,
+        twitchTokensRepository = twitchTokensRepository,
+        twitchUserIdsRepository = twitchUserIdsRepository,
+        usersRepository = usersRepository
+    ),
     timber = timber,
     twitchAnnounceChannelsRepository = twitchAnnounceChannelsRepository,
     twitchAnnounceSettingsRepository = twitchAnnounceSettingsRepository,
     twitchLiveUsersRepository = TwitchLiveUsersRepository(
+        eventLoop = eventLoop,
+        announcedStreamsRepository = announcedStreamsRepository,
         twitchAnnounceChannelsRepository = twitchAnnounceChannelsRepository,
-        twitchAnnounceSettingsRepository = twitchAnnounceSettingsRepository,
         twitchLiveHelper = TwitchLiveHelper(
             timber = timber,
-            twitchApiService = twitchApiService,
             twitchHandleProviderInterface = authRepository,
-            twitchTokensRepository = twitchTokensRepository
+            twitchHelixApiService = twitchHelixApiService,
+            twitchTokensRepository = twitchTokensRepository,
+            twitchUserIdsRepository = twitchUserIdsRepository,
+            usersRepository = usersRepository
         ),
-        usersRepository = usersRepository
-    )
+        usersRepository = usersRepository,
+        pollScheduler = PollScheduler(
+            timber = timber,
+            twitchAnnounceSettingsRepository = twitchAnnounceSettingsRepository,
+            helixRateLimiter = helixRateLimiter
+        )
+    ),
+    twitchUserIdsRepository = twitchUserIdsRepository,
+    twitchUsersImportExportHelper = TwitchUsersImportExportHelper(
+        timber = timber,
+        twitchAnnounceChannelsRepository = twitchAnnounceChannelsRepository,
+        twitchUserIdsRepository = twitchUserIdsRepository
+    ),
+    discordGatewayStats = discordGatewayStats
 )
 
 
 ###################################################################################################
 # begin CynanBotDiscord Commands                                                                  #
-# More information on Discord bot commands available here:                                        #
-# https://discordpy.readthedocs.io/en/latest/ext/commands/commands.html                           #
+# More information on Discord application (slash) commands available here:                        #
+# https://discordpy.readthedocs.io/en/latest/interactions/api.html#application-commands           #
 #                                                                                                 #
 # I hate putting the commands here like this, but I haven't found a way to have them completely   #
 # isolated within the CynanBotDiscord class :( Maybe someday when I've learned more about Python. #
+# Discord requires command and option names to be lowercase. They're registered with Discord by   #
+# CynanBotDiscord.setup_hook(), and are only shown to administrators unless a server says so.     #
 ###################################################################################################
 
-@cynanBotDiscord.command()
-async def addTwitchUser(ctx, *args):
-    await cynanBotDiscord.addTwitchUser(ctx)
+@cynanBotDiscord.tree.command(name = 'addtwitchuser', description = 'Announces a user\'s Twitch streams in this channel')
+@app_commands.default_permissions(administrator = True)
+@app_commands.guild_only()
+@app_commands.describe(member = 'the user to add', twitchHandle = 'their Twitch handle, as taken directly from their ttv url')
+@app_commands.rename(twitchHandle = 'twitch_handle')
+async def addTwitchUser(interaction: discord.Interaction, member: discord.Member, twitchHandle: str):
+    await cynanBotDiscord.addTwitchUser(interaction, member, twitchHandle)
+
+@cynanBotDiscord.tree.command(name = 'exporttwitchusers', description = 'Exports the users whose Twitch streams are announced in this channel')
+@app_commands.default_permissions(administrator = True)
+@app_commands.guild_only()
+@app_commands.describe(fileFormat = 'the format of the exported file, csv by default')
+@app_commands.rename(fileFormat = 'format')
+async def exportTwitchUsers(interaction: discord.Interaction, fileFormat: Literal['csv', 'json'] = 'csv'):
+    await cynanBotDiscord.exportTwitchUsers(interaction, fileFormat)
 
-@cynanBotDiscord.command()
-async def listTwitchUsers(ctx, *args):
-    await cynanBotDiscord.listTwitchUsers(ctx)
+@cynanBotDiscord.tree.command(name = 'importtwitchusers', description = 'Imports users whose Twitch streams should be announced in this channel')
+@app_commands.default_permissions(administrator = True)
+@app_commands.guild_only()
+@app_commands.describe(attachment = 'a CSV or JSON file, in the same format that /exporttwitchusers creates')
+@app_commands.rename(attachment = 'file')
+async def importTwitchUsers(interaction: discord.Interaction, attachment: discord.Attachment):
+    await cynanBotDiscord.importTwitchUsers(interaction, attachment)
 
-@cynanBotDiscord.command()
-async def removeTwitchUser(ctx, *args):
-    await cynanBotDiscord.removeTwitchUser(ctx)
+@cynanBotDiscord.tree.command(name = 'listtwitchusers', description = 'Lists the users whose Twitch streams are announced in this channel')
+@app_commands.default_permissions(administrator = True)
+@app_commands.guild_only()
+async def listTwitchUsers(interaction: discord.Interaction):
+    await cynanBotDiscord.listTwitchUsers(interaction)
+
+@cynanBotDiscord.tree.command(name = 'removetwitchuser', description = 'Stops announcing the Twitch streams of up to 5 users in this channel')
+@app_commands.default_permissions(administrator = True)
+@app_commands.guild_only()
+@app_commands.describe(
+    member = 'the user to remove, even if they\'ve already left the server',
+    member2 = 'another user to remove',
+    member3 = 'another user to remove',
+    member4 = 'another user to remove',
+    member5 = 'another user to remove'
+)
+async def removeTwitchUser(
+    interaction: discord.Interaction,
+    member: Union[discord.Member, discord.User],
+    member2: Optional[Union[discord.Member, discord.User]] = None,
+    member3: Optional[Union[discord.Member, discord.User]] = None,
+    member4: Optional[Union[discord.Member, discord.User]] = None,
+    member5: Optional[Union[discord.Member, discord.User]] = None
+):
+    await cynanBotDiscord.removeTwitchUsers(interaction, [ member, member2, member3, member4, member5 ])
 
 ###################################################################################################
 # end CynanBotDiscord commands                                                                    #
 ###################################################################################################
 
+if generalSettingsRepository.getAll().isEventLoopWatchdogEnabled():
+    eventLoopWatchdog = EventLoopWatchdog(
+        eventLoop = eventLoop,
+        timber = timber,
+        lagThresholdSeconds = generalSettingsRepository.getAll().getEventLoopLagThresholdMillis() / 1000
+    )
+
+    eventLoopWatchdog.start()
+
+if discordGatewayStats is not None:
+    discordGatewayStats.start()
+
+helixRateLimiter.start()
+
+if rosterChangeNotifier is not None:
+    rosterChangeListener = RosterChangeListener(
+        eventLoop = eventLoop,
+        databaseSchemaRegistry = databaseSchemaRegistry,
+        psqlCredentialsProvider = psqlCredentialsProvider,
+        rosterChangeNotifier = rosterChangeNotifier,
+        rosterVersionRepository = rosterVersionRepository,
+        timber = timber,
+        twitchAnnounceChannelsRepository = twitchAnnounceChannelsRepository
+    )
+
+    rosterChangeListener.start()
+
+if generalSettingsRepository.getAll().isRosterMaintenanceEnabled():
+    rosterMaintenance = RosterMaintenance(
+        eventLoop = eventLoop,
+        backingDatabase = backingDatabase,
+        rosterVersionRepository = rosterVersionRepository,
+        timber = timber,
+        twitchAnnounceChannelsRepository = twitchAnnounceChannelsRepository,
+        usersRepository = usersRepository,
+        intervalSeconds = generalSettingsRepository.getAll().getRosterMaintenanceIntervalHours() * 3600
+    )
+
+    rosterMaintenance.start()
+
 timber.log('initCynanBotDiscord', 'Starting CynanBotDiscord...')
-cynanBotDiscord.run(authRepository.getAll().requireDiscordToken())
+
+# Client.run() would start the bot on a brand new loop of its own (via asyncio.run()), where
+# none of the tasks that were just scheduled on eventLoop above would ever get to run. So the
+# bot is started on eventLoop instead, along with the logging that run() would've set up.
+discord.utils.setup_logging()
+
+try:
+    eventLoop.run_until_complete(cynanBotDiscord.start(authRepository.getAll().requireDiscordToken()))
+except KeyboardInterrupt:
+    pass
+finally:
+    if not cynanBotDiscord.is_closed():
+        eventLoop.run_until_complete(cynanBotDiscord.close())
@@ -0,0 +1,364 @@
+import math
+import statistics
+import time
+from collections import deque
+from datetime import datetime, timezone
+from enum import Enum, auto
+from typing import Deque, Dict, List, Optional, Tuple
+
+import CynanBotCommon.utils as utils
+from bufferedTimber import BufferedTimber
+from helixRateLimiter import HelixRateLimiter
+from twitchAnnounceSettingsRepository import TwitchAnnounceSettingsRepository
+from twitchAnnounceSettingsSnapshot import TwitchAnnounceSettingsSnapshot
+from user import User
+
+
+class PollTier(Enum):
+
+    ACTIVE = auto()
+    REGULAR = auto()
+    DORMANT = auto()
+
+    def toStr(self) -> str:
+        return self.name.lower()
+
+
+class PollSchedulerMetrics():
+
+    def __init__(self, maxLatencySamples: int = 500):
+        if not utils.isValidInt(maxLatencySamples):
+            raise ValueError(f'maxLatencySamples argument is malformed: \"{maxLatencySamples}\"')
+        elif maxLatencySamples < 1:
+            raise ValueError(f'maxLatencySamples argument is out of bounds: {maxLatencySamples}')
+
+        self.__helixCallCount: int = 0
+        self.__overBudgetTickCount: int = 0
+        self.__remainingBudget: float = 0
+        self.__tickCount: int = 0
+        self.__tierDetectionLatencies: Dict[PollTier, Deque[float]] = dict()
+        self.__tierPollCounts: Dict[PollTier, int] = dict()
+        self.__tierUserCounts: Dict[PollTier, int] = dict()
+
+        for pollTier in PollTier:
+            self.__tierDetectionLatencies[pollTier] = deque(maxlen = maxLatencySamples)
+            self.__tierPollCounts[pollTier] = 0
+            self.__tierUserCounts[pollTier] = 0
+
+    def getHelixCallCount(self) -> int:
+        return self.__helixCallCount
+
+    def getMedianDetectionLatencySeconds(self, pollTier: PollTier) -> Optional[float]:
+        if not isinstance(pollTier, PollTier):
+            raise ValueError(f'pollTier argument is malformed: \"{pollTier}\"')
+
+        detectionLatencies = self.__tierDetectionLatencies[pollTier]
+
+        if not utils.hasItems(detectionLatencies):
+            return None
+
+        return statistics.median(detectionLatencies)
+
+    def getOverBudgetTickCount(self) -> int:
+        return self.__overBudgetTickCount
+
+    def getRemainingBudget(self) -> float:
+        return self.__remainingBudget
+
+    def getTickCount(self) -> int:
+        return self.__tickCount
+
+    def getTierPollCount(self, pollTier: PollTier) -> int:
+        return self.__tierPollCounts[pollTier]
+
+    def getTierUserCount(self, pollTier: PollTier) -> int:
+        return self.__tierUserCounts[pollTier]
+
+    def recordDetection(self, pollTier: PollTier, detectionLatencySeconds: float):
+        self.__tierDetectionLatencies[pollTier].append(detectionLatencySeconds)
+
+    def recordPoll(self, pollTier: PollTier):
+        self.__tierPollCounts[pollTier] = self.__tierPollCounts[pollTier] + 1
+
+    def recordTick(
+        self,
+        helixCallCount: int,
+        isOverBudget: bool,
+        remainingBudget: float,
+        tierUserCounts: Dict[PollTier, int]
+    ):
+        self.__tickCount = self.__tickCount + 1
+        self.__helixCallCount = self.__helixCallCount + helixCallCount
+        self.__remainingBudget = remainingBudget
+
+        if isOverBudget:
+            self.__overBudgetTickCount = self.__overBudgetTickCount + 1
+
+        for pollTier in PollTier:
+            self.__tierUserCounts[pollTier] = tierUserCounts.get(pollTier, 0)
+
+    def toStr(self) -> str:
+        tierStrs: List[str] = list()
+
+        for pollTier in PollTier:
+            medianLatency = self.getMedianDetectionLatencySeconds(pollTier)
+            medianLatencyStr = 'n/a' if medianLatency is None else f'{medianLatency:.0f}s'
+            tierStrs.append(f'{pollTier.toStr()}(users={self.__tierUserCounts[pollTier]}, polls={self.__tierPollCounts[pollTier]}, medianDetection={medianLatencyStr})')
+
+        return f'ticks={self.__tickCount}, helixCalls={self.__helixCallCount}, overBudgetTicks={self.__overBudgetTickCount}, remainingBudget={self.__remainingBudget:.1f}, {", ".join(tierStrs)}'
+
+
+class PollScheduler():
+
+    # Decides which roster users get checked for being live on each poll tick, so that streamers
+    # who are likely to go live are checked more often than ones who haven't streamed in ages:
+    #
+    # - ACTIVE: streamed within the last activeWithinDays, or usually streams around this time of
+    #   day (their most recent stream began within scheduleWindowMinutes of the current time of
+    #   day). Polled every activePollMinutes.
+    # - REGULAR: everyone else, including users who have never been seen live. Polled every
+    #   refreshEveryMinutes, just as every user was before tiers existed.
+    # - DORMANT: last streamed more than dormantAfterDays ago. Polled every dormantPollMinutes.
+    #
+    # All Helix calls come out of a token bucket that refills at helixCallsPerHourBudget. Left at
+    # 0, that budget is exactly what polling the whole roster every refreshEveryMinutes used to
+    # cost, so tiering can never spend more calls than flat polling did. When the budget runs
+    # short, the most overdue users (relative to their tier's interval) go first. Since a Helix
+    # call costs the same for 1 user as it does for 100, any leftover room in the final batch is
+    # filled with whoever is closest to being due. Given a HelixRateLimiter, a tick also never
+    # asks for more calls than Twitch says are left in its own rate limit bucket.
+
+    def __init__(
+        self,
+        timber: BufferedTimber,
+        twitchAnnounceSettingsRepository: TwitchAnnounceSettingsRepository,
+        helixRateLimiter: Optional[HelixRateLimiter] = None,
+        helixBatchSize: int = 100,
+        metricsLogEveryTicks: int = 60
+    ):
+        if not isinstance(timber, BufferedTimber):
+            raise ValueError(f'timber argument is malformed: \"{timber}\"')
+        elif not isinstance(twitchAnnounceSettingsRepository, TwitchAnnounceSettingsRepository):
+            raise ValueError(f'twitchAnnounceSettingsRepository argument is malformed: \"{twitchAnnounceSettingsRepository}\"')
+        elif helixRateLimiter is not None and not isinstance(helixRateLimiter, HelixRateLimiter):
+            raise ValueError(f'helixRateLimiter argument is malformed: \"{helixRateLimiter}\"')
+        elif not utils.isValidInt(helixBatchSize):
+            raise ValueError(f'helixBatchSize argument is malformed: \"{helixBatchSize}\"')
+        elif helixBatchSize < 1 or helixBatchSize > 100:
+            raise ValueError(f'helixBatchSize argument is out of bounds: {helixBatchSize}')
+        elif not utils.isValidInt(metricsLogEveryTicks):
+            raise ValueError(f'metricsLogEveryTicks argument is malformed: \"{metricsLogEveryTicks}\"')
+        elif metricsLogEveryTicks < 1:
+            raise ValueError(f'metricsLogEveryTicks argument is out of bounds: {metricsLogEveryTicks}')
+
+        self.__timber: BufferedTimber = timber
+        self.__twitchAnnounceSettingsRepository: TwitchAnnounceSettingsRepository = twitchAnnounceSettingsRepository
+        self.__helixRateLimiter: Optional[HelixRateLimiter] = helixRateLimiter
+        self.__helixBatchSize: int = helixBatchSize
+        self.__metricsLogEveryTicks: int = metricsLogEveryTicks
+
+        self.__metrics: PollSchedulerMetrics = PollSchedulerMetrics()
+        self.__budgetTokens: Optional[float] = None
+        self.__budgetUpdatedAt: Optional[float] = None
+        self.__lastPollTimes: Dict[str, float] = dict()
+        self.__userTiers: Dict[str, PollTier] = dict()
+        self.__mostRecentStreamTimes: Dict[str, Tuple[str, Optional[float]]] = dict()
+
+    def __classify(
+        self,
+        user: User,
+        now: float,
+        twitchAnnounceSettings: TwitchAnnounceSettingsSnapshot
+    ) -> PollTier:
+        mostRecentStreamTime = self.__getMostRecentStreamTime(user)
+
+        if mostRecentStreamTime is None:
+            return PollTier.REGULAR
+
+        daysSinceStream = (now - mostRecentStreamTime) / 86400
+
+        if daysSinceStream <= twitchAnnounceSettings.getActiveWithinDays():
+            return PollTier.ACTIVE
+        elif daysSinceStream > twitchAnnounceSettings.getDormantAfterDays():
+            return PollTier.DORMANT
+
+        # people tend to stream at around the same time of day, so the time of day that their
+        # most recent stream started at is used as a (very) small observed schedule
+        secondsApartInDay = abs((now % 86400) - (mostRecentStreamTime % 86400))
+        secondsApartInDay = min(secondsApartInDay, 86400 - secondsApartInDay)
+
+        if secondsApartInDay <= twitchAnnounceSettings.getScheduleWindowMinutes() * 60:
+            return PollTier.ACTIVE
+        else:
+            return PollTier.REGULAR
+
+    def __getMostRecentStreamTime(self, user: User) -> Optional[float]:
+        if not user.hasMostRecentStreamDateTime():
+            return None
+
+        # parsing dates for the whole roster every tick adds up, so each user's parsed time is
+        # kept until their most recent stream changes
+        isoFormatStr = user.getMostRecentStreamDateTime().getIsoFormatStr()
+        cachedTime = self.__mostRecentStreamTimes.get(user.getDiscordId())
+
+        if cachedTime is not None and cachedTime[0] == isoFormatStr:
+            return cachedTime[1]
+
+        mostRecentStreamTime: Optional[float] = None
+        mostRecentStreamDateTime: Optional[datetime] = utils.getDateTimeFromStr(isoFormatStr)
+
+        if mostRecentStreamDateTime is not None:
+            if mostRecentStreamDateTime.tzinfo is None:
+                mostRecentStreamDateTime = mostRecentStreamDateTime.replace(tzinfo = timezone.utc)
+
+            mostRecentStreamTime = mostRecentStreamDateTime.timestamp()
+
+        self.__mostRecentStreamTimes[user.getDiscordId()] = (isoFormatStr, mostRecentStreamTime)
+        return mostRecentStreamTime
+
+    def getMetrics(self) -> PollSchedulerMetrics:
+        return self.__metrics
+
+    def __getPollIntervalSeconds(
+        self,
+        pollTier: PollTier,
+        twitchAnnounceSettings: TwitchAnnounceSettingsSnapshot
+    ) -> float:
+        regularPollSeconds = twitchAnnounceSettings.getRefreshEveryMinutes() * 60
+
+        if pollTier is PollTier.ACTIVE:
+            return min(twitchAnnounceSettings.getActivePollMinutes() * 60, regularPollSeconds)
+        elif pollTier is PollTier.DORMANT:
+            return max(twitchAnnounceSettings.getDormantPollMinutes() * 60, regularPollSeconds)
+        else:
+            return regularPollSeconds
+
+    def onPolled(
+        self,
+        polledUsers: List[User],
+        detectedUsers: Optional[List[User]] = None,
+        now: Optional[float] = None
+    ):
+        if polledUsers is None:
+            raise ValueError(f'polledUsers argument is malformed: \"{polledUsers}\"')
+
+        # detectedUsers are the users whose streams were just announced for the first time
+
+        if now is None:
+            now = time.time()
+
+        if utils.hasItems(detectedUsers):
+            for user in detectedUsers:
+                previousPollTime = self.__lastPollTimes.get(user.getDiscordId())
+                pollTier = self.__userTiers.get(user.getDiscordId(), PollTier.REGULAR)
+
+                # the stream started at some point since the previous poll, so on average it
+                # was detected half of that gap after it went live
+                if previousPollTime is not None:
+                    self.__metrics.recordDetection(pollTier, (now - previousPollTime) / 2)
+
+        for user in polledUsers:
+            self.__lastPollTimes[user.getDiscordId()] = now
+            self.__metrics.recordPoll(self.__userTiers.get(user.getDiscordId(), PollTier.REGULAR))
+
+    async def selectBatches(
+        self,
+        users: List[User],
+        now: Optional[float] = None
+    ) -> List[List[User]]:
+        if users is None:
+            raise ValueError(f'users argument is malformed: \"{users}\"')
+
+        # returns the batches of users to check on this tick, each of which costs one Helix call
+
+        if now is None:
+            now = time.time()
+
+        if not utils.hasItems(users):
+            return list()
+
+        twitchAnnounceSettings = await self.__twitchAnnounceSettingsRepository.getAllAsync()
+        fullSweepCallCount = math.ceil(len(users) / self.__helixBatchSize)
+
+        callsPerHourBudget: float = twitchAnnounceSettings.getHelixCallsPerHourBudget()
+        if callsPerHourBudget <= 0:
+            callsPerHourBudget = fullSweepCallCount * 60 / twitchAnnounceSettings.getRefreshEveryMinutes()
+
+        self.__refillBudget(now, callsPerHourBudget, fullSweepCallCount)
+
+        userScores: List[Tuple[float, int, User]] = list()
+        userTiers: Dict[str, PollTier] = dict()
+        tierUserCounts: Dict[PollTier, int] = dict()
+        dueCount = 0
+
+        for user in users:
+            pollTier = self.__classify(user, now, twitchAnnounceSettings)
+            userTiers[user.getDiscordId()] = pollTier
+            tierUserCounts[pollTier] = tierUserCounts.get(pollTier, 0) + 1
+
+            lastPollTime = self.__lastPollTimes.get(user.getDiscordId())
+
+            # how overdue this user is, as a multiple of their tier's poll interval
+            score = math.inf
+            if lastPollTime is not None:
+                score = (now - lastPollTime) / self.__getPollIntervalSeconds(pollTier, twitchAnnounceSettings)
+
+            if score >= 1:
+                dueCount = dueCount + 1
+
+            userScores.append((score, pollTier.value, user))
+
+        self.__userTiers = userTiers
+
+        # users that have left the roster don't need to be remembered anymore
+        if len(self.__lastPollTimes) > 2 * len(users):
+            self.__lastPollTimes = { discordId: lastPollTime for discordId, lastPollTime in self.__lastPollTimes.items() if discordId in userTiers }
+            self.__mostRecentStreamTimes = { discordId: streamTime for discordId, streamTime in self.__mostRecentStreamTimes.items() if discordId in userTiers }
+
+        callCount = 0
+        isOverBudget = False
+
+        if dueCount >= 1:
+            wantedCallCount = math.ceil(dueCount / self.__helixBatchSize)
+            callCount = min(wantedCallCount, int(self.__budgetTokens))
+
+            if self.__helixRateLimiter is not None:
+                callCount = min(callCount, self.__helixRateLimiter.getRemainingBudget())
+
+            isOverBudget = callCount < wantedCallCount
+
+        batches: List[List[User]] = list()
+
+        if callCount >= 1:
+            self.__budgetTokens = self.__budgetTokens - callCount
+            userScores.sort(key = lambda userScore: (-userScore[0], userScore[1]))
+            selectedUsers = [ userScore[2] for userScore in userScores[0:callCount * self.__helixBatchSize] ]
+
+            for index in range(0, len(selectedUsers), self.__helixBatchSize):
+                batches.append(selectedUsers[index:index + self.__helixBatchSize])
+
+        self.__metrics.recordTick(
+            helixCallCount = callCount,
+            isOverBudget = isOverBudget,
+            remainingBudget = self.__budgetTokens,
+            tierUserCounts = tierUserCounts
+        )
+
+        if self.__metrics.getTickCount() % self.__metricsLogEveryTicks == 0:
+            if self.__helixRateLimiter is None:
+                self.__timber.log('PollScheduler', f'Poll scheduler metrics: {self.__metrics.toStr()}')
+            else:
+                self.__timber.log('PollScheduler', f'Poll scheduler metrics: {self.__metrics.toStr()}, helix: {self.__helixRateLimiter.toStr()}')
+
+        return batches
+
+    def __refillBudget(self, now: float, callsPerHourBudget: float, capacity: int):
+        # the bucket can hold up to one full sweep of the roster, and starts out full so that
+        # the very first tick checks everyone
+        if self.__budgetTokens is None or self.__budgetUpdatedAt is None:
+            self.__budgetTokens = capacity
+        else:
+            elapsedSeconds = max(0, now - self.__budgetUpdatedAt)
+            self.__budgetTokens = min(capacity, self.__budgetTokens + (elapsedSeconds * callsPerHourBudget / 3600))
+
+        self.__budgetUpdatedAt = now
@@ -0,0 +1,187 @@
+from typing import Any, Dict, Optional
+
+import aiohttp
+
+import CynanBotCommon.utils as utils
+from bufferedTimber import BufferedTimber
+from CynanBotCommon.network.exceptions import GenericNetworkException
+from CynanBotCommon.network.networkClientProvider import NetworkClientProvider
+from CynanBotCommon.network.networkClientType import NetworkClientType
+from CynanBotCommon.network.networkHandle import NetworkHandle
+from CynanBotCommon.network.networkResponse import NetworkResponse
+
+
+class PooledAioHttpResponse(NetworkResponse):
+
+    def __init__(
+        self,
+        response: aiohttp.ClientResponse,
+        url: str
+    ):
+        if response is None:
+            raise ValueError(f'response argument is malformed: \"{response}\"')
+        elif not utils.isValidStr(url):
+            raise ValueError(f'url argument is malformed: \"{url}\"')
+
+        self.__response: aiohttp.ClientResponse = response
+        self.__url: str = url
+        self.__isClosed: bool = False
+
+    async def close(self):
+        if self.__isClosed:
+            return
+
+        self.__isClosed = True
+
+        # release() hands the connection back to the shared pool instead of dropping it
+        self.__response.release()
+
+    def getHeaders(self) -> Dict[str, str]:
+        return dict(self.__response.headers)
+
+    def getNetworkClientType(self) -> NetworkClientType:
+        return NetworkClientType.AIOHTTP
+
+    def getStatusCode(self) -> int:
+        return self.__response.status
+
+    def getUrl(self) -> str:
+        return self.__url
+
+    def isClosed(self) -> bool:
+        return self.__isClosed
+
+    async def json(self) -> Optional[Dict[str, Any]]:
+        return await self.__response.json()
+
+    async def read(self) -> bytes:
+        return await self.__response.read()
+
+
+class PooledAioHttpHandle(NetworkHandle):
+
+    def __init__(
+        self,
+        clientSession: aiohttp.ClientSession,
+        timber: BufferedTimber
+    ):
+        if not isinstance(clientSession, aiohttp.ClientSession):
+            raise ValueError(f'clientSession argument is malformed: \"{clientSession}\"')
+        elif not isinstance(timber, BufferedTimber):
+            raise ValueError(f'timber argument is malformed: \"{timber}\"')
+
+        self.__clientSession: aiohttp.ClientSession = clientSession
+        self.__timber: BufferedTimber = timber
+
+    async def close(self):
+        # the session is shared and owned by PooledAioHttpClientProvider, don't close it here
+        pass
+
+    async def get(
+        self,
+        url: str,
+        headers: Optional[Dict[str, Any]] = None
+    ) -> PooledAioHttpResponse:
+        if not utils.isValidStr(url):
+            raise ValueError(f'url argument is malformed: \"{url}\"')
+
+        try:
+            response = await self.__clientSession.get(url, headers = headers)
+        except Exception as e:
+            self.__timber.log('PooledAioHttpHandle', f'Encountered network error when GETting \"{url}\": {e}', e)
+            raise GenericNetworkException(f'Encountered network error when GETting \"{url}\": {e}')
+
+        return PooledAioHttpResponse(
+            response = response,
+            url = url
+        )
+
+    def getNetworkClientType(self) -> NetworkClientType:
+        return NetworkClientType.AIOHTTP
+
+    async def post(
+        self,
+        url: str,
+        headers: Optional[Dict[str, Any]] = None,
+        json: Optional[Dict[str, Any]] = None
+    ) -> PooledAioHttpResponse:
+        if not utils.isValidStr(url):
+            raise ValueError(f'url argument is malformed: \"{url}\"')
+
+        try:
+            response = await self.__clientSession.post(url, headers = headers, json = json)
+        except Exception as e:
+            self.__timber.log('PooledAioHttpHandle', f'Encountered network error when POSTing \"{url}\": {e}', e)
+            raise GenericNetworkException(f'Encountered network error when POSTing \"{url}\": {e}')
+
+        return PooledAioHttpResponse(
+            response = response,
+            url = url
+        )
+
+
+class PooledAioHttpClientProvider(NetworkClientProvider):
+
+    # Hands out handles backed by a single long lived aiohttp.ClientSession, so that every call
+    # shares one connection pool (and its keep-alive connections and DNS cache) rather than
+    # paying for a fresh session and TLS handshake each time. The session (and its connector)
+    # isn't created until the first get(), so that it belongs to whichever event loop is actually
+    # running by then, rather than to one that was passed in up front.
+
+    def __init__(
+        self,
+        timber: BufferedTimber,
+        connectionPoolSize: int = 10,
+        connectionPoolSizePerHost: int = 6,
+        keepAliveSeconds: float = 30,
+        timeoutSeconds: float = 8
+    ):
+        if not isinstance(timber, BufferedTimber):
+            raise ValueError(f'timber argument is malformed: \"{timber}\"')
+        elif not utils.isValidInt(connectionPoolSize):
+            raise ValueError(f'connectionPoolSize argument is malformed: \"{connectionPoolSize}\"')
+        elif connectionPoolSize < 1:
+            raise ValueError(f'connectionPoolSize argument is out of bounds: {connectionPoolSize}')
+        elif not utils.isValidInt(connectionPoolSizePerHost):
+            raise ValueError(f'connectionPoolSizePerHost argument is malformed: \"{connectionPoolSizePerHost}\"')
+        elif connectionPoolSizePerHost < 1:
+            raise ValueError(f'connectionPoolSizePerHost argument is out of bounds: {connectionPoolSizePerHost}')
+        elif not utils.isValidNum(keepAliveSeconds):
+            raise ValueError(f'keepAliveSeconds argument is malformed: \"{keepAliveSeconds}\"')
+        elif not utils.isValidNum(timeoutSeconds):
+            raise ValueError(f'timeoutSeconds argument is malformed: \"{timeoutSeconds}\"')
+        elif timeoutSeconds <= 0:
+            raise ValueError(f'timeoutSeconds argument is out of bounds: {timeoutSeconds}')
+
+        self.__timber: BufferedTimber = timber
+        self.__connectionPoolSize: int = connectionPoolSize
+        self.__connectionPoolSizePerHost: int = connectionPoolSizePerHost
+        self.__keepAliveSeconds: float = keepAliveSeconds
+        self.__timeoutSeconds: float = timeoutSeconds
+
+        self.__clientSession: Optional[aiohttp.ClientSession] = None
+
+    async def close(self):
+        if self.__clientSession is not None and not self.__clientSession.closed:
+            await self.__clientSession.close()
+
+        self.__clientSession = None
+
+    async def get(self) -> NetworkHandle:
+        if self.__clientSession is None or self.__clientSession.closed:
+            self.__clientSession = aiohttp.ClientSession(
+                connector = aiohttp.TCPConnector(
+                    limit = self.__connectionPoolSize,
+                    limit_per_host = min(self.__connectionPoolSizePerHost, self.__connectionPoolSize),
+                    keepalive_timeout = self.__keepAliveSeconds,
+                    ttl_dns_cache = 300,
+                    enable_cleanup_closed = True
+                ),
+                cookie_jar = aiohttp.DummyCookieJar(),
+                timeout = aiohttp.ClientTimeout(total = self.__timeoutSeconds)
+            )
+
+        return PooledAioHttpHandle(
+            clientSession = self.__clientSession,
+            timber = self.__timber
+        )
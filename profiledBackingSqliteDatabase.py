@@ -0,0 +1,74 @@
+import asyncio
+from asyncio import AbstractEventLoop
+from typing import List, Optional
+
+import CynanBotCommon.utils as utils
+from CynanBotCommon.storage.backingSqliteDatabase import BackingSqliteDatabase
+from CynanBotCommon.storage.databaseConnection import DatabaseConnection
+from sqlitePerformanceProfile import SqlitePerformanceProfile
+
+
+class ProfiledBackingSqliteDatabase(BackingSqliteDatabase):
+
+    # A BackingSqliteDatabase that applies a SqlitePerformanceProfile to every connection that
+    # it hands out. The journal mode is persistent, so it's only set on the very first connection
+    # (and read back, as SQLite quietly keeps its current mode when it can't switch, e.g. WAL on
+    # a network filesystem). The rest of the profile is per connection, so it's set every time.
+
+    def __init__(
+        self,
+        eventLoop: AbstractEventLoop,
+        sqlitePerformanceProfile: SqlitePerformanceProfile,
+        databaseFile: Optional[str] = None
+    ):
+        if databaseFile is None:
+            super().__init__(eventLoop = eventLoop)
+        else:
+            super().__init__(
+                eventLoop = eventLoop,
+                databaseFile = databaseFile
+            )
+
+        if not isinstance(sqlitePerformanceProfile, SqlitePerformanceProfile):
+            raise ValueError(f'sqlitePerformanceProfile argument is malformed: \"{sqlitePerformanceProfile}\"')
+
+        self.__sqlitePerformanceProfile: SqlitePerformanceProfile = sqlitePerformanceProfile
+
+        self.__connectionPragmas: List[str] = sqlitePerformanceProfile.getConnectionPragmas()
+        self.__journalModeLock: asyncio.Lock = asyncio.Lock()
+        self.__isJournalModeApplied: bool = sqlitePerformanceProfile.getJournalModePragma() is None
+        self.__journalMode: Optional[str] = None
+
+    async def __applyJournalMode(self, connection: DatabaseConnection):
+        async with self.__journalModeLock:
+            if self.__isJournalModeApplied:
+                return
+
+            row = await connection.fetchRow(self.__sqlitePerformanceProfile.getJournalModePragma())
+
+            if utils.hasItems(row):
+                self.__journalMode = str(row[0]).lower()
+
+            self.__isJournalModeApplied = True
+
+    async def getConnection(self) -> DatabaseConnection:
+        connection = await super().getConnection()
+
+        try:
+            for connectionPragma in self.__connectionPragmas:
+                await connection.execute(connectionPragma)
+
+            if not self.__isJournalModeApplied:
+                await self.__applyJournalMode(connection)
+        except Exception:
+            await connection.close()
+            raise
+
+        return connection
+
+    def getJournalMode(self) -> Optional[str]:
+        # the journal mode that SQLite actually reported, once the first connection has been made
+        return self.__journalMode
+
+    def getSqlitePerformanceProfile(self) -> SqlitePerformanceProfile:
+        return self.__sqlitePerformanceProfile
@@ -0,0 +1,211 @@
+import asyncio
+from asyncio import AbstractEventLoop
+from typing import Optional, Set
+
+import asyncpg
+
+import CynanBotCommon.utils as utils
+from bufferedTimber import BufferedTimber
+from CynanBotCommon.storage.psqlCredentialsProvider import \
+    PsqlCredentialsProvider
+from databaseSchemaRegistry import DatabaseSchemaRegistry
+from rosterChangeNotifier import RosterChangeNotifier
+from rosterChangeType import RosterChangeType
+from rosterVersionRepository import RosterVersionRepository
+from twitchAnnounceChannelsRepository import TwitchAnnounceChannelsRepository
+
+
+class RosterChangeListener():
+
+    # Keeps this process's roster caches in line with writes made by any other bot process (or
+    # anything else that sends the same notifications, see RosterChangeNotifier) sharing the same
+    # PostgreSQL database. It holds one dedicated connection that LISTENs for roster changes, and
+    # applies each one as a fine-grained invalidation: only the channels that were written to, or
+    # that hold a user who was written to, get read again. Notifications that arrive together
+    # are coalesced and applied in one go, straight away.
+    #
+    # Notifications sent while nobody is listening are simply lost, so every time the listener
+    # (re)connects it also does a full resync, which drops all of the roster caches to be loaded
+    # again upon next use. The connection is checked every healthCheckSeconds, as a connection
+    # that silently went away would otherwise look exactly like a quiet roster.
+
+    def __init__(
+        self,
+        eventLoop: AbstractEventLoop,
+        databaseSchemaRegistry: DatabaseSchemaRegistry,
+        psqlCredentialsProvider: PsqlCredentialsProvider,
+        rosterChangeNotifier: RosterChangeNotifier,
+        rosterVersionRepository: RosterVersionRepository,
+        timber: BufferedTimber,
+        twitchAnnounceChannelsRepository: TwitchAnnounceChannelsRepository,
+        healthCheckSeconds: float = 30,
+        reconnectDelaySeconds: float = 5
+    ):
+        if not isinstance(eventLoop, AbstractEventLoop):
+            raise ValueError(f'eventLoop argument is malformed: \"{eventLoop}\"')
+        elif not isinstance(databaseSchemaRegistry, DatabaseSchemaRegistry):
+            raise ValueError(f'databaseSchemaRegistry argument is malformed: \"{databaseSchemaRegistry}\"')
+        elif not isinstance(psqlCredentialsProvider, PsqlCredentialsProvider):
+            raise ValueError(f'psqlCredentialsProvider argument is malformed: \"{psqlCredentialsProvider}\"')
+        elif not isinstance(rosterChangeNotifier, RosterChangeNotifier):
+            raise ValueError(f'rosterChangeNotifier argument is malformed: \"{rosterChangeNotifier}\"')
+        elif not isinstance(rosterVersionRepository, RosterVersionRepository):
+            raise ValueError(f'rosterVersionRepository argument is malformed: \"{rosterVersionRepository}\"')
+        elif not isinstance(timber, BufferedTimber):
+            raise ValueError(f'timber argument is malformed: \"{timber}\"')
+        elif not isinstance(twitchAnnounceChannelsRepository, TwitchAnnounceChannelsRepository):
+            raise ValueError(f'twitchAnnounceChannelsRepository argument is malformed: \"{twitchAnnounceChannelsRepository}\"')
+        elif not utils.isValidNum(healthCheckSeconds):
+            raise ValueError(f'healthCheckSeconds argument is malformed: \"{healthCheckSeconds}\"')
+        elif healthCheckSeconds <= 0:
+            raise ValueError(f'healthCheckSeconds argument is out of bounds: {healthCheckSeconds}')
+        elif not utils.isValidNum(reconnectDelaySeconds):
+            raise ValueError(f'reconnectDelaySeconds argument is malformed: \"{reconnectDelaySeconds}\"')
+        elif reconnectDelaySeconds < 0:
+            raise ValueError(f'reconnectDelaySeconds argument is out of bounds: {reconnectDelaySeconds}')
+
+        self.__eventLoop: AbstractEventLoop = eventLoop
+        self.__databaseSchemaRegistry: DatabaseSchemaRegistry = databaseSchemaRegistry
+        self.__psqlCredentialsProvider: PsqlCredentialsProvider = psqlCredentialsProvider
+        self.__rosterChangeNotifier: RosterChangeNotifier = rosterChangeNotifier
+        self.__rosterVersionRepository: RosterVersionRepository = rosterVersionRepository
+        self.__timber: BufferedTimber = timber
+        self.__twitchAnnounceChannelsRepository: TwitchAnnounceChannelsRepository = twitchAnnounceChannelsRepository
+        self.__healthCheckSeconds: float = healthCheckSeconds
+        self.__reconnectDelaySeconds: float = reconnectDelaySeconds
+
+        self.__isListening: bool = False
+        self.__listenTask: Optional[asyncio.Task] = None
+        self.__applyTask: Optional[asyncio.Task] = None
+        self.__pendingChannelIds: Set[int] = set()
+        self.__pendingRemovedChannelIds: Set[int] = set()
+        self.__pendingUserIds: Set[str] = set()
+
+        self.__appliedCount: int = 0
+        self.__resyncCount: int = 0
+
+    async def __applyPendingChanges(self):
+        while utils.hasItems(self.__pendingChannelIds) or utils.hasItems(self.__pendingRemovedChannelIds) or utils.hasItems(self.__pendingUserIds):
+            channelIds = self.__pendingChannelIds - self.__pendingRemovedChannelIds
+            removedChannelIds = self.__pendingRemovedChannelIds
+            userIds = self.__pendingUserIds
+            self.__pendingChannelIds = set()
+            self.__pendingRemovedChannelIds = set()
+            self.__pendingUserIds = set()
+
+            try:
+                await self.__rosterVersionRepository.clearCaches()
+
+                # another process may have created tables that this one doesn't know about yet
+                if utils.hasItems(channelIds):
+                    await self.__databaseSchemaRegistry.clearCaches()
+
+                if utils.hasItems(removedChannelIds):
+                    await self.__twitchAnnounceChannelsRepository.invalidateRemovedChannels(list(removedChannelIds))
+
+                if utils.hasItems(channelIds):
+                    await self.__twitchAnnounceChannelsRepository.invalidateChannels(list(channelIds))
+
+                if utils.hasItems(userIds):
+                    await self.__twitchAnnounceChannelsRepository.invalidateUsers(list(userIds))
+            except Exception as e:
+                self.__timber.log('RosterChangeListener', f'Encountered Exception when applying roster changes ({len(channelIds)} channel(s), {len(removedChannelIds)} removed channel(s), {len(userIds)} user(s)), falling back to a full resync: {e}', e)
+                await self.__resync()
+                return
+
+            self.__appliedCount = self.__appliedCount + len(channelIds) + len(removedChannelIds) + len(userIds)
+
+    def getAppliedCount(self) -> int:
+        return self.__appliedCount
+
+    def getResyncCount(self) -> int:
+        return self.__resyncCount
+
+    def isListening(self) -> bool:
+        return self.__isListening
+
+    async def __listen(self):
+        while True:
+            connection: Optional[asyncpg.Connection] = None
+            connectionLost = asyncio.Event()
+
+            try:
+                connection = await asyncpg.connect(
+                    database = await self.__psqlCredentialsProvider.requireDatabaseName(),
+                    user = await self.__psqlCredentialsProvider.requireUser(),
+                    password = await self.__psqlCredentialsProvider.getPassword()
+                )
+
+                connection.add_termination_listener(lambda connection: connectionLost.set())
+                await connection.add_listener(self.__rosterChangeNotifier.getNotifyChannel(), self.__onNotification)
+                self.__isListening = True
+
+                # anything written before LISTEN took effect was never heard about
+                await self.__resync()
+                self.__timber.log('RosterChangeListener', f'Listening for roster changes on \"{self.__rosterChangeNotifier.getNotifyChannel()}\" ({self.toStr()})')
+
+                while not connectionLost.is_set():
+                    try:
+                        await asyncio.wait_for(connectionLost.wait(), timeout = self.__healthCheckSeconds)
+                    except asyncio.TimeoutError:
+                        await asyncio.wait_for(connection.execute('SELECT 1'), timeout = self.__healthCheckSeconds)
+
+                self.__timber.log('RosterChangeListener', 'Lost the roster change listener connection')
+            except Exception as e:
+                self.__timber.log('RosterChangeListener', f'Encountered Exception on the roster change listener connection: {e}', e)
+            finally:
+                self.__isListening = False
+
+                if connection is not None and not connection.is_closed():
+                    try:
+                        await connection.close(timeout = self.__healthCheckSeconds)
+                    except Exception:
+                        connection.terminate()
+
+            await asyncio.sleep(self.__reconnectDelaySeconds)
+
+    def __onNotification(self, connection: asyncpg.Connection, pid: int, channel: str, payload: str):
+        rosterChange = self.__rosterChangeNotifier.parsePayload(payload)
+
+        if rosterChange is None:
+            self.__timber.log('RosterChangeListener', lambda payload = payload: f'Ignoring malformed roster change notification: \"{payload}\"', sampleKey = 'RosterChangeListener:malformed')
+            return
+        elif rosterChange.getOriginId() == self.__rosterChangeNotifier.getOriginId():
+            # this process already applied its own write to its own caches
+            return
+
+        if rosterChange.getRosterChangeType() is RosterChangeType.USERS:
+            self.__pendingUserIds.update(rosterChange.getIds())
+        else:
+            discordChannelIds: Set[int] = set()
+
+            for id in rosterChange.getIds():
+                if id.isdigit():
+                    discordChannelIds.add(int(id))
+
+            if rosterChange.getRosterChangeType() is RosterChangeType.CHANNELS_REMOVED:
+                self.__pendingRemovedChannelIds.update(discordChannelIds)
+            else:
+                self.__pendingChannelIds.update(discordChannelIds)
+
+        if self.__applyTask is None or self.__applyTask.done():
+            self.__applyTask = self.__eventLoop.create_task(self.__applyPendingChanges())
+
+    async def __resync(self):
+        self.__pendingChannelIds = set()
+        self.__pendingRemovedChannelIds = set()
+        self.__pendingUserIds = set()
+
+        await self.__databaseSchemaRegistry.clearCaches()
+        await self.__rosterVersionRepository.clearCaches()
+        await self.__twitchAnnounceChannelsRepository.clearCaches()
+        self.__resyncCount = self.__resyncCount + 1
+
+    def start(self):
+        if self.__listenTask is not None and not self.__listenTask.done():
+            return
+
+        self.__listenTask = self.__eventLoop.create_task(self.__listen())
+
+    def toStr(self) -> str:
+        return f'listening={self.__isListening}, applied={self.__appliedCount}, resyncs={self.__resyncCount}, sent={self.__rosterChangeNotifier.getSentCount()}'
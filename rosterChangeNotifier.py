@@ -0,0 +1,120 @@
+import json
+import uuid
+from typing import Any, Dict, List, Optional
+
+import CynanBotCommon.utils as utils
+from CynanBotCommon.storage.databaseConnection import DatabaseConnection
+from CynanBotCommon.storage.databaseType import DatabaseType
+from rosterChangeType import RosterChangeType
+
+
+class RosterChange():
+
+    def __init__(
+        self,
+        rosterChangeType: RosterChangeType,
+        ids: List[str],
+        originId: str
+    ):
+        if not isinstance(rosterChangeType, RosterChangeType):
+            raise ValueError(f'rosterChangeType argument is malformed: \"{rosterChangeType}\"')
+        elif ids is None:
+            raise ValueError(f'ids argument is malformed: \"{ids}\"')
+        elif not utils.isValidStr(originId):
+            raise ValueError(f'originId argument is malformed: \"{originId}\"')
+
+        self.__rosterChangeType: RosterChangeType = rosterChangeType
+        self.__ids: List[str] = ids
+        self.__originId: str = originId
+
+    def getIds(self) -> List[str]:
+        return self.__ids
+
+    def getOriginId(self) -> str:
+        return self.__originId
+
+    def getRosterChangeType(self) -> RosterChangeType:
+        return self.__rosterChangeType
+
+
+class RosterChangeNotifier():
+
+    # Tells every other bot process sharing the same PostgreSQL database what part of the roster
+    # was just written to, so that they can invalidate exactly that part of their caches (see
+    # RosterChangeListener). Notifications are sent with pg_notify() on the same connection as
+    # the write itself, right after it, and carry a small JSON payload:
+    #
+    #   { "o": origin id, "t": change type, "i": [ ids ] }
+    #
+    # The origin id is random per process, so that a process can ignore its own notifications.
+    # PostgreSQL caps payloads at 8000 bytes, so ids are sent maxIdsPerNotification at a time.
+    # On SQLite there's nobody else to tell, so nothing is sent at all.
+
+    def __init__(
+        self,
+        notifyChannel: str = 'roster_changes',
+        maxIdsPerNotification: int = 200
+    ):
+        if not utils.isValidStr(notifyChannel):
+            raise ValueError(f'notifyChannel argument is malformed: \"{notifyChannel}\"')
+        elif not utils.isValidInt(maxIdsPerNotification):
+            raise ValueError(f'maxIdsPerNotification argument is malformed: \"{maxIdsPerNotification}\"')
+        elif maxIdsPerNotification < 1 or maxIdsPerNotification > 300:
+            raise ValueError(f'maxIdsPerNotification argument is out of bounds: {maxIdsPerNotification}')
+
+        self.__notifyChannel: str = notifyChannel
+        self.__maxIdsPerNotification: int = maxIdsPerNotification
+
+        self.__originId: str = uuid.uuid4().hex
+        self.__sentCount: int = 0
+
+    def getNotifyChannel(self) -> str:
+        return self.__notifyChannel
+
+    def getOriginId(self) -> str:
+        return self.__originId
+
+    def getSentCount(self) -> int:
+        return self.__sentCount
+
+    async def notify(
+        self,
+        connection: DatabaseConnection,
+        rosterChangeType: RosterChangeType,
+        ids: List[Any]
+    ):
+        if not isinstance(connection, DatabaseConnection):
+            raise ValueError(f'connection argument is malformed: \"{connection}\"')
+        elif not isinstance(rosterChangeType, RosterChangeType):
+            raise ValueError(f'rosterChangeType argument is malformed: \"{rosterChangeType}\"')
+        elif connection.getDatabaseType() is not DatabaseType.POSTGRESQL:
+            return
+        elif not utils.hasItems(ids):
+            return
+
+        ids = list(dict.fromkeys(str(id) for id in ids))
+
+        for index in range(0, len(ids), self.__maxIdsPerNotification):
+            payload = json.dumps({
+                'o': self.__originId,
+                't': rosterChangeType.toStr(),
+                'i': ids[index:index + self.__maxIdsPerNotification]
+            }, separators = (',', ':'))
+
+            await connection.execute('SELECT pg_notify($1, $2)', self.__notifyChannel, payload)
+            self.__sentCount = self.__sentCount + 1
+
+    def parsePayload(self, payload: Optional[str]) -> Optional[RosterChange]:
+        if not utils.isValidStr(payload):
+            return None
+
+        try:
+            jsonContents: Dict[str, Any] = json.loads(payload)
+
+            return RosterChange(
+                rosterChangeType = RosterChangeType.fromStr(jsonContents['t']),
+                ids = [ str(id) for id in jsonContents['i'] ],
+                originId = jsonContents['o']
+            )
+        except (KeyError, TypeError, ValueError):
+            return None
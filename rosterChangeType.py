@@ -0,0 +1,29 @@
+from enum import Enum, auto
+
+import CynanBotCommon.utils as utils
+
+
+class RosterChangeType(Enum):
+
+    CHANNELS = auto()
+    CHANNELS_REMOVED = auto()
+    USERS = auto()
+
+    @classmethod
+    def fromStr(cls, text: str):
+        if not utils.isValidStr(text):
+            raise ValueError(f'text argument is malformed: \"{text}\"')
+
+        text = text.lower()
+
+        if text == 'channels':
+            return RosterChangeType.CHANNELS
+        elif text == 'channels_removed':
+            return RosterChangeType.CHANNELS_REMOVED
+        elif text == 'users':
+            return RosterChangeType.USERS
+        else:
+            raise ValueError(f'unknown RosterChangeType: \"{text}\"')
+
+    def toStr(self) -> str:
+        return self.name.lower()
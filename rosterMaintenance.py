@@ -0,0 +1,365 @@
+import asyncio
+import time
+from asyncio import AbstractEventLoop
+from typing import List, Optional, Set
+
+import CynanBotCommon.utils as utils
+from bufferedTimber import BufferedTimber
+from CynanBotCommon.storage.backingDatabase import BackingDatabase
+from CynanBotCommon.storage.databaseConnection import DatabaseConnection
+from CynanBotCommon.storage.databaseType import DatabaseType
+from rosterVersionRepository import RosterVersionRepository
+from twitchAnnounceChannelsRepository import TwitchAnnounceChannelsRepository
+from usersRepository import UsersRepository
+
+
+class RosterMaintenanceReport():
+
+    def __init__(
+        self,
+        emptyChannelsRemoved: int,
+        orphanedUsersRemoved: int,
+        isCompacted: bool,
+        isInterrupted: bool,
+        databaseBytesBefore: int,
+        databaseBytesAfter: int,
+        probeSecondsBefore: float,
+        probeSecondsAfter: float,
+        durationSeconds: float
+    ):
+        if not utils.isValidInt(emptyChannelsRemoved):
+            raise ValueError(f'emptyChannelsRemoved argument is malformed: \"{emptyChannelsRemoved}\"')
+        elif not utils.isValidInt(orphanedUsersRemoved):
+            raise ValueError(f'orphanedUsersRemoved argument is malformed: \"{orphanedUsersRemoved}\"')
+        elif not utils.isValidBool(isCompacted):
+            raise ValueError(f'isCompacted argument is malformed: \"{isCompacted}\"')
+        elif not utils.isValidBool(isInterrupted):
+            raise ValueError(f'isInterrupted argument is malformed: \"{isInterrupted}\"')
+        elif not utils.isValidInt(databaseBytesBefore):
+            raise ValueError(f'databaseBytesBefore argument is malformed: \"{databaseBytesBefore}\"')
+        elif not utils.isValidInt(databaseBytesAfter):
+            raise ValueError(f'databaseBytesAfter argument is malformed: \"{databaseBytesAfter}\"')
+        elif not utils.isValidNum(probeSecondsBefore):
+            raise ValueError(f'probeSecondsBefore argument is malformed: \"{probeSecondsBefore}\"')
+        elif not utils.isValidNum(probeSecondsAfter):
+            raise ValueError(f'probeSecondsAfter argument is malformed: \"{probeSecondsAfter}\"')
+        elif not utils.isValidNum(durationSeconds):
+            raise ValueError(f'durationSeconds argument is malformed: \"{durationSeconds}\"')
+
+        self.__emptyChannelsRemoved: int = emptyChannelsRemoved
+        self.__orphanedUsersRemoved: int = orphanedUsersRemoved
+        self.__isCompacted: bool = isCompacted
+        self.__isInterrupted: bool = isInterrupted
+        self.__databaseBytesBefore: int = databaseBytesBefore
+        self.__databaseBytesAfter: int = databaseBytesAfter
+        self.__probeSecondsBefore: float = probeSecondsBefore
+        self.__probeSecondsAfter: float = probeSecondsAfter
+        self.__durationSeconds: float = durationSeconds
+
+    def getDatabaseBytesAfter(self) -> int:
+        return self.__databaseBytesAfter
+
+    def getDatabaseBytesBefore(self) -> int:
+        return self.__databaseBytesBefore
+
+    def getDurationSeconds(self) -> float:
+        return self.__durationSeconds
+
+    def getEmptyChannelsRemoved(self) -> int:
+        return self.__emptyChannelsRemoved
+
+    def getOrphanedUsersRemoved(self) -> int:
+        return self.__orphanedUsersRemoved
+
+    def getProbeSecondsAfter(self) -> float:
+        return self.__probeSecondsAfter
+
+    def getProbeSecondsBefore(self) -> float:
+        return self.__probeSecondsBefore
+
+    def getReclaimedBytes(self) -> int:
+        return self.__databaseBytesBefore - self.__databaseBytesAfter
+
+    def isCompacted(self) -> bool:
+        return self.__isCompacted
+
+    def isInterrupted(self) -> bool:
+        return self.__isInterrupted
+
+    def toStr(self) -> str:
+        interruptedStr = ' (interrupted by a roster write, the rest is left for the next run)' if self.__isInterrupted else ''
+        compactedStr = 'compacted' if self.__isCompacted else 'analyzed'
+        return f'removed {self.__emptyChannelsRemoved} empty channel(s) and {self.__orphanedUsersRemoved} orphaned user(s){interruptedStr}, {compactedStr}, database {self.__databaseBytesBefore / 1024:.0f}KiB -> {self.__databaseBytesAfter / 1024:.0f}KiB ({self.getReclaimedBytes() / 1024:.0f}KiB reclaimed), roster query {self.__probeSecondsBefore * 1000:.1f}ms -> {self.__probeSecondsAfter * 1000:.1f}ms, took {self.__durationSeconds:.1f}s'
+
+
+class RosterMaintenance():
+
+    # Garbage collects the roster every intervalSeconds: channels that are still registered in
+    # twitchannouncechannels but no longer have any announce users are removed (table and all),
+    # and then users that are no longer in any channel's table are deleted from the users table.
+    # Both are written in batches of batchSize, pausing for batchPauseSeconds in between so that
+    # the poll loop always gets its turn at the database.
+    #
+    # Whatever is found to be garbage is only garbage as of the scan, so right before every batch
+    # the job checks that the roster hasn't been written to since (no writes in flight, and the
+    # roster version hasn't moved). If it has, the job stops there and leaves the rest for the
+    # next run. A write can still land in between that check and the batch itself, so orphaned
+    # users are also checked against every channel in the same statement that deletes them (see
+    # TwitchAnnounceChannelsRepository.removeOrphanedUsers()), rather than deleting a user that
+    # was just added back to a channel.
+    #
+    # Afterwards the database is compacted in the way that suits the backend. SQLite only gets a
+    # full VACUUM once at least vacuumFreeRatio of its pages are free, as VACUUM rewrites the
+    # whole file and holds the database while it does, then ANALYZE. PostgreSQL gets a plain
+    # VACUUM (ANALYZE), which marks the space as reusable without locking any tables, but rarely
+    # gives it back to the OS, so the reclaimed size reported for it is usually close to 0.
+    # Database size and the time taken by a sample of roster queries are measured before and
+    # after, and logged with the rest of the report.
+
+    def __init__(
+        self,
+        eventLoop: AbstractEventLoop,
+        backingDatabase: BackingDatabase,
+        rosterVersionRepository: RosterVersionRepository,
+        timber: BufferedTimber,
+        twitchAnnounceChannelsRepository: TwitchAnnounceChannelsRepository,
+        usersRepository: UsersRepository,
+        intervalSeconds: float = 86400,
+        initialDelaySeconds: float = 900,
+        batchSize: int = 500,
+        batchPauseSeconds: float = 0.25,
+        probeChannelCount: int = 10,
+        vacuumFreeRatio: float = 0.1
+    ):
+        if not isinstance(eventLoop, AbstractEventLoop):
+            raise ValueError(f'eventLoop argument is malformed: \"{eventLoop}\"')
+        elif not isinstance(backingDatabase, BackingDatabase):
+            raise ValueError(f'backingDatabase argument is malformed: \"{backingDatabase}\"')
+        elif not isinstance(rosterVersionRepository, RosterVersionRepository):
+            raise ValueError(f'rosterVersionRepository argument is malformed: \"{rosterVersionRepository}\"')
+        elif not isinstance(timber, BufferedTimber):
+            raise ValueError(f'timber argument is malformed: \"{timber}\"')
+        elif not isinstance(twitchAnnounceChannelsRepository, TwitchAnnounceChannelsRepository):
+            raise ValueError(f'twitchAnnounceChannelsRepository argument is malformed: \"{twitchAnnounceChannelsRepository}\"')
+        elif not isinstance(usersRepository, UsersRepository):
+            raise ValueError(f'usersRepository argument is malformed: \"{usersRepository}\"')
+        elif not utils.isValidNum(intervalSeconds):
+            raise ValueError(f'intervalSeconds argument is malformed: \"{intervalSeconds}\"')
+        elif intervalSeconds < 60:
+            raise ValueError(f'intervalSeconds argument is out of bounds: {intervalSeconds}')
+        elif not utils.isValidNum(initialDelaySeconds):
+            raise ValueError(f'initialDelaySeconds argument is malformed: \"{initialDelaySeconds}\"')
+        elif initialDelaySeconds < 0:
+            raise ValueError(f'initialDelaySeconds argument is out of bounds: {initialDelaySeconds}')
+        elif not utils.isValidInt(batchSize):
+            raise ValueError(f'batchSize argument is malformed: \"{batchSize}\"')
+        elif batchSize < 1 or batchSize > 900:
+            raise ValueError(f'batchSize argument is out of bounds: {batchSize}')
+        elif not utils.isValidNum(batchPauseSeconds):
+            raise ValueError(f'batchPauseSeconds argument is malformed: \"{batchPauseSeconds}\"')
+        elif batchPauseSeconds < 0:
+            raise ValueError(f'batchPauseSeconds argument is out of bounds: {batchPauseSeconds}')
+        elif not utils.isValidInt(probeChannelCount):
+            raise ValueError(f'probeChannelCount argument is malformed: \"{probeChannelCount}\"')
+        elif probeChannelCount < 0:
+            raise ValueError(f'probeChannelCount argument is out of bounds: {probeChannelCount}')
+        elif not utils.isValidNum(vacuumFreeRatio):
+            raise ValueError(f'vacuumFreeRatio argument is malformed: \"{vacuumFreeRatio}\"')
+        elif vacuumFreeRatio < 0 or vacuumFreeRatio > 1:
+            raise ValueError(f'vacuumFreeRatio argument is out of bounds: {vacuumFreeRatio}')
+
+        self.__eventLoop: AbstractEventLoop = eventLoop
+        self.__backingDatabase: BackingDatabase = backingDatabase
+        self.__rosterVersionRepository: RosterVersionRepository = rosterVersionRepository
+        self.__timber: BufferedTimber = timber
+        self.__twitchAnnounceChannelsRepository: TwitchAnnounceChannelsRepository = twitchAnnounceChannelsRepository
+        self.__usersRepository: UsersRepository = usersRepository
+        self.__intervalSeconds: float = intervalSeconds
+        self.__initialDelaySeconds: float = initialDelaySeconds
+        self.__batchSize: int = batchSize
+        self.__batchPauseSeconds: float = batchPauseSeconds
+        self.__probeChannelCount: int = probeChannelCount
+        self.__vacuumFreeRatio: float = vacuumFreeRatio
+
+        self.__runLock: asyncio.Lock = asyncio.Lock()
+        self.__scheduleTask: Optional[asyncio.Task] = None
+        self.__lastReport: Optional[RosterMaintenanceReport] = None
+
+    async def __compact(self, connection: DatabaseConnection) -> bool:
+        if connection.getDatabaseType() is DatabaseType.POSTGRESQL:
+            await connection.execute('VACUUM (ANALYZE)')
+            return True
+        elif connection.getDatabaseType() is DatabaseType.SQLITE:
+            pageCountRow = await connection.fetchRow('PRAGMA page_count')
+            freelistCountRow = await connection.fetchRow('PRAGMA freelist_count')
+            pageCount = int(pageCountRow[0]) if utils.hasItems(pageCountRow) else 0
+            freelistCount = int(freelistCountRow[0]) if utils.hasItems(freelistCountRow) else 0
+            isVacuumed = False
+
+            if pageCount > 0 and freelistCount / pageCount >= self.__vacuumFreeRatio:
+                await connection.execute('VACUUM')
+                isVacuumed = True
+
+            await connection.execute('ANALYZE')
+            return isVacuumed
+        else:
+            raise RuntimeError(f'unknown DatabaseType: \"{connection.getDatabaseType()}\"')
+
+    async def __fetchDatabaseBytes(self, connection: DatabaseConnection) -> int:
+        if connection.getDatabaseType() is DatabaseType.POSTGRESQL:
+            row = await connection.fetchRow('SELECT pg_database_size(current_database())')
+            return int(row[0]) if utils.hasItems(row) else 0
+        elif connection.getDatabaseType() is DatabaseType.SQLITE:
+            pageCountRow = await connection.fetchRow('PRAGMA page_count')
+            pageSizeRow = await connection.fetchRow('PRAGMA page_size')
+
+            if not utils.hasItems(pageCountRow) or not utils.hasItems(pageSizeRow):
+                return 0
+
+            return int(pageCountRow[0]) * int(pageSizeRow[0])
+        else:
+            raise RuntimeError(f'unknown DatabaseType: \"{connection.getDatabaseType()}\"')
+
+    def getLastReport(self) -> Optional[RosterMaintenanceReport]:
+        return self.__lastReport
+
+    async def __isRosterUnchanged(self, rosterVersion: int) -> bool:
+        if self.__twitchAnnounceChannelsRepository.hasPendingWrites():
+            return False
+
+        return await self.__rosterVersionRepository.fetchVersion() == rosterVersion
+
+    def isRunning(self) -> bool:
+        return self.__scheduleTask is not None and not self.__scheduleTask.done()
+
+    async def __probeRosterQueries(self, discordChannelIds: List[int]) -> float:
+        # the first page of each sampled channel, which is the same users join that
+        # listTwitchUsers does, best of 3 rounds to keep noise out of the comparison
+        if not utils.hasItems(discordChannelIds):
+            return 0
+
+        bestSeconds: Optional[float] = None
+
+        for _ in range(3):
+            start = time.perf_counter()
+
+            for discordChannelId in discordChannelIds:
+                await self.__twitchAnnounceChannelsRepository.fetchTwitchAnnounceChannelUsersPage(
+                    discordChannelId = discordChannelId,
+                    pageSize = 100
+                )
+
+            seconds = time.perf_counter() - start
+
+            if bestSeconds is None or seconds < bestSeconds:
+                bestSeconds = seconds
+
+        return bestSeconds
+
+    async def run(self) -> RosterMaintenanceReport:
+        async with self.__runLock:
+            report = await self.__run()
+
+        self.__lastReport = report
+        self.__timber.log('RosterMaintenance', f'Finished roster maintenance: {report.toStr()}')
+        return report
+
+    async def __run(self) -> RosterMaintenanceReport:
+        start = time.perf_counter()
+
+        connection = await self.__backingDatabase.getConnection()
+        databaseBytesBefore = await self.__fetchDatabaseBytes(connection)
+        await connection.close()
+
+        probeDiscordChannelIds = await self.__sampleProbeChannels()
+        probeSecondsBefore = await self.__probeRosterQueries(probeDiscordChannelIds)
+
+        rosterVersion = await self.__rosterVersionRepository.fetchVersion()
+        discordChannelIdsToDiscordUserIds = await self.__twitchAnnounceChannelsRepository.fetchDiscordChannelIdsToDiscordUserIds()
+
+        emptyDiscordChannelIds: List[int] = list()
+        memberDiscordIds: Set[str] = set()
+
+        for discordChannelId, discordUserIds in discordChannelIdsToDiscordUserIds.items():
+            if utils.hasItems(discordUserIds):
+                memberDiscordIds.update(discordUserIds)
+            else:
+                emptyDiscordChannelIds.append(discordChannelId)
+
+        orphanedDiscordIds = [ discordId for discordId in await self.__usersRepository.fetchDiscordIds() if discordId.lower() not in memberDiscordIds ]
+        emptyDiscordChannelIds.sort()
+        orphanedDiscordIds.sort()
+
+        emptyChannelsRemoved = 0
+        orphanedUsersRemoved = 0
+        isInterrupted = False
+
+        # each removal bumps the roster version exactly once, so the version to expect before
+        # the next batch is always known up front
+        for index in range(0, len(emptyDiscordChannelIds), self.__batchSize):
+            if not await self.__isRosterUnchanged(rosterVersion):
+                isInterrupted = True
+                break
+
+            chunk = emptyDiscordChannelIds[index:index + self.__batchSize]
+            await self.__twitchAnnounceChannelsRepository.removeChannels(chunk, chunkSize = self.__batchSize)
+            rosterVersion = rosterVersion + 1
+            emptyChannelsRemoved = emptyChannelsRemoved + len(chunk)
+            await asyncio.sleep(self.__batchPauseSeconds)
+
+        if not isInterrupted:
+            for index in range(0, len(orphanedDiscordIds), self.__batchSize):
+                if not await self.__isRosterUnchanged(rosterVersion):
+                    isInterrupted = True
+                    break
+
+                chunk = orphanedDiscordIds[index:index + self.__batchSize]
+                removedDiscordIds = await self.__twitchAnnounceChannelsRepository.removeOrphanedUsers(chunk, chunkSize = self.__batchSize)
+                rosterVersion = rosterVersion + 1
+                orphanedUsersRemoved = orphanedUsersRemoved + len(removedDiscordIds)
+                await asyncio.sleep(self.__batchPauseSeconds)
+
+        connection = await self.__backingDatabase.getConnection()
+        isCompacted = await self.__compact(connection)
+        databaseBytesAfter = await self.__fetchDatabaseBytes(connection)
+        await connection.close()
+
+        probeSecondsAfter = await self.__probeRosterQueries(probeDiscordChannelIds)
+
+        return RosterMaintenanceReport(
+            emptyChannelsRemoved = emptyChannelsRemoved,
+            orphanedUsersRemoved = orphanedUsersRemoved,
+            isCompacted = isCompacted,
+            isInterrupted = isInterrupted,
+            databaseBytesBefore = databaseBytesBefore,
+            databaseBytesAfter = databaseBytesAfter,
+            probeSecondsBefore = probeSecondsBefore,
+            probeSecondsAfter = probeSecondsAfter,
+            durationSeconds = time.perf_counter() - start
+        )
+
+    async def __runPeriodically(self):
+        await asyncio.sleep(self.__initialDelaySeconds)
+
+        while True:
+            try:
+                await self.run()
+            except Exception as e:
+                self.__timber.log('RosterMaintenance', f'Encountered Exception during roster maintenance: {e}', e)
+
+            await asyncio.sleep(self.__intervalSeconds)
+
+    async def __sampleProbeChannels(self) -> List[int]:
+        twitchAnnounceChannels = await self.__twitchAnnounceChannelsRepository.fetchTwitchAnnounceChannels()
+
+        if not utils.hasItems(twitchAnnounceChannels) or self.__probeChannelCount == 0:
+            return list()
+
+        discordChannelIds = sorted(twitchAnnounceChannel.getDiscordChannelId() for twitchAnnounceChannel in twitchAnnounceChannels if twitchAnnounceChannel.hasUsers())
+        return discordChannelIds[0:self.__probeChannelCount]
+
+    def start(self):
+        if self.isRunning():
+            return
+
+        self.__scheduleTask = self.__eventLoop.create_task(self.__runPeriodically())
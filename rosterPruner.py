@@ -0,0 +1,192 @@
+import asyncio
+from asyncio import AbstractEventLoop
+from typing import Dict, List, Optional, Set
+
+import CynanBotCommon.utils as utils
+from bufferedTimber import BufferedTimber
+from twitchAnnounceChannelsRepository import TwitchAnnounceChannelsRepository
+
+
+class RosterPruner():
+
+    # Takes roster entries out as soon as Discord tells us they're dead (a member left a guild, a
+    # channel was deleted, or the bot was removed from a guild), or as soon as an announcement
+    # runs into one, instead of leaving them to be polled on Helix and announced to forever.
+    # Removals tend to arrive in bursts (removing the bot from a guild is one event for every
+    # channel in it, and member purges are many events in a row), so they're collected for
+    # flushDelaySeconds after the first one and then written in one batch, in the background.
+    # Only entries that are actually in the roster are ever written. If writing a batch fails,
+    # it's put back with whatever has arrived since and tried again after retryDelaySeconds.
+
+    def __init__(
+        self,
+        eventLoop: AbstractEventLoop,
+        timber: BufferedTimber,
+        twitchAnnounceChannelsRepository: TwitchAnnounceChannelsRepository,
+        flushDelaySeconds: float = 2,
+        maxPendingRemovals: int = 1000,
+        retryDelaySeconds: float = 30
+    ):
+        if not isinstance(eventLoop, AbstractEventLoop):
+            raise ValueError(f'eventLoop argument is malformed: \"{eventLoop}\"')
+        elif not isinstance(timber, BufferedTimber):
+            raise ValueError(f'timber argument is malformed: \"{timber}\"')
+        elif not isinstance(twitchAnnounceChannelsRepository, TwitchAnnounceChannelsRepository):
+            raise ValueError(f'twitchAnnounceChannelsRepository argument is malformed: \"{twitchAnnounceChannelsRepository}\"')
+        elif not utils.isValidNum(flushDelaySeconds):
+            raise ValueError(f'flushDelaySeconds argument is malformed: \"{flushDelaySeconds}\"')
+        elif flushDelaySeconds < 0:
+            raise ValueError(f'flushDelaySeconds argument is out of bounds: {flushDelaySeconds}')
+        elif not utils.isValidInt(maxPendingRemovals):
+            raise ValueError(f'maxPendingRemovals argument is malformed: \"{maxPendingRemovals}\"')
+        elif maxPendingRemovals < 1:
+            raise ValueError(f'maxPendingRemovals argument is out of bounds: {maxPendingRemovals}')
+        elif not utils.isValidNum(retryDelaySeconds):
+            raise ValueError(f'retryDelaySeconds argument is malformed: \"{retryDelaySeconds}\"')
+        elif retryDelaySeconds < 1:
+            raise ValueError(f'retryDelaySeconds argument is out of bounds: {retryDelaySeconds}')
+
+        self.__eventLoop: AbstractEventLoop = eventLoop
+        self.__timber: BufferedTimber = timber
+        self.__twitchAnnounceChannelsRepository: TwitchAnnounceChannelsRepository = twitchAnnounceChannelsRepository
+        self.__flushDelaySeconds: float = flushDelaySeconds
+        self.__maxPendingRemovals: int = maxPendingRemovals
+        self.__retryDelaySeconds: float = retryDelaySeconds
+
+        self.__pendingChannelIds: Set[int] = set()
+        self.__pendingUserIdsToChannelIds: Dict[str, Set[int]] = dict()
+        self.__pendingRemovalCount: int = 0
+        self.__flushLock: asyncio.Lock = asyncio.Lock()
+        self.__flushTask: Optional[asyncio.Task] = None
+
+        self.__prunedChannelCount: int = 0
+        self.__prunedMembershipCount: int = 0
+
+    async def __delayedFlush(self):
+        if self.__pendingRemovalCount < self.__maxPendingRemovals:
+            await asyncio.sleep(self.__flushDelaySeconds)
+
+        await self.flush()
+
+    async def flush(self):
+        async with self.__flushLock:
+            if not utils.hasItems(self.__pendingChannelIds) and not utils.hasItems(self.__pendingUserIdsToChannelIds):
+                return
+
+            pendingChannelIds = self.__pendingChannelIds
+            pendingUserIdsToChannelIds = self.__pendingUserIdsToChannelIds
+            self.__pendingChannelIds = set()
+            self.__pendingUserIdsToChannelIds = dict()
+            self.__pendingRemovalCount = 0
+
+            removeChannelIds: List[int] = list()
+            removeUserIds: Dict[int, Set[str]] = dict()
+            membershipCount = 0
+
+            try:
+                twitchAnnounceChannels = await self.__twitchAnnounceChannelsRepository.fetchTwitchAnnounceChannels()
+                if not utils.hasItems(twitchAnnounceChannels):
+                    return
+
+                for twitchAnnounceChannel in twitchAnnounceChannels:
+                    discordChannelId = twitchAnnounceChannel.getDiscordChannelId()
+
+                    if discordChannelId in pendingChannelIds:
+                        removeChannelIds.append(discordChannelId)
+                        continue
+                    elif not twitchAnnounceChannel.hasUsers():
+                        continue
+
+                    for user in twitchAnnounceChannel.getUsers():
+                        channelIds = pendingUserIdsToChannelIds.get(user.getDiscordId())
+
+                        if channelIds is not None and discordChannelId in channelIds:
+                            if discordChannelId not in removeUserIds:
+                                removeUserIds[discordChannelId] = set()
+
+                            removeUserIds[discordChannelId].add(user.getDiscordId())
+
+                membershipCount = sum(len(discordUserIds) for discordUserIds in removeUserIds.values())
+
+                if utils.hasItems(removeChannelIds):
+                    await self.__twitchAnnounceChannelsRepository.removeChannels(removeChannelIds)
+
+                if utils.hasItems(removeUserIds):
+                    await self.__twitchAnnounceChannelsRepository.removeUsers(removeUserIds)
+            except Exception as e:
+                self.__timber.log('RosterPruner', f'Encountered Exception when pruning {len(removeChannelIds)} channel(s) and {membershipCount} membership(s) from the roster, will retry in {self.__retryDelaySeconds}s: {e}', e)
+                self.__requeue(pendingChannelIds, pendingUserIdsToChannelIds)
+                return
+
+            if not utils.hasItems(removeChannelIds) and membershipCount == 0:
+                return
+
+            self.__prunedChannelCount = self.__prunedChannelCount + len(removeChannelIds)
+            self.__prunedMembershipCount = self.__prunedMembershipCount + membershipCount
+            self.__timber.log('RosterPruner', f'Pruned {len(removeChannelIds)} channel(s) and {membershipCount} membership(s) from the roster ({self.toStr()})')
+
+    def getPendingRemovalCount(self) -> int:
+        return self.__pendingRemovalCount
+
+    def getPrunedChannelCount(self) -> int:
+        return self.__prunedChannelCount
+
+    def getPrunedMembershipCount(self) -> int:
+        return self.__prunedMembershipCount
+
+    def onChannelsRemoved(self, discordChannelIds: Optional[List[int]]):
+        if not utils.hasItems(discordChannelIds):
+            return
+
+        for discordChannelId in discordChannelIds:
+            if discordChannelId not in self.__pendingChannelIds:
+                self.__pendingChannelIds.add(discordChannelId)
+                self.__pendingRemovalCount = self.__pendingRemovalCount + 1
+
+        self.__scheduleFlush()
+
+    def onMemberRemoved(self, discordUserId: str, discordChannelIds: Optional[List[int]]):
+        if not utils.isValidStr(discordUserId):
+            raise ValueError(f'discordUserId argument is malformed: \"{discordUserId}\"')
+        elif not utils.hasItems(discordChannelIds):
+            return
+
+        # discordChannelIds are all of the channels that the member can no longer be announced
+        # in, e.g. every channel of the guild they just left
+        if discordUserId not in self.__pendingUserIdsToChannelIds:
+            self.__pendingUserIdsToChannelIds[discordUserId] = set()
+
+        self.__pendingUserIdsToChannelIds[discordUserId].update(discordChannelIds)
+        self.__pendingRemovalCount = self.__pendingRemovalCount + 1
+        self.__scheduleFlush()
+
+    def __requeue(self, pendingChannelIds: Set[int], pendingUserIdsToChannelIds: Dict[str, Set[int]]):
+        # merges a batch that couldn't be written back in with anything that has arrived while
+        # it was being written, so that nothing is lost, and then tries again a bit later
+        for discordChannelId in pendingChannelIds:
+            if discordChannelId not in self.__pendingChannelIds:
+                self.__pendingChannelIds.add(discordChannelId)
+                self.__pendingRemovalCount = self.__pendingRemovalCount + 1
+
+        for discordUserId, discordChannelIds in pendingUserIdsToChannelIds.items():
+            if discordUserId not in self.__pendingUserIdsToChannelIds:
+                self.__pendingUserIdsToChannelIds[discordUserId] = set()
+                self.__pendingRemovalCount = self.__pendingRemovalCount + 1
+
+            self.__pendingUserIdsToChannelIds[discordUserId].update(discordChannelIds)
+
+        self.__flushTask = self.__eventLoop.create_task(self.__retryFlush())
+
+    async def __retryFlush(self):
+        await asyncio.sleep(self.__retryDelaySeconds)
+        await self.flush()
+
+    def __scheduleFlush(self):
+        if self.__flushTask is not None and not self.__flushTask.done():
+            if self.__pendingRemovalCount < self.__maxPendingRemovals:
+                return
+
+        self.__flushTask = self.__eventLoop.create_task(self.__delayedFlush())
+
+    def toStr(self) -> str:
+        return f'prunedChannels={self.__prunedChannelCount}, prunedMemberships={self.__prunedMembershipCount}, pending={self.__pendingRemovalCount}'
@@ -0,0 +1,233 @@
+import mmap
+import os
+import struct
+import time
+import zlib
+from asyncio import AbstractEventLoop
+from typing import Dict, List, Optional
+
+import CynanBotCommon.utils as utils
+from bufferedTimber import BufferedTimber
+
+
+class RosterSnapshot():
+
+    # Each user row is the same five columns that UsersRepository.createUserFromRow() expects:
+    # discorddiscriminator, discordid, discordname, mostrecentstreamdatetime, twitchname
+
+    def __init__(
+        self,
+        rosterVersion: int,
+        channelIdsToUserRows: Dict[int, List[List[Optional[str]]]],
+        createdAt: Optional[int] = None
+    ):
+        if not utils.isValidInt(rosterVersion):
+            raise ValueError(f'rosterVersion argument is malformed: \"{rosterVersion}\"')
+        elif rosterVersion < 0:
+            raise ValueError(f'rosterVersion argument is out of bounds: {rosterVersion}')
+        elif channelIdsToUserRows is None:
+            raise ValueError(f'channelIdsToUserRows argument is malformed: \"{channelIdsToUserRows}\"')
+
+        if createdAt is None:
+            createdAt = int(time.time())
+
+        self.__rosterVersion: int = rosterVersion
+        self.__channelIdsToUserRows: Dict[int, List[List[Optional[str]]]] = channelIdsToUserRows
+        self.__createdAt: int = createdAt
+
+    def getChannelIdsToUserRows(self) -> Dict[int, List[List[Optional[str]]]]:
+        return self.__channelIdsToUserRows
+
+    def getCreatedAt(self) -> int:
+        return self.__createdAt
+
+    def getRosterVersion(self) -> int:
+        return self.__rosterVersion
+
+
+class RosterSnapshotStore():
+
+    # Reads and writes the roster as a compact, versioned binary file, so that a restart can have
+    # the whole roster back in memory without a single database query. The layout is:
+    #
+    #   header:   magic (4s), format version (H), reserved (H), roster version (q),
+    #             created at (q), user count (I), channel count (I), body CRC32 (I)
+    #   users:    for each user, 5 strings, each a length (H, 0xFFFF meaning None) then UTF-8
+    #   channels: for each channel, its id (q), member count (I), then member user indexes (I)
+    #
+    # Every user is written exactly once, even if they're in many channels. The file is memory
+    # mapped when loaded, and anything that doesn't check out (wrong magic, wrong format version,
+    # bad CRC, truncation) is treated as no snapshot at all. Writes go to a temporary file that's
+    # then renamed over the old one, so a crash mid-write can never leave a half written snapshot.
+    # All of the file I/O and (de)serialization happens on the event loop's default executor.
+
+    def __init__(
+        self,
+        eventLoop: AbstractEventLoop,
+        timber: BufferedTimber,
+        snapshotFile: str = 'rosterSnapshot.bin'
+    ):
+        if not isinstance(eventLoop, AbstractEventLoop):
+            raise ValueError(f'eventLoop argument is malformed: \"{eventLoop}\"')
+        elif not isinstance(timber, BufferedTimber):
+            raise ValueError(f'timber argument is malformed: \"{timber}\"')
+        elif not utils.isValidStr(snapshotFile):
+            raise ValueError(f'snapshotFile argument is malformed: \"{snapshotFile}\"')
+
+        self.__eventLoop: AbstractEventLoop = eventLoop
+        self.__timber: BufferedTimber = timber
+        self.__snapshotFile: str = snapshotFile
+
+        self.__magic: bytes = b'CBRS'
+        self.__formatVersion: int = 1
+        self.__header: struct.Struct = struct.Struct('<4sHHqqIII')
+        self.__stringLength: struct.Struct = struct.Struct('<H')
+        self.__channelHeader: struct.Struct = struct.Struct('<qI')
+        self.__noneStringLength: int = 0xFFFF
+
+    def __decode(self, buffer) -> RosterSnapshot:
+        if len(buffer) < self.__header.size:
+            raise ValueError(f'roster snapshot is truncated ({len(buffer)} bytes)')
+
+        magic, formatVersion, _, rosterVersion, createdAt, userCount, channelCount, bodyCrc = self.__header.unpack_from(buffer, 0)
+
+        if magic != self.__magic:
+            raise ValueError(f'roster snapshot has an unknown magic: {magic}')
+        elif formatVersion != self.__formatVersion:
+            raise ValueError(f'roster snapshot has an unsupported format version: {formatVersion}')
+        elif zlib.crc32(memoryview(buffer)[self.__header.size:]) != bodyCrc:
+            raise ValueError('roster snapshot failed its CRC check')
+
+        offset = self.__header.size
+        userRows: List[List[Optional[str]]] = list()
+
+        for _ in range(userCount):
+            userRow: List[Optional[str]] = list()
+
+            for _ in range(5):
+                length, = self.__stringLength.unpack_from(buffer, offset)
+                offset = offset + self.__stringLength.size
+
+                if length == self.__noneStringLength:
+                    userRow.append(None)
+                else:
+                    if offset + length > len(buffer):
+                        raise ValueError('roster snapshot is truncated')
+
+                    userRow.append(bytes(buffer[offset:offset + length]).decode('utf-8'))
+                    offset = offset + length
+
+            userRows.append(userRow)
+
+        channelIdsToUserRows: Dict[int, List[List[Optional[str]]]] = dict()
+
+        for _ in range(channelCount):
+            discordChannelId, memberCount = self.__channelHeader.unpack_from(buffer, offset)
+            offset = offset + self.__channelHeader.size
+
+            userIndexes = struct.unpack_from(f'<{memberCount}I', buffer, offset)
+            offset = offset + (4 * memberCount)
+
+            channelIdsToUserRows[discordChannelId] = [ userRows[userIndex] for userIndex in userIndexes ]
+
+        if offset != len(buffer):
+            raise ValueError(f'roster snapshot has {len(buffer) - offset} unexpected trailing byte(s)')
+
+        return RosterSnapshot(
+            rosterVersion = rosterVersion,
+            channelIdsToUserRows = channelIdsToUserRows,
+            createdAt = createdAt
+        )
+
+    def __encode(self, rosterSnapshot: RosterSnapshot) -> bytes:
+        body = bytearray()
+        userIdsToIndexes: Dict[str, int] = dict()
+
+        for userRows in rosterSnapshot.getChannelIdsToUserRows().values():
+            for userRow in userRows:
+                if userRow[1] in userIdsToIndexes:
+                    continue
+
+                userIdsToIndexes[userRow[1]] = len(userIdsToIndexes)
+
+                for value in userRow:
+                    if value is None:
+                        body.extend(self.__stringLength.pack(self.__noneStringLength))
+                    else:
+                        encodedValue = value.encode('utf-8')
+
+                        if len(encodedValue) >= self.__noneStringLength:
+                            raise ValueError(f'roster snapshot value is too long to encode ({len(encodedValue)} bytes)')
+
+                        body.extend(self.__stringLength.pack(len(encodedValue)))
+                        body.extend(encodedValue)
+
+        for discordChannelId, userRows in rosterSnapshot.getChannelIdsToUserRows().items():
+            body.extend(self.__channelHeader.pack(discordChannelId, len(userRows)))
+            body.extend(struct.pack(f'<{len(userRows)}I', *[ userIdsToIndexes[userRow[1]] for userRow in userRows ]))
+
+        header = self.__header.pack(
+            self.__magic,
+            self.__formatVersion,
+            0,
+            rosterSnapshot.getRosterVersion(),
+            rosterSnapshot.getCreatedAt(),
+            len(userIdsToIndexes),
+            len(rosterSnapshot.getChannelIdsToUserRows()),
+            zlib.crc32(body)
+        )
+
+        return header + bytes(body)
+
+    def getSnapshotFile(self) -> str:
+        return self.__snapshotFile
+
+    async def load(self) -> Optional[RosterSnapshot]:
+        start = time.perf_counter()
+
+        try:
+            rosterSnapshot = await self.__eventLoop.run_in_executor(None, self.__readSnapshot)
+        except (OSError, ValueError, UnicodeDecodeError, struct.error, IndexError) as e:
+            self.__timber.log('RosterSnapshotStore', f'Ignoring unreadable roster snapshot \"{self.__snapshotFile}\": {e}', e)
+            return None
+
+        if rosterSnapshot is None:
+            return None
+
+        self.__timber.log('RosterSnapshotStore', f'Loaded roster snapshot v{rosterSnapshot.getRosterVersion()} ({len(rosterSnapshot.getChannelIdsToUserRows())} channel(s)) in {(time.perf_counter() - start) * 1000:.1f}ms')
+        return rosterSnapshot
+
+    def __readSnapshot(self) -> Optional[RosterSnapshot]:
+        if not os.path.exists(self.__snapshotFile):
+            return None
+
+        with open(self.__snapshotFile, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                raise ValueError('roster snapshot is empty')
+
+            with mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ) as buffer:
+                return self.__decode(buffer)
+
+    async def save(self, rosterSnapshot: RosterSnapshot):
+        if not isinstance(rosterSnapshot, RosterSnapshot):
+            raise ValueError(f'rosterSnapshot argument is malformed: \"{rosterSnapshot}\"')
+
+        try:
+            byteCount = await self.__eventLoop.run_in_executor(None, self.__writeSnapshot, rosterSnapshot)
+        except (OSError, ValueError, struct.error) as e:
+            self.__timber.log('RosterSnapshotStore', f'Unable to save roster snapshot \"{self.__snapshotFile}\": {e}', e)
+            return
+
+        self.__timber.log('RosterSnapshotStore', f'Saved roster snapshot v{rosterSnapshot.getRosterVersion()} ({byteCount} bytes)')
+
+    def __writeSnapshot(self, rosterSnapshot: RosterSnapshot) -> int:
+        contents = self.__encode(rosterSnapshot)
+        temporaryFile = f'{self.__snapshotFile}.tmp'
+
+        with open(temporaryFile, 'wb') as file:
+            file.write(contents)
+            file.flush()
+            os.fsync(file.fileno())
+
+        os.replace(temporaryFile, self.__snapshotFile)
+        return len(contents)
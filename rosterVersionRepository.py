@@ -0,0 +1,103 @@
+from typing import Optional
+
+import CynanBotCommon.utils as utils
+from CynanBotCommon.storage.backingDatabase import BackingDatabase
+from CynanBotCommon.storage.databaseConnection import DatabaseConnection
+from databaseSchemaRegistry import DatabaseSchemaRegistry
+
+
+class RosterVersionRepository():
+
+    # A single database-backed counter that goes up every time the roster (the users table, or
+    # any channel's list of announce users) is written to. Anything derived from the roster, like
+    # the on-disk roster snapshot, can be tagged with this version and later checked to see if
+    # the database has changed since then.
+
+    def __init__(
+        self,
+        backingDatabase: BackingDatabase,
+        databaseSchemaRegistry: DatabaseSchemaRegistry
+    ):
+        if not isinstance(backingDatabase, BackingDatabase):
+            raise ValueError(f'backingDatabase argument is malformed: \"{backingDatabase}\"')
+        elif not isinstance(databaseSchemaRegistry, DatabaseSchemaRegistry):
+            raise ValueError(f'databaseSchemaRegistry argument is malformed: \"{databaseSchemaRegistry}\"')
+
+        self.__backingDatabase: BackingDatabase = backingDatabase
+        self.__databaseSchemaRegistry: DatabaseSchemaRegistry = databaseSchemaRegistry
+
+        self.__isDatabaseReady: bool = False
+        self.__version: Optional[int] = None
+
+    async def bumpVersion(self, connection: DatabaseConnection):
+        if not isinstance(connection, DatabaseConnection):
+            raise ValueError(f'connection argument is malformed: \"{connection}\"')
+
+        # this is always done on the same connection as the roster write that caused it, so that
+        # it never costs an extra connection
+        await self.__initDatabaseTable(connection)
+        await connection.execute(
+            '''
+                INSERT INTO rosterversion (id, version)
+                VALUES (0, 1)
+                ON CONFLICT (id) DO UPDATE SET version = rosterversion.version + 1
+            '''
+        )
+
+        if self.__version is not None:
+            self.__version = self.__version + 1
+
+    async def clearCaches(self):
+        self.__version = None
+
+    async def fetchVersion(self) -> int:
+        if self.__version is not None:
+            return self.__version
+
+        await self.__initDatabaseTable()
+        connection = await self.__backingDatabase.getConnection()
+        row = await connection.fetchRow(
+            '''
+                SELECT version FROM rosterversion
+                WHERE id = 0
+                LIMIT 1
+            '''
+        )
+
+        await connection.close()
+
+        version = 0
+        if utils.hasItems(row):
+            version = int(row[0])
+
+        self.__version = version
+        return version
+
+    async def initDatabaseTable(self):
+        await self.__initDatabaseTable()
+
+    async def __initDatabaseTable(self, connection: Optional[DatabaseConnection] = None):
+        if self.__isDatabaseReady:
+            return
+
+        await self.__databaseSchemaRegistry.createTableIfNotExists(
+            tableName = 'rosterversion',
+            psqlStatement = '''
+                CREATE TABLE IF NOT EXISTS rosterversion (
+                    id integer NOT NULL PRIMARY KEY,
+                    version bigint NOT NULL
+                )
+            ''',
+            sqliteStatement = '''
+                CREATE TABLE IF NOT EXISTS rosterversion (
+                    id INTEGER NOT NULL PRIMARY KEY,
+                    version INTEGER NOT NULL
+                )
+            ''',
+            connection = connection
+        )
+
+        self.__isDatabaseReady = True
+
+    async def warmUp(self):
+        await self.fetchVersion()
@@ -0,0 +1,38 @@
+from enum import Enum, auto
+
+import CynanBotCommon.utils as utils
+
+
+class SqliteJournalMode(Enum):
+
+    DELETE = auto()
+    MEMORY = auto()
+    OFF = auto()
+    PERSIST = auto()
+    TRUNCATE = auto()
+    WAL = auto()
+
+    @classmethod
+    def fromStr(cls, text: str):
+        if not utils.isValidStr(text):
+            raise ValueError(f'text argument is malformed: \"{text}\"')
+
+        text = text.lower()
+
+        if text == 'delete':
+            return SqliteJournalMode.DELETE
+        elif text == 'memory':
+            return SqliteJournalMode.MEMORY
+        elif text == 'off':
+            return SqliteJournalMode.OFF
+        elif text == 'persist':
+            return SqliteJournalMode.PERSIST
+        elif text == 'truncate':
+            return SqliteJournalMode.TRUNCATE
+        elif text == 'wal':
+            return SqliteJournalMode.WAL
+        else:
+            raise ValueError(f'unknown SqliteJournalMode: \"{text}\"')
+
+    def toStr(self) -> str:
+        return self.name.lower()
@@ -0,0 +1,92 @@
+from typing import List, Optional
+
+import CynanBotCommon.utils as utils
+from sqliteJournalMode import SqliteJournalMode
+from sqliteSynchronousMode import SqliteSynchronousMode
+
+
+class SqlitePerformanceProfile():
+
+    # The PRAGMAs that BackingSqliteDatabase connections get tuned with (see
+    # ProfiledBackingSqliteDatabase). Anything left as None keeps SQLite's own default. The
+    # journal mode is stored in the database file itself, so it only ever has to be set once,
+    # while every other setting here only lasts for the connection that it was set on.
+
+    def __init__(
+        self,
+        journalMode: Optional[SqliteJournalMode] = None,
+        synchronousMode: Optional[SqliteSynchronousMode] = None,
+        mmapSizeBytes: Optional[int] = None,
+        cacheSizeKibibytes: Optional[int] = None,
+        busyTimeoutMillis: Optional[int] = None
+    ):
+        if journalMode is not None and not isinstance(journalMode, SqliteJournalMode):
+            raise ValueError(f'journalMode argument is malformed: \"{journalMode}\"')
+        elif synchronousMode is not None and not isinstance(synchronousMode, SqliteSynchronousMode):
+            raise ValueError(f'synchronousMode argument is malformed: \"{synchronousMode}\"')
+        elif mmapSizeBytes is not None and not utils.isValidInt(mmapSizeBytes):
+            raise ValueError(f'mmapSizeBytes argument is malformed: \"{mmapSizeBytes}\"')
+        elif mmapSizeBytes is not None and mmapSizeBytes < 0:
+            raise ValueError(f'mmapSizeBytes argument is out of bounds: {mmapSizeBytes}')
+        elif cacheSizeKibibytes is not None and not utils.isValidInt(cacheSizeKibibytes):
+            raise ValueError(f'cacheSizeKibibytes argument is malformed: \"{cacheSizeKibibytes}\"')
+        elif cacheSizeKibibytes is not None and cacheSizeKibibytes < 1:
+            raise ValueError(f'cacheSizeKibibytes argument is out of bounds: {cacheSizeKibibytes}')
+        elif busyTimeoutMillis is not None and not utils.isValidInt(busyTimeoutMillis):
+            raise ValueError(f'busyTimeoutMillis argument is malformed: \"{busyTimeoutMillis}\"')
+        elif busyTimeoutMillis is not None and busyTimeoutMillis < 0:
+            raise ValueError(f'busyTimeoutMillis argument is out of bounds: {busyTimeoutMillis}')
+
+        self.__journalMode: Optional[SqliteJournalMode] = journalMode
+        self.__synchronousMode: Optional[SqliteSynchronousMode] = synchronousMode
+        self.__mmapSizeBytes: Optional[int] = mmapSizeBytes
+        self.__cacheSizeKibibytes: Optional[int] = cacheSizeKibibytes
+        self.__busyTimeoutMillis: Optional[int] = busyTimeoutMillis
+
+    def getBusyTimeoutMillis(self) -> Optional[int]:
+        return self.__busyTimeoutMillis
+
+    def getCacheSizeKibibytes(self) -> Optional[int]:
+        return self.__cacheSizeKibibytes
+
+    def getConnectionPragmas(self) -> List[str]:
+        pragmas: List[str] = list()
+
+        # the busy timeout goes first, so that it already applies to the rest of these
+        if self.__busyTimeoutMillis is not None:
+            pragmas.append(f'PRAGMA busy_timeout = {self.__busyTimeoutMillis}')
+
+        if self.__synchronousMode is not None:
+            pragmas.append(f'PRAGMA synchronous = {self.__synchronousMode.toStr()}')
+
+        if self.__cacheSizeKibibytes is not None:
+            # a negative cache_size is in KiB rather than in pages
+            pragmas.append(f'PRAGMA cache_size = -{self.__cacheSizeKibibytes}')
+
+        if self.__mmapSizeBytes is not None:
+            pragmas.append(f'PRAGMA mmap_size = {self.__mmapSizeBytes}')
+
+        return pragmas
+
+    def getJournalMode(self) -> Optional[SqliteJournalMode]:
+        return self.__journalMode
+
+    def getJournalModePragma(self) -> Optional[str]:
+        if self.__journalMode is None:
+            return None
+
+        return f'PRAGMA journal_mode = {self.__journalMode.toStr()}'
+
+    def getMmapSizeBytes(self) -> Optional[int]:
+        return self.__mmapSizeBytes
+
+    def getSynchronousMode(self) -> Optional[SqliteSynchronousMode]:
+        return self.__synchronousMode
+
+    def toStr(self) -> str:
+        journalModeStr = 'default' if self.__journalMode is None else self.__journalMode.toStr()
+        synchronousModeStr = 'default' if self.__synchronousMode is None else self.__synchronousMode.toStr()
+        mmapSizeStr = 'default' if self.__mmapSizeBytes is None else f'{self.__mmapSizeBytes / 1048576:.0f}MiB'
+        cacheSizeStr = 'default' if self.__cacheSizeKibibytes is None else f'{self.__cacheSizeKibibytes}KiB'
+        busyTimeoutStr = 'default' if self.__busyTimeoutMillis is None else f'{self.__busyTimeoutMillis}ms'
+        return f'journalMode={journalModeStr}, synchronous={synchronousModeStr}, mmapSize={mmapSizeStr}, cacheSize={cacheSizeStr}, busyTimeout={busyTimeoutStr}'
@@ -0,0 +1,32 @@
+from enum import Enum, auto
+
+import CynanBotCommon.utils as utils
+
+
+class SqliteSynchronousMode(Enum):
+
+    EXTRA = auto()
+    FULL = auto()
+    NORMAL = auto()
+    OFF = auto()
+
+    @classmethod
+    def fromStr(cls, text: str):
+        if not utils.isValidStr(text):
+            raise ValueError(f'text argument is malformed: \"{text}\"')
+
+        text = text.lower()
+
+        if text == 'extra':
+            return SqliteSynchronousMode.EXTRA
+        elif text == 'full':
+            return SqliteSynchronousMode.FULL
+        elif text == 'normal':
+            return SqliteSynchronousMode.NORMAL
+        elif text == 'off':
+            return SqliteSynchronousMode.OFF
+        else:
+            raise ValueError(f'unknown SqliteSynchronousMode: \"{text}\"')
+
+    def toStr(self) -> str:
+        return self.name.lower()
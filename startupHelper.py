@@ -0,0 +1,159 @@
+import asyncio
+import time
+from typing import Awaitable, Dict, Optional
+
+import CynanBotCommon.utils as utils
+from announcedStreamsRepository import AnnouncedStreamsRepository
+from authRepository import AuthRepository
+from bufferedTimber import BufferedTimber
+from CynanBotCommon.twitch.twitchTokensRepository import TwitchTokensRepository
+from rosterVersionRepository import RosterVersionRepository
+from twitchAnnounceChannelsRepository import TwitchAnnounceChannelsRepository
+from twitchAnnounceSettingsRepository import TwitchAnnounceSettingsRepository
+from twitchUserIdsRepository import TwitchUserIdsRepository
+from usersRepository import UsersRepository
+
+
+class StartupTimings():
+
+    def __init__(self):
+        self.__startTime: float = time.perf_counter()
+        self.__durations: Dict[str, float] = dict()
+        self.__failures: Dict[str, Exception] = dict()
+
+    def getDurations(self) -> Dict[str, float]:
+        return self.__durations
+
+    def getElapsedSeconds(self) -> float:
+        return time.perf_counter() - self.__startTime
+
+    def getFailures(self) -> Dict[str, Exception]:
+        return self.__failures
+
+    def hasFailures(self) -> bool:
+        return utils.hasItems(self.__failures)
+
+    def recordDuration(self, stepName: str, durationSeconds: float):
+        self.__durations[stepName] = durationSeconds
+
+    def recordFailure(self, stepName: str, exception: Exception):
+        self.__failures[stepName] = exception
+
+    def toStr(self) -> str:
+        steps = ', '.join(f'{stepName}={durationSeconds * 1000:.0f}ms' for stepName, durationSeconds in self.__durations.items())
+
+        if self.hasFailures():
+            failedSteps = ', '.join(self.__failures.keys())
+            return f'{steps} (failed: {failedSteps})'
+        else:
+            return steps
+
+
+class StartupHelper():
+
+    # Everything that used to be lazily done on the first poll cycle (or the first command) is
+    # instead done here, concurrently with discord.py logging in and connecting to the gateway.
+    # The database work has to stay in order (the roster can't be loaded until the tables exist),
+    # but it runs alongside settings loading and the first Twitch token acquisition.
+
+    def __init__(
+        self,
+        announcedStreamsRepository: AnnouncedStreamsRepository,
+        authRepository: AuthRepository,
+        rosterVersionRepository: RosterVersionRepository,
+        timber: BufferedTimber,
+        twitchAnnounceChannelsRepository: TwitchAnnounceChannelsRepository,
+        twitchAnnounceSettingsRepository: TwitchAnnounceSettingsRepository,
+        twitchTokensRepository: TwitchTokensRepository,
+        twitchUserIdsRepository: TwitchUserIdsRepository,
+        usersRepository: UsersRepository
+    ):
+        if not isinstance(announcedStreamsRepository, AnnouncedStreamsRepository):
+            raise ValueError(f'announcedStreamsRepository argument is malformed: \"{announcedStreamsRepository}\"')
+        elif not isinstance(authRepository, AuthRepository):
+            raise ValueError(f'authRepository argument is malformed: \"{authRepository}\"')
+        elif not isinstance(rosterVersionRepository, RosterVersionRepository):
+            raise ValueError(f'rosterVersionRepository argument is malformed: \"{rosterVersionRepository}\"')
+        elif not isinstance(timber, BufferedTimber):
+            raise ValueError(f'timber argument is malformed: \"{timber}\"')
+        elif not isinstance(twitchAnnounceChannelsRepository, TwitchAnnounceChannelsRepository):
+            raise ValueError(f'twitchAnnounceChannelsRepository argument is malformed: \"{twitchAnnounceChannelsRepository}\"')
+        elif not isinstance(twitchAnnounceSettingsRepository, TwitchAnnounceSettingsRepository):
+            raise ValueError(f'twitchAnnounceSettingsRepository argument is malformed: \"{twitchAnnounceSettingsRepository}\"')
+        elif not isinstance(twitchTokensRepository, TwitchTokensRepository):
+            raise ValueError(f'twitchTokensRepository argument is malformed: \"{twitchTokensRepository}\"')
+        elif not isinstance(twitchUserIdsRepository, TwitchUserIdsRepository):
+            raise ValueError(f'twitchUserIdsRepository argument is malformed: \"{twitchUserIdsRepository}\"')
+        elif not isinstance(usersRepository, UsersRepository):
+            raise ValueError(f'usersRepository argument is malformed: \"{usersRepository}\"')
+
+        self.__announcedStreamsRepository: AnnouncedStreamsRepository = announcedStreamsRepository
+        self.__authRepository: AuthRepository = authRepository
+        self.__rosterVersionRepository: RosterVersionRepository = rosterVersionRepository
+        self.__timber: BufferedTimber = timber
+        self.__twitchAnnounceChannelsRepository: TwitchAnnounceChannelsRepository = twitchAnnounceChannelsRepository
+        self.__twitchAnnounceSettingsRepository: TwitchAnnounceSettingsRepository = twitchAnnounceSettingsRepository
+        self.__twitchTokensRepository: TwitchTokensRepository = twitchTokensRepository
+        self.__twitchUserIdsRepository: TwitchUserIdsRepository = twitchUserIdsRepository
+        self.__usersRepository: UsersRepository = usersRepository
+
+        self.__startupTimings: Optional[StartupTimings] = None
+
+    async def __acquireTwitchToken(self):
+        twitchHandle = await self.__authRepository.getTwitchHandle()
+        await self.__twitchTokensRepository.requireAccessToken(
+            twitchHandle = twitchHandle
+        )
+
+    def getStartupTimings(self) -> Optional[StartupTimings]:
+        return self.__startupTimings
+
+    async def __initDatabase(self, startupTimings: StartupTimings):
+        await self.__timeStep(startupTimings, 'schema', asyncio.gather(
+            self.__rosterVersionRepository.initDatabaseTable(),
+            self.__usersRepository.initDatabaseTable(),
+            self.__twitchAnnounceChannelsRepository.initDatabaseTable(),
+            self.__twitchUserIdsRepository.initDatabaseTable(),
+            self.__announcedStreamsRepository.initDatabaseTable()
+        ))
+
+        await asyncio.gather(
+            self.__timeStep(startupTimings, 'roster', self.__twitchAnnounceChannelsRepository.warmUp()),
+            self.__timeStep(startupTimings, 'twitchUserIds', self.__twitchUserIdsRepository.warmUp()),
+            self.__timeStep(startupTimings, 'announcedStreams', self.__announcedStreamsRepository.warmUp())
+        )
+
+    async def __loadSettings(self):
+        await asyncio.gather(
+            self.__authRepository.getAllAsync(),
+            self.__twitchAnnounceSettingsRepository.getAllAsync()
+        )
+
+    async def __timeStep(
+        self,
+        startupTimings: StartupTimings,
+        stepName: str,
+        step: Awaitable
+    ):
+        start = time.perf_counter()
+
+        try:
+            await step
+        except Exception as e:
+            startupTimings.recordFailure(stepName, e)
+            self.__timber.log('StartupHelper', f'Encountered exception during startup step \"{stepName}\": {e}', e)
+
+        startupTimings.recordDuration(stepName, time.perf_counter() - start)
+
+    async def warmUp(self) -> StartupTimings:
+        startupTimings = StartupTimings()
+        self.__startupTimings = startupTimings
+
+        await asyncio.gather(
+            self.__timeStep(startupTimings, 'settings', self.__loadSettings()),
+            self.__timeStep(startupTimings, 'twitchToken', self.__acquireTwitchToken()),
+            self.__initDatabase(startupTimings)
+        )
+
+        startupTimings.recordDuration('warmUp', startupTimings.getElapsedSeconds())
+        return startupTimings
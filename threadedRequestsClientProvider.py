@@ -0,0 +1,270 @@
+import threading
+import time
+from asyncio import AbstractEventLoop
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import CynanBotCommon.utils as utils
+from bufferedTimber import BufferedTimber
+from CynanBotCommon.network.exceptions import GenericNetworkException
+from CynanBotCommon.network.networkClientProvider import NetworkClientProvider
+from CynanBotCommon.network.networkClientType import NetworkClientType
+from CynanBotCommon.network.networkHandle import NetworkHandle
+from CynanBotCommon.network.networkResponse import NetworkResponse
+
+
+class NetworkCallStats():
+
+    def __init__(self):
+        self.__callCount: int = 0
+        self.__totalQueuedSeconds: float = 0
+        self.__totalExecutingSeconds: float = 0
+        self.__maxQueuedSeconds: float = 0
+        self.__maxExecutingSeconds: float = 0
+
+    def getCallCount(self) -> int:
+        return self.__callCount
+
+    def getMaxExecutingSeconds(self) -> float:
+        return self.__maxExecutingSeconds
+
+    def getMaxQueuedSeconds(self) -> float:
+        return self.__maxQueuedSeconds
+
+    def getMeanExecutingSeconds(self) -> float:
+        if self.__callCount == 0:
+            return 0
+
+        return self.__totalExecutingSeconds / self.__callCount
+
+    def getMeanQueuedSeconds(self) -> float:
+        if self.__callCount == 0:
+            return 0
+
+        return self.__totalQueuedSeconds / self.__callCount
+
+    def record(self, queuedSeconds: float, executingSeconds: float):
+        self.__callCount = self.__callCount + 1
+        self.__totalQueuedSeconds = self.__totalQueuedSeconds + queuedSeconds
+        self.__totalExecutingSeconds = self.__totalExecutingSeconds + executingSeconds
+        self.__maxQueuedSeconds = max(self.__maxQueuedSeconds, queuedSeconds)
+        self.__maxExecutingSeconds = max(self.__maxExecutingSeconds, executingSeconds)
+
+    def toStr(self) -> str:
+        return f'calls={self.__callCount}, queued(mean={self.getMeanQueuedSeconds() * 1000:.1f}ms, max={self.__maxQueuedSeconds * 1000:.1f}ms), executing(mean={self.getMeanExecutingSeconds() * 1000:.1f}ms, max={self.__maxExecutingSeconds * 1000:.1f}ms)'
+
+
+class ThreadedRequestsResponse(NetworkResponse):
+
+    def __init__(self, response: requests.Response, url: str):
+        if response is None:
+            raise ValueError(f'response argument is malformed: \"{response}\"')
+        elif not utils.isValidStr(url):
+            raise ValueError(f'url argument is malformed: \"{url}\"')
+
+        self.__response: requests.Response = response
+        self.__url: str = url
+        self.__isClosed: bool = False
+
+    async def close(self):
+        if self.__isClosed:
+            return
+
+        self.__isClosed = True
+        self.__response.close()
+
+    def getHeaders(self) -> Dict[str, str]:
+        return dict(self.__response.headers)
+
+    def getNetworkClientType(self) -> NetworkClientType:
+        return NetworkClientType.REQUESTS
+
+    def getStatusCode(self) -> int:
+        return self.__response.status_code
+
+    def getUrl(self) -> str:
+        return self.__url
+
+    def isClosed(self) -> bool:
+        return self.__isClosed
+
+    async def json(self) -> Optional[Dict[str, Any]]:
+        # the response body has already been fully read on the worker thread, so this doesn't
+        # block the event loop
+        return self.__response.json()
+
+    async def read(self) -> bytes:
+        return self.__response.content
+
+
+class ThreadedRequestsHandle(NetworkHandle):
+
+    def __init__(
+        self,
+        threadedRequestsClientProvider,
+        timeoutSeconds: float
+    ):
+        self.__threadedRequestsClientProvider: ThreadedRequestsClientProvider = threadedRequestsClientProvider
+        self.__timeoutSeconds: float = timeoutSeconds
+
+    async def close(self):
+        # the underlying sessions are pooled by ThreadedRequestsClientProvider, so there's nothing
+        # to close here
+        pass
+
+    async def get(
+        self,
+        url: str,
+        headers: Optional[Dict[str, Any]] = None
+    ) -> ThreadedRequestsResponse:
+        if not utils.isValidStr(url):
+            raise ValueError(f'url argument is malformed: \"{url}\"')
+
+        return await self.__threadedRequestsClientProvider.execute(
+            url = url,
+            call = lambda session: session.get(url, headers = headers, timeout = self.__timeoutSeconds)
+        )
+
+    def getNetworkClientType(self) -> NetworkClientType:
+        return NetworkClientType.REQUESTS
+
+    async def post(
+        self,
+        url: str,
+        headers: Optional[Dict[str, Any]] = None,
+        json: Optional[Dict[str, Any]] = None
+    ) -> ThreadedRequestsResponse:
+        if not utils.isValidStr(url):
+            raise ValueError(f'url argument is malformed: \"{url}\"')
+
+        return await self.__threadedRequestsClientProvider.execute(
+            url = url,
+            call = lambda session: session.post(url, headers = headers, json = json, timeout = self.__timeoutSeconds)
+        )
+
+
+class ThreadedRequestsClientProvider(NetworkClientProvider):
+
+    # The requests library is blocking, so every call is handed off to a small dedicated thread
+    # pool rather than being run directly on the event loop. Each worker thread keeps its own
+    # requests.Session (sessions aren't thread safe), and with it a pool of keep-alive
+    # connections. Time spent waiting for a free worker is tracked separately from time spent
+    # actually executing the request.
+
+    def __init__(
+        self,
+        eventLoop: AbstractEventLoop,
+        timber: BufferedTimber,
+        maxWorkers: int = 4,
+        connectionPoolSize: int = 10,
+        timeoutSeconds: float = 8,
+        statsLogEveryCalls: int = 250
+    ):
+        if not isinstance(eventLoop, AbstractEventLoop):
+            raise ValueError(f'eventLoop argument is malformed: \"{eventLoop}\"')
+        elif not isinstance(timber, BufferedTimber):
+            raise ValueError(f'timber argument is malformed: \"{timber}\"')
+        elif not utils.isValidInt(maxWorkers):
+            raise ValueError(f'maxWorkers argument is malformed: \"{maxWorkers}\"')
+        elif maxWorkers < 1 or maxWorkers > 32:
+            raise ValueError(f'maxWorkers argument is out of bounds: {maxWorkers}')
+        elif not utils.isValidInt(connectionPoolSize):
+            raise ValueError(f'connectionPoolSize argument is malformed: \"{connectionPoolSize}\"')
+        elif connectionPoolSize < 1:
+            raise ValueError(f'connectionPoolSize argument is out of bounds: {connectionPoolSize}')
+        elif not utils.isValidNum(timeoutSeconds):
+            raise ValueError(f'timeoutSeconds argument is malformed: \"{timeoutSeconds}\"')
+        elif timeoutSeconds <= 0:
+            raise ValueError(f'timeoutSeconds argument is out of bounds: {timeoutSeconds}')
+        elif not utils.isValidInt(statsLogEveryCalls):
+            raise ValueError(f'statsLogEveryCalls argument is malformed: \"{statsLogEveryCalls}\"')
+        elif statsLogEveryCalls < 1:
+            raise ValueError(f'statsLogEveryCalls argument is out of bounds: {statsLogEveryCalls}')
+
+        self.__eventLoop: AbstractEventLoop = eventLoop
+        self.__timber: BufferedTimber = timber
+        self.__connectionPoolSize: int = connectionPoolSize
+        self.__timeoutSeconds: float = timeoutSeconds
+        self.__statsLogEveryCalls: int = statsLogEveryCalls
+
+        self.__executor: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers = maxWorkers,
+            thread_name_prefix = 'ThreadedRequestsClientProvider'
+        )
+
+        self.__threadLocal: threading.local = threading.local()
+        self.__stats: NetworkCallStats = NetworkCallStats()
+
+    async def execute(
+        self,
+        url: str,
+        call: Callable[[requests.Session], requests.Response]
+    ) -> ThreadedRequestsResponse:
+        if not utils.isValidStr(url):
+            raise ValueError(f'url argument is malformed: \"{url}\"')
+        elif not callable(call):
+            raise ValueError(f'call argument is malformed: \"{call}\"')
+
+        submitTime = time.perf_counter()
+
+        def runOnWorkerThread():
+            startTime = time.perf_counter()
+
+            try:
+                response = call(self.__getSession())
+
+                # read the entire body while still on the worker thread
+                response.content
+                return response, startTime, time.perf_counter()
+            except requests.exceptions.RequestException as e:
+                return e, startTime, time.perf_counter()
+
+        result, startTime, endTime = await self.__eventLoop.run_in_executor(self.__executor, runOnWorkerThread)
+        self.__stats.record(
+            queuedSeconds = startTime - submitTime,
+            executingSeconds = endTime - startTime
+        )
+
+        if self.__stats.getCallCount() % self.__statsLogEveryCalls == 0:
+            self.__timber.log('ThreadedRequestsClientProvider', f'Network call stats: {self.__stats.toStr()}')
+
+        if isinstance(result, Exception):
+            self.__timber.log('ThreadedRequestsClientProvider', f'Encountered network error when requesting \"{url}\": {result}', result)
+            raise GenericNetworkException(f'Encountered network error when requesting \"{url}\": {result}')
+
+        return ThreadedRequestsResponse(
+            response = result,
+            url = url
+        )
+
+    async def get(self) -> NetworkHandle:
+        return ThreadedRequestsHandle(
+            threadedRequestsClientProvider = self,
+            timeoutSeconds = self.__timeoutSeconds
+        )
+
+    def __getSession(self) -> requests.Session:
+        # only ever called from one of this provider's own worker threads
+        session: Optional[requests.Session] = getattr(self.__threadLocal, 'session', None)
+
+        if session is None:
+            adapter = HTTPAdapter(
+                pool_connections = self.__connectionPoolSize,
+                pool_maxsize = self.__connectionPoolSize
+            )
+
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self.__threadLocal.session = session
+
+        return session
+
+    def getStats(self) -> NetworkCallStats:
+        return self.__stats
+
+    async def close(self):
+        self.__executor.shutdown(wait = False)
@@ -1,10 +1,14 @@
-from sqlite3 import OperationalError
-from typing import Any, List, Optional
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 import CynanBotCommon.utils as utils
 from CynanBotCommon.storage.backingDatabase import BackingDatabase
 from CynanBotCommon.storage.databaseConnection import DatabaseConnection
-from CynanBotCommon.storage.databaseType import DatabaseType
+from databaseSchemaRegistry import DatabaseSchemaRegistry
+from databaseWriteQueue import DatabaseWriteQueue
+from rosterChangeNotifier import RosterChangeNotifier
+from rosterChangeType import RosterChangeType
+from rosterSnapshotStore import RosterSnapshot, RosterSnapshotStore
+from rosterVersionRepository import RosterVersionRepository
 from user import User
 from usersRepository import UsersRepository
 
@@ -39,17 +43,40 @@ class TwitchAnnounceChannelsRepository():
     def __init__(
         self,
         backingDatabase: BackingDatabase,
-        usersRepository: UsersRepository
+        databaseSchemaRegistry: DatabaseSchemaRegistry,
+        rosterVersionRepository: RosterVersionRepository,
+        usersRepository: UsersRepository,
+        rosterSnapshotStore: Optional[RosterSnapshotStore] = None,
+        rosterChangeNotifier: Optional[RosterChangeNotifier] = None,
+        databaseWriteQueue: Optional[DatabaseWriteQueue] = None
     ):
         if not isinstance(backingDatabase, BackingDatabase):
             raise ValueError(f'backingDatabase argument is malformed: \"{backingDatabase}\"')
+        elif not isinstance(databaseSchemaRegistry, DatabaseSchemaRegistry):
+            raise ValueError(f'databaseSchemaRegistry argument is malformed: \"{databaseSchemaRegistry}\"')
+        elif not isinstance(rosterVersionRepository, RosterVersionRepository):
+            raise ValueError(f'rosterVersionRepository argument is malformed: \"{rosterVersionRepository}\"')
         elif not isinstance(usersRepository, UsersRepository):
             raise ValueError(f'usersRepository argument is malformed: \"{usersRepository}\"')
+        elif rosterSnapshotStore is not None and not isinstance(rosterSnapshotStore, RosterSnapshotStore):
+            raise ValueError(f'rosterSnapshotStore argument is malformed: \"{rosterSnapshotStore}\"')
+        elif rosterChangeNotifier is not None and not isinstance(rosterChangeNotifier, RosterChangeNotifier):
+            raise ValueError(f'rosterChangeNotifier argument is malformed: \"{rosterChangeNotifier}\"')
+        elif databaseWriteQueue is not None and not isinstance(databaseWriteQueue, DatabaseWriteQueue):
+            raise ValueError(f'databaseWriteQueue argument is malformed: \"{databaseWriteQueue}\"')
 
         self.__backingDatabase: BackingDatabase = backingDatabase
+        self.__databaseSchemaRegistry: DatabaseSchemaRegistry = databaseSchemaRegistry
+        self.__rosterVersionRepository: RosterVersionRepository = rosterVersionRepository
         self.__usersRepository: UsersRepository = usersRepository
+        self.__rosterSnapshotStore: Optional[RosterSnapshotStore] = rosterSnapshotStore
+        self.__rosterChangeNotifier: Optional[RosterChangeNotifier] = rosterChangeNotifier
+        self.__databaseWriteQueue: Optional[DatabaseWriteQueue] = databaseWriteQueue
 
         self.__isDatabaseReady: bool = False
+        self.__cache: Optional[Dict[int, TwitchAnnounceChannel]] = None
+        self.__pendingWriteCount: int = 0
+        self.__snapshotRosterVersion: Optional[int] = None
 
     async def addUser(self, user: User, discordChannelId: int):
         if not isinstance(user, User):
@@ -59,28 +86,135 @@ class TwitchAnnounceChannelsRepository():
         elif discordChannelId < 0 or discordChannelId > utils.getLongMaxSafeSize():
             raise ValueError(f'discordChannelId argument is out of bounds: {discordChannelId}')
 
-        await self.__createTablesForDiscordChannelId(discordChannelId)
-        await self.__usersRepository.addOrUpdateUser(user)
+        if self.__databaseWriteQueue is not None and user.hasTwitchName():
+            # coalesced with any other additions that are queued up alongside it, see addUsers()
+            self.__pendingWriteCount = self.__pendingWriteCount + 1
 
+            try:
+                await self.__databaseWriteQueue.write(
+                    writeKey = 'channels:add',
+                    items = [ (discordChannelId, user) ],
+                    writeFunction = self.__addUserPairs
+                )
+            finally:
+                self.__pendingWriteCount = self.__pendingWriteCount - 1
+
+            return
+
+        self.__pendingWriteCount = self.__pendingWriteCount + 1
+
+        try:
+            await self.__usersRepository.addOrUpdateUser(user)
+
+            connection = await self.__getDatabaseConnection()
+            await self.__createTablesForDiscordChannelId(connection, discordChannelId)
+            await connection.execute(
+                f'''
+                    INSERT INTO twitchannouncechannel_{discordChannelId} (discorduserid)
+                    VALUES ($1)
+                    ON CONFLICT (discorduserid) DO NOTHING
+                ''',
+                user.getDiscordId()
+            )
+
+            await self.__rosterVersionRepository.bumpVersion(connection)
+            await self.__notifyRosterChange(connection, RosterChangeType.CHANNELS, [ discordChannelId ])
+            await connection.close()
+            await self.__refreshCachedChannel(discordChannelId)
+        finally:
+            self.__pendingWriteCount = self.__pendingWriteCount - 1
+
+    async def __addUserPairs(self, discordChannelIdsAndUsers: List[Tuple[int, User]]):
+        # what addUser() and addUsers() write through the DatabaseWriteQueue, as pairs of
+        # (discordChannelId, user), so that additions to any number of channels can all be
+        # coalesced together, into one bulk addition per channel
+        discordChannelIdsToUsers: Dict[int, List[User]] = dict()
+
+        for discordChannelId, user in discordChannelIdsAndUsers:
+            if discordChannelId not in discordChannelIdsToUsers:
+                discordChannelIdsToUsers[discordChannelId] = list()
+
+            discordChannelIdsToUsers[discordChannelId].append(user)
+
+        for discordChannelId, users in discordChannelIdsToUsers.items():
+            await self.__addUsers(users, discordChannelId)
+
+    async def addUsers(self, users: List[User], discordChannelId: int, chunkSize: int = 500):
+        if not utils.hasItems(users):
+            raise ValueError(f'users argument is malformed: \"{users}\"')
+        elif not utils.isValidInt(discordChannelId):
+            raise ValueError(f'discordChannelId argument is malformed: \"{discordChannelId}\"')
+        elif discordChannelId < 0 or discordChannelId > utils.getLongMaxSafeSize():
+            raise ValueError(f'discordChannelId argument is out of bounds: {discordChannelId}')
+        elif not utils.isValidInt(chunkSize):
+            raise ValueError(f'chunkSize argument is malformed: \"{chunkSize}\"')
+        elif chunkSize < 1 or chunkSize > 900:
+            raise ValueError(f'chunkSize argument is out of bounds: {chunkSize}')
+
+        self.__pendingWriteCount = self.__pendingWriteCount + 1
+
+        try:
+            if self.__databaseWriteQueue is None:
+                await self.__addUsers(users, discordChannelId, chunkSize)
+            else:
+                await self.__databaseWriteQueue.write(
+                    writeKey = 'channels:add',
+                    items = [ (discordChannelId, user) for user in users ],
+                    writeFunction = self.__addUserPairs
+                )
+        finally:
+            self.__pendingWriteCount = self.__pendingWriteCount - 1
+
+    async def __addUsers(self, users: List[User], discordChannelId: int, chunkSize: int = 500):
+        # Bulk version of addUser(): the users are upserted in bulk, the channel's table is only
+        # ever created once, and then membership rows are inserted in multi-row chunks over a
+        # single connection. The cached channel is only refreshed once at the very end.
+
+        await self.__usersRepository.addOrUpdateUsers(users)
+
+        discordIds: List[str] = list(dict.fromkeys(user.getDiscordId() for user in users))
+
+        tableName = self.__getTableName(discordChannelId)
         connection = await self.__getDatabaseConnection()
-        await connection.execute(
-            f'''
-                INSERT INTO twitchannouncechannel_{discordChannelId} (discorduserid)
-                VALUES ($1)
-                ON CONFLICT (discorduserid) DO NOTHING
-            ''',
-            user.getDiscordId()
-        )
+        await self.__createTablesForDiscordChannelId(connection, discordChannelId)
+
+        for index in range(0, len(discordIds), chunkSize):
+            chunk = discordIds[index:index + chunkSize]
+            valuesStr = ', '.join(f'(${parameterIndex + 1})' for parameterIndex in range(len(chunk)))
+
+            await connection.execute(
+                f'''
+                    INSERT INTO {tableName} (discorduserid)
+                    VALUES {valuesStr}
+                    ON CONFLICT (discorduserid) DO NOTHING
+                ''',
+                *chunk
+            )
 
+        await self.__rosterVersionRepository.bumpVersion(connection)
+        await self.__notifyRosterChange(connection, RosterChangeType.CHANNELS, [ discordChannelId ])
         await connection.close()
+        await self.__refreshCachedChannel(discordChannelId)
 
-    async def __createTablesForDiscordChannelId(self, discordChannelId: int):
-        if not utils.isValidInt(discordChannelId):
+    async def clearCaches(self):
+        self.__cache = None
+        self.__snapshotRosterVersion = None
+
+    async def __createTablesForDiscordChannelId(self, connection: DatabaseConnection, discordChannelId: int):
+        if not isinstance(connection, DatabaseConnection):
+            raise ValueError(f'connection argument is malformed: \"{connection}\"')
+        elif not utils.isValidInt(discordChannelId):
             raise ValueError(f'discordChannelId argument is malformed: \"{discordChannelId}\"')
         elif discordChannelId < 0 or discordChannelId > utils.getLongMaxSafeSize():
             raise ValueError(f'discordChannelId argument is out of bounds: {discordChannelId}')
 
-        connection = await self.__getDatabaseConnection()
+        tableName = self.__getTableName(discordChannelId)
+
+        # A channel's table and its twitchannouncechannels row are always created together, so
+        # if the table is already known then there's nothing to do here at all.
+        if await self.__databaseSchemaRegistry.hasTable(tableName):
+            return
+
         await connection.execute(
             '''
                 INSERT INTO twitchannouncechannels (discordchannelid)
@@ -90,26 +224,46 @@ class TwitchAnnounceChannelsRepository():
             str(discordChannelId)
         )
 
-        if connection.getDatabaseType() is DatabaseType.POSTGRESQL:
-            await connection.createTableIfNotExists(
-                f'''
-                    CREATE TABLE IF NOT EXISTS twitchannouncechannel_{discordChannelId} (
-                        discorduserid public.citext NOT NULL PRIMARY KEY
-                    )
-                '''
-            )
-        elif connection.getDatabaseType() is DatabaseType.SQLITE:
-            await connection.createTableIfNotExists(
-                f'''
-                    CREATE TABLE IF NOT EXISTS twitchannouncechannel_{discordChannelId} (
-                        discorduserid TEXT NOT NULL PRIMARY KEY COLLATE NOCASE
-                    )
-                '''
-            )
-        else:
-            raise RuntimeError(f'unknown DatabaseType: \"{connection.getDatabaseType()}\"')
+        await self.__databaseSchemaRegistry.createTableIfNotExists(
+            tableName = tableName,
+            psqlStatement = f'''
+                CREATE TABLE IF NOT EXISTS {tableName} (
+                    discorduserid public.citext NOT NULL PRIMARY KEY
+                )
+            ''',
+            sqliteStatement = f'''
+                CREATE TABLE IF NOT EXISTS {tableName} (
+                    discorduserid TEXT NOT NULL PRIMARY KEY COLLATE NOCASE
+                )
+            ''',
+            connection = connection
+        )
+
+    async def fetchDiscordChannelIdsToDiscordUserIds(self) -> Dict[int, Set[str]]:
+        # Reads every registered channel's announce users straight from the database rather than
+        # from the cache, for anything that needs to know exactly what's stored. Channels whose
+        # table is empty or missing map to an empty set.
+        connection = await self.__getDatabaseConnection()
+        channelRows = await connection.fetchRows('SELECT discordchannelid FROM twitchannouncechannels')
+        discordChannelIdsToDiscordUserIds: Dict[int, Set[str]] = dict()
+
+        if utils.hasItems(channelRows):
+            for channelRow in channelRows:
+                discordChannelId = int(channelRow[0])
+                tableName = self.__getTableName(discordChannelId)
+                discordUserIds: Set[str] = set()
+
+                if await self.__databaseSchemaRegistry.hasTable(tableName):
+                    rows = await connection.fetchRows(f'SELECT discorduserid FROM {tableName}')
+
+                    if utils.hasItems(rows):
+                        for row in rows:
+                            discordUserIds.add(row[0].lower())
+
+                discordChannelIdsToDiscordUserIds[discordChannelId] = discordUserIds
 
         await connection.close()
+        return discordChannelIdsToDiscordUserIds
 
     async def fetchTwitchAnnounceChannel(self, discordChannelId: int) ->  TwitchAnnounceChannel:
         if not utils.isValidInt(discordChannelId):
@@ -118,29 +272,30 @@ class TwitchAnnounceChannelsRepository():
             raise ValueError(f'discordChannelId argument is out of bounds: {discordChannelId}')
 
         connection = await self.__getDatabaseConnection()
+        tableName = self.__getTableName(discordChannelId)
         rows: Optional[List[List[Any]]] = None
 
-        try:
-            rows = await connection.fetchRows(f'SELECT discorduserid FROM twitchannouncechannel_{discordChannelId}')
-        except OperationalError:
-            # this error can be safely ignored, it just means the above table doesn't exist
-            pass
+        if await self.__databaseSchemaRegistry.hasTable(tableName):
+            rows = await connection.fetchRows(f'SELECT discorduserid FROM {tableName}')
 
         if not utils.hasItems(rows):
             await connection.close()
             return TwitchAnnounceChannel(discordChannelId = discordChannelId)
 
-        users: List[User] = list()
+        await connection.close()
+
+        discordUserIds: List[str] = [ row[0] for row in rows ]
+        users = await self.__usersRepository.getUsersAsync(discordUserIds)
 
-        for row in rows:
-            user = await self.__usersRepository.getUserAsync(row[0])
+        if len(users) != len(discordUserIds):
+            foundDiscordUserIds = set(user.getDiscordId().lower() for user in users)
+            missingDiscordUserIds = [ discordUserId for discordUserId in discordUserIds if discordUserId.lower() not in foundDiscordUserIds ]
+            raise ValueError(f'Unable to find user(s) for channel {discordChannelId} with discordId(s): \"{missingDiscordUserIds}\"')
 
+        for user in users:
             if not user.hasTwitchName():
                 raise RuntimeError(f'Twitch announce user {user.getDiscordNameAndDiscriminator()} for channel {discordChannelId} has no Twitch name!')
 
-            users.append(user)
-
-        await connection.close()
         users.sort(key = lambda user: user.getDiscordName().lower())
 
         return TwitchAnnounceChannel(
@@ -148,56 +303,298 @@ class TwitchAnnounceChannelsRepository():
             users = users
         )
 
-    async def fetchTwitchAnnounceChannels(self) -> Optional[List[TwitchAnnounceChannel]]:
+    async def fetchTwitchAnnounceChannelUserCount(self, discordChannelId: int) -> int:
+        if not utils.isValidInt(discordChannelId):
+            raise ValueError(f'discordChannelId argument is malformed: \"{discordChannelId}\"')
+        elif discordChannelId < 0 or discordChannelId > utils.getLongMaxSafeSize():
+            raise ValueError(f'discordChannelId argument is out of bounds: {discordChannelId}')
+
+        tableName = self.__getTableName(discordChannelId)
+        if not await self.__databaseSchemaRegistry.hasTable(tableName):
+            return 0
+
         connection = await self.__getDatabaseConnection()
-        rows = await connection.fetchRows('SELECT discordchannelid FROM twitchannouncechannels')
+        row = await connection.fetchRow(f'SELECT COUNT(*) FROM {tableName}')
+        await connection.close()
 
-        if not utils.hasItems(rows):
-            await connection.close()
-            return None
+        if not utils.hasItems(row):
+            return 0
 
-        twitchAnnounceChannels: List[TwitchAnnounceChannel] = list()
+        return int(row[0])
 
-        for row in rows:
-            twitchAnnounceChannel = await self.fetchTwitchAnnounceChannel(int(row[0]))
-            twitchAnnounceChannels.append(twitchAnnounceChannel)
+    async def fetchTwitchAnnounceChannelUsersPage(
+        self,
+        discordChannelId: int,
+        pageSize: int,
+        afterUser: Optional[User] = None
+    ) -> List[User]:
+        if not utils.isValidInt(discordChannelId):
+            raise ValueError(f'discordChannelId argument is malformed: \"{discordChannelId}\"')
+        elif discordChannelId < 0 or discordChannelId > utils.getLongMaxSafeSize():
+            raise ValueError(f'discordChannelId argument is out of bounds: {discordChannelId}')
+        elif not utils.isValidInt(pageSize):
+            raise ValueError(f'pageSize argument is malformed: \"{pageSize}\"')
+        elif pageSize < 1 or pageSize > 100:
+            raise ValueError(f'pageSize argument is out of bounds: {pageSize}')
+        elif afterUser is not None and not isinstance(afterUser, User):
+            raise ValueError(f'afterUser argument is malformed: \"{afterUser}\"')
+
+        tableName = self.__getTableName(discordChannelId)
+        if not await self.__databaseSchemaRegistry.hasTable(tableName):
+            return list()
+
+        # Keyset pagination: each page is a single query that picks up right after the last user
+        # of the previous page, so no page ever has to skip over (or load) the ones before it.
+        # Both discordname and discordid are case insensitive columns, so this ordering matches
+        # the case insensitive sort that fetchTwitchAnnounceChannel() does.
+        connection = await self.__getDatabaseConnection()
+        rows: Optional[List[List[Any]]] = None
+
+        if afterUser is None:
+            rows = await connection.fetchRows(
+                f'''
+                    SELECT users.discorddiscriminator, users.discordid, users.discordname, users.mostrecentstreamdatetime, users.twitchname FROM {tableName}
+                    INNER JOIN users ON users.discordid = {tableName}.discorduserid
+                    ORDER BY users.discordname, users.discordid
+                    LIMIT $1
+                ''',
+                pageSize
+            )
+        else:
+            rows = await connection.fetchRows(
+                f'''
+                    SELECT users.discorddiscriminator, users.discordid, users.discordname, users.mostrecentstreamdatetime, users.twitchname FROM {tableName}
+                    INNER JOIN users ON users.discordid = {tableName}.discorduserid
+                    WHERE (users.discordname, users.discordid) > ($1, $2)
+                    ORDER BY users.discordname, users.discordid
+                    LIMIT $3
+                ''',
+                afterUser.getDiscordName(), afterUser.getDiscordId(), pageSize
+            )
 
         await connection.close()
-        return twitchAnnounceChannels
+        users: List[User] = list()
+
+        if utils.hasItems(rows):
+            for row in rows:
+                users.append(self.__usersRepository.createUserFromRow(row))
+
+        return users
+
+    async def fetchTwitchAnnounceChannels(self) -> Optional[List[TwitchAnnounceChannel]]:
+        if self.__cache is None:
+            await self.warmUp()
+
+        if not utils.hasItems(self.__cache):
+            return None
+
+        return list(self.__cache.values())
 
     async def __getDatabaseConnection(self) -> DatabaseConnection:
         await self.__initDatabaseTable()
         return await self.__backingDatabase.getConnection()
 
+    def __getTableName(self, discordChannelId: int) -> str:
+        return f'twitchannouncechannel_{discordChannelId}'
+
+    def hasPendingWrites(self) -> bool:
+        return self.__pendingWriteCount > 0
+
+    async def initDatabaseTable(self):
+        await self.__initDatabaseTable()
+
     async def __initDatabaseTable(self):
         if self.__isDatabaseReady:
             return
 
+        # the schema registry serializes concurrent callers, so this flag is only ever set once
+        # the table really does exist
+        await self.__databaseSchemaRegistry.createTableIfNotExists(
+            tableName = 'twitchannouncechannels',
+            psqlStatement = '''
+                CREATE TABLE IF NOT EXISTS twitchannouncechannels (
+                    discordchannelid public.citext NOT NULL PRIMARY KEY
+                )
+            ''',
+            sqliteStatement = '''
+                CREATE TABLE IF NOT EXISTS twitchannouncechannels (
+                    discordchannelid TEXT NOT NULL PRIMARY KEY COLLATE NOCASE
+                )
+            '''
+        )
+
         self.__isDatabaseReady = True
 
-        connection = await self.__backingDatabase.getConnection()
+    async def invalidateChannels(self, discordChannelIds: List[int]):
+        if not utils.hasItems(discordChannelIds):
+            raise ValueError(f'discordChannelIds argument is malformed: \"{discordChannelIds}\"')
+
+        # for when these channels have been written to by someone else, e.g. another process
+        if self.__cache is None:
+            return
+
+        for discordChannelId in discordChannelIds:
+            self.__cache[discordChannelId] = await self.fetchTwitchAnnounceChannel(discordChannelId)
+
+    async def invalidateRemovedChannels(self, discordChannelIds: List[int]):
+        if not utils.hasItems(discordChannelIds):
+            raise ValueError(f'discordChannelIds argument is malformed: \"{discordChannelIds}\"')
+
+        for discordChannelId in discordChannelIds:
+            self.__databaseSchemaRegistry.removeTable(self.__getTableName(discordChannelId))
+
+            if self.__cache is not None:
+                self.__cache.pop(discordChannelId, None)
+
+    async def invalidateUsers(self, discordUserIds: List[str]):
+        if not utils.hasItems(discordUserIds):
+            raise ValueError(f'discordUserIds argument is malformed: \"{discordUserIds}\"')
 
-        if connection.getDatabaseType() is DatabaseType.POSTGRESQL:
-            await connection.createTableIfNotExists(
-                '''
-                    CREATE TABLE IF NOT EXISTS twitchannouncechannels (
-                        discordchannelid public.citext NOT NULL PRIMARY KEY
-                    )
-                '''
+        if self.__cache is None:
+            return
+
+        # only the channels that these users are actually in need to be read again
+        discordUserIdsSet = set(discordUserId.lower() for discordUserId in discordUserIds)
+        discordChannelIds: List[int] = list()
+
+        for discordChannelId, twitchAnnounceChannel in self.__cache.items():
+            if twitchAnnounceChannel.hasUsers() and any(user.getDiscordId().lower() in discordUserIdsSet for user in twitchAnnounceChannel.getUsers()):
+                discordChannelIds.append(discordChannelId)
+
+        if utils.hasItems(discordChannelIds):
+            await self.invalidateChannels(discordChannelIds)
+
+    async def __loadFromSnapshot(self, rosterVersion: int) -> bool:
+        if self.__rosterSnapshotStore is None:
+            return False
+
+        rosterSnapshot = await self.__rosterSnapshotStore.load()
+
+        if rosterSnapshot is None:
+            return False
+        elif rosterSnapshot.getRosterVersion() != rosterVersion:
+            # the database has been written to since this snapshot was saved
+            return False
+
+        cache: Dict[int, TwitchAnnounceChannel] = dict()
+
+        for discordChannelId, userRows in rosterSnapshot.getChannelIdsToUserRows().items():
+            users: List[User] = list()
+
+            for userRow in userRows:
+                users.append(self.__usersRepository.createUserFromRow(userRow))
+
+            cache[discordChannelId] = TwitchAnnounceChannel(
+                discordChannelId = discordChannelId,
+                users = users
             )
-        elif connection.getDatabaseType() is DatabaseType.SQLITE:
-            await connection.createTableIfNotExists(
-                '''
-                    CREATE TABLE IF NOT EXISTS twitchannouncechannels (
-                        discordchannelid TEXT NOT NULL PRIMARY KEY COLLATE NOCASE
-                    )
-                '''
+
+        self.__cache = cache
+        self.__snapshotRosterVersion = rosterVersion
+        return True
+
+    async def __notifyRosterChange(self, connection: DatabaseConnection, rosterChangeType: RosterChangeType, ids: List[Any]):
+        if self.__rosterChangeNotifier is not None:
+            await self.__rosterChangeNotifier.notify(connection, rosterChangeType, ids)
+
+    async def __refreshCachedChannel(self, discordChannelId: int):
+        if self.__cache is None:
+            return
+
+        self.__cache[discordChannelId] = await self.fetchTwitchAnnounceChannel(discordChannelId)
+
+    async def removeChannels(self, discordChannelIds: List[int], chunkSize: int = 500):
+        if not utils.hasItems(discordChannelIds):
+            raise ValueError(f'discordChannelIds argument is malformed: \"{discordChannelIds}\"')
+        elif not utils.isValidInt(chunkSize):
+            raise ValueError(f'chunkSize argument is malformed: \"{chunkSize}\"')
+        elif chunkSize < 1 or chunkSize > 900:
+            raise ValueError(f'chunkSize argument is out of bounds: {chunkSize}')
+
+        discordChannelIds = list(dict.fromkeys(discordChannelIds))
+
+        # The channels are dropped from the cache before anything is written, so that they stop
+        # being polled and announced to right away, rather than once the database catches up.
+        if self.__cache is not None:
+            for discordChannelId in discordChannelIds:
+                self.__cache.pop(discordChannelId, None)
+
+        self.__pendingWriteCount = self.__pendingWriteCount + 1
+
+        try:
+            if self.__databaseWriteQueue is None:
+                await self.__removeChannels(discordChannelIds, chunkSize)
+            else:
+                await self.__databaseWriteQueue.write(
+                    writeKey = None,
+                    items = discordChannelIds,
+                    writeFunction = lambda discordChannelIds, chunkSize = chunkSize: self.__removeChannels(discordChannelIds, chunkSize)
+                )
+        finally:
+            self.__pendingWriteCount = self.__pendingWriteCount - 1
+
+    async def __removeChannels(self, discordChannelIds: List[int], chunkSize: int):
+        connection = await self.__getDatabaseConnection()
+
+        for index in range(0, len(discordChannelIds), chunkSize):
+            chunk = discordChannelIds[index:index + chunkSize]
+            parametersStr = ', '.join(f'${parameterIndex + 1}' for parameterIndex in range(len(chunk)))
+
+            await connection.execute(
+                f'''
+                    DELETE FROM twitchannouncechannels
+                    WHERE discordchannelid IN ({parametersStr})
+                ''',
+                *[ str(discordChannelId) for discordChannelId in chunk ]
             )
+
+        for discordChannelId in discordChannelIds:
+            tableName = self.__getTableName(discordChannelId)
+
+            if await self.__databaseSchemaRegistry.hasTable(tableName):
+                await connection.execute(f'DROP TABLE IF EXISTS {tableName}')
+                self.__databaseSchemaRegistry.removeTable(tableName)
+
+        await self.__rosterVersionRepository.bumpVersion(connection)
+        await self.__notifyRosterChange(connection, RosterChangeType.CHANNELS_REMOVED, discordChannelIds)
+        await connection.close()
+
+    async def removeOrphanedUsers(self, discordIds: List[str], chunkSize: int = 500) -> List[str]:
+        if not utils.hasItems(discordIds):
+            raise ValueError(f'discordIds argument is malformed: \"{discordIds}\"')
+        elif not utils.isValidInt(chunkSize):
+            raise ValueError(f'chunkSize argument is malformed: \"{chunkSize}\"')
+        elif chunkSize < 1 or chunkSize > 900:
+            raise ValueError(f'chunkSize argument is out of bounds: {chunkSize}')
+
+        # Removes whichever of the given users aren't in any channel at the time of the delete,
+        # and returns their ids. With a DatabaseWriteQueue, the channel tables are listed and the
+        # users deleted as one write, so no roster write can land in between the two.
+        if self.__databaseWriteQueue is None:
+            return await self.__removeOrphanedUsers(discordIds, chunkSize)
         else:
-            raise RuntimeError(f'unknown DatabaseType: \"{connection.getDatabaseType()}\"')
+            return await self.__databaseWriteQueue.write(
+                writeKey = None,
+                items = discordIds,
+                writeFunction = lambda discordIds, chunkSize = chunkSize: self.__removeOrphanedUsers(discordIds, chunkSize)
+            )
 
+    async def __removeOrphanedUsers(self, discordIds: List[str], chunkSize: int) -> List[str]:
+        connection = await self.__getDatabaseConnection()
+        channelRows = await connection.fetchRows('SELECT discordchannelid FROM twitchannouncechannels')
         await connection.close()
 
+        channelTableNames: List[str] = list()
+
+        if utils.hasItems(channelRows):
+            for channelRow in channelRows:
+                tableName = self.__getTableName(int(channelRow[0]))
+
+                if await self.__databaseSchemaRegistry.hasTable(tableName):
+                    channelTableNames.append(tableName)
+
+        return await self.__usersRepository.removeOrphanedUsers(discordIds, channelTableNames, chunkSize)
+
     async def removeUser(self, user: User, discordChannelId: int):
         if not isinstance(user, User):
             raise ValueError(f'user argument is malformed: \"{user}\"')
@@ -206,18 +603,182 @@ class TwitchAnnounceChannelsRepository():
         elif discordChannelId < 0 or discordChannelId > utils.getLongMaxSafeSize():
             raise ValueError(f'discordChannelId argument is out of bounds: {discordChannelId}')
 
-        connection = await self.__getDatabaseConnection()
+        tableName = self.__getTableName(discordChannelId)
+        if not await self.__databaseSchemaRegistry.hasTable(tableName):
+            return
+
+        if self.__databaseWriteQueue is not None:
+            # coalesced with any other removals that are queued up alongside it, see removeUsers()
+            self.__pendingWriteCount = self.__pendingWriteCount + 1
+
+            try:
+                await self.__databaseWriteQueue.write(
+                    writeKey = 'channels:remove',
+                    items = [ (discordChannelId, user.getDiscordId()) ],
+                    writeFunction = self.__removeUserPairs
+                )
+            finally:
+                self.__pendingWriteCount = self.__pendingWriteCount - 1
+
+            return
+
+        self.__pendingWriteCount = self.__pendingWriteCount + 1
 
         try:
-            connection.execute(
+            connection = await self.__getDatabaseConnection()
+            await connection.execute(
                 f'''
-                    DELETE FROM twitchannouncechannel_{discordChannelId}
+                    DELETE FROM {tableName}
                     WHERE discorduserid = $1
                 ''',
                 user.getDiscordId()
             )
-        except OperationalError:
-            # this error can be safely ignored, it just means the above table doesn't exist
-            pass
 
+            await self.__rosterVersionRepository.bumpVersion(connection)
+            await self.__notifyRosterChange(connection, RosterChangeType.CHANNELS, [ discordChannelId ])
+            await connection.close()
+            await self.__refreshCachedChannel(discordChannelId)
+        finally:
+            self.__pendingWriteCount = self.__pendingWriteCount - 1
+
+    async def __removeUserPairs(self, discordChannelIdsAndUserIds: List[Tuple[int, str]]):
+        # what removeUser() and removeUsers() write through the DatabaseWriteQueue, as pairs of
+        # (discordChannelId, discordUserId), so that they can all be coalesced together
+        discordChannelIdsToUserIds: Dict[int, Set[str]] = dict()
+
+        for discordChannelId, discordUserId in discordChannelIdsAndUserIds:
+            if discordChannelId not in discordChannelIdsToUserIds:
+                discordChannelIdsToUserIds[discordChannelId] = set()
+
+            discordChannelIdsToUserIds[discordChannelId].add(discordUserId)
+
+        self.__removeUsersFromCache(discordChannelIdsToUserIds)
+        await self.__removeUsers(discordChannelIdsToUserIds)
+
+    async def removeUsers(self, discordChannelIdsToUserIds: Dict[int, Set[str]], chunkSize: int = 500):
+        if not utils.hasItems(discordChannelIdsToUserIds):
+            raise ValueError(f'discordChannelIdsToUserIds argument is malformed: \"{discordChannelIdsToUserIds}\"')
+        elif not utils.isValidInt(chunkSize):
+            raise ValueError(f'chunkSize argument is malformed: \"{chunkSize}\"')
+        elif chunkSize < 1 or chunkSize > 900:
+            raise ValueError(f'chunkSize argument is out of bounds: {chunkSize}')
+
+        # Bulk version of removeUser(): every removal is written over a single connection, in
+        # multi-row chunks per channel, with one roster version bump at the very end. Just like
+        # removeChannels(), the cache is updated first.
+        self.__removeUsersFromCache(discordChannelIdsToUserIds)
+        self.__pendingWriteCount = self.__pendingWriteCount + 1
+
+        try:
+            if self.__databaseWriteQueue is None:
+                await self.__removeUsers(discordChannelIdsToUserIds, chunkSize)
+            else:
+                await self.__databaseWriteQueue.write(
+                    writeKey = 'channels:remove',
+                    items = [ (discordChannelId, discordUserId) for discordChannelId, discordUserIds in discordChannelIdsToUserIds.items() for discordUserId in discordUserIds ],
+                    writeFunction = self.__removeUserPairs
+                )
+        finally:
+            self.__pendingWriteCount = self.__pendingWriteCount - 1
+
+    async def __removeUsers(self, discordChannelIdsToUserIds: Dict[int, Set[str]], chunkSize: int = 500):
+        connection = await self.__getDatabaseConnection()
+
+        for discordChannelId, discordUserIds in discordChannelIdsToUserIds.items():
+            tableName = self.__getTableName(discordChannelId)
+
+            if not utils.hasItems(discordUserIds) or not await self.__databaseSchemaRegistry.hasTable(tableName):
+                continue
+
+            discordUserIdsList = list(discordUserIds)
+
+            for index in range(0, len(discordUserIdsList), chunkSize):
+                chunk = discordUserIdsList[index:index + chunkSize]
+                parametersStr = ', '.join(f'${parameterIndex + 1}' for parameterIndex in range(len(chunk)))
+
+                await connection.execute(
+                    f'''
+                        DELETE FROM {tableName}
+                        WHERE discorduserid IN ({parametersStr})
+                    ''',
+                    *chunk
+                )
+
+        await self.__rosterVersionRepository.bumpVersion(connection)
+        await self.__notifyRosterChange(connection, RosterChangeType.CHANNELS, list(discordChannelIdsToUserIds.keys()))
+        await connection.close()
+
+    def __removeUsersFromCache(self, discordChannelIdsToUserIds: Dict[int, Set[str]]):
+        if self.__cache is None:
+            return
+
+        for discordChannelId, discordUserIds in discordChannelIdsToUserIds.items():
+            twitchAnnounceChannel = self.__cache.get(discordChannelId)
+
+            if twitchAnnounceChannel is None or not twitchAnnounceChannel.hasUsers():
+                continue
+
+            self.__cache[discordChannelId] = TwitchAnnounceChannel(
+                discordChannelId = discordChannelId,
+                users = [ user for user in twitchAnnounceChannel.getUsers() if user.getDiscordId() not in discordUserIds ]
+            )
+
+    async def saveSnapshot(self):
+        if self.__rosterSnapshotStore is None or self.__cache is None:
+            return
+        elif self.__pendingWriteCount > 0:
+            # a write is mid-flight, so the cache may not match the roster version yet
+            return
+
+        rosterVersion = await self.__rosterVersionRepository.fetchVersion()
+
+        if rosterVersion != self.__snapshotRosterVersion:
+            await self.__saveSnapshot(rosterVersion)
+
+    async def __saveSnapshot(self, rosterVersion: int):
+        channelIdsToUserRows: Dict[int, List[List[Optional[str]]]] = dict()
+
+        for discordChannelId, twitchAnnounceChannel in self.__cache.items():
+            userRows: List[List[Optional[str]]] = list()
+
+            if twitchAnnounceChannel.hasUsers():
+                for user in twitchAnnounceChannel.getUsers():
+                    mostRecentStreamDateTime: Optional[str] = None
+                    if user.hasMostRecentStreamDateTime():
+                        mostRecentStreamDateTime = user.getMostRecentStreamDateTime().getIsoFormatStr()
+
+                    userRows.append([ user.getDiscordDiscriminator(), user.getDiscordId(), user.getDiscordName(), mostRecentStreamDateTime, user.getTwitchName() ])
+
+            channelIdsToUserRows[discordChannelId] = userRows
+
+        await self.__rosterSnapshotStore.save(RosterSnapshot(
+            rosterVersion = rosterVersion,
+            channelIdsToUserRows = channelIdsToUserRows
+        ))
+
+        self.__snapshotRosterVersion = rosterVersion
+
+    async def warmUp(self):
+        # The roster version is read before anything else, so that a write racing with this load
+        # can only ever make the snapshot look older than it is, never newer.
+        rosterVersion = await self.__rosterVersionRepository.fetchVersion()
+
+        if await self.__loadFromSnapshot(rosterVersion):
+            return
+
+        connection = await self.__getDatabaseConnection()
+        rows = await connection.fetchRows('SELECT discordchannelid FROM twitchannouncechannels')
         await connection.close()
+
+        cache: Dict[int, TwitchAnnounceChannel] = dict()
+
+        if utils.hasItems(rows):
+            for row in rows:
+                twitchAnnounceChannel = await self.fetchTwitchAnnounceChannel(int(row[0]))
+                cache[twitchAnnounceChannel.getDiscordChannelId()] = twitchAnnounceChannel
+
+        self.__cache = cache
+
+        # the snapshot is tagged with the version read up above, not whatever the version is now
+        if self.__rosterSnapshotStore is not None and self.__pendingWriteCount == 0:
+            await self.__saveSnapshot(rosterVersion)
@@ -18,13 +18,44 @@ class TwitchAnnounceSettingsSnapshot():
         self.__jsonContents: Dict[str, Any] = jsonContents
         self.__twitchAnnounceSettingsFile: str = twitchAnnounceSettingsFile
 
-    def getAnnounceFalloffMinutes(self) -> int:
-        announceFalloffMinutes = utils.getIntFromDict(self.__jsonContents, 'announceFalloffMinutes', 60)
+    def getActivePollMinutes(self) -> int:
+        activePollMinutes = utils.getIntFromDict(self.__jsonContents, 'activePollMinutes', 1)
 
-        if announceFalloffMinutes < 30:
-            raise ValueError(f'\"announceFalloffMinutes\" is too aggressive: {announceFalloffMinutes}')
+        if activePollMinutes < 1:
+            raise ValueError(f'\"activePollMinutes\" is too aggressive: {activePollMinutes}')
 
-        return announceFalloffMinutes
+        return activePollMinutes
+
+    def getActiveWithinDays(self) -> int:
+        return utils.getIntFromDict(self.__jsonContents, 'activeWithinDays', 7)
+
+    def getAnnouncedStreamTimeToLiveMinutes(self) -> int:
+        announcedStreamTimeToLiveMinutes = utils.getIntFromDict(self.__jsonContents, 'announcedStreamTimeToLiveMinutes', 2880)
+
+        # a stream that's still live must never be evicted, so this has to comfortably outlast
+        # the longest poll interval
+        if announcedStreamTimeToLiveMinutes < 60:
+            raise ValueError(f'\"announcedStreamTimeToLiveMinutes\" is too aggressive: {announcedStreamTimeToLiveMinutes}')
+
+        return announcedStreamTimeToLiveMinutes
+
+    def getDormantAfterDays(self) -> int:
+        return utils.getIntFromDict(self.__jsonContents, 'dormantAfterDays', 60)
+
+    def getDormantPollMinutes(self) -> int:
+        return utils.getIntFromDict(self.__jsonContents, 'dormantPollMinutes', 30)
+
+    def getHelixCallsPerHourBudget(self) -> int:
+        # 0 means to spend exactly what polling the whole roster every refreshEveryMinutes costs
+        return utils.getIntFromDict(self.__jsonContents, 'helixCallsPerHourBudget', 0)
+
+    def getPollTickSeconds(self) -> int:
+        pollTickSeconds = utils.getIntFromDict(self.__jsonContents, 'pollTickSeconds', 60)
+
+        if pollTickSeconds < 15:
+            raise ValueError(f'\"pollTickSeconds\" is too aggressive: {pollTickSeconds}')
+
+        return pollTickSeconds
 
     def getRefreshEveryMinutes(self) -> int:
         refreshEveryMinutes = utils.getIntFromDict(self.__jsonContents, 'refreshEveryMinutes', 5)
@@ -33,3 +64,6 @@ class TwitchAnnounceSettingsSnapshot():
             raise ValueError(f'\"refreshEveryMinutes\" is too aggressive: {refreshEveryMinutes}')
 
         return refreshEveryMinutes
+
+    def getScheduleWindowMinutes(self) -> int:
+        return utils.getIntFromDict(self.__jsonContents, 'scheduleWindowMinutes', 90)
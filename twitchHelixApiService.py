@@ -0,0 +1,284 @@
+import asyncio
+import time
+import urllib.parse
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import CynanBotCommon.utils as utils
+from bufferedTimber import BufferedTimber
+from CynanBotCommon.network.exceptions import GenericNetworkException
+from CynanBotCommon.network.networkClientProvider import NetworkClientProvider
+from CynanBotCommon.twitch.exceptions import TwitchTokenIsExpiredException
+from CynanBotCommon.twitch.twitchApiService import TwitchApiService
+from CynanBotCommon.twitch.twitchCredentialsProviderInterface import \
+    TwitchCredentialsProviderInterface
+from CynanBotCommon.twitch.twitchLiveUserDetails import TwitchLiveUserDetails
+from CynanBotCommon.twitch.twitchStreamType import TwitchStreamType
+from helixRateLimiter import HelixRateLimiter, HelixRequestPriority
+from helixRecorder import HelixRecorder
+from twitchLogins import isValidTwitchLogin
+
+
+class TwitchUserIdentity():
+
+    def __init__(
+        self,
+        userId: str,
+        userLogin: str,
+        displayName: Optional[str] = None
+    ):
+        if not utils.isValidStr(userId):
+            raise ValueError(f'userId argument is malformed: \"{userId}\"')
+        elif not utils.isValidStr(userLogin):
+            raise ValueError(f'userLogin argument is malformed: \"{userLogin}\"')
+
+        self.__userId: str = userId
+        self.__userLogin: str = userLogin
+        self.__displayName: Optional[str] = displayName
+
+    def getDisplayName(self) -> Optional[str]:
+        return self.__displayName
+
+    def getUserId(self) -> str:
+        return self.__userId
+
+    def getUserLogin(self) -> str:
+        return self.__userLogin
+
+
+class TwitchHelixApiService(TwitchApiService):
+
+    # Adds the handful of Helix calls that CynanBotCommon's TwitchApiService doesn't offer:
+    # batched lookups of user identities (by login or by id), and live stream lookups by user id
+    # rather than by login. User ids never change, so querying by them keeps working even after
+    # somebody renames their Twitch account.
+    #
+    # When given a HelixRateLimiter, every Helix call made through this service is paced by it:
+    # live polling goes first, then user lookups. Token validation (which CynanBotCommon's
+    # TwitchTokensRepository does through this service) goes to id.twitch.tv rather than Helix,
+    # and doesn't count against Helix's bucket, so it's paced on its own instead, at most one
+    # validation every validationSpacingSeconds.
+    #
+    # When given a HelixRecorder, every successful stream and user lookup response is recorded,
+    # so that it can be replayed later as input for performance regression tests.
+
+    def __init__(
+        self,
+        networkClientProvider: NetworkClientProvider,
+        timber: BufferedTimber,
+        twitchCredentialsProviderInterface: TwitchCredentialsProviderInterface,
+        helixRateLimiter: Optional[HelixRateLimiter] = None,
+        helixRecorder: Optional[HelixRecorder] = None,
+        helixBaseUrl: str = 'https://api.twitch.tv/helix',
+        maxIdsPerRequest: int = 100,
+        validationSpacingSeconds: float = 1
+    ):
+        super().__init__(
+            networkClientProvider = networkClientProvider,
+            timber = timber,
+            twitchCredentialsProviderInterface = twitchCredentialsProviderInterface
+        )
+
+        if not isinstance(networkClientProvider, NetworkClientProvider):
+            raise ValueError(f'networkClientProvider argument is malformed: \"{networkClientProvider}\"')
+        elif not isinstance(timber, BufferedTimber):
+            raise ValueError(f'timber argument is malformed: \"{timber}\"')
+        elif not isinstance(twitchCredentialsProviderInterface, TwitchCredentialsProviderInterface):
+            raise ValueError(f'twitchCredentialsProviderInterface argument is malformed: \"{twitchCredentialsProviderInterface}\"')
+        elif helixRateLimiter is not None and not isinstance(helixRateLimiter, HelixRateLimiter):
+            raise ValueError(f'helixRateLimiter argument is malformed: \"{helixRateLimiter}\"')
+        elif helixRecorder is not None and not isinstance(helixRecorder, HelixRecorder):
+            raise ValueError(f'helixRecorder argument is malformed: \"{helixRecorder}\"')
+        elif not utils.isValidStr(helixBaseUrl):
+            raise ValueError(f'helixBaseUrl argument is malformed: \"{helixBaseUrl}\"')
+        elif not utils.isValidInt(maxIdsPerRequest):
+            raise ValueError(f'maxIdsPerRequest argument is malformed: \"{maxIdsPerRequest}\"')
+        elif maxIdsPerRequest < 1 or maxIdsPerRequest > 100:
+            raise ValueError(f'maxIdsPerRequest argument is out of bounds: {maxIdsPerRequest}')
+        elif not utils.isValidNum(validationSpacingSeconds):
+            raise ValueError(f'validationSpacingSeconds argument is malformed: \"{validationSpacingSeconds}\"')
+        elif validationSpacingSeconds < 0:
+            raise ValueError(f'validationSpacingSeconds argument is out of bounds: {validationSpacingSeconds}')
+
+        self.__networkClientProvider: NetworkClientProvider = networkClientProvider
+        self.__timber: BufferedTimber = timber
+        self.__twitchCredentialsProviderInterface: TwitchCredentialsProviderInterface = twitchCredentialsProviderInterface
+        self.__helixRateLimiter: Optional[HelixRateLimiter] = helixRateLimiter
+        self.__helixRecorder: Optional[HelixRecorder] = helixRecorder
+        self.__helixBaseUrl: str = helixBaseUrl
+        self.__maxIdsPerRequest: int = maxIdsPerRequest
+        self.__validationSpacingSeconds: float = validationSpacingSeconds
+
+        self.__validationLock: asyncio.Lock = asyncio.Lock()
+        self.__lastValidationTime: Optional[float] = None
+
+    async def fetchLiveUserDetailsByUserIds(
+        self,
+        twitchAccessToken: str,
+        userIds: List[str]
+    ) -> List[TwitchLiveUserDetails]:
+        if not utils.isValidStr(twitchAccessToken):
+            raise ValueError(f'twitchAccessToken argument is malformed: \"{twitchAccessToken}\"')
+        elif not utils.hasItems(userIds):
+            raise ValueError(f'userIds argument is malformed: \"{userIds}\"')
+        elif len(userIds) > self.__maxIdsPerRequest:
+            raise ValueError(f'more userIds than can be asked for from the Twitch API: \"{len(userIds)}\"')
+
+        for userId in userIds:
+            if not utils.isValidStr(userId) or not userId.isdigit():
+                raise ValueError(f'userId is malformed: \"{userId}\"')
+
+        query = urllib.parse.urlencode([ ( 'user_id', userId ) for userId in userIds ])
+        jsonResponse = await self.__get(
+            twitchAccessToken = twitchAccessToken,
+            url = f'{self.__helixBaseUrl}/streams?first={self.__maxIdsPerRequest}&{query}',
+            priority = HelixRequestPriority.POLL
+        )
+
+        if self.__helixRecorder is not None:
+            self.__helixRecorder.record('streams', userIds, jsonResponse.get('data'))
+
+        liveUserDetails: List[TwitchLiveUserDetails] = list()
+
+        for entry in jsonResponse.get('data', list()):
+            liveUserDetails.append(TwitchLiveUserDetails(
+                streamId = utils.getStrFromDict(entry, 'id'),
+                userId = utils.getStrFromDict(entry, 'user_id'),
+                userLogin = utils.getStrFromDict(entry, 'user_login'),
+                userName = utils.getStrFromDict(entry, 'user_name'),
+                viewerCount = utils.getIntFromDict(entry, 'viewer_count', 0),
+                gameId = entry.get('game_id'),
+                gameName = entry.get('game_name'),
+                language = entry.get('language'),
+                thumbnailUrl = entry.get('thumbnail_url'),
+                title = entry.get('title'),
+                streamType = TwitchStreamType.fromStr(entry.get('type'))
+            ))
+
+        return liveUserDetails
+
+    async def fetchUserIdentities(
+        self,
+        twitchAccessToken: str,
+        userLogins: Optional[List[str]] = None,
+        userIds: Optional[List[str]] = None
+    ) -> List[TwitchUserIdentity]:
+        if not utils.isValidStr(twitchAccessToken):
+            raise ValueError(f'twitchAccessToken argument is malformed: \"{twitchAccessToken}\"')
+        elif not utils.hasItems(userLogins) and not utils.hasItems(userIds):
+            raise ValueError(f'userLogins and userIds arguments are both malformed: \"{userLogins}\", \"{userIds}\"')
+
+        # these can come straight from a command, so they're checked before going anywhere near
+        # the query string, which is encoded regardless
+        queryParams: List[Tuple[str, str]] = list()
+
+        if utils.hasItems(userLogins):
+            for userLogin in userLogins:
+                if not isValidTwitchLogin(userLogin):
+                    raise ValueError(f'userLogin is malformed: \"{userLogin}\"')
+
+                queryParams.append(( 'login', userLogin.lower() ))
+
+        if utils.hasItems(userIds):
+            for userId in userIds:
+                if not utils.isValidStr(userId) or not userId.isdigit():
+                    raise ValueError(f'userId is malformed: \"{userId}\"')
+
+                queryParams.append(( 'id', userId ))
+
+        if len(queryParams) > self.__maxIdsPerRequest:
+            raise ValueError(f'more users than can be asked for from the Twitch API: \"{len(queryParams)}\"')
+
+        jsonResponse = await self.__get(
+            twitchAccessToken = twitchAccessToken,
+            url = f'{self.__helixBaseUrl}/users?{urllib.parse.urlencode(queryParams)}',
+            priority = HelixRequestPriority.LOOKUP
+        )
+
+        if self.__helixRecorder is not None:
+            self.__helixRecorder.record('users', [ f'{key}={value}' for key, value in queryParams ], jsonResponse.get('data'))
+
+        userIdentities: List[TwitchUserIdentity] = list()
+
+        for entry in jsonResponse.get('data', list()):
+            userIdentities.append(TwitchUserIdentity(
+                userId = utils.getStrFromDict(entry, 'id'),
+                userLogin = utils.getStrFromDict(entry, 'login'),
+                displayName = entry.get('display_name')
+            ))
+
+        return userIdentities
+
+    async def __get(
+        self,
+        twitchAccessToken: str,
+        url: str,
+        priority: HelixRequestPriority
+    ) -> Dict[str, Any]:
+        clientSession = await self.__networkClientProvider.get()
+        twitchClientId = await self.__twitchCredentialsProviderInterface.getTwitchClientId()
+
+        if self.__helixRateLimiter is not None:
+            await self.__helixRateLimiter.acquire(priority)
+
+        # The slot taken above has to be handed back however this ends, cancellation included
+        # (a poll cycle cancels its other fetchers as soon as one of them fails), otherwise the
+        # limiter keeps counting it as in flight, and takes it off of every budget from then on.
+        isResponseCounted = False
+
+        try:
+            try:
+                response = await clientSession.get(
+                    url = url,
+                    headers = {
+                        'Authorization': f'Bearer {twitchAccessToken}',
+                        'Client-Id': twitchClientId
+                    }
+                )
+            except GenericNetworkException as e:
+                self.__timber.log('TwitchHelixApiService', f'Encountered network error when fetching \"{url}\": {e}', e)
+                raise GenericNetworkException(f'TwitchHelixApiService encountered network error when fetching \"{url}\": {e}')
+
+            if self.__helixRateLimiter is not None:
+                self.__helixRateLimiter.onResponse(response.getStatusCode(), response.getHeaders())
+
+            isResponseCounted = True
+        finally:
+            if self.__helixRateLimiter is not None and not isResponseCounted:
+                self.__helixRateLimiter.release()
+
+        # closing the response is what hands a pooled connection back to the pool, so it's done
+        # however reading the response ends
+        try:
+            if response.getStatusCode() == 401:
+                raise TwitchTokenIsExpiredException(f'TwitchHelixApiService received 401 when fetching \"{url}\"')
+            elif response.getStatusCode() != 200:
+                self.__timber.log('TwitchHelixApiService', f'Encountered non-200 HTTP status code ({response.getStatusCode()}) when fetching \"{url}\"')
+                raise GenericNetworkException(f'TwitchHelixApiService encountered non-200 HTTP status code ({response.getStatusCode()}) when fetching \"{url}\"')
+
+            try:
+                jsonResponse: Optional[Dict[str, Any]] = await response.json()
+            except Exception as e:
+                # e.g. an HTML error page from a proxy, or a body that isn't valid JSON
+                self.__timber.log('TwitchHelixApiService', f'Encountered unparseable response when fetching \"{url}\": {e}', e)
+                raise GenericNetworkException(f'TwitchHelixApiService encountered unparseable response when fetching \"{url}\": {e}')
+        finally:
+            await response.close()
+
+        if not isinstance(jsonResponse, dict):
+            raise GenericNetworkException(f'TwitchHelixApiService received malformed JSON response when fetching \"{url}\": {jsonResponse}')
+
+        return jsonResponse
+
+    async def validateTokens(self, twitchAccessToken: str) -> Optional[datetime]:
+        async with self.__validationLock:
+            if self.__lastValidationTime is not None:
+                waitSeconds = self.__lastValidationTime + self.__validationSpacingSeconds - time.monotonic()
+
+                if waitSeconds > 0:
+                    await asyncio.sleep(waitSeconds)
+
+            try:
+                return await super().validateTokens(twitchAccessToken)
+            finally:
+                self.__lastValidationTime = time.monotonic()
@@ -1,45 +1,55 @@
 from typing import Dict, List, Optional
 
 import CynanBotCommon.utils as utils
+from bufferedTimber import BufferedTimber
 from CynanBotCommon.network.exceptions import GenericNetworkException
-from CynanBotCommon.timber.timber import Timber
 from CynanBotCommon.twitch.exceptions import TwitchTokenIsExpiredException
-from CynanBotCommon.twitch.twitchApiService import TwitchApiService
 from CynanBotCommon.twitch.twitchHandleProviderInterface import \
     TwitchHandleProviderInterface
 from CynanBotCommon.twitch.twitchLiveUserDetails import TwitchLiveUserDetails
 from CynanBotCommon.twitch.twitchStreamType import TwitchStreamType
 from CynanBotCommon.twitch.twitchTokensRepository import TwitchTokensRepository
+from twitchHelixApiService import TwitchHelixApiService
+from twitchUserIdsRepository import TwitchUserIdsRepository
 from user import User
+from usersRepository import UsersRepository
 
 
 class TwitchLiveHelper():
 
     def __init__(
         self,
-        timber: Timber,
-        twitchApiService: TwitchApiService,
+        timber: BufferedTimber,
         twitchHandleProviderInterface: TwitchHandleProviderInterface,
+        twitchHelixApiService: TwitchHelixApiService,
         twitchTokensRepository: TwitchTokensRepository,
+        twitchUserIdsRepository: TwitchUserIdsRepository,
+        usersRepository: UsersRepository,
         maxRetryCount: int = 3
     ):
-        if not isinstance(timber, Timber):
+        if not isinstance(timber, BufferedTimber):
             raise ValueError(f'timber argument is malformed: \"{timber}\"')
-        elif not isinstance(twitchApiService, TwitchApiService):
-            raise ValueError(f'twitchApiService argument is malformed: \"{twitchApiService}\"')
         elif not isinstance(twitchHandleProviderInterface, TwitchHandleProviderInterface):
             raise ValueError(f'botHandleProviderInterface argument is malformed: \"{twitchHandleProviderInterface}\"')
+        elif not isinstance(twitchHelixApiService, TwitchHelixApiService):
+            raise ValueError(f'twitchHelixApiService argument is malformed: \"{twitchHelixApiService}\"')
         elif not isinstance(twitchTokensRepository, TwitchTokensRepository):
             raise ValueError(f'twitchTokensRepository argument is malformed: \"{twitchTokensRepository}\"')
+        elif not isinstance(twitchUserIdsRepository, TwitchUserIdsRepository):
+            raise ValueError(f'twitchUserIdsRepository argument is malformed: \"{twitchUserIdsRepository}\"')
+        elif not isinstance(usersRepository, UsersRepository):
+            raise ValueError(f'usersRepository argument is malformed: \"{usersRepository}\"')
         elif not utils.isValidInt(maxRetryCount):
             raise ValueError(f'retryCount argument is malformed: \"{maxRetryCount}\"')
         elif maxRetryCount < 3 or maxRetryCount > 6:
             raise ValueError(f'maxRetryCount argument is out of bounds: {maxRetryCount}')
 
-        self.__timber: Timber = timber
-        self.__twitchApiService: TwitchApiService = twitchApiService
+        self.__timber: BufferedTimber = timber
         self.__twitchHandleProviderInterface: TwitchHandleProviderInterface = twitchHandleProviderInterface
+        self.__twitchHelixApiService: TwitchHelixApiService = twitchHelixApiService
         self.__twitchTokensRepository: TwitchTokensRepository = twitchTokensRepository
+        self.__twitchUserIdsRepository: TwitchUserIdsRepository = twitchUserIdsRepository
+        self.__usersRepository: UsersRepository = usersRepository
         self.__maxRetryCount: int = maxRetryCount
 
     async def fetchWhoIsLive(
@@ -55,7 +65,34 @@ class TwitchLiveHelper():
 
         userNames: List[str] = list()
         for user in users:
-            userNames.append(user.getTwitchName())
+            if user.hasTwitchName():
+                userNames.append(user.getTwitchName())
+
+        if not utils.hasItems(userNames):
+            return None
+
+        twitchUserIdEntries = await self.__twitchUserIdsRepository.fetchUserIds(userNames)
+        twitchUserIdsToUsers: Dict[str, List[User]] = dict()
+
+        for user in users:
+            if not user.hasTwitchName():
+                continue
+
+            twitchUserIdEntry = twitchUserIdEntries.get(user.getTwitchName().lower())
+
+            if twitchUserIdEntry is None:
+                self.__timber.log('TwitchLiveHelper', lambda user = user: f'Unable to resolve a Twitch user id for {user.getDiscordNameAndDiscriminator()} (ttv/{user.getTwitchName()})', sampleKey = 'fetchWhoIsLive:unresolvedTwitchUserId')
+                continue
+
+            await self.__healRenamedUser(user, twitchUserIdEntry.getTwitchLogin())
+
+            if twitchUserIdEntry.getTwitchUserId() not in twitchUserIdsToUsers:
+                twitchUserIdsToUsers[twitchUserIdEntry.getTwitchUserId()] = list()
+
+            twitchUserIdsToUsers[twitchUserIdEntry.getTwitchUserId()].append(user)
+
+        if not utils.hasItems(twitchUserIdsToUsers):
+            return None
 
         retryCount = 0
         liveUserDetails: Optional[List[TwitchLiveUserDetails]] = None
@@ -69,14 +106,14 @@ class TwitchLiveHelper():
             )
 
             try:
-                liveUserDetails = await self.__twitchApiService.fetchLiveUserDetails(
+                liveUserDetails = await self.__twitchHelixApiService.fetchLiveUserDetailsByUserIds(
                     twitchAccessToken = twitchAccessToken,
-                    userNames = userNames
+                    userIds = list(twitchUserIdsToUsers.keys())
                 )
             except GenericNetworkException as e:
-                self.__timber.log('TwitchLiveHelper', f'General network exception occurred (retryCount={retryCount}) when attempting to fetch live Twitch stream(s) for {len(users)} user(s): {e}', e)
+                self.__timber.log('TwitchLiveHelper', lambda retryCount = retryCount, e = e: f'General network exception occurred (retryCount={retryCount}) when attempting to fetch live Twitch stream(s) for {len(users)} user(s): {e}', e, sampleKey = 'fetchWhoIsLive:GenericNetworkException')
             except TwitchTokenIsExpiredException as e:
-                self.__timber.log('TwitchLiveHelper', f'Twitch token exception occurred (retryCount={retryCount}) when attempting to fetch live Twitch stream(s) for {len(users)} user(s): {e}', e)
+                self.__timber.log('TwitchLiveHelper', lambda retryCount = retryCount, e = e: f'Twitch token exception occurred (retryCount={retryCount}) when attempting to fetch live Twitch stream(s) for {len(users)} user(s): {e}', e, sampleKey = 'fetchWhoIsLive:TwitchTokenIsExpiredException')
 
                 await self.__twitchTokensRepository.validateAndRefreshAccessToken(
                     twitchHandle = twitchHandle
@@ -93,21 +130,34 @@ class TwitchLiveHelper():
             if liveUser.getStreamType() is not TwitchStreamType.LIVE:
                 continue
 
-            userLogin = liveUser.getUserLogin().lower()
-            userName = liveUser.getUserName().lower()
+            liveUsers = twitchUserIdsToUsers.get(liveUser.getUserId())
+            if not utils.hasItems(liveUsers):
+                continue
+
             whoIsLiveUserLogins.append(liveUser.getUserLogin())
 
-            for user in users:
-                twitchName = user.getTwitchName().lower()
+            # Streams are matched up by user id, so a login that differs from ours means this
+            # account was renamed since we last looked it up. Helix has already told us the new
+            # login, so healing it here costs no extra API calls.
+            await self.__twitchUserIdsRepository.onUserLoginObserved(
+                twitchUserId = liveUser.getUserId(),
+                twitchLogin = liveUser.getUserLogin()
+            )
 
-                # We check both userLogin and userName because some multi-language users
-                # could have very different names between userLogin and userName. For example,
-                # a Korean user may have a userName written using actual Korean characters,
-                # and then a userLogin written in English characters.
-                if userLogin == twitchName or userName == twitchName:
-                    whoIsLive[user] = liveUserDetails
+            for user in liveUsers:
+                await self.__healRenamedUser(user, liveUser.getUserLogin())
+                whoIsLive[user] = liveUser
 
-        whoIsLiveUserLoginsString = ', '.join(whoIsLiveUserLogins)
-        self.__timber.log('TwitchLiveHelper', f'{len(whoIsLive)} user(s) live on Twitch: {whoIsLiveUserLoginsString}')
+        # whoIsLive is handed back to (and modified by) the caller, so its size is captured now
+        liveCount = len(whoIsLive)
+        self.__timber.log('TwitchLiveHelper', lambda: f'{liveCount} user(s) live on Twitch: {", ".join(whoIsLiveUserLogins)}')
 
         return whoIsLive
+
+    async def __healRenamedUser(self, user: User, twitchLogin: str):
+        if user.getTwitchName().lower() == twitchLogin.lower():
+            return
+
+        self.__timber.log('TwitchLiveHelper', f'Healing renamed Twitch account for {user.getDiscordNameAndDiscriminator()}: ttv/{user.getTwitchName()} is now ttv/{twitchLogin}')
+        user.setTwitchName(twitchLogin.lower())
+        await self.__usersRepository.addOrUpdateUser(user)
@@ -1,11 +1,15 @@
-from datetime import timedelta
-from typing import Dict, List, Optional, Set
+import asyncio
+import math
+from asyncio import AbstractEventLoop
+from typing import (AsyncIterator, Dict, Iterable, Iterator, List, Optional,
+                    Set)
 
 import CynanBotCommon.utils as utils
+from announcedStreamsRepository import AnnouncedStreamsRepository
 from CynanBotCommon.simpleDateTime import SimpleDateTime
 from CynanBotCommon.twitch.twitchLiveUserDetails import TwitchLiveUserDetails
+from pollScheduler import PollScheduler
 from twitchAnnounceChannelsRepository import TwitchAnnounceChannelsRepository
-from twitchAnnounceSettingsRepository import TwitchAnnounceSettingsRepository
 from twitchLiveHelper import TwitchLiveHelper
 from user import User
 from usersRepository import UsersRepository
@@ -30,6 +34,21 @@ class TwitchLiveUserData():
         self.__twitchLiveDetails: TwitchLiveUserDetails = twitchLiveDetails
         self.__user: User = user
 
+    def getDiscordAnnounceText(self) -> str:
+        firstLineText = ''
+        if self.__twitchLiveDetails.hasGameName():
+            firstLineText = f'{self.__twitchLiveDetails.getUserLogin()} is now live with {self.__twitchLiveDetails.getGameName()}!'
+        else:
+            firstLineText = f'{self.__twitchLiveDetails.getUserLogin()} is now live!'
+
+        secondLineText = f' https://twitch.tv/{self.__twitchLiveDetails.getUserLogin()}'
+
+        thirdLineText = ''
+        if self.__twitchLiveDetails.hasTitle():
+            thirdLineText = f'\n> {self.__twitchLiveDetails.getTitle()}'
+
+        return f'{firstLineText}{secondLineText}{thirdLineText}'
+
     def getDiscordChannelIds(self) -> Set[int]:
         return self.__discordChannelIds
 
@@ -42,31 +61,122 @@ class TwitchLiveUserData():
 
 class TwitchLiveUsersRepository():
 
+    # Each poll cycle runs as a pipeline of stages joined by bounded queues: the roster is cut
+    # into Helix sized batches, up to helixConcurrency batches are checked against Helix at once,
+    # and each checked batch is deduplicated against the already announced streams and handed
+    # to the caller (see streamTwitchLiveUserData()) as soon as it's ready. Nobody has to wait for
+    # the whole roster to be checked before the first announcements go out, and because every
+    # queue holds at most maxBatchesInFlight batches, a slow consumer holds back the Helix calls
+    # instead of letting results pile up in memory.
+
     def __init__(
         self,
+        eventLoop: AbstractEventLoop,
+        announcedStreamsRepository: AnnouncedStreamsRepository,
         twitchAnnounceChannelsRepository: TwitchAnnounceChannelsRepository,
-        twitchAnnounceSettingsRepository: TwitchAnnounceSettingsRepository,
         twitchLiveHelper: TwitchLiveHelper,
-        usersRepository: UsersRepository
+        usersRepository: UsersRepository,
+        pollScheduler: Optional[PollScheduler] = None,
+        helixBatchSize: int = 100,
+        helixConcurrency: int = 2,
+        maxBatchesInFlight: int = 4
     ):
-        if not isinstance(twitchAnnounceChannelsRepository, TwitchAnnounceChannelsRepository):
+        if not isinstance(eventLoop, AbstractEventLoop):
+            raise ValueError(f'eventLoop argument is malformed: \"{eventLoop}\"')
+        elif not isinstance(announcedStreamsRepository, AnnouncedStreamsRepository):
+            raise ValueError(f'announcedStreamsRepository argument is malformed: \"{announcedStreamsRepository}\"')
+        elif not isinstance(twitchAnnounceChannelsRepository, TwitchAnnounceChannelsRepository):
             raise ValueError(f'twitchAnnounceChannelsRepository argument is malformed: \"{twitchAnnounceChannelsRepository}\"')
-        elif not isinstance(twitchAnnounceSettingsRepository, TwitchAnnounceSettingsRepository):
-            raise ValueError(f'twitchAnnounceSettingsRepository argument is malformed: \"{twitchAnnounceSettingsRepository}\"')
         elif not isinstance(twitchLiveHelper, TwitchLiveHelper):
             raise ValueError(f'twitchLiveHelper argument is malformed: \"{twitchLiveHelper}\"')
         elif not isinstance(usersRepository, UsersRepository):
             raise ValueError(f'usersRepository argument is malformed: \"{usersRepository}\"')
+        elif pollScheduler is not None and not isinstance(pollScheduler, PollScheduler):
+            raise ValueError(f'pollScheduler argument is malformed: \"{pollScheduler}\"')
+        elif not utils.isValidInt(helixBatchSize):
+            raise ValueError(f'helixBatchSize argument is malformed: \"{helixBatchSize}\"')
+        elif helixBatchSize < 1 or helixBatchSize > 100:
+            raise ValueError(f'helixBatchSize argument is out of bounds: {helixBatchSize}')
+        elif not utils.isValidInt(helixConcurrency):
+            raise ValueError(f'helixConcurrency argument is malformed: \"{helixConcurrency}\"')
+        elif helixConcurrency < 1 or helixConcurrency > 16:
+            raise ValueError(f'helixConcurrency argument is out of bounds: {helixConcurrency}')
+        elif not utils.isValidInt(maxBatchesInFlight):
+            raise ValueError(f'maxBatchesInFlight argument is malformed: \"{maxBatchesInFlight}\"')
+        elif maxBatchesInFlight < 1:
+            raise ValueError(f'maxBatchesInFlight argument is out of bounds: {maxBatchesInFlight}')
 
+        self.__eventLoop: AbstractEventLoop = eventLoop
+        self.__announcedStreamsRepository: AnnouncedStreamsRepository = announcedStreamsRepository
         self.__twitchAnnounceChannelsRepository: TwitchAnnounceChannelsRepository = twitchAnnounceChannelsRepository
-        self.__twitchAnnounceSettingsRepository: TwitchAnnounceSettingsRepository = twitchAnnounceSettingsRepository
         self.__twitchLiveHelper: TwitchLiveHelper = twitchLiveHelper
         self.__usersRepository: UsersRepository = usersRepository
+        self.__pollScheduler: Optional[PollScheduler] = pollScheduler
+        self.__helixBatchSize: int = helixBatchSize
+        self.__helixConcurrency: int = helixConcurrency
+        self.__maxBatchesInFlight: int = maxBatchesInFlight
+
+    def __batchUsers(self, users: List[User]) -> Iterator[List[User]]:
+        for index in range(0, len(users), self.__helixBatchSize):
+            yield users[index:index + self.__helixBatchSize]
+
+    async def __fetchBatches(
+        self,
+        batchQueue: asyncio.Queue,
+        resultQueue: asyncio.Queue
+    ):
+        while True:
+            batch: Optional[List[User]] = await batchQueue.get()
+
+            if batch is None:
+                await resultQueue.put(None)
+                return
+
+            batchWhoIsLive: Optional[Dict[User, TwitchLiveUserDetails]] = None
+
+            try:
+                batchWhoIsLive = await self.__twitchLiveHelper.fetchWhoIsLive(batch)
+            except (RuntimeError, ValueError):
+                # None is also what fetchWhoIsLive() returns when nobody is live, so a failed
+                # batch is flagged as such, to keep its users from being counted as polled
+                await resultQueue.put((batch, None, False))
+                continue
+            except Exception as e:
+                # handed to the consumer to be raised there, just like it would've been before
+                # the cycle was split up into stages
+                await resultQueue.put(e)
+                return
+
+            await resultQueue.put((batch, batchWhoIsLive, True))
 
     async def fetchTwitchLiveUserData(self) -> Optional[List[TwitchLiveUserData]]:
+        twitchLiveUserDataList: List[TwitchLiveUserData] = list()
+
+        async for twitchLiveUserData in self.streamTwitchLiveUserData():
+            twitchLiveUserDataList.append(twitchLiveUserData)
+
+        if not utils.hasItems(twitchLiveUserDataList):
+            return None
+
+        twitchLiveUserDataList.sort(key = lambda entry: entry.getTwitchLiveDetails().getUserLogin().lower())
+        return twitchLiveUserDataList
+
+    async def __queueBatches(
+        self,
+        batches: Iterable[List[User]],
+        batchQueue: asyncio.Queue,
+        fetcherCount: int
+    ):
+        for batch in batches:
+            await batchQueue.put(batch)
+
+        for _ in range(fetcherCount):
+            await batchQueue.put(None)
+
+    async def streamTwitchLiveUserData(self) -> AsyncIterator[TwitchLiveUserData]:
         twitchAnnounceChannels = await self.__twitchAnnounceChannelsRepository.fetchTwitchAnnounceChannels()
         if not utils.hasItems(twitchAnnounceChannels):
-            return None
+            return
 
         now = SimpleDateTime()
         userIdsToChannels: Dict[str, Set[int]] = dict()
@@ -84,46 +194,149 @@ class TwitchLiveUsersRepository():
                     userIdsToChannels[user.getDiscordId()].add(twitchAnnounceChannel.getDiscordChannelId())
 
         if not utils.hasItems(userIdsToChannels) or not utils.hasItems(userIdsToUsers):
-            return None
+            return
+
+        users: List[User] = list(userIdsToUsers.values())
+
+        # Without a PollScheduler, every user is checked on every cycle. With one, only the users
+        # that are due on this tick get checked (see PollScheduler for how that's decided).
+        batches: Iterable[List[User]] = None
+        batchCount = 0
+        if self.__pollScheduler is None:
+            batches = self.__batchUsers(users)
+            batchCount = math.ceil(len(users) / self.__helixBatchSize)
+        else:
+            batches = await self.__pollScheduler.selectBatches(users)
+            batchCount = len(batches)
 
-        users: List[User] = list()
-        for user in userIdsToUsers.values():
-            users.append(user)
+        if batchCount < 1:
+            return
+
+        batchQueue: asyncio.Queue = asyncio.Queue(maxsize = self.__maxBatchesInFlight)
+        resultQueue: asyncio.Queue = asyncio.Queue(maxsize = self.__maxBatchesInFlight)
+        fetcherCount = min(self.__helixConcurrency, batchCount)
+
+        tasks: List[asyncio.Task] = [ self.__eventLoop.create_task(self.__queueBatches(batches, batchQueue, fetcherCount)) ]
+        for _ in range(fetcherCount):
+            tasks.append(self.__eventLoop.create_task(self.__fetchBatches(batchQueue, resultQueue)))
+
+        polledUsers: List[User] = list()
+        detectedUsers: List[User] = list()
+
+        # streams that were announced for the first time during this cycle, which are still new
+        # to any later batch that has another user on the same stream
+        newStreamIds: Set[str] = set()
+
+        # streams that were marked as announced during this cycle, but that haven't been handed
+        # to the caller yet, which have to be unmarked again if they never are (e.g. their user
+        # was removed or renamed meanwhile, or the caller stopped early), or nobody would ever
+        # hear about them
+        unyieldedStreamIds: Set[str] = set()
+        runningFetcherCount = fetcherCount
 
-        whoIsLive: Optional[Dict[User, TwitchLiveUserDetails]] = None
         try:
-            whoIsLive = await self.__twitchLiveHelper.fetchWhoIsLive(users)
-        except (RuntimeError, ValueError):
-            return None
+            while runningFetcherCount >= 1:
+                result = await resultQueue.get()
 
-        if not utils.hasItems(whoIsLive):
-            return None
+                if result is None:
+                    runningFetcherCount = runningFetcherCount - 1
+                    continue
+                elif isinstance(result, Exception):
+                    raise result
 
-        twitchAnnounceSettings = await self.__twitchAnnounceSettingsRepository.getAllAsync()
-        announceTimeDelta = timedelta(minutes = twitchAnnounceSettings.getAnnounceFalloffMinutes())
-        removeTheseUsers: List[User] = list()
+                batch, batchWhoIsLive, wasPolled = result
 
-        for user in whoIsLive:
-            if user.hasMostRecentStreamDateTime() and user.getMostRecentStreamDateTime() + announceTimeDelta >= now:
-                removeTheseUsers.append(user)
+                # users in a failed batch stay overdue, so they're retried on the next tick
+                if not wasPolled:
+                    continue
 
-            user.setMostRecentStreamDateTime(now)
-            await self.__usersRepository.addOrUpdateUser(user)
+                polledUsers.extend(batch)
 
-        if utils.hasItems(removeTheseUsers):
-            for removeThisUser in removeTheseUsers:
-                del whoIsLive[removeThisUser]
+                if not utils.hasItems(batchWhoIsLive):
+                    continue
 
-        if not utils.hasItems(whoIsLive):
-            return None
+                streamIds = set(twitchLiveDetails.getStreamId() for twitchLiveDetails in batchWhoIsLive.values()) - newStreamIds
 
-        twitchLiveUserDataList: List[TwitchLiveUserData] = list()
-        for user, twitchLiveDetails in whoIsLive.items():
-            twitchLiveUserDataList.append(TwitchLiveUserData(
-                discordChannelIds = userIdsToChannels[user.getDiscordId()],
-                twitchLiveDetails = twitchLiveDetails,
-                user = user
-            ))
+                if utils.hasItems(streamIds):
+                    markedStreamIds = await self.__announcedStreamsRepository.markStreamsAnnounced(
+                        streamIds = list(streamIds)
+                    )
 
-        twitchLiveUserDataList.sort(key = lambda entry: entry.getTwitchLiveDetails().getUserLogin().lower())
-        return twitchLiveUserDataList
+                    newStreamIds.update(markedStreamIds)
+                    unyieldedStreamIds.update(markedStreamIds)
+
+                newlyLiveUsers: Dict[User, TwitchLiveUserDetails] = dict()
+
+                for user, twitchLiveDetails in batchWhoIsLive.items():
+                    if twitchLiveDetails.getStreamId() in newStreamIds:
+                        newlyLiveUsers[user] = twitchLiveDetails
+
+                if not utils.hasItems(newlyLiveUsers):
+                    continue
+
+                # The roster this cycle started from can be out of date by now, so the stored
+                # users are looked up again (in one query, by Twitch name) before anything gets
+                # written back. A user that was removed meanwhile, or that changed their Twitch
+                # name, is left out rather than written back as it was.
+                storedUsers = await self.__usersRepository.getUsersByTwitchNames(
+                    twitchNames = [ user.getTwitchName() for user in newlyLiveUsers ]
+                )
+
+                userIdsToStoredUsers: Dict[str, User] = dict()
+                for storedUser in storedUsers:
+                    userIdsToStoredUsers[storedUser.getDiscordId()] = storedUser
+
+                batchTwitchLiveUserData: List[TwitchLiveUserData] = list()
+                usersToWrite: List[User] = list()
+
+                for user, twitchLiveDetails in newlyLiveUsers.items():
+                    storedUser = userIdsToStoredUsers.get(user.getDiscordId())
+
+                    if storedUser is None or storedUser.getTwitchName().lower() != user.getTwitchName().lower():
+                        continue
+
+                    detectedUsers.append(user)
+
+                    # only streams being announced for the first time are written back
+                    user.setMostRecentStreamDateTime(now)
+                    storedUser.setMostRecentStreamDateTime(now)
+                    usersToWrite.append(storedUser)
+
+                    batchTwitchLiveUserData.append(TwitchLiveUserData(
+                        discordChannelIds = userIdsToChannels[user.getDiscordId()],
+                        twitchLiveDetails = twitchLiveDetails,
+                        user = storedUser
+                    ))
+
+                # one bulk upsert for the whole batch, rather than one write per user
+                if utils.hasItems(usersToWrite):
+                    await self.__usersRepository.addOrUpdateUsers(usersToWrite)
+
+                batchTwitchLiveUserData.sort(key = lambda entry: entry.getTwitchLiveDetails().getUserLogin().lower())
+
+                for twitchLiveUserData in batchTwitchLiveUserData:
+                    unyieldedStreamIds.discard(twitchLiveUserData.getTwitchLiveDetails().getStreamId())
+                    yield twitchLiveUserData
+        finally:
+            # only does anything if the consumer stopped early, or something went wrong
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+            if self.__pollScheduler is not None:
+                self.__pollScheduler.onPolled(polledUsers, detectedUsers)
+
+            if utils.hasItems(unyieldedStreamIds):
+                await self.__announcedStreamsRepository.unmarkStreamsAnnounced(
+                    streamIds = list(unyieldedStreamIds)
+                )
+
+    async def unmarkAnnounced(self, twitchLiveUserData: TwitchLiveUserData):
+        if not isinstance(twitchLiveUserData, TwitchLiveUserData):
+            raise ValueError(f'twitchLiveUserData argument is malformed: \"{twitchLiveUserData}\"')
+
+        # for announcements that couldn't be delivered to any channel at all, so that the stream
+        # counts as new again, and is announced on the next poll cycle that sees it
+        await self.__announcedStreamsRepository.unmarkStreamsAnnounced(
+            streamIds = [ twitchLiveUserData.getTwitchLiveDetails().getStreamId() ]
+        )
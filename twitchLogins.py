@@ -0,0 +1,10 @@
+import re
+from typing import Optional, Pattern
+
+# Twitch logins are 1 to 25 letters, digits, or underscores. Anything else can't be a real
+# account, and mustn't ever end up in a Helix query.
+twitchLoginPattern: Pattern = re.compile(r'[a-zA-Z0-9_]{1,25}')
+
+
+def isValidTwitchLogin(twitchLogin: Optional[str]) -> bool:
+    return isinstance(twitchLogin, str) and twitchLoginPattern.fullmatch(twitchLogin) is not None
@@ -0,0 +1,377 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import CynanBotCommon.utils as utils
+from bufferedTimber import BufferedTimber
+from CynanBotCommon.network.exceptions import GenericNetworkException
+from CynanBotCommon.storage.backingDatabase import BackingDatabase
+from CynanBotCommon.storage.databaseConnection import DatabaseConnection
+from CynanBotCommon.twitch.exceptions import TwitchTokenIsExpiredException
+from CynanBotCommon.twitch.twitchHandleProviderInterface import \
+    TwitchHandleProviderInterface
+from CynanBotCommon.twitch.twitchTokensRepository import TwitchTokensRepository
+from databaseSchemaRegistry import DatabaseSchemaRegistry
+from twitchHelixApiService import TwitchHelixApiService, TwitchUserIdentity
+from twitchLogins import isValidTwitchLogin
+
+
+class TwitchUserIdEntry():
+
+    def __init__(
+        self,
+        twitchLogin: str,
+        twitchUserId: str,
+        updatedAt: datetime
+    ):
+        if not utils.isValidStr(twitchLogin):
+            raise ValueError(f'twitchLogin argument is malformed: \"{twitchLogin}\"')
+        elif not utils.isValidStr(twitchUserId):
+            raise ValueError(f'twitchUserId argument is malformed: \"{twitchUserId}\"')
+        elif not isinstance(updatedAt, datetime):
+            raise ValueError(f'updatedAt argument is malformed: \"{updatedAt}\"')
+
+        self.__twitchLogin: str = twitchLogin.lower()
+        self.__twitchUserId: str = twitchUserId
+        self.__updatedAt: datetime = updatedAt
+
+    def getTwitchLogin(self) -> str:
+        return self.__twitchLogin
+
+    def getTwitchUserId(self) -> str:
+        return self.__twitchUserId
+
+    def getUpdatedAt(self) -> datetime:
+        return self.__updatedAt
+
+    def isExpired(self, now: datetime, timeToLive: timedelta) -> bool:
+        return self.__updatedAt + timeToLive < now
+
+
+class TwitchUserIdsRepository():
+
+    # Maps Twitch logins (which can change whenever a streamer renames their account) onto Twitch
+    # user ids (which never change). Entries are persisted to the database and kept in memory.
+    # Missing entries are looked up by login, and expired entries are refreshed by user id, both
+    # in batches of up to 100 per Helix call. Refreshing by user id is what lets renamed accounts
+    # heal themselves: the old login simply gets swapped out for whatever Helix reports now.
+
+    def __init__(
+        self,
+        backingDatabase: BackingDatabase,
+        databaseSchemaRegistry: DatabaseSchemaRegistry,
+        timber: BufferedTimber,
+        twitchHandleProviderInterface: TwitchHandleProviderInterface,
+        twitchHelixApiService: TwitchHelixApiService,
+        twitchTokensRepository: TwitchTokensRepository,
+        timeToLive: timedelta = timedelta(days = 7),
+        unknownLoginTimeToLive: timedelta = timedelta(hours = 1),
+        maxLookupsPerRequest: int = 100
+    ):
+        if not isinstance(backingDatabase, BackingDatabase):
+            raise ValueError(f'backingDatabase argument is malformed: \"{backingDatabase}\"')
+        elif not isinstance(databaseSchemaRegistry, DatabaseSchemaRegistry):
+            raise ValueError(f'databaseSchemaRegistry argument is malformed: \"{databaseSchemaRegistry}\"')
+        elif not isinstance(timber, BufferedTimber):
+            raise ValueError(f'timber argument is malformed: \"{timber}\"')
+        elif not isinstance(twitchHandleProviderInterface, TwitchHandleProviderInterface):
+            raise ValueError(f'twitchHandleProviderInterface argument is malformed: \"{twitchHandleProviderInterface}\"')
+        elif not isinstance(twitchHelixApiService, TwitchHelixApiService):
+            raise ValueError(f'twitchHelixApiService argument is malformed: \"{twitchHelixApiService}\"')
+        elif not isinstance(twitchTokensRepository, TwitchTokensRepository):
+            raise ValueError(f'twitchTokensRepository argument is malformed: \"{twitchTokensRepository}\"')
+        elif not isinstance(timeToLive, timedelta):
+            raise ValueError(f'timeToLive argument is malformed: \"{timeToLive}\"')
+        elif not isinstance(unknownLoginTimeToLive, timedelta):
+            raise ValueError(f'unknownLoginTimeToLive argument is malformed: \"{unknownLoginTimeToLive}\"')
+        elif not utils.isValidInt(maxLookupsPerRequest):
+            raise ValueError(f'maxLookupsPerRequest argument is malformed: \"{maxLookupsPerRequest}\"')
+        elif maxLookupsPerRequest < 1 or maxLookupsPerRequest > 100:
+            raise ValueError(f'maxLookupsPerRequest argument is out of bounds: {maxLookupsPerRequest}')
+
+        self.__backingDatabase: BackingDatabase = backingDatabase
+        self.__databaseSchemaRegistry: DatabaseSchemaRegistry = databaseSchemaRegistry
+        self.__timber: BufferedTimber = timber
+        self.__twitchHandleProviderInterface: TwitchHandleProviderInterface = twitchHandleProviderInterface
+        self.__twitchHelixApiService: TwitchHelixApiService = twitchHelixApiService
+        self.__twitchTokensRepository: TwitchTokensRepository = twitchTokensRepository
+        self.__timeToLive: timedelta = timeToLive
+        self.__unknownLoginTimeToLive: timedelta = unknownLoginTimeToLive
+        self.__maxLookupsPerRequest: int = maxLookupsPerRequest
+
+        self.__isDatabaseReady: bool = False
+        self.__loadLock: asyncio.Lock = asyncio.Lock()
+        self.__loginsToEntries: Optional[Dict[str, TwitchUserIdEntry]] = None
+        self.__userIdsToEntries: Dict[str, TwitchUserIdEntry] = dict()
+        self.__unknownLogins: Dict[str, datetime] = dict()
+
+    async def clearCaches(self):
+        self.__loginsToEntries = None
+        self.__userIdsToEntries = dict()
+        self.__unknownLogins = dict()
+
+    async def fetchUserId(self, twitchLogin: str) -> Optional[TwitchUserIdEntry]:
+        if not utils.isValidStr(twitchLogin):
+            raise ValueError(f'twitchLogin argument is malformed: \"{twitchLogin}\"')
+
+        # Unlike fetchUserIds(), network and token failures are raised to the caller here, so
+        # that "this account doesn't exist" can be told apart from "Twitch couldn't be reached".
+        twitchLogin = twitchLogin.lower()
+
+        if not isValidTwitchLogin(twitchLogin):
+            return None
+
+        loginsToEntries = await self.__getLoginsToEntries()
+        entry = loginsToEntries.get(twitchLogin)
+
+        if entry is not None and not entry.isExpired(datetime.now(timezone.utc), self.__timeToLive):
+            return entry
+
+        twitchAccessToken = await self.__requireAccessToken()
+        userIdentities = await self.__twitchHelixApiService.fetchUserIdentities(
+            twitchAccessToken = twitchAccessToken,
+            userLogins = [ twitchLogin ]
+        )
+
+        await self.__saveUserIdentities(userIdentities)
+        entry = loginsToEntries.get(twitchLogin)
+
+        if entry is None:
+            self.__unknownLogins[twitchLogin] = datetime.now(timezone.utc)
+        else:
+            self.__unknownLogins.pop(twitchLogin, None)
+
+        return entry
+
+    async def fetchUserIds(self, twitchLogins: List[str]) -> Dict[str, TwitchUserIdEntry]:
+        if not utils.hasItems(twitchLogins):
+            raise ValueError(f'twitchLogins argument is malformed: \"{twitchLogins}\"')
+
+        # The returned dictionary is keyed by the given logins (lowercased). If an account has
+        # been renamed, its entry's login will differ from the key it's stored under.
+
+        loginsToEntries = await self.__getLoginsToEntries()
+        now = datetime.now(timezone.utc)
+        missingLogins: List[str] = list()
+        expiredUserIds: List[str] = list()
+        requestedLoginsToUserIds: Dict[str, str] = dict()
+
+        for twitchLogin in twitchLogins:
+            twitchLogin = twitchLogin.lower()
+            entry = loginsToEntries.get(twitchLogin)
+
+            if entry is not None:
+                requestedLoginsToUserIds[twitchLogin] = entry.getTwitchUserId()
+
+                if entry.isExpired(now, self.__timeToLive) and entry.getTwitchUserId() not in expiredUserIds:
+                    expiredUserIds.append(entry.getTwitchUserId())
+            elif twitchLogin not in missingLogins and isValidTwitchLogin(twitchLogin):
+                unknownSince = self.__unknownLogins.get(twitchLogin)
+
+                if unknownSince is None or unknownSince + self.__unknownLoginTimeToLive < now:
+                    missingLogins.append(twitchLogin)
+
+        if utils.hasItems(missingLogins) or utils.hasItems(expiredUserIds):
+            try:
+                await self.__lookUp(missingLogins, expiredUserIds, now)
+            except (GenericNetworkException, TwitchTokenIsExpiredException) as e:
+                # stale entries are still perfectly usable, user ids never change
+                self.__timber.log('TwitchUserIdsRepository', lambda e = e: f'Unable to look up {len(missingLogins)} missing and {len(expiredUserIds)} expired Twitch user id(s): {e}', e, sampleKey = 'fetchUserIds:lookUp')
+
+        results: Dict[str, TwitchUserIdEntry] = dict()
+
+        for twitchLogin in twitchLogins:
+            twitchLogin = twitchLogin.lower()
+            entry = loginsToEntries.get(twitchLogin)
+
+            if entry is None and twitchLogin in requestedLoginsToUserIds:
+                entry = self.__userIdsToEntries.get(requestedLoginsToUserIds[twitchLogin])
+
+            if entry is not None:
+                results[twitchLogin] = entry
+
+        return results
+
+    async def __getDatabaseConnection(self) -> DatabaseConnection:
+        await self.__initDatabaseTable()
+        return await self.__backingDatabase.getConnection()
+
+    async def __getLoginsToEntries(self) -> Dict[str, TwitchUserIdEntry]:
+        if self.__loginsToEntries is not None:
+            return self.__loginsToEntries
+
+        async with self.__loadLock:
+            if self.__loginsToEntries is not None:
+                return self.__loginsToEntries
+
+            connection = await self.__getDatabaseConnection()
+            rows = await connection.fetchRows('SELECT twitchlogin, twitchuserid, updatedat FROM twitchuserids')
+            await connection.close()
+
+            loginsToEntries: Dict[str, TwitchUserIdEntry] = dict()
+            userIdsToEntries: Dict[str, TwitchUserIdEntry] = dict()
+
+            if utils.hasItems(rows):
+                for row in rows:
+                    updatedAt = utils.getDateTimeFromStr(row[2])
+                    if updatedAt is None:
+                        updatedAt = datetime.fromtimestamp(0, timezone.utc)
+
+                    entry = TwitchUserIdEntry(
+                        twitchLogin = row[0],
+                        twitchUserId = row[1],
+                        updatedAt = updatedAt
+                    )
+
+                    loginsToEntries[entry.getTwitchLogin()] = entry
+                    userIdsToEntries[entry.getTwitchUserId()] = entry
+
+            self.__userIdsToEntries = userIdsToEntries
+            self.__loginsToEntries = loginsToEntries
+            return loginsToEntries
+
+    async def initDatabaseTable(self):
+        await self.__initDatabaseTable()
+
+    async def __initDatabaseTable(self):
+        if self.__isDatabaseReady:
+            return
+
+        await self.__databaseSchemaRegistry.createTableIfNotExists(
+            tableName = 'twitchuserids',
+            psqlStatement = '''
+                CREATE TABLE IF NOT EXISTS twitchuserids (
+                    twitchuserid public.citext NOT NULL PRIMARY KEY,
+                    twitchlogin public.citext NOT NULL,
+                    updatedat text NOT NULL
+                )
+            ''',
+            sqliteStatement = '''
+                CREATE TABLE IF NOT EXISTS twitchuserids (
+                    twitchuserid TEXT NOT NULL PRIMARY KEY COLLATE NOCASE,
+                    twitchlogin TEXT NOT NULL COLLATE NOCASE,
+                    updatedat TEXT NOT NULL
+                )
+            '''
+        )
+
+        self.__isDatabaseReady = True
+
+    async def __lookUp(
+        self,
+        missingLogins: List[str],
+        expiredUserIds: List[str],
+        now: datetime
+    ):
+        twitchAccessToken = await self.__requireAccessToken()
+        userIdentities: List[TwitchUserIdentity] = list()
+
+        for index in range(0, len(expiredUserIds), self.__maxLookupsPerRequest):
+            userIdentities.extend(await self.__twitchHelixApiService.fetchUserIdentities(
+                twitchAccessToken = twitchAccessToken,
+                userIds = expiredUserIds[index:index + self.__maxLookupsPerRequest]
+            ))
+
+        for index in range(0, len(missingLogins), self.__maxLookupsPerRequest):
+            userIdentities.extend(await self.__twitchHelixApiService.fetchUserIdentities(
+                twitchAccessToken = twitchAccessToken,
+                userLogins = missingLogins[index:index + self.__maxLookupsPerRequest]
+            ))
+
+        await self.__saveUserIdentities(userIdentities)
+
+        foundLogins = set(userIdentity.getUserLogin().lower() for userIdentity in userIdentities)
+
+        for missingLogin in missingLogins:
+            if missingLogin not in foundLogins:
+                self.__unknownLogins[missingLogin] = now
+
+        self.__timber.log('TwitchUserIdsRepository', lambda: f'Looked up {len(missingLogins)} missing and {len(expiredUserIds)} expired Twitch user id(s), {len(userIdentities)} found')
+
+    async def onUserLoginObserved(self, twitchUserId: str, twitchLogin: str) -> Optional[str]:
+        if not utils.isValidStr(twitchUserId):
+            raise ValueError(f'twitchUserId argument is malformed: \"{twitchUserId}\"')
+        elif not utils.isValidStr(twitchLogin):
+            raise ValueError(f'twitchLogin argument is malformed: \"{twitchLogin}\"')
+
+        # Called with the login that Helix reported alongside a known user id (e.g. as part of a
+        # live stream), so renames get picked up for free. Returns the previous login if this
+        # turns out to be a rename, otherwise None.
+
+        await self.__getLoginsToEntries()
+        entry = self.__userIdsToEntries.get(twitchUserId)
+
+        if entry is None or entry.getTwitchLogin() == twitchLogin.lower():
+            return None
+
+        await self.__saveUserIdentities([ TwitchUserIdentity(
+            userId = twitchUserId,
+            userLogin = twitchLogin
+        ) ])
+
+        return entry.getTwitchLogin()
+
+    async def __requireAccessToken(self) -> str:
+        twitchHandle = await self.__twitchHandleProviderInterface.getTwitchHandle()
+
+        try:
+            return await self.__twitchTokensRepository.requireAccessToken(
+                twitchHandle = twitchHandle
+            )
+        except TwitchTokenIsExpiredException:
+            await self.__twitchTokensRepository.validateAndRefreshAccessToken(
+                twitchHandle = twitchHandle
+            )
+
+            raise
+
+    async def __saveUserIdentities(self, userIdentities: List[TwitchUserIdentity]):
+        if not utils.hasItems(userIdentities):
+            return
+
+        loginsToEntries = await self.__getLoginsToEntries()
+        now = datetime.now(timezone.utc)
+        connection = await self.__getDatabaseConnection()
+
+        for userIdentity in userIdentities:
+            entry = TwitchUserIdEntry(
+                twitchLogin = userIdentity.getUserLogin(),
+                twitchUserId = userIdentity.getUserId(),
+                updatedAt = now
+            )
+
+            previousEntry = self.__userIdsToEntries.get(entry.getTwitchUserId())
+            if previousEntry is not None and previousEntry.getTwitchLogin() != entry.getTwitchLogin():
+                loginsToEntries.pop(previousEntry.getTwitchLogin(), None)
+                self.__timber.log('TwitchUserIdsRepository', f'Twitch user {entry.getTwitchUserId()} has been renamed from \"{previousEntry.getTwitchLogin()}\" to \"{entry.getTwitchLogin()}\"')
+
+            # A login can be released by one account and then claimed by another, in which case
+            # the older mapping is no longer correct.
+            staleEntry = loginsToEntries.get(entry.getTwitchLogin())
+            if staleEntry is not None and staleEntry.getTwitchUserId() != entry.getTwitchUserId():
+                self.__userIdsToEntries.pop(staleEntry.getTwitchUserId(), None)
+
+                await connection.execute(
+                    '''
+                        DELETE FROM twitchuserids
+                        WHERE twitchuserid = $1
+                    ''',
+                    staleEntry.getTwitchUserId()
+                )
+
+            await connection.execute(
+                '''
+                    INSERT INTO twitchuserids (twitchuserid, twitchlogin, updatedat)
+                    VALUES ($1, $2, $3)
+                    ON CONFLICT (twitchuserid) DO UPDATE SET twitchlogin = EXCLUDED.twitchlogin, updatedat = EXCLUDED.updatedat
+                ''',
+                entry.getTwitchUserId(), entry.getTwitchLogin(), entry.getUpdatedAt().isoformat()
+            )
+
+            loginsToEntries[entry.getTwitchLogin()] = entry
+            self.__userIdsToEntries[entry.getTwitchUserId()] = entry
+
+        await connection.close()
+
+    async def warmUp(self):
+        await self.__getLoginsToEntries()
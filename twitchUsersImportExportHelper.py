@@ -0,0 +1,338 @@
+import csv
+import io
+import json
+import time
+import urllib
+from typing import (Any, Awaitable, Callable, Dict, List, Optional, Set,
+                    Tuple)
+
+import CynanBotCommon.utils as utils
+from bufferedTimber import BufferedTimber
+from twitchAnnounceChannelsRepository import TwitchAnnounceChannelsRepository
+from twitchLogins import isValidTwitchLogin
+from twitchUserIdsRepository import TwitchUserIdsRepository
+from user import User
+
+
+class TwitchUsersImportFailure():
+
+    def __init__(self, rowNumber: int, reason: str):
+        if not utils.isValidInt(rowNumber):
+            raise ValueError(f'rowNumber argument is malformed: \"{rowNumber}\"')
+        elif not utils.isValidStr(reason):
+            raise ValueError(f'reason argument is malformed: \"{reason}\"')
+
+        self.__rowNumber: int = rowNumber
+        self.__reason: str = reason
+
+    def getReason(self) -> str:
+        return self.__reason
+
+    def getRowNumber(self) -> int:
+        return self.__rowNumber
+
+    def toStr(self) -> str:
+        return f'row {self.__rowNumber}: {self.__reason}'
+
+
+class TwitchUsersImportResult():
+
+    def __init__(
+        self,
+        rowCount: int,
+        elapsedSeconds: float,
+        failures: List[TwitchUsersImportFailure],
+        importedUsers: List[User]
+    ):
+        if not utils.isValidInt(rowCount):
+            raise ValueError(f'rowCount argument is malformed: \"{rowCount}\"')
+        elif not utils.isValidNum(elapsedSeconds):
+            raise ValueError(f'elapsedSeconds argument is malformed: \"{elapsedSeconds}\"')
+        elif failures is None:
+            raise ValueError(f'failures argument is malformed: \"{failures}\"')
+        elif importedUsers is None:
+            raise ValueError(f'importedUsers argument is malformed: \"{importedUsers}\"')
+
+        self.__rowCount: int = rowCount
+        self.__elapsedSeconds: float = elapsedSeconds
+        self.__failures: List[TwitchUsersImportFailure] = failures
+        self.__importedUsers: List[User] = importedUsers
+
+    def getElapsedSeconds(self) -> float:
+        return self.__elapsedSeconds
+
+    def getFailures(self) -> List[TwitchUsersImportFailure]:
+        return self.__failures
+
+    def getImportedUsers(self) -> List[User]:
+        return self.__importedUsers
+
+    def getRowCount(self) -> int:
+        return self.__rowCount
+
+    def hasFailures(self) -> bool:
+        return utils.hasItems(self.__failures)
+
+
+class TwitchUsersImportExportHelper():
+
+    # Import and export of an entire channel's Twitch announce roster, as either CSV or JSON.
+    # Both formats use the same four fields: discordId, discordName, discordDiscriminator and
+    # twitchName. Only discordId and twitchName are required upon import, the Discord name and
+    # discriminator are looked up from the guild's members (all at once) when they're left out.
+
+    def __init__(
+        self,
+        timber: BufferedTimber,
+        twitchAnnounceChannelsRepository: TwitchAnnounceChannelsRepository,
+        twitchUserIdsRepository: TwitchUserIdsRepository,
+        maxRows: int = 10000,
+        exportPageSize: int = 100
+    ):
+        if not isinstance(timber, BufferedTimber):
+            raise ValueError(f'timber argument is malformed: \"{timber}\"')
+        elif not isinstance(twitchAnnounceChannelsRepository, TwitchAnnounceChannelsRepository):
+            raise ValueError(f'twitchAnnounceChannelsRepository argument is malformed: \"{twitchAnnounceChannelsRepository}\"')
+        elif not isinstance(twitchUserIdsRepository, TwitchUserIdsRepository):
+            raise ValueError(f'twitchUserIdsRepository argument is malformed: \"{twitchUserIdsRepository}\"')
+        elif not utils.isValidInt(maxRows):
+            raise ValueError(f'maxRows argument is malformed: \"{maxRows}\"')
+        elif maxRows < 1:
+            raise ValueError(f'maxRows argument is out of bounds: {maxRows}')
+        elif not utils.isValidInt(exportPageSize):
+            raise ValueError(f'exportPageSize argument is malformed: \"{exportPageSize}\"')
+        elif exportPageSize < 1 or exportPageSize > 100:
+            raise ValueError(f'exportPageSize argument is out of bounds: {exportPageSize}')
+
+        self.__timber: BufferedTimber = timber
+        self.__twitchAnnounceChannelsRepository: TwitchAnnounceChannelsRepository = twitchAnnounceChannelsRepository
+        self.__twitchUserIdsRepository: TwitchUserIdsRepository = twitchUserIdsRepository
+        self.__maxRows: int = maxRows
+        self.__exportPageSize: int = exportPageSize
+
+        self.__fieldNames: List[str] = [ 'discordId', 'discordName', 'discordDiscriminator', 'twitchName' ]
+
+    async def exportUsers(self, discordChannelId: int, isJson: bool) -> Tuple[str, int]:
+        if not utils.isValidInt(discordChannelId):
+            raise ValueError(f'discordChannelId argument is malformed: \"{discordChannelId}\"')
+        elif not utils.isValidBool(isJson):
+            raise ValueError(f'isJson argument is malformed: \"{isJson}\"')
+
+        # returns the exported file contents, along with how many users were exported
+
+        output = io.StringIO()
+        csvWriter: Optional[csv.DictWriter] = None
+        jsonEntries: List[Dict[str, str]] = list()
+
+        if not isJson:
+            csvWriter = csv.DictWriter(output, fieldnames = self.__fieldNames, lineterminator = '\n')
+            csvWriter.writeheader()
+
+        userCount = 0
+        afterUser: Optional[User] = None
+
+        # the roster is read one keyset page at a time, so that even very large rosters never
+        # need to be entirely loaded at once
+        while True:
+            users = await self.__twitchAnnounceChannelsRepository.fetchTwitchAnnounceChannelUsersPage(
+                discordChannelId = discordChannelId,
+                pageSize = self.__exportPageSize,
+                afterUser = afterUser
+            )
+
+            if not utils.hasItems(users):
+                break
+
+            for user in users:
+                entry = {
+                    'discordId': user.getDiscordId(),
+                    'discordName': user.getDiscordName(),
+                    'discordDiscriminator': user.getDiscordDiscriminator(),
+                    'twitchName': user.getTwitchName() if user.hasTwitchName() else ''
+                }
+
+                if csvWriter is None:
+                    jsonEntries.append(entry)
+                else:
+                    csvWriter.writerow(entry)
+
+            userCount = userCount + len(users)
+            afterUser = users[len(users) - 1]
+
+            if len(users) < self.__exportPageSize:
+                break
+
+        if isJson:
+            json.dump(jsonEntries, output, indent = 2)
+
+        return output.getvalue(), userCount
+
+    async def importUsers(
+        self,
+        discordChannelId: int,
+        content: str,
+        fileName: Optional[str],
+        memberLookup: Callable[[List[str]], Awaitable[Dict[str, Tuple[str, str]]]]
+    ) -> TwitchUsersImportResult:
+        if not utils.isValidInt(discordChannelId):
+            raise ValueError(f'discordChannelId argument is malformed: \"{discordChannelId}\"')
+        elif not utils.isValidStr(content):
+            raise ValueError(f'content argument is malformed: \"{content}\"')
+        elif not callable(memberLookup):
+            raise ValueError(f'memberLookup argument is malformed: \"{memberLookup}\"')
+
+        # memberLookup takes a list of Discord user ids and returns the name and discriminator of
+        # each of them that it could find, keyed by their id. It's only called once per import.
+
+        startTime = time.perf_counter()
+        rows = self.__parseRows(content, fileName)
+
+        if len(rows) > self.__maxRows:
+            raise ValueError(f'that file has {len(rows)} rows, but at most {self.__maxRows} can be imported at once')
+
+        failures: List[TwitchUsersImportFailure] = list()
+        validRows: List[Tuple[int, str, Optional[str], Optional[str], str]] = list()
+        discordIdsToRowNumbers: Dict[str, int] = dict()
+        unnamedDiscordIds: Set[str] = set()
+
+        # row numbers are 1-based and count the CSV header, so they line up with a spreadsheet
+        for rowNumber, row in rows:
+            discordId = self.__getField(row, 'discordId')
+            twitchName = self.__cleanTwitchName(self.__getField(row, 'twitchName'))
+            discordName = self.__getField(row, 'discordName')
+            discordDiscriminator = self.__getField(row, 'discordDiscriminator')
+
+            if not utils.isValidStr(discordId) or not discordId.isdigit() or int(discordId) > utils.getLongMaxSafeSize():
+                failures.append(TwitchUsersImportFailure(rowNumber, f'discordId is malformed: \"{discordId}\"'))
+                continue
+            elif not isValidTwitchLogin(twitchName):
+                failures.append(TwitchUsersImportFailure(rowNumber, f'twitchName is malformed: \"{twitchName}\"'))
+                continue
+            elif discordId in discordIdsToRowNumbers:
+                failures.append(TwitchUsersImportFailure(rowNumber, f'discordId {discordId} is a duplicate of row {discordIdsToRowNumbers[discordId]}'))
+                continue
+
+            if not utils.isValidStr(discordName) or not utils.isValidStr(discordDiscriminator):
+                unnamedDiscordIds.add(discordId)
+
+            discordIdsToRowNumbers[discordId] = rowNumber
+            validRows.append((rowNumber, discordId, discordName, discordDiscriminator, twitchName))
+
+        if utils.hasItems(unnamedDiscordIds):
+            discordIdsToMembers = await memberLookup(sorted(unnamedDiscordIds, key = lambda discordId: discordIdsToRowNumbers[discordId]))
+            namedRows: List[Tuple[int, str, Optional[str], Optional[str], str]] = list()
+
+            for rowNumber, discordId, discordName, discordDiscriminator, twitchName in validRows:
+                if discordId in unnamedDiscordIds:
+                    member = discordIdsToMembers.get(discordId)
+
+                    if member is None:
+                        failures.append(TwitchUsersImportFailure(rowNumber, f'discordId {discordId} couldn\'t be found in this server, so discordName and discordDiscriminator must be given'))
+                        continue
+
+                    discordName, discordDiscriminator = member
+
+                namedRows.append((rowNumber, discordId, discordName, discordDiscriminator, twitchName))
+
+            validRows = namedRows
+
+        importedUsers: List[User] = list()
+
+        if utils.hasItems(validRows):
+            # TwitchUserIdsRepository batches this into as few Helix calls as possible, and
+            # already known handles don't cost any calls at all
+            twitchUserIdEntries = await self.__twitchUserIdsRepository.fetchUserIds([ validRow[4] for validRow in validRows ])
+
+            for rowNumber, discordId, discordName, discordDiscriminator, twitchName in validRows:
+                twitchUserIdEntry = twitchUserIdEntries.get(twitchName.lower())
+
+                if twitchUserIdEntry is None:
+                    failures.append(TwitchUsersImportFailure(rowNumber, f'ttv/{twitchName} couldn\'t be verified with Twitch, please double check their ttv handle'))
+                    continue
+
+                importedUsers.append(User(
+                    discordDiscriminator = discordDiscriminator,
+                    discordId = discordId,
+                    discordName = discordName,
+                    twitchName = twitchUserIdEntry.getTwitchLogin()
+                ))
+
+        if utils.hasItems(importedUsers):
+            await self.__twitchAnnounceChannelsRepository.addUsers(importedUsers, discordChannelId)
+
+        failures.sort(key = lambda failure: failure.getRowNumber())
+        elapsedSeconds = time.perf_counter() - startTime
+        self.__timber.log('TwitchUsersImportExportHelper', f'Imported {len(importedUsers)} of {len(rows)} row(s) into channel {discordChannelId} in {elapsedSeconds:.2f}s ({len(failures)} failure(s))')
+
+        return TwitchUsersImportResult(
+            rowCount = len(rows),
+            elapsedSeconds = elapsedSeconds,
+            failures = failures,
+            importedUsers = importedUsers
+        )
+
+    def __cleanTwitchName(self, twitchName: Optional[str]) -> Optional[str]:
+        if not utils.isValidStr(twitchName):
+            return None
+
+        # accept full ttv urls too, the same way that !addTwitchUser does
+        url = urllib.parse.urlparse(twitchName.strip())
+        path = url.path.strip('/')
+
+        if '/' in path:
+            return path[path.rindex('/') + 1:len(path)]
+        else:
+            return path
+
+    def __getField(self, row: Dict[str, Any], fieldName: str) -> Optional[str]:
+        value = row.get(fieldName.lower())
+
+        if value is None:
+            return None
+
+        value = str(value).strip()
+
+        if not utils.isValidStr(value):
+            return None
+
+        return value
+
+    def __parseRows(self, content: str, fileName: Optional[str]) -> List[Tuple[int, Dict[str, Any]]]:
+        strippedContent = content.lstrip('﻿').strip()
+        isJson = (utils.isValidStr(fileName) and fileName.lower().endswith('.json')) or strippedContent.startswith('[') or strippedContent.startswith('{')
+        rows: List[Tuple[int, Dict[str, Any]]] = list()
+
+        if isJson:
+            try:
+                jsonContents = json.loads(strippedContent)
+            except json.JSONDecodeError as e:
+                raise ValueError(f'that JSON couldn\'t be parsed: {e}')
+
+            if isinstance(jsonContents, dict):
+                jsonContents = jsonContents.get('users')
+
+            if not isinstance(jsonContents, list):
+                raise ValueError('JSON imports must be a list of objects (or an object with a \"users\" list)')
+
+            for index, entry in enumerate(jsonContents):
+                if isinstance(entry, dict):
+                    rows.append((index + 1, { str(key).lower(): value for key, value in entry.items() }))
+                else:
+                    rows.append((index + 1, dict()))
+        else:
+            csvReader = csv.DictReader(io.StringIO(strippedContent))
+
+            if csvReader.fieldnames is None:
+                raise ValueError('that CSV is empty')
+
+            fieldNames = [ fieldName.strip().lower() for fieldName in csvReader.fieldnames ]
+
+            if 'discordid' not in fieldNames or 'twitchname' not in fieldNames:
+                raise ValueError(f'CSV imports need a header row with at least the discordId and twitchName columns (allowed columns: {", ".join(self.__fieldNames)})')
+
+            csvReader.fieldnames = fieldNames
+
+            for index, entry in enumerate(csvReader):
+                rows.append((index + 2, entry))
+
+        return rows
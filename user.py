@@ -57,3 +57,6 @@ class User(UserInterface):
 
     def setMostRecentStreamDateTime(self, mostRecentStreamDateTime: Optional[SimpleDateTime]):
         self.__mostRecentStreamDateTime = mostRecentStreamDateTime
+
+    def setTwitchName(self, twitchName: Optional[str]):
+        self.__twitchName = twitchName
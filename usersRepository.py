@@ -1,23 +1,46 @@
 from datetime import datetime
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 import CynanBotCommon.utils as utils
 from CynanBotCommon.simpleDateTime import SimpleDateTime
 from CynanBotCommon.storage.backingDatabase import BackingDatabase
 from CynanBotCommon.storage.databaseConnection import DatabaseConnection
-from CynanBotCommon.storage.databaseType import DatabaseType
 from CynanBotCommon.users.usersRepositoryInterface import \
     UsersRepositoryInterface
+from databaseSchemaRegistry import DatabaseSchemaRegistry
+from databaseWriteQueue import DatabaseWriteQueue
+from rosterChangeNotifier import RosterChangeNotifier
+from rosterChangeType import RosterChangeType
+from rosterVersionRepository import RosterVersionRepository
 from user import User
 
 
 class UsersRepository(UsersRepositoryInterface):
 
-    def __init__(self, backingDatabase: BackingDatabase):
+    def __init__(
+        self,
+        backingDatabase: BackingDatabase,
+        databaseSchemaRegistry: DatabaseSchemaRegistry,
+        rosterVersionRepository: RosterVersionRepository,
+        rosterChangeNotifier: Optional[RosterChangeNotifier] = None,
+        databaseWriteQueue: Optional[DatabaseWriteQueue] = None
+    ):
         if not isinstance(backingDatabase, BackingDatabase):
             raise ValueError(f'backingDatabase argument is malformed: \"{backingDatabase}\"')
+        elif not isinstance(databaseSchemaRegistry, DatabaseSchemaRegistry):
+            raise ValueError(f'databaseSchemaRegistry argument is malformed: \"{databaseSchemaRegistry}\"')
+        elif not isinstance(rosterVersionRepository, RosterVersionRepository):
+            raise ValueError(f'rosterVersionRepository argument is malformed: \"{rosterVersionRepository}\"')
+        elif rosterChangeNotifier is not None and not isinstance(rosterChangeNotifier, RosterChangeNotifier):
+            raise ValueError(f'rosterChangeNotifier argument is malformed: \"{rosterChangeNotifier}\"')
+        elif databaseWriteQueue is not None and not isinstance(databaseWriteQueue, DatabaseWriteQueue):
+            raise ValueError(f'databaseWriteQueue argument is malformed: \"{databaseWriteQueue}\"')
 
         self.__backingDatabase: BackingDatabase = backingDatabase
+        self.__databaseSchemaRegistry: DatabaseSchemaRegistry = databaseSchemaRegistry
+        self.__rosterVersionRepository: RosterVersionRepository = rosterVersionRepository
+        self.__rosterChangeNotifier: Optional[RosterChangeNotifier] = rosterChangeNotifier
+        self.__databaseWriteQueue: Optional[DatabaseWriteQueue] = databaseWriteQueue
 
         self.__isDatabaseReady: bool = False
 
@@ -25,6 +48,16 @@ class UsersRepository(UsersRepositoryInterface):
         if user is None:
             raise ValueError(f'user argument is malformed: \"{user}\"')
 
+        if self.__databaseWriteQueue is not None and user.hasTwitchName():
+            # coalesced into one upsert with whichever other users are queued up alongside it
+            await self.__databaseWriteQueue.write(
+                writeKey = 'users:addOrUpdate',
+                items = [ user ],
+                writeFunction = self.__addOrUpdateUsers
+            )
+
+            return
+
         connection = await self.__getDatabaseConnection()
 
         if user.hasMostRecentStreamDateTime() and user.hasTwitchName():
@@ -64,8 +97,111 @@ class UsersRepository(UsersRepositoryInterface):
                 user.getDiscordDiscriminator(), user.getDiscordId(), user.getDiscordName()
             )
 
+        await self.__rosterVersionRepository.bumpVersion(connection)
+        await self.__notifyRosterChange(connection, RosterChangeType.USERS, [ user.getDiscordId() ])
+        await connection.close()
+
+    async def addOrUpdateUsers(self, users: List[User], chunkSize: int = 190):
+        if not utils.hasItems(users):
+            raise ValueError(f'users argument is malformed: \"{users}\"')
+        elif not utils.isValidInt(chunkSize):
+            raise ValueError(f'chunkSize argument is malformed: \"{chunkSize}\"')
+        elif chunkSize < 1 or chunkSize > 190:
+            raise ValueError(f'chunkSize argument is out of bounds: {chunkSize}')
+
+        for user in users:
+            if not user.hasTwitchName():
+                raise ValueError(f'user is missing a Twitch name: \"{user.getDiscordNameAndDiscriminator()}\"')
+
+        if self.__databaseWriteQueue is None:
+            await self.__addOrUpdateUsers(users, chunkSize)
+        else:
+            await self.__databaseWriteQueue.write(
+                writeKey = 'users:addOrUpdate',
+                items = users,
+                writeFunction = lambda users, chunkSize = chunkSize: self.__addOrUpdateUsers(users, chunkSize)
+            )
+
+    async def __addOrUpdateUsers(self, users: List[User], chunkSize: int = 190):
+        # Bulk version of addOrUpdateUser(), for users that all have a Twitch name. Rows are
+        # written as multi-row upserts (5 parameters per row, so that a chunk always stays below
+        # SQLite's default limit of 999 parameters). A user without a most recent stream keeps
+        # whichever one is already stored, just like with addOrUpdateUser(). A user may only
+        # appear once per statement, so duplicates are collapsed first, with the last occurrence
+        # winning.
+
+        discordIdsToUsers: Dict[str, User] = dict()
+        discordIdsToMostRecentStreamDateTimes: Dict[str, str] = dict()
+
+        for user in users:
+            discordIdsToUsers[user.getDiscordId()] = user
+
+            # a later duplicate without a most recent stream mustn't undo an earlier one that has
+            # one, as that's not what writing them one after the other would have done either
+            if user.hasMostRecentStreamDateTime():
+                discordIdsToMostRecentStreamDateTimes[user.getDiscordId()] = user.getMostRecentStreamDateTime().getIsoFormatStr()
+
+        uniqueUsers = list(discordIdsToUsers.values())
+        connection = await self.__getDatabaseConnection()
+
+        for index in range(0, len(uniqueUsers), chunkSize):
+            chunk = uniqueUsers[index:index + chunkSize]
+            valuesStrs: List[str] = list()
+            parameters: List[Optional[str]] = list()
+
+            for user in chunk:
+                parameterIndex = len(parameters)
+                valuesStrs.append(f'(${parameterIndex + 1}, ${parameterIndex + 2}, ${parameterIndex + 3}, ${parameterIndex + 4}, ${parameterIndex + 5})')
+                parameters.extend([ user.getDiscordDiscriminator(), user.getDiscordId(), user.getDiscordName(), discordIdsToMostRecentStreamDateTimes.get(user.getDiscordId()), user.getTwitchName() ])
+
+            await connection.execute(
+                f'''
+                    INSERT INTO users (discorddiscriminator, discordid, discordname, mostrecentstreamdatetime, twitchname)
+                    VALUES {', '.join(valuesStrs)}
+                    ON CONFLICT(discordid) DO UPDATE SET discorddiscriminator = EXCLUDED.discorddiscriminator, discordname = EXCLUDED.discordname, mostrecentstreamdatetime = COALESCE(EXCLUDED.mostrecentstreamdatetime, users.mostrecentstreamdatetime), twitchname = EXCLUDED.twitchname
+                ''',
+                *parameters
+            )
+
+        await self.__rosterVersionRepository.bumpVersion(connection)
+        await self.__notifyRosterChange(connection, RosterChangeType.USERS, list(discordIdsToUsers.keys()))
+        await connection.close()
+
+    def createUserFromRow(self, row: List[Any]) -> User:
+        if not utils.hasItems(row):
+            raise ValueError(f'row argument is malformed: \"{row}\"')
+
+        # expects the columns: discorddiscriminator, discordid, discordname,
+        # mostrecentstreamdatetime, twitchname
+
+        mostRecentStreamDateTime: Optional[datetime] = utils.getDateTimeFromStr(row[3])
+        mostRecentStreamSimpleDateTime: Optional[SimpleDateTime] = None
+        if mostRecentStreamDateTime is not None:
+            mostRecentStreamSimpleDateTime = SimpleDateTime(
+                now = mostRecentStreamDateTime
+            )
+
+        return User(
+            discordDiscriminator = row[0],
+            discordId = row[1],
+            discordName = row[2],
+            mostRecentStreamDateTime = mostRecentStreamSimpleDateTime,
+            twitchName = row[4]
+        )
+
+    async def fetchDiscordIds(self) -> List[str]:
+        connection = await self.__getDatabaseConnection()
+        rows = await connection.fetchRows('SELECT discordid FROM users')
         await connection.close()
 
+        discordIds: List[str] = list()
+
+        if utils.hasItems(rows):
+            for row in rows:
+                discordIds.append(row[0])
+
+        return discordIds
+
     async def __getDatabaseConnection(self) -> DatabaseConnection:
         await self.__initDatabaseTable()
         return await self.__backingDatabase.getConnection()
@@ -87,67 +223,216 @@ class UsersRepository(UsersRepositoryInterface):
             discordId
         )
 
+        await connection.close()
+
         if not utils.hasItems(row):
-            await connection.close()
             raise ValueError(f'Unable to find user with discordId: \"{discordId}\"')
 
-        mostRecentStreamDateTime: Optional[datetime] = utils.getDateTimeFromStr(row[3])
-        mostRecentStreamSimpleDateTime: Optional[SimpleDateTime] = None
-        if mostRecentStreamDateTime is not None:
-            mostRecentStreamSimpleDateTime = SimpleDateTime(
-                now = mostRecentStreamDateTime
+        return self.createUserFromRow(row)
+
+    def getUsers(self) -> List[User]:
+        raise NotImplementedError()
+
+    async def getUsersAsync(self, discordIds: List[str], chunkSize: int = 500) -> List[User]:
+        if not utils.hasItems(discordIds):
+            raise ValueError(f'discordIds argument is malformed: \"{discordIds}\"')
+        elif not utils.isValidInt(chunkSize):
+            raise ValueError(f'chunkSize argument is malformed: \"{chunkSize}\"')
+        elif chunkSize < 1 or chunkSize > 900:
+            raise ValueError(f'chunkSize argument is out of bounds: {chunkSize}')
+
+        # Bulk version of getUserAsync(), one query per chunk of ids. Unlike getUserAsync(), ids
+        # that have no stored user are just left out of the returned list, which is in no
+        # particular order.
+        return await self.__getUsersWhereIn('discordid', list(dict.fromkeys(discordIds)), chunkSize)
+
+    async def getUsersByTwitchNames(self, twitchNames: List[str], chunkSize: int = 500) -> List[User]:
+        if not utils.hasItems(twitchNames):
+            raise ValueError(f'twitchNames argument is malformed: \"{twitchNames}\"')
+        elif not utils.isValidInt(chunkSize):
+            raise ValueError(f'chunkSize argument is malformed: \"{chunkSize}\"')
+        elif chunkSize < 1 or chunkSize > 900:
+            raise ValueError(f'chunkSize argument is out of bounds: {chunkSize}')
+
+        # twitchname is case insensitive, and more than one user can have the same one, so this
+        # may return more users than there are Twitch names
+        return await self.__getUsersWhereIn('twitchname', list(dict.fromkeys(twitchName.lower() for twitchName in twitchNames)), chunkSize)
+
+    async def __getUsersWhereIn(self, columnName: str, values: List[str], chunkSize: int) -> List[User]:
+        connection = await self.__getDatabaseConnection()
+        users: List[User] = list()
+
+        for index in range(0, len(values), chunkSize):
+            chunk = values[index:index + chunkSize]
+            parametersStr = ', '.join(f'${parameterIndex + 1}' for parameterIndex in range(len(chunk)))
+
+            rows = await connection.fetchRows(
+                f'''
+                    SELECT discorddiscriminator, discordid, discordname, mostrecentstreamdatetime, twitchname FROM users
+                    WHERE {columnName} IN ({parametersStr})
+                ''',
+                *chunk
             )
 
-        user = User(
-            discordDiscriminator = row[0],
-            discordId = row[1],
-            discordName = row[2],
-            mostRecentStreamDateTime = mostRecentStreamSimpleDateTime,
-            twitchName = row[4]
-        )
+            if utils.hasItems(rows):
+                for row in rows:
+                    users.append(self.createUserFromRow(row))
 
         await connection.close()
-        return user
-
-    def getUsers(self) -> List[User]:
-        raise NotImplementedError()
+        return users
 
-    def getUsersAsync(self) -> List[User]:
-        raise NotImplementedError()
+    async def initDatabaseTable(self):
+        await self.__initDatabaseTable()
 
     async def __initDatabaseTable(self):
         if self.__isDatabaseReady:
             return
 
-        self.__isDatabaseReady = True
+        # the schema registry serializes concurrent callers, so this flag is only ever set once
+        # the table really does exist
+        await self.__databaseSchemaRegistry.createTableIfNotExists(
+            tableName = 'users',
+            psqlStatement = '''
+                CREATE TABLE IF NOT EXISTS users (
+                    discorddiscriminator public.citext NOT NULL,
+                    discordid public.citext NOT NULL PRIMARY KEY,
+                    discordname public.citext NOT NULL,
+                    mostrecentstreamdatetime text DEFAULT NULL,
+                    twitchname public.citext DEFAULT NULL
+                )
+            ''',
+            sqliteStatement = '''
+                CREATE TABLE IF NOT EXISTS users (
+                    discorddiscriminator TEXT NOT NULL COLLATE NOCASE,
+                    discordid TEXT NOT NULL PRIMARY KEY COLLATE NOCASE,
+                    discordname TEXT NOT NULL COLLATE NOCASE,
+                    mostrecentstreamdatetime TEXT DEFAULT NULL COLLATE NOCASE,
+                    twitchname TEXT DEFAULT NULL COLLATE NOCASE
+                )
+            '''
+        )
 
+        # Matching Helix results back up to users goes by twitchname (see getUsersByTwitchNames()).
+        # Databases created before this index existed get it here, it's a no-op from then on.
         connection = await self.__backingDatabase.getConnection()
+        await connection.execute('CREATE INDEX IF NOT EXISTS users_twitchname_index ON users (twitchname)')
+        await connection.close()
 
-        if connection.getDatabaseType() is DatabaseType.POSTGRESQL:
-            await connection.createTableIfNotExists(
-                '''
-                    CREATE TABLE IF NOT EXISTS users (
-                        discorddiscriminator public.citext NOT NULL,
-                        discordid public.citext NOT NULL PRIMARY KEY,
-                        discordname public.citext NOT NULL,
-                        mostrecentstreamdatetime text DEFAULT NULL,
-                        twitchname public.citext DEFAULT NULLE
-                    )
-                '''
+        self.__isDatabaseReady = True
+
+    async def __notifyRosterChange(self, connection: DatabaseConnection, rosterChangeType: RosterChangeType, ids: List[Any]):
+        if self.__rosterChangeNotifier is not None:
+            await self.__rosterChangeNotifier.notify(connection, rosterChangeType, ids)
+
+    async def removeOrphanedUsers(self, discordIds: List[str], channelTableNames: List[str], chunkSize: int = 500) -> List[str]:
+        if not utils.hasItems(discordIds):
+            raise ValueError(f'discordIds argument is malformed: \"{discordIds}\"')
+        elif not isinstance(channelTableNames, list):
+            raise ValueError(f'channelTableNames argument is malformed: \"{channelTableNames}\"')
+        elif not utils.isValidInt(chunkSize):
+            raise ValueError(f'chunkSize argument is malformed: \"{chunkSize}\"')
+        elif chunkSize < 1 or chunkSize > 900:
+            raise ValueError(f'chunkSize argument is out of bounds: {chunkSize}')
+
+        # Like removeUsers(), but the users are checked against every given channel table in the
+        # very statement that deletes them, so a user that was added back to a channel after
+        # being found to be orphaned is kept. Returns the ids of the users that were removed.
+        if self.__databaseWriteQueue is None:
+            return await self.__removeOrphanedUsers(discordIds, channelTableNames, chunkSize)
+        else:
+            return await self.__databaseWriteQueue.write(
+                writeKey = None,
+                items = discordIds,
+                writeFunction = lambda discordIds, channelTableNames = channelTableNames, chunkSize = chunkSize: self.__removeOrphanedUsers(discordIds, channelTableNames, chunkSize)
             )
-        elif connection.getDatabaseType() is DatabaseType.SQLITE:
-            await connection.createTableIfNotExists(
-                '''
-                    CREATE TABLE IF NOT EXISTS users (
-                        discorddiscriminator TEXT NOT NULL COLLATE NOCASE,
-                        discordid TEXT NOT NULL PRIMARY KEY COLLATE NOCASE,
-                        discordname TEXT NOT NULL COLLATE NOCASE,
-                        mostrecentstreamdatetime TEXT DEFAULT NULL COLLATE NOCASE,
-                        twitchname TEXT DEFAULT NULL COLLATE NOCASE
-                    )
-                '''
+
+    async def __removeOrphanedUsers(self, discordIds: List[str], channelTableNames: List[str], chunkSize: int) -> List[str]:
+        discordIds = list(dict.fromkeys(discordIds))
+        orphanedConditionStr = self.__toOrphanedConditionStr(channelTableNames)
+        removedDiscordIds: List[str] = list()
+        connection = await self.__getDatabaseConnection()
+
+        for index in range(0, len(discordIds), chunkSize):
+            chunk = discordIds[index:index + chunkSize]
+            parametersStr = ', '.join(f'${parameterIndex + 1}' for parameterIndex in range(len(chunk)))
+
+            rows = await connection.fetchRows(
+                f'''
+                    SELECT discordid FROM users
+                    WHERE discordid IN ({parametersStr}) AND {orphanedConditionStr}
+                ''',
+                *chunk
             )
+
+            if not utils.hasItems(rows):
+                continue
+
+            await connection.execute(
+                f'''
+                    DELETE FROM users
+                    WHERE discordid IN ({parametersStr}) AND {orphanedConditionStr}
+                ''',
+                *chunk
+            )
+
+            removedDiscordIds.extend(row[0] for row in rows)
+
+        # the roster version is bumped even if nobody turned out to be orphaned, so that callers
+        # can always count on one bump per call, just like removeUsers()
+        await self.__rosterVersionRepository.bumpVersion(connection)
+
+        if utils.hasItems(removedDiscordIds):
+            await self.__notifyRosterChange(connection, RosterChangeType.USERS, removedDiscordIds)
+
+        await connection.close()
+        return removedDiscordIds
+
+    async def removeUsers(self, discordIds: List[str], chunkSize: int = 500):
+        if not utils.hasItems(discordIds):
+            raise ValueError(f'discordIds argument is malformed: \"{discordIds}\"')
+        elif not utils.isValidInt(chunkSize):
+            raise ValueError(f'chunkSize argument is malformed: \"{chunkSize}\"')
+        elif chunkSize < 1 or chunkSize > 900:
+            raise ValueError(f'chunkSize argument is out of bounds: {chunkSize}')
+
+        if self.__databaseWriteQueue is None:
+            await self.__removeUsers(discordIds, chunkSize)
         else:
-            raise RuntimeError(f'unknown DatabaseType: \"{connection.getDatabaseType()}\"')
+            await self.__databaseWriteQueue.write(
+                writeKey = None,
+                items = discordIds,
+                writeFunction = lambda discordIds, chunkSize = chunkSize: self.__removeUsers(discordIds, chunkSize)
+            )
 
+    async def __removeUsers(self, discordIds: List[str], chunkSize: int):
+        discordIds = list(dict.fromkeys(discordIds))
+        connection = await self.__getDatabaseConnection()
+
+        for index in range(0, len(discordIds), chunkSize):
+            chunk = discordIds[index:index + chunkSize]
+            parametersStr = ', '.join(f'${parameterIndex + 1}' for parameterIndex in range(len(chunk)))
+
+            await connection.execute(
+                f'''
+                    DELETE FROM users
+                    WHERE discordid IN ({parametersStr})
+                ''',
+                *chunk
+            )
+
+        await self.__rosterVersionRepository.bumpVersion(connection)
+        await self.__notifyRosterChange(connection, RosterChangeType.USERS, discordIds)
         await connection.close()
+
+    def __toOrphanedConditionStr(self, channelTableNames: List[str], groupSize: int = 50) -> str:
+        if not utils.hasItems(channelTableNames):
+            return '1 = 1'
+
+        # SQLite caps how deeply an expression can nest (1000 by default), and a flat chain of
+        # ANDs nests one level deeper per table, so with lots of channels they're grouped up
+        conditionStrs = [ f'NOT EXISTS (SELECT 1 FROM {channelTableName} WHERE {channelTableName}.discorduserid = users.discordid)' for channelTableName in channelTableNames ]
+
+        while len(conditionStrs) > groupSize:
+            conditionStrs = [ f'({" AND ".join(conditionStrs[index:index + groupSize])})' for index in range(0, len(conditionStrs), groupSize) ]
+
+        return f'({" AND ".join(conditionStrs)})'